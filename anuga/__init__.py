@@ -175,6 +175,7 @@ else:
     # SwW Standard Boundaries
     # -----------------------------
     from anuga.shallow_water.boundaries import File_boundary
+    from anuga.shallow_water.boundaries import Sts_boundary
     from anuga.shallow_water.boundaries import Reflective_boundary
     from anuga.shallow_water.boundaries import Field_boundary
     from anuga.shallow_water.boundaries import \
@@ -212,6 +213,7 @@ else:
     # These are old, should use operators
     # -----------------------------
     from anuga.shallow_water.forcing import Inflow, Rainfall, Wind_stress
+    from anuga.shallow_water.forcing import Gridded_met_forcing
 
     # -----------------------------
     # File conversion utilities
@@ -273,6 +275,7 @@ else:
     from anuga.operators.kinematic_viscosity_operator import Kinematic_viscosity_operator
 
     from anuga.operators.rate_operators import Rate_operator
+    from anuga.operators.rate_operators import Radar_rate_operator
     from anuga.operators.set_friction_operators import Depth_friction_operator
 
     from anuga.operators.set_elevation_operator import Set_elevation_operator
@@ -307,6 +310,7 @@ else:
         from anuga.structures.internal_boundary_operator import Internal_boundary_operator
 
     from anuga.structures.internal_boundary_functions import pumping_station_function
+    from anuga.structures.structure_manager import Structure_manager
 
     # ----------------------------
     # Parallel distribute
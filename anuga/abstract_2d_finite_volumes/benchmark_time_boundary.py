@@ -0,0 +1,90 @@
+"""
+Benchmark the per step cost of Time_boundary and Time_space_boundary
+with and without a tabulated time grid.
+
+The boundary function is a tidal synthesis with many constituents,
+which is typical of an expensive Python boundary function. The cost of
+domain.update_boundary is reported per call for each boundary.
+
+Run as
+    python benchmark_time_boundary.py
+"""
+
+import time
+
+import numpy as num
+import anuga
+
+from anuga.abstract_2d_finite_volumes.generic_boundary_conditions \
+     import Time_boundary, Time_space_boundary
+
+
+number_of_constituents = 40
+number_of_steps = 200
+finaltime = 3*24*3600.0
+grid_spacing = 600.0   # Time grid for tabulation (s)
+
+# Random but reproducible tidal constituents
+num.random.seed(17)
+amplitudes = 0.5*num.random.rand(number_of_constituents)
+periods = 3600.0*(6.0 + 20.0*num.random.rand(number_of_constituents))
+phases = 2*num.pi*num.random.rand(number_of_constituents)
+
+
+def tide(t):
+    stage = 0.0
+    for a, T, p in zip(amplitudes, periods, phases):
+        stage += a*num.cos(2*num.pi*t/T + p)
+    return [stage, 0.0, 0.0]
+
+
+def tide_xy(t, x, y):
+    stage = 0.0
+    for a, T, p in zip(amplitudes, periods, phases):
+        stage += a*num.cos(2*num.pi*t/T + p - 1.0e-4*x)
+    return [stage, 0.0, 0.0]
+
+
+def time_update_boundary(B):
+    """Return wall time per call of update_boundary with B on the left
+    and right boundaries of a 100 x 100 domain
+    """
+
+    domain = anuga.rectangular_cross_domain(100, 100, len1=10000.0,
+                                            len2=10000.0)
+    Br = anuga.Reflective_boundary(domain)
+    B = B(domain)
+    domain.set_boundary({'left': B, 'right': B, 'top': Br, 'bottom': Br})
+
+    # First call includes tabulation of Time_space_boundary
+    t0 = time.time()
+    domain.update_boundary()
+    setup = time.time() - t0
+
+    times = num.linspace(0.0, finaltime, number_of_steps)
+    t0 = time.time()
+    for t in times:
+        domain.set_time(t)
+        domain.update_boundary()
+
+    return (time.time() - t0)/number_of_steps, setup
+
+
+time_grid = num.arange(0.0, finaltime + grid_spacing, grid_spacing)
+
+cases = [('Time_boundary',
+          lambda domain: Time_boundary(domain, tide)),
+         ('Time_boundary (tabulated)',
+          lambda domain: Time_boundary(domain, tide, time_grid=time_grid)),
+         ('Time_space_boundary',
+          lambda domain: Time_space_boundary(domain, tide_xy)),
+         ('Time_space_boundary (tabulated)',
+          lambda domain: Time_space_boundary(domain, tide_xy,
+                                             time_grid=time_grid))]
+
+print '%d constituents, %d steps, time grid of %d times' \
+      % (number_of_constituents, number_of_steps, len(time_grid))
+print '%-35s %15s %15s' % ('Boundary', 'per step (ms)', 'first call (s)')
+for label, B in cases:
+    step, setup = time_update_boundary(B)
+    print '%-35s %15.3f %15.3f' % (label, 1000*step, setup)
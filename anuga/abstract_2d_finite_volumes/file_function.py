@@ -13,6 +13,7 @@ have an undefined value.
 """
 
 import numpy as num
+import threading
 
 from anuga.geospatial_data.geospatial_data import ensure_absolute
 from anuga.file.netcdf import NetCDFFile
@@ -31,7 +32,10 @@ def file_function(filename,
                   verbose=False,
                   use_cache=False,
                   boundary_polygon=None,
-                  output_centroids=False):
+                  output_centroids=False,
+                  streaming=False,
+                  block_size=1,
+                  prefetch=False):
     """Read time history of spatial data from NetCDF file and return
     a callable object.
 
@@ -76,6 +80,21 @@ def file_function(filename,
 
     boundary_polygon - 
 
+    streaming - True means that the file is kept open and only the two
+                time slices bracketing the current model time are read
+                and interpolated. Use this for long, finely resolved
+                boundary files that do not fit in memory. Caching is
+                not used when streaming.
+
+    block_size - Number of (thinned) timesteps read from the file at a time when
+                 streaming. Memory use is bounded by this number of
+                 timesteps (two blocks if prefetching).
+
+    prefetch - True means that the block following the current one is
+               read in a background thread when streaming.
+
+    When streaming, close() the returned function (or the boundary using
+    it) to close the file once it is no longer needed.
     
     See Interpolation function in anuga.fit_interpolate.interpolation for
     further documentation
@@ -117,10 +136,14 @@ def file_function(filename,
               'time_limit': time_limit,                                 
               'verbose': verbose,
               'boundary_polygon': boundary_polygon,
-              'output_centroids': output_centroids}
+              'output_centroids': output_centroids,
+              'streaming': streaming,
+              'block_size': block_size,
+              'prefetch': prefetch}
 
     # Call underlying engine with or without caching
-    if use_cache is True:
+    # (a streaming function holds an open file and cannot be cached)
+    if use_cache is True and streaming is False:
         try:
             from anuga.caching import cache
         except:
@@ -169,7 +192,10 @@ def _file_function(filename,
                    time_limit=None,
                    verbose=False,
                    boundary_polygon=None,
-                   output_centroids=False):
+                   output_centroids=False,
+                   streaming=False,
+                   block_size=1,
+                   prefetch=False):
     """Internal function
     
     See file_function for documentatiton
@@ -203,7 +229,10 @@ def _file_function(filename,
                                         time_limit=time_limit,
                                         verbose=verbose,
                                         boundary_polygon=boundary_polygon,
-                                        output_centroids=output_centroids)
+                                        output_centroids=output_centroids,
+                                        streaming=streaming,
+                                        block_size=block_size,
+                                        prefetch=prefetch)
     elif ext in [".csv"]:
         # FIXME (Ole): Could add csv file here to address Ted Rigby's
         # suggestion about reading hydrographs.
@@ -222,11 +251,18 @@ def get_netcdf_file_function(filename,
                              time_limit=None,            
                              verbose=False,
                              boundary_polygon=None,
-                             output_centroids=False):
+                             output_centroids=False,
+                             streaming=False,
+                             block_size=1,
+                             prefetch=False):
     """Read time history of spatial data from NetCDF sww file and
     return a callable object f(t,x,y)
     which will return interpolated values based on the input file.
 
+    If streaming is True the file is left open and quantities are read
+    block_size time slices at a time by the returned function, optionally
+    prefetching the next block in the background.
+
     Model time (domain_starttime)
     will be checked, possibly modified and returned
     
@@ -446,14 +482,28 @@ def get_netcdf_file_function(filename,
     # Produce values for desired data points at
     # each timestep for each quantity
     quantities = {}
+    lock = threading.Lock()    # Serialise reads from fid across threads
     for i, name in enumerate(quantity_names):
-        quantities[name] = fid.variables[name][:]
         if boundary_polygon is not None:
             #removes sts points that do not lie on boundary
-            quantities[name] = num.take(quantities[name], gauge_id, axis=1)
-            
-    # Close sww, tms or sts netcdf file         
-    fid.close()
+            columns = gauge_id
+        else:
+            columns = None
+
+        if streaming:
+            quantities[name] = Netcdf_quantity_reader(fid, name, columns,
+                                                      block_size=block_size,
+                                                      prefetch=prefetch,
+                                                      lock=lock,
+                                                      time_thinning=time_thinning)
+        else:
+            quantities[name] = fid.variables[name][:]
+            if columns is not None:
+                quantities[name] = num.take(quantities[name], columns, axis=1)
+
+    # Close sww, tms or sts netcdf file unless it is read on demand
+    if not streaming:
+        fid.close()
 
     from anuga.fit_interpolate.interpolate import Interpolation_function
 
@@ -477,8 +527,137 @@ def get_netcdf_file_function(filename,
                                    time_thinning=time_thinning,
                                    verbose=verbose,
                                    gauge_neighbour_id=gauge_neighbour_id,
-                                   output_centroids=output_centroids),
+                                   output_centroids=output_centroids,
+                                   streaming=streaming),
             starttime)
 
     # NOTE (Ole): Caching Interpolation function is too slow as
     # the very long parameters need to be hashed.
+
+
+class Netcdf_quantity_reader:
+    """Read a quantity from an open NetCDF file in blocks of time slices.
+
+    Indexing with a time index returns the values at that timestep,
+    restricted to the given columns (e.g. sts gauges on the boundary).
+    The block of block_size timesteps containing the index is read from
+    the file and kept until an index outside it is requested. If prefetch
+    is True the following block is read in a background thread so it is
+    ready when the simulation clock reaches it. Any other index (e.g. a
+    slice for time independent quantities) is read directly.
+
+    With time_thinning the time indices used are multiples of
+    time_thinning and the blocks only hold these timesteps, i.e. block_size
+    counts thinned timesteps.
+
+    Used by get_netcdf_file_function when streaming. The file is shared
+    by the quantities and closed by the Interpolation_function using them.
+    """
+
+    def __init__(self, fid, name, columns=None,
+                 block_size=1, prefetch=False, lock=None, time_thinning=1):
+
+        msg = 'block_size must be a positive integer. I got %s' % block_size
+        assert block_size >= 1, msg
+
+        if lock is None:
+            lock = threading.Lock()
+
+        self.fid = fid
+        self.variable = fid.variables[name]
+        self.columns = columns
+        self.shape = self.variable.shape
+        self.block_size = int(block_size)
+        self.prefetch = prefetch
+        self.lock = lock
+
+        # Timesteps in thinned indices
+        self.time_thinning = int(time_thinning)
+        self.number_of_timesteps = (self.shape[0] + self.time_thinning - 1) \
+                                   / self.time_thinning
+
+        # Current block and the one being prefetched
+        self.block = None
+        self.block_start = None
+        self.next_block = None
+        self.next_start = None
+        self.thread = None
+
+    def __getitem__(self, index):
+        if not isinstance(index, (int, long, num.integer)) or \
+               index % self.time_thinning != 0:
+            return self._read(index)
+
+        index = index / self.time_thinning
+        start = index - index % self.block_size
+        if start != self.block_start:
+            self._load_block(start)
+
+        return self.block[index - start]
+
+    def _read(self, index):
+        """Read index of the variable from file
+        """
+
+        self.lock.acquire()
+        try:
+            Q = num.array(self.variable[index], num.float)
+        finally:
+            self.lock.release()
+
+        if self.columns is not None:
+            Q = num.take(Q, self.columns, axis=-1)
+        return Q
+
+    def _read_block(self, start):
+        """Read the block beginning at thinned timestep start
+        """
+
+        k = self.time_thinning
+        return self._read(slice(start*k, (start + self.block_size)*k, k))
+
+    def _load_block(self, start):
+        """Make the block beginning at thinned timestep start current
+        """
+
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        if self.next_start == start:
+            self.block = self.next_block
+        else:
+            self.block = None    # Release memory before reading
+            self.block = self._read_block(start)
+        self.block_start = start
+
+        self.next_block = self.next_start = None
+        next_start = start + self.block_size
+        if self.prefetch and next_start < self.number_of_timesteps:
+            self.thread = threading.Thread(target=self._prefetch_block,
+                                           args=(next_start,))
+            self.thread.daemon = True
+            self.thread.start()
+
+    def close(self):
+        """Wait for the prefetch thread and release the blocks read.
+        The file itself is left open.
+        """
+
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        self.block = self.next_block = None
+        self.block_start = self.next_start = None
+
+    def _prefetch_block(self, start):
+        """Read the block beginning at thinned timestep start in the
+        background. On failure the block is read again (raising) when needed.
+        """
+
+        try:
+            self.next_block = self._read_block(start)
+            self.next_start = start
+        except Exception:
+            pass
@@ -87,6 +87,35 @@ class Boundary:
                 Q.boundary_values[i] = q_evol[j]
 
 
+    def set_segment_values(self, domain, segment_edges, q_bdry):
+        """Store array q_bdry of conserved quantities (one row per edge)
+        as boundary values on the edges of segment_edges.
+
+        Helper for numpy based implementations of evaluate_segment.
+        """
+
+        ids = num.asarray(segment_edges, num.int)
+
+        if len(domain.conserved_quantities) == len(domain.evolved_quantities):
+            # conserved and evolved quantities are the same
+            for j, name in enumerate(domain.evolved_quantities):
+                domain.quantities[name].boundary_values[ids] = q_bdry[:,j]
+            return
+
+        # Need to calculate all the evolved quantities edge by edge
+        # using the default conversion
+        for k, i in enumerate(ids):
+            vol_id  = domain.boundary_cells[i]
+            edge_id = domain.boundary_edges[i]
+
+            q_evol = domain.get_evolved_quantities(vol_id, edge = edge_id)
+            q_evol = domain.conserved_values_to_evolved_values \
+                                                    (q_bdry[k], q_evol)
+
+            for j, name in enumerate(domain.evolved_quantities):
+                domain.quantities[name].boundary_values[i] = q_evol[j]
+
+
     def get_time(self):
 
         return self.domain.get_time()
@@ -132,6 +161,51 @@ class Boundary:
         return res
 
 
+def check_time_grid(time_grid):
+    """Return time_grid as an array of floats after checking that it
+    is a strictly increasing sequence of at least two times.
+    """
+
+    time_grid = num.array(time_grid, num.float)
+
+    msg = 'time_grid must be a 1d sequence of at least two times'
+    assert len(time_grid.shape) == 1 and len(time_grid) > 1, msg
+
+    msg = 'time_grid must be strictly increasing'
+    assert num.alltrue(time_grid[1:] > time_grid[:-1]), msg
+
+    return time_grid
+
+
+def interpolate_table(time_grid, table, t, columns=None):
+    """Interpolate table of values tabulated at the times of time_grid
+    (along the first axis of table) linearly to time t.
+
+    If columns is specified only those columns (second axis) of the
+    table are interpolated.
+    """
+
+    if t < time_grid[0] or t > time_grid[-1]:
+        msg = 'Model time %.16f' % t
+        msg += ' is not contained in tabulated time grid [%.16f:%.16f].\n'\
+               % (time_grid[0], time_grid[-1])
+        if t < time_grid[0]: raise Modeltime_too_early(msg)
+        raise Modeltime_too_late(msg)
+
+    i = min(num.searchsorted(time_grid, t, side='right') - 1,
+            len(time_grid) - 2)
+    ratio = (t - time_grid[i])/(time_grid[i+1] - time_grid[i])
+
+    if columns is None:
+        Q0 = table[i]
+        Q1 = table[i+1]
+    else:
+        Q0 = table[i, columns]
+        Q1 = table[i+1, columns]
+
+    return Q0 + ratio*(Q1 - Q0)
+
+
 
 class Transmissive_boundary(Boundary):
     """Transmissive boundary returns same conserved quantities as
@@ -304,6 +378,13 @@ class Time_boundary(Boundary):
       This will produce a boundary condition with is a 2m high square wave
       starting 60 seconds into the simulation and lasting one hour.
       Momentum applied will be 0 at all times.
+
+    If time_grid (an increasing sequence of times) is specified the
+    function is evaluated once at each of these times when the boundary
+    is created and the boundary values are linearly interpolated from
+    this table during the run. Use this for expensive functions such as
+    tidal synthesis. Model times outside time_grid are treated as
+    outside the domain of the function (see default_boundary).
                         
     """
 
@@ -311,6 +392,7 @@ class Time_boundary(Boundary):
                  #f=None, # Should be removed and replaced by function below
                  function=None,
                  default_boundary=None,
+                 time_grid=None,
                  verbose=False):
         Boundary.__init__(self)
 
@@ -352,9 +434,26 @@ class Time_boundary(Boundary):
         self.function = function
         self.domain = domain
 
+        self.time_grid = None
+        if time_grid is not None:
+            self.time_grid = check_time_grid(time_grid)
+
+            if verbose:
+                log.critical('Time_boundary: tabulating function at %d times'
+                             % len(self.time_grid))
+            self.table = num.array([function(t) for t in self.time_grid],
+                                   num.float)
+            self.function = self.evaluate_table
+
     def __repr__(self):
         return 'Time boundary'
 
+    def evaluate_table(self, t):
+        """Return boundary values at time t interpolated from the table
+        """
+
+        return interpolate_table(self.time_grid, self.table, t)
+
     def get_time(self):
 
         return self.domain.get_time()
@@ -426,6 +525,10 @@ class Time_space_boundary(Boundary):
       This will produce a boundary condition with is a 2m high square wave
       starting 60 seconds into the simulation and lasting one hour.
       Momentum applied will be 0 at all times.
+
+    If time_grid is specified the function is tabulated at these times
+    for each edge of a segment the first time the segment is evaluated,
+    and interpolated linearly in time thereafter (see Time_boundary).
                         
     """
 
@@ -433,6 +536,7 @@ class Time_space_boundary(Boundary):
     def __init__(self, domain=None,
                  function=None,
                  default_boundary=None,
+                 time_grid=None,
                  verbose=False):
         Boundary.__init__(self)
 
@@ -471,6 +575,14 @@ class Time_space_boundary(Boundary):
         self.function = function
         self.domain = domain
 
+        # Table of function values (timestep x column x quantity) and
+        # the column of each boundary edge (-1 if not yet tabulated)
+        self.time_grid = None
+        if time_grid is not None:
+            self.time_grid = check_time_grid(time_grid)
+            self.table = num.zeros((len(self.time_grid), 0, d), num.float)
+            self.table_columns = -num.ones(len(domain.boundary_cells), num.int)
+
     def __repr__(self):
         return 'Time space boundary'
 
@@ -512,6 +624,87 @@ class Time_space_boundary(Boundary):
 
         return res
 
+
+    def evaluate_segment(self, domain, segment_edges):
+        """Set boundary values on all edges of segment_edges, interpolating
+        all edges at once from the table if time_grid was specified.
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        ids = num.asarray(segment_edges, num.int)
+        t = self.domain.get_time()
+
+        try:
+            if self.time_grid is None:
+                E = self.get_segment_midpoints(domain, ids)
+                q_bdry = num.array([self.function(t, x, y) for x, y in E],
+                                   num.float)
+            else:
+                self.tabulate_segment(domain, ids)
+                q_bdry = interpolate_table(self.time_grid, self.table, t,
+                                           columns=self.table_columns[ids])
+        except Modeltime_too_early, e:
+            raise Modeltime_too_early(e)
+        except Modeltime_too_late, e:
+            if self.default_boundary is None:
+                raise Exception(e) # Reraise exception
+
+            # Pass control to default boundary
+            self.default_boundary.evaluate_segment(domain, segment_edges)
+
+            if self.default_boundary_invoked is False:
+                if self.verbose:
+                    # Issue warning the first time
+                    msg = '%s' %str(e)
+                    msg += 'Instead I will use the default boundary: %s\n'\
+                        %str(self.default_boundary)
+                    msg += 'Note: Further warnings will be supressed'
+                    log.critical(msg)
+
+                self.default_boundary_invoked = True
+            return
+
+        self.set_segment_values(domain, ids, q_bdry)
+
+
+    def get_segment_midpoints(self, domain, ids):
+        """Return (relative) midpoint coordinates of boundary edges ids
+        """
+
+        k = 3*domain.boundary_cells[ids] + domain.boundary_edges[ids]
+        return domain.get_edge_midpoint_coordinates()[k]
+
+
+    def tabulate_segment(self, domain, ids):
+        """Add columns to the table for boundary edges ids which
+        have not been tabulated yet
+        """
+
+        new_ids = ids[self.table_columns[ids] < 0]
+        if len(new_ids) == 0:
+            return
+
+        if self.verbose:
+            log.critical('Time_space_boundary: tabulating function at %d '
+                         'times for %d edges'
+                         % (len(self.time_grid), len(new_ids)))
+
+        E = self.get_segment_midpoints(domain, new_ids)
+        d = self.table.shape[2]
+        columns = num.zeros((len(self.time_grid), len(new_ids), d), num.float)
+        for i, t in enumerate(self.time_grid):
+            for k, (x, y) in enumerate(E):
+                columns[i, k, :] = self.function(t, x, y)
+
+        self.table_columns[new_ids] = self.table.shape[1] + \
+                                      num.arange(len(new_ids))
+        self.table = num.concatenate((self.table, columns), axis=1)
+
+
 class File_boundary(Boundary):
     """The File_boundary reads values for the conserved
     quantities from an sww NetCDF file, and returns interpolated values
@@ -536,6 +729,11 @@ class File_boundary(Boundary):
     an instance of class descending from class Boundary.
     This will be used in case model time exceeds that available in the 
     underlying data.
+
+    Optional keyword argument streaming keeps the file open and reads
+    only the time slices needed at the current model time, block_size
+    timesteps at a time and optionally prefetching the next block
+    (see file_function).
        
     """
 
@@ -548,7 +746,10 @@ class File_boundary(Boundary):
                  boundary_polygon=None,    
                  default_boundary=None,
                  use_cache=False, 
-                 verbose=False): 
+                 verbose=False,
+                 streaming=False,
+                 block_size=1,
+                 prefetch=False): 
 
         import time
         from anuga.config import time_format
@@ -586,6 +787,13 @@ class File_boundary(Boundary):
             # Register index of this boundary edge for use with evaluate
             self.boundary_indices[(vol_id, edge_id)] = i
 
+        # Index of the interpolation point for each entry of
+        # domain.boundary_cells for use with evaluate_segment
+        self.boundary_point_ids = num.array([self.boundary_indices[vol_id, edge_id]
+                                             for vol_id, edge_id in
+                                             zip(domain.boundary_cells,
+                                                 domain.boundary_edges)],
+                                            num.int)
             
             
         if verbose: log.critical('Initialise file_function')
@@ -597,7 +805,10 @@ class File_boundary(Boundary):
                                time_limit=time_limit,
                                use_cache=use_cache, 
                                verbose=verbose,
-                               boundary_polygon=boundary_polygon)
+                               boundary_polygon=boundary_polygon,
+                               streaming=streaming,
+                               block_size=block_size,
+                               prefetch=prefetch)
                              
         # Check and store default_boundary
         msg = 'Keyword argument default_boundary must be either None '
@@ -643,6 +854,13 @@ class File_boundary(Boundary):
         return 'File boundary'
 
 
+    def close(self):
+        """Close the file read when streaming
+        """
+
+        self.F.close()
+
+
     def evaluate(self, vol_id=None, edge_id=None):
         """Return linearly interpolated values based on domain.time
         at midpoint of segment defined by vol_id and edge_id.
@@ -714,6 +932,125 @@ class File_boundary(Boundary):
             msg += 'vol_id=%s, edge_id=%s' %(str(vol_id), str(edge_id))
             raise Exception(msg)
 
+
+    def evaluate_segment(self, domain, segment_edges):
+        """Set boundary values on all edges of segment_edges from
+        linearly interpolated values based on domain.time
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        q_bdry = self.get_segment_values(domain, segment_edges)
+        self.set_segment_values(domain, segment_edges, q_bdry)
+
+
+    def get_segment_values(self, domain, segment_edges):
+        """Return array of conserved quantities (one row per edge) on the
+        edges of segment_edges, interpolated in time in one operation.
+        """
+
+        t = self.domain.time
+
+        ids = num.asarray(segment_edges, num.int)
+        point_ids = self.boundary_point_ids[ids]
+
+        try:
+            res = self.F.evaluate_points(t, point_ids).T
+        except Modeltime_too_early, e:
+            raise Modeltime_too_early(e)
+        except Modeltime_too_late, e:
+            if self.default_boundary is None:
+                raise Exception(e) # Reraise exception
+            else:
+                # Pass control to default boundary and read back
+                # the values it has set on the segment
+                self.default_boundary.evaluate_segment(domain, segment_edges)
+
+                res = num.zeros((len(ids), len(domain.conserved_quantities)),
+                                num.float)
+                for j, name in enumerate(domain.conserved_quantities):
+                    res[:,j] = domain.quantities[name].boundary_values[ids]
+
+                if self.default_boundary_invoked is False:
+                    # Issue warning the first time
+                    if self.verbose:
+                        msg = '%s' %str(e)
+                        msg += 'Instead I will use the default boundary: %s\n'\
+                            %str(self.default_boundary) 
+                        msg += 'Note: Further warnings will be supressed'
+                        log.critical(msg)
+
+                    self.default_boundary_invoked = True
+
+        nan_edges = num.flatnonzero(num.any(res == NAN, axis=1))
+        if len(nan_edges) > 0:
+            i = point_ids[nan_edges[0]]
+            x,y=self.midpoint_coordinates[i,:]
+            msg = 'NAN value found in file_boundary at '
+            msg += 'point id #%d: (%.2f, %.2f).\n' %(i, x, y)
+
+            if hasattr(self.F, 'indices_outside_mesh') and\
+                   len(self.F.indices_outside_mesh) > 0:
+                # Check if NAN point is due it being outside
+                # boundary defined in sww file.
+
+                if i in self.F.indices_outside_mesh:
+                    msg += 'This point refers to one outside the '
+                    msg += 'mesh defined by the file %s.\n'\
+                           %self.F.filename
+                    msg += 'Make sure that the file covers '
+                    msg += 'the boundary segment it is assigned to '
+                    msg += 'in set_boundary.'
+                else:
+                    msg += 'This point is inside the mesh defined '
+                    msg += 'the file %s.\n' %self.F.filename
+                    msg += 'Check this file for NANs.'
+            raise Exception(msg)
+
+        return res
+
+
+class Sts_boundary(File_boundary):
+    """File_boundary for long sts files (e.g. from urs2sts).
+
+    The sts file is kept open and read in blocks of block_size timesteps
+    as the model time advances, with the next block read in the
+    background. Memory use is therefore bounded by the block size
+    rather than the length of the record.
+
+    Example:
+    Bs = Sts_boundary('source_file.sts', domain,
+                      boundary_polygon=bounding_polygon,
+                      block_size=500)
+    """
+
+    def __init__(self, filename, domain,
+                 time_thinning=1,
+                 time_limit=None,
+                 boundary_polygon=None,
+                 default_boundary=None,
+                 block_size=100,
+                 prefetch=True,
+                 verbose=False):
+
+        File_boundary.__init__(self, filename, domain,
+                               time_thinning=time_thinning,
+                               time_limit=time_limit,
+                               boundary_polygon=boundary_polygon,
+                               default_boundary=default_boundary,
+                               verbose=verbose,
+                               streaming=True,
+                               block_size=block_size,
+                               prefetch=prefetch)
+
+
+    def __repr__(self):
+        return 'Sts boundary'
+
+
 class AWI_boundary(Boundary):
     """The AWI_boundary reads values for the conserved
     quantities (only STAGE) from an sww NetCDF file, and returns interpolated values
@@ -16,6 +16,7 @@ from time import time as walltime
 
 from anuga.abstract_2d_finite_volumes.neighbour_mesh import Mesh
 from pmesh2domain import pmesh_to_domain
+from mesh_reordering import reorder_mesh
 from tag_region import Set_tag_region as region_set_tag_region
 from anuga.geometry.polygon import inside_polygon
 from anuga.abstract_2d_finite_volumes.util import get_textual_float
@@ -24,6 +25,13 @@ import anuga.utilities.log as log
 
 import numpy as num
 
+# Phases of evolve timed by the wall clock counters (see
+# get_timing_statistics). Storage and checkpoint are timed in the loop
+# over the yieldsteps.
+timing_phases = ['extrapolation', 'boundaries', 'fluxes', 'forcing_terms',
+                 'timestep', 'update', 'ghost_exchange', 'extrema',
+                 'operators', 'fused_rk2_step', 'storage', 'checkpoint']
+
 
 
 
@@ -53,7 +61,9 @@ class Generic_Domain:
                        numproc=1,
                        number_of_full_nodes=None,
                        number_of_full_triangles=None,
-                       ghost_layer_width=2):
+                       ghost_layer_width=2,
+                       reorder=None,
+                       diagnostic_quantities=None):
 
         """Instantiate generic computational Domain.
 
@@ -68,9 +78,16 @@ class Generic_Domain:
                                 conservation equations
           evolved_quantities:   List of all quantities that evolve
           other_quantities:     List of other quantity names
+          diagnostic_quantities: Those other quantities derived from the
+                                 evolved ones (e.g. velocities). The rest
+                                 are static (e.g. elevation).
 
           tagged_elements:
           ...
+          reorder:   Renumber triangles and nodes for memory locality
+                     ('hilbert', 'morton' or 'rcm'). Defaults to
+                     anuga.config.mesh_reordering. Not available for
+                     parallel domains.
         """
         
         if verbose: log.critical('Domain: Initialising')
@@ -96,6 +113,26 @@ class Generic_Domain:
                                          use_cache=use_cache,
                                          verbose=verbose)
 
+        # Renumber triangles and nodes along a space filling curve or by RCM
+        from anuga.config import mesh_reordering
+        parallel = full_send_dict is not None or ghost_recv_dict is not None
+        if reorder is None and not parallel:
+            reorder = mesh_reordering
+
+        self.triangle_permutation = None
+        self.node_permutation = None
+        if reorder is not None:
+            msg = 'Mesh reordering is not supported for parallel domains'
+            assert not parallel, msg
+
+            if verbose: log.critical('Domain: Reordering mesh (%s)' % reorder)
+            coordinates, triangles, boundary, tagged_elements, \
+                         self.triangle_permutation, self.node_permutation = \
+                         reorder_mesh(coordinates, triangles,
+                                      boundary=boundary,
+                                      tagged_elements=tagged_elements,
+                                      method=reorder)
+
         # Initialise underlying mesh structure
         self.mesh = Mesh(coordinates, triangles,
                          boundary=boundary,
@@ -126,6 +163,15 @@ class Generic_Domain:
         self.radii = self.mesh.radii
         self.areas = self.mesh.areas
 
+        self.number_of_unique_edges = self.mesh.number_of_unique_edges
+        self.edge_left_cells = self.mesh.edge_left_cells
+        self.edge_left_edges = self.mesh.edge_left_edges
+        self.edge_right_cells = self.mesh.edge_right_cells
+        self.edge_right_edges = self.mesh.edge_right_edges
+        self.edge_normals = self.mesh.edge_normals
+        self.edge_lengths = self.mesh.edge_lengths
+        self.edge_index = self.mesh.edge_index
+
         self.number_of_boundaries = self.mesh.number_of_boundaries
         self.boundary_length = self.mesh.boundary_length
         self.tag_boundary_cells = self.mesh.tag_boundary_cells
@@ -160,6 +206,11 @@ class Generic_Domain:
         else:
             self.other_quantities = other_quantities
 
+        if diagnostic_quantities is None:
+            self.diagnostic_quantities = []
+        else:
+            self.diagnostic_quantities = diagnostic_quantities
+
         # Test that conserved_quantities are stored in the first entries of
         # evolved_quantities
         for i, quantity in enumerate(self.conserved_quantities):
@@ -174,10 +225,13 @@ class Generic_Domain:
 
         for name in self.evolved_quantities:
             #self.quantities[name] = Quantity(self, name=name)
-            Quantity(self, name=name, register=True)
+            Quantity(self, name=name, register=True, role='evolved')
         for name in self.other_quantities:
             #self.quantities[name] = Quantity(self, name=name)
-            Quantity(self, name=name , register=True)
+            if name in self.diagnostic_quantities:
+                Quantity(self, name=name , register=True, role='diagnostic')
+            else:
+                Quantity(self, name=name , register=True, role='static')
 
         # Create an empty list for forcing terms
         self.forcing_terms = []
@@ -324,6 +378,10 @@ class Generic_Domain:
 
         self.last_walltime = walltime()
 
+        # Wall clock counters of the phases of evolve
+        self.reset_timing_statistics()
+        self.timing_file = None
+
         # Monitoring
         self.quantities_to_be_monitored = None
         self.monitor_polygon = None
@@ -686,12 +744,19 @@ class Generic_Domain:
         value: Compatible list, numeric array, const or function (see below)
 
         The values will be stored in elements following their internal ordering.
+        Per node values are given in the original node numbering and are
+        permuted if the mesh has been reordered.
         """
 
         # FIXME: Could we name this a bit more intuitively
         # E.g. set_quantities_from_dictionary
         for key in quantity_dict.keys():
-            self.set_quantity(key, quantity_dict[key], location='vertices')
+            values = quantity_dict[key]
+            if self.node_permutation is not None:
+                values = num.array(values)
+                if values.shape == (self.number_of_nodes,):
+                    values = values[self.node_permutation]
+            self.set_quantity(key, values, location='vertices')
 
     def set_quantity(self, name,
                            *args, **kwargs):
@@ -1207,11 +1272,179 @@ class Generic_Domain:
 
         return msg
 
+    def reset_timing_statistics(self):
+        """Reset the wall clock counters of the phases of evolve
+        """
+
+        self.timing = dict([(phase, 0.0) for phase in timing_phases])
+        self.operator_timing = {}
+        self.evolve_walltime = 0.0
+        self.timing_steps = 0
+
+    def _record_timing(self, phase, t0):
+        """Add the wall clock time since t0 to the counter of phase and
+        return the current time
+        """
+
+        t1 = walltime()
+        self.timing[phase] += t1 - t0
+        return t1
+
+    def get_timing_statistics(self):
+        """Return dictionary of the cumulative wall clock times (s) spent
+        in evolve since the counters were last reset:
+
+        evolve:    total time
+        steps:     number of timesteps
+        phases:    time of each phase, with other the time not in any phase
+        operators: time of each fractional step operator by label
+        """
+
+        phases = dict(self.timing)
+
+        total = self.evolve_walltime + phases['storage'] + phases['checkpoint']
+        phases['other'] = max(total - sum(phases.values()), 0.0)
+
+        return {'evolve': total,
+                'steps': self.timing_steps,
+                'phases': phases,
+                'operators': dict(self.operator_timing)}
+
+    def timing_statistics(self):
+        """Return string with the wall clock times of the phases of evolve
+        """
+
+        stats = self.get_timing_statistics()
+        total = stats['evolve']
+
+        msg = 'Wall clock time %.3f s in %d steps:\n' % (total, stats['steps'])
+
+        phases = sorted(stats['phases'].items(), key=lambda x: -x[1])
+        for phase, seconds in phases:
+            if seconds > 0.0:
+                msg += '    %-16s %10.3f s %6.1f%%\n' \
+                       % (phase, seconds, 100.0*seconds/max(total, 1.0e-12))
+
+        if stats['operators']:
+            msg += 'Fractional step operators:\n'
+        for label, seconds in sorted(stats['operators'].items()):
+            msg += '    %-16s %10.3f s\n' % (label, seconds)
+
+        return msg.rstrip()
+
+    def print_timing_statistics(self):
+        print self.timing_statistics()
+
+    def set_timing_file(self, filename=None):
+        """Append the timing statistics (see get_timing_statistics) and
+        the model time to filename as a line of JSON at each yieldstep.
+        Parallel domains append _P<numproc>_<processor> to the name.
+        filename None switches this off.
+        """
+
+        import os
+
+        if filename is not None and self.numproc > 1:
+            root, ext = os.path.splitext(filename)
+            filename = root + '_P%d_%d' % (self.numproc, self.processor) + ext
+
+        self.timing_file = filename
+
+    def _stop_evolve_timing(self, evolve_start):
+        """Add the wall clock time since evolve_start to the evolve time
+        before yielding, and write the timing file if one is set
+        """
+
+        self.evolve_walltime += walltime() - evolve_start
+
+        if self.timing_file is not None:
+            self._write_timing_statistics()
+
+    def _write_timing_statistics(self):
+        """Append the timing statistics to the timing file
+        """
+
+        import json
+
+        stats = self.get_timing_statistics()
+        stats['time'] = self.get_time()
+
+        fid = open(self.timing_file, 'a')
+        fid.write(json.dumps(stats, sort_keys=True) + '\n')
+        fid.close()
+
     def print_timestepping_statistics(self, *args, **kwargs):
         print self.timestepping_statistics(self, *args, **kwargs)
 
 
         
+    def memory_report(self):
+        """Return string reporting the memory (MB) used by the arrays of
+        each quantity, the arrays its role does not need (so far not
+        allocated) and the largest arrays of the domain and mesh
+        """
+
+        from quantity import value_array_names
+
+        MB = 1024.0*1024.0
+        N = len(self)
+        L = self.boundary_length
+
+        msg = 'Memory report (MB):\n'
+        msg += '    %-12s %-10s %10s %12s  %s\n' % ('quantity', 'role',
+                                                 'allocated',
+                                                 'unallocated', 'arrays')
+
+        quantity_total = 0
+        unallocated_total = 0
+        for name in sorted(self.get_quantity_names()):
+            Q = self.quantities[name]
+            arrays = Q.get_allocated_arrays()
+            itemsize = Q.centroid_values.itemsize
+
+            unallocated = 0
+            for array_name in value_array_names:
+                if array_name in arrays:
+                    continue
+                if array_name in ['vertex_values', 'edge_values']:
+                    unallocated += 3*N*itemsize
+                elif array_name == 'boundary_values':
+                    unallocated += L*itemsize
+                else:
+                    unallocated += N*itemsize
+
+            allocated = sum(arrays.values())
+            quantity_total += allocated
+            unallocated_total += unallocated
+
+            msg += '    %-12s %-10s %10.2f %12.2f  %s\n' \
+                   % (name, Q.get_role(), allocated/MB, unallocated/MB,
+                      ', '.join(sorted(arrays.keys())))
+
+        # Arrays of the domain and mesh structures (each counted once)
+        structures = {}
+        for obj in [self, self.mesh]:
+            for key, value in obj.__dict__.items():
+                if isinstance(value, num.ndarray):
+                    structures.setdefault(id(value), (key, value.nbytes))
+
+        structures = sorted(structures.values(), key=lambda x: -x[1])
+        structure_total = sum([nbytes for key, nbytes in structures])
+
+        msg += '    %-23s %10.2f %12.2f\n' % ('quantities', quantity_total/MB,
+                                            unallocated_total/MB)
+        msg += '    %-23s %10.2f  (largest: %s)\n' \
+               % ('domain and mesh', structure_total/MB,
+                  ', '.join(['%s %.2f' % (key, nbytes/MB)
+                             for key, nbytes in structures[:5]]))
+        msg += '    %-23s %10.2f' % ('total',
+                                     (quantity_total + structure_total)/MB)
+
+        return msg
+
+    def print_memory_report(self):
+        print self.memory_report()
+
     def print_boundary_statistics(self, quantities=None, tags=None):
         print self.boundary_statistics(quantities, tags)
 
@@ -1657,12 +1890,17 @@ class Generic_Domain:
         self.number_of_first_order_steps = 0
 
 
+        # Wall clock time spent in evolve (excluding the yields)
+        evolve_start = t0 = walltime()
+
         # Update ghosts to ensure all centroid values are available
         self.update_ghosts()
+        t0 = self._record_timing('ghost_exchange', t0)
 
 
         # Update extrema if necessary (for reporting)
         self.update_extrema()
+        self._record_timing('extrema', t0)
         
 
 
@@ -1675,10 +1913,15 @@ class Generic_Domain:
             #==========================================
             # Assuming centroid values ok, calculate edge and vertes values
             #==========================================  
+            t0 = walltime()
             self.distribute_to_vertices_and_edges()
+            t0 = self._record_timing('extrapolation', t0)
             self.update_boundary()
+            self._record_timing('boundaries', t0)
             
+            self._stop_evolve_timing(evolve_start)
             yield(self.get_time())      # Yield initial values
+            evolve_start = walltime()
             
             
 
@@ -1701,7 +1944,9 @@ class Generic_Domain:
             #==========================================
             # Apply other fractional steps
             #==========================================
+            t0 = walltime()
             self.apply_fractional_steps()
+            t0 = self._record_timing('operators', t0)
 
             #==========================================
             # Centroid Values of variables should be ok,
@@ -1711,11 +1956,14 @@ class Generic_Domain:
             self.set_time(initial_time + self.timestep)
 
             self.update_ghosts()
+            t0 = self._record_timing('ghost_exchange', t0)
 
             # Update extrema (only uses centroid values)
             self.update_extrema()            
+            self._record_timing('extrema', t0)
 
             self.number_of_steps += 1
+            self.timing_steps += 1
 
             if self._order_ == 1:
                 self.number_of_first_order_steps += 1
@@ -1733,9 +1981,13 @@ class Generic_Domain:
 
                 # Distribute to vertices, Log and then Yield final time and stop
                 self.set_time(self.finaltime)
+                t0 = walltime()
                 self.distribute_to_vertices_and_edges()
+                t0 = self._record_timing('extrapolation', t0)
                 self.update_boundary()
+                self._record_timing('boundaries', t0)
                 self.log_operator_timestepping_statistics()
+                self._stop_evolve_timing(evolve_start)
                 yield(self.get_time())
                 break
 
@@ -1747,10 +1999,15 @@ class Generic_Domain:
                 #    self.delete_old_checkpoints()
 
                 # Log and then Pass control on to outer loop for more specific actions
+                t0 = walltime()
                 self.distribute_to_vertices_and_edges()
+                t0 = self._record_timing('extrapolation', t0)
                 self.update_boundary()
+                self._record_timing('boundaries', t0)
                 self.log_operator_timestepping_statistics()
+                self._stop_evolve_timing(evolve_start)
                 yield(self.get_time())
+                evolve_start = walltime()
 
                 # Reinitialise
                 self.yieldtime += yieldstep                 # move to next yield
@@ -1768,17 +2025,23 @@ class Generic_Domain:
         Does not assume that centroid values have been extrapolated to vertices and edges
         """
 
+        t0 = walltime()
+
         # From centroid values calculate edge and vertex values
         self.distribute_to_vertices_and_edges()
+        t0 = self._record_timing('extrapolation', t0)
             
         # Apply boundary conditions
         self.update_boundary()
+        t0 = self._record_timing('boundaries', t0)
         
         # Compute fluxes across each element edge
         self.compute_fluxes()
+        t0 = self._record_timing('fluxes', t0)
 
         # Compute forcing terms
         self.compute_forcing_terms()
+        t0 = self._record_timing('forcing_terms', t0)
 
         # Update timestep to fit yieldstep and finaltime
         self.update_timestep(yieldstep, finaltime)
@@ -1786,9 +2049,11 @@ class Generic_Domain:
         if self.max_flux_update_frequency is not 1:
             # Update flux_update_frequency using the new timestep
             self.compute_flux_update_frequency()
+        t0 = self._record_timing('timestep', t0)
 
         # Update conserved quantities
         self.update_conserved_quantities()
+        self._record_timing('update', t0)
 
 
 
@@ -1800,10 +2065,12 @@ class Generic_Domain:
         
         Does not assume that centroid values have been extrapolated to vertices and edges
         """
-        
+
+        t0 = walltime()
 
         # Save initial initial conserved quantities values
         self.backup_conserved_quantities()
+        t0 = self._record_timing('update', t0)
 
         ######
         # First euler step
@@ -1811,22 +2078,28 @@ class Generic_Domain:
         
         # From centroid values calculate edge and vertex values
         self.distribute_to_vertices_and_edges()
+        t0 = self._record_timing('extrapolation', t0)
             
         # Apply boundary conditions
         self.update_boundary()        
+        t0 = self._record_timing('boundaries', t0)
 
         # Compute fluxes across each element edge
         self.compute_fluxes()
+        t0 = self._record_timing('fluxes', t0)
 
         # Compute forcing terms
         self.compute_forcing_terms()
+        t0 = self._record_timing('forcing_terms', t0)
 
         # Update timestep to fit yieldstep and finaltime
         self.update_timestep(yieldstep, finaltime)
+        t0 = self._record_timing('timestep', t0)
         
 
         # Update centroid values of conserved quantities
         self.update_conserved_quantities()
+        t0 = self._record_timing('update', t0)
 
         # Update special conditions
         #self.update_special_conditions()
@@ -1837,12 +2110,15 @@ class Generic_Domain:
         # Update ghosts
         if self.ghost_layer_width < 4:
             self.update_ghosts()
+            t0 = self._record_timing('ghost_exchange', t0)
 
         # Update vertex and edge values
         self.distribute_to_vertices_and_edges()
+        t0 = self._record_timing('extrapolation', t0)
 
         # Update boundary values
         self.update_boundary()
+        t0 = self._record_timing('boundaries', t0)
 
         ######
         # Second Euler step using the same timestep
@@ -1853,12 +2129,15 @@ class Generic_Domain:
 
         # Compute fluxes across each element edge
         self.compute_fluxes()
+        t0 = self._record_timing('fluxes', t0)
 
         # Compute forcing terms
         self.compute_forcing_terms()
+        t0 = self._record_timing('forcing_terms', t0)
 
         # Update conserved quantities
         self.update_conserved_quantities()
+        t0 = self._record_timing('update', t0)
 
         ######
         # Combine initial and final values
@@ -1867,6 +2146,7 @@ class Generic_Domain:
 
         # Combine steps
         self.saxpy_conserved_quantities(0.5, 0.5)
+        self._record_timing('update', t0)
 
         # Update special conditions
         #self.update_special_conditions()
@@ -1883,8 +2163,11 @@ class Generic_Domain:
         Does not assume that centroid values have been extrapolated to vertices and edges
         """
 
+        t0 = walltime()
+
         # Save initial initial conserved quantities values
         self.backup_conserved_quantities()
+        t0 = self._record_timing('update', t0)
 
         initial_time = self.get_time()
 
@@ -1894,21 +2177,27 @@ class Generic_Domain:
 
         # From centroid values calculate edge and vertex values
         self.distribute_to_vertices_and_edges()
+        t0 = self._record_timing('extrapolation', t0)
             
         # Apply boundary conditions
         self.update_boundary() 
+        t0 = self._record_timing('boundaries', t0)
 
         # Compute fluxes across each element edge
         self.compute_fluxes()
+        t0 = self._record_timing('fluxes', t0)
 
         # Compute forcing terms
         self.compute_forcing_terms()
+        t0 = self._record_timing('forcing_terms', t0)
 
         # Update timestep to fit yieldstep and finaltime
         self.update_timestep(yieldstep, finaltime)
+        t0 = self._record_timing('timestep', t0)
 
         # Update conserved quantities
         self.update_conserved_quantities()
+        t0 = self._record_timing('update', t0)
 
         # Update special conditions
         #self.update_special_conditions()
@@ -1918,12 +2207,15 @@ class Generic_Domain:
 
         # Update ghosts
         self.update_ghosts()
+        t0 = self._record_timing('ghost_exchange', t0)
 
         # Update vertex and edge values
         self.distribute_to_vertices_and_edges()
+        t0 = self._record_timing('extrapolation', t0)
 
         # Update boundary values
         self.update_boundary()
+        t0 = self._record_timing('boundaries', t0)
 
         ######
         # Second Euler step using the same timestep
@@ -1934,12 +2226,15 @@ class Generic_Domain:
 
         # Compute fluxes across each element edge
         self.compute_fluxes()
+        t0 = self._record_timing('fluxes', t0)
 
         # Compute forcing terms
         self.compute_forcing_terms()
+        t0 = self._record_timing('forcing_terms', t0)
 
         # Update conserved quantities
         self.update_conserved_quantities()
+        t0 = self._record_timing('update', t0)
 
         ######
         # Combine steps to obtain intermediate
@@ -1948,6 +2243,7 @@ class Generic_Domain:
 
         # Combine steps
         self.saxpy_conserved_quantities(0.25, 0.75)
+        t0 = self._record_timing('update', t0)
 
         # Update special conditions
         #self.update_special_conditions()
@@ -1957,12 +2253,15 @@ class Generic_Domain:
 
         # Update ghosts
         self.update_ghosts()
+        t0 = self._record_timing('ghost_exchange', t0)
 
         # Update vertex and edge values
         self.distribute_to_vertices_and_edges()
+        t0 = self._record_timing('extrapolation', t0)
 
         # Update boundary values
         self.update_boundary()
+        t0 = self._record_timing('boundaries', t0)
 
         ######
         # Third Euler step
@@ -1970,12 +2269,15 @@ class Generic_Domain:
 
         # Compute fluxes across each element edge
         self.compute_fluxes()
+        t0 = self._record_timing('fluxes', t0)
 
         # Compute forcing terms
         self.compute_forcing_terms()
+        t0 = self._record_timing('forcing_terms', t0)
 
         # Update conserved quantities
         self.update_conserved_quantities()
+        t0 = self._record_timing('update', t0)
 
         ######
         # Combine final and initial values
@@ -1992,6 +2294,7 @@ class Generic_Domain:
         for name in self.conserved_quantities:
             Q = self.quantities[name]
             Q.centroid_values[:] = Q.centroid_values/3.0
+        self._record_timing('update', t0)
             
 
         # Update special conditions
@@ -2154,8 +2457,13 @@ class Generic_Domain:
     def apply_fractional_steps(self):
 
         for operator in self.fractional_step_operators:
+            t0 = walltime()
             operator()
 
+            label = getattr(operator, 'label', operator.__class__.__name__)
+            self.operator_timing[label] = \
+                self.operator_timing.get(label, 0.0) + walltime() - t0
+
 
     def log_operator_timestepping_statistics(self):
         for operator in self.fractional_step_operators:
@@ -0,0 +1,231 @@
+"""Cache friendly renumbering of triangles and nodes.
+
+The flux, extrapolation and update loops walk the triangles in index order
+and gather data from neighbouring triangles and nodes. Meshes coming from
+the mesh generator are numbered more or less randomly, so these gathers
+jump all over memory. Renumbering the triangles along a space filling
+curve (Hilbert or Morton) or by reverse Cuthill-McKee keeps neighbours
+close in memory.
+
+The main entry point is reorder_mesh which returns a renumbered copy of
+the mesh structures together with the permutations used, so that results
+can be mapped back to the original numbering:
+
+    new_triangle_id -> triangle_permutation[new_triangle_id] (original id)
+    new_node_id     -> node_permutation[new_node_id]         (original id)
+"""
+
+import numpy as num
+
+from anuga.utilities.numerical_tools import ensure_numeric
+
+reordering_methods = ['hilbert', 'morton', 'rcm']
+
+
+def _quantize(points, bits):
+    """Map points onto an integer grid of size 2**bits x 2**bits
+    """
+
+    points = ensure_numeric(points, num.float)
+
+    lower = num.min(points, axis=0)
+    extent = num.max(points, axis=0) - lower
+    extent = num.where(extent > 0.0, extent, 1.0)
+
+    n = 2**bits
+    ij = num.floor((points - lower)/extent*(n-1) + 0.5).astype(num.int64)
+
+    return num.clip(ij, 0, n-1)
+
+
+def hilbert_keys(points, bits=16):
+    """Return the distance of each point along a Hilbert curve
+    covering the bounding box of points.
+    """
+
+    ij = _quantize(points, bits)
+    x = ij[:,0].copy()
+    y = ij[:,1].copy()
+
+    n = 2**bits
+    d = num.zeros(len(x), num.int64)
+
+    s = n//2
+    while s > 0:
+        rx = ((x & s) > 0).astype(num.int64)
+        ry = ((y & s) > 0).astype(num.int64)
+        d += s*s*((3*rx) ^ ry)
+
+        # Rotate quadrant
+        flip = (ry == 0) & (rx == 1)
+        x[flip] = n-1 - x[flip]
+        y[flip] = n-1 - y[flip]
+
+        swap = (ry == 0)
+        x[swap], y[swap] = y[swap], x[swap].copy()
+
+        s = s//2
+
+    return d
+
+
+def _spread_bits(v):
+    """Insert a zero bit between each of the lower 32 bits of v
+    """
+
+    v = v.astype(num.uint64)
+    v = (v | (v << num.uint64(16))) & num.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << num.uint64(8))) & num.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << num.uint64(4))) & num.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << num.uint64(2))) & num.uint64(0x3333333333333333)
+    v = (v | (v << num.uint64(1))) & num.uint64(0x5555555555555555)
+
+    return v
+
+
+def morton_keys(points, bits=16):
+    """Return the position of each point along a Morton (Z order) curve
+    covering the bounding box of points.
+    """
+
+    ij = _quantize(points, bits)
+
+    return _spread_bits(ij[:,0]) | (_spread_bits(ij[:,1]) << num.uint64(1))
+
+
+def triangle_adjacency(triangles):
+    """Return arrays (i, j) of pairs of triangles sharing an edge
+    """
+
+    triangles = ensure_numeric(triangles, num.int)
+    M = triangles.shape[0]
+
+    edges = num.concatenate([triangles[:,[1,2]],
+                             triangles[:,[2,0]],
+                             triangles[:,[0,1]]])
+    edges.sort(axis=1)
+    owners = num.tile(num.arange(M), 3)
+
+    order = num.lexsort((edges[:,1], edges[:,0]))
+    edges = edges[order]
+    owners = owners[order]
+
+    shared = num.all(edges[1:] == edges[:-1], axis=1)
+
+    return owners[:-1][shared], owners[1:][shared]
+
+
+def rcm_order(triangles):
+    """Return the reverse Cuthill-McKee ordering of the triangle
+    adjacency graph. Requires scipy.
+    """
+
+    try:
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import reverse_cuthill_mckee
+    except ImportError:
+        msg = 'Reordering method rcm requires scipy'
+        raise Exception(msg)
+
+    M = len(triangles)
+    i, j = triangle_adjacency(triangles)
+
+    rows = num.concatenate([i, j])
+    cols = num.concatenate([j, i])
+    data = num.ones(len(rows), num.int)
+    graph = coo_matrix((data, (rows, cols)), shape=(M, M)).tocsr()
+
+    return num.array(reverse_cuthill_mckee(graph, symmetric_mode=True),
+                     num.int)
+
+
+def triangle_order(coordinates, triangles, method='hilbert'):
+    """Return the triangle permutation (new id -> original id)
+    for the given reordering method.
+    """
+
+    coordinates = ensure_numeric(coordinates, num.float)
+    triangles = ensure_numeric(triangles, num.int)
+
+    if method == 'rcm':
+        return rcm_order(triangles)
+
+    centroids = (coordinates[triangles[:,0]] +
+                 coordinates[triangles[:,1]] +
+                 coordinates[triangles[:,2]])/3.0
+
+    if method == 'hilbert':
+        keys = hilbert_keys(centroids)
+    elif method == 'morton':
+        keys = morton_keys(centroids)
+    else:
+        msg = 'Unknown reordering method %s. Use one of %s' \
+              % (method, reordering_methods)
+        raise Exception(msg)
+
+    return num.argsort(keys, kind='mergesort')
+
+
+def node_order(triangles, number_of_nodes):
+    """Return the node permutation (new id -> original id) numbering
+    nodes in order of first use by triangles. Nodes not used by any
+    triangle keep their relative order at the end.
+    """
+
+    triangles = ensure_numeric(triangles, num.int)
+
+    used = triangles.flatten()
+    first = num.zeros(number_of_nodes, num.int) + len(used)
+    # Reversed so that the first occurrence is the one that is kept
+    first[used[::-1]] = num.arange(len(used))[::-1]
+
+    return num.lexsort((num.arange(number_of_nodes), first))
+
+
+def reorder_mesh(coordinates, triangles, boundary=None,
+                 tagged_elements=None, method='hilbert'):
+    """Renumber triangles and nodes of a mesh for memory locality.
+
+    Return coordinates, triangles, boundary, tagged_elements,
+    triangle_permutation, node_permutation where the first four are the
+    renumbered mesh structures and the permutations map new ids to
+    original ids.
+    """
+
+    coordinates = ensure_numeric(coordinates, num.float)
+    triangles = ensure_numeric(triangles, num.int)
+
+    M = triangles.shape[0]
+    N = coordinates.shape[0]
+
+    triangle_permutation = triangle_order(coordinates, triangles, method)
+
+    new_triangle_id = num.zeros(M, num.int)
+    new_triangle_id[triangle_permutation] = num.arange(M)
+
+    # Vertex order within a triangle is unchanged so edge ids still hold
+    triangles = triangles[triangle_permutation]
+
+    node_permutation = node_order(triangles, N)
+
+    new_node_id = num.zeros(N, num.int)
+    new_node_id[node_permutation] = num.arange(N)
+
+    triangles = new_node_id[triangles]
+    coordinates = coordinates[node_permutation]
+
+    if boundary is not None:
+        new_boundary = {}
+        for (vol_id, edge_id), tag in boundary.items():
+            new_boundary[(int(new_triangle_id[vol_id]), edge_id)] = tag
+        boundary = new_boundary
+
+    if tagged_elements is not None:
+        new_tagged_elements = {}
+        for tag, elements in tagged_elements.items():
+            elements = new_triangle_id[ensure_numeric(elements, num.int)]
+            new_tagged_elements[tag] = elements.tolist()
+        tagged_elements = new_tagged_elements
+
+    return coordinates, triangles, boundary, tagged_elements, \
+           triangle_permutation, node_permutation
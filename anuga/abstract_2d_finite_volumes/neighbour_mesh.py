@@ -172,6 +172,10 @@ class Mesh(General_mesh):
         #Update boundary_enumeration
         self.build_boundary_neighbours()
 
+        #Build table of unique edges
+        if verbose: log.critical('Mesh: Building edge structure')
+        self.build_edge_structure()
+
         #Build tagged element  dictionary mapping (tag) to array of elements
         if verbose: log.critical('Mesh: Building tagged elements dictionary')
         self.build_tagged_elements_dictionary(tagged_elements)
@@ -564,6 +568,51 @@ class Mesh(General_mesh):
 
         #print self.tag_boundary_cells
 
+    def build_edge_structure(self):
+        """Build a table of the unique edges of the mesh, so that
+        computations over edges can visit each edge once.
+
+        An internal edge is shared by two triangles, and is stored once
+        with the lower numbered triangle on the left. Boundary edges are
+        stored with the (negative) boundary index, as used in neighbours,
+        as their right cell and -1 as their right edge. Edges are ordered
+        by their left triangle.
+
+        Precondition:
+            neighbours array has unique negative indices for boundary
+        Postconditions:
+            edge_left_cells, edge_left_edges, edge_right_cells,
+            edge_right_edges, edge_normals and edge_lengths are defined
+            with one entry per unique edge, and edge_index maps each
+            triangle edge (3*k+i) to its unique edge.
+        """
+
+        N = len(self) #Number of triangles
+
+        neighbours = self.neighbours.flatten()
+        cells = num.arange(3*N)//3
+
+        # Each edge is owned by its lower numbered triangle
+        owned = num.logical_or(neighbours < 0, cells < neighbours)
+        owned_edges = num.flatnonzero(owned)
+
+        self.number_of_unique_edges = len(owned_edges)
+
+        self.edge_left_cells = cells[owned_edges]
+        self.edge_left_edges = owned_edges % 3
+        self.edge_right_cells = neighbours[owned_edges]
+        self.edge_right_edges = num.where(self.edge_right_cells < 0, -1,
+                                   self.neighbour_edges.flatten()[owned_edges])
+        self.edge_normals = self.normals.reshape((3*N, 2))[owned_edges]
+        self.edge_lengths = self.edgelengths.flatten()[owned_edges]
+
+        # Triangle edges which are not owned point to the neighbour's edge
+        self.edge_index = -1*num.ones(3*N, num.int)
+        self.edge_index[owned_edges] = num.arange(self.number_of_unique_edges)
+        not_owned = num.flatnonzero(num.logical_not(owned))
+        self.edge_index[not_owned] = self.edge_index[3*neighbours[not_owned] +
+                                     self.neighbour_edges.flatten()[not_owned]]
+
     def get_boundary_tags(self):
         """Return list of available boundary tags
         """
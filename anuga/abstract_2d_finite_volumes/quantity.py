@@ -42,7 +42,8 @@ class Quantity:
 
     counter = 0
 
-    def __init__(self, domain, vertex_values=None, name=None, register=False):
+    def __init__(self, domain, vertex_values=None, name=None, register=False,
+                 role='static'):
         from anuga.abstract_2d_finite_volumes.generic_domain \
                             import Generic_Domain
 
@@ -51,10 +52,22 @@ class Quantity:
                % (str(Generic_Domain.__name__),str(domain.__class__)))
         assert isinstance(domain, Generic_Domain), msg
 
-        if vertex_values is None:
-            N = len(domain)             # number_of_elements
-            self.vertex_values = num.zeros((N, 3), num.float)
-        else:
+        msg = 'Role of a quantity must be one of %s' % str(quantity_roles.keys())
+        assert role in quantity_roles, msg
+
+        self.domain = domain
+        self.role = role
+
+        N = len(domain)             # number_of_elements
+        self.boundary_length = self.domain.boundary_length
+
+        # Allocate the arrays needed by the role of the quantity. Other
+        # arrays are allocated on first access (see __getattr__)
+        self.centroid_values = num.zeros(N, num.float)
+        for array_name in quantity_roles[role]:
+            getattr(self, array_name)
+
+        if vertex_values is not None:
             self.vertex_values = num.array(vertex_values, num.float)
 
             N, V = self.vertex_values.shape
@@ -64,34 +77,8 @@ class Quantity:
             msg += 'number of elements in specified domain (%d).' % len(domain)
             assert N == len(domain), msg
 
-        self.domain = domain
-
-        # Allocate space for other quantities
-        self.centroid_values = num.zeros(N, num.float)
-        self.edge_values = num.zeros((N, 3), num.float)
-
-        # Allocate space for Gradient
-        self.x_gradient = num.zeros(N, num.float)
-        self.y_gradient = num.zeros(N, num.float)
-
-        # Allocate space for Limiter Phi
-        self.phi = num.zeros(N, num.float)
-
-        # Intialise centroid and edge_values
-        self.interpolate()
-
-        # Allocate space for boundary values
-        #self.boundary_length = domain.boundary_length
-        self.boundary_length = L = self.domain.boundary_length
-        self.boundary_values = num.zeros(L, num.float)
-
-        # Allocate space for updates of conserved quantities by
-        # flux calculations and forcing functions
-
-        # Allocate space for update fields
-        self.explicit_update = num.zeros(N, num.float )
-        self.semi_implicit_update = num.zeros(N, num.float )
-        self.centroid_backup_values = num.zeros(N, num.float)
+            # Intialise centroid and edge_values
+            self.interpolate()
 
         self.set_beta(1.0)
 
@@ -104,6 +91,43 @@ class Quantity:
         if register:
             self.domain.quantities[self.name] = self
 
+    def __getattr__(self, name):
+        """Allocate arrays not needed by the role of the quantity when
+        they are first used
+        """
+
+        if name not in value_array_names or \
+               'centroid_values' not in self.__dict__:
+            raise AttributeError(name)
+
+        N = len(self.centroid_values)
+        dtype = self.centroid_values.dtype
+
+        if name in ['vertex_values', 'edge_values']:
+            values = num.zeros((N, 3), dtype)
+        elif name == 'boundary_values':
+            values = num.zeros(self.boundary_length, dtype)
+        else:
+            values = num.zeros(N, dtype)
+
+        setattr(self, name, values)
+        return values
+
+    def get_role(self):
+        """Return the role of the quantity, one of evolved, static or
+        diagnostic
+        """
+
+        return self.role
+
+    def get_allocated_arrays(self):
+        """Return dictionary of the number of bytes of each allocated
+        array of the quantity
+        """
+
+        return dict([(name, self.__dict__[name].nbytes)
+                     for name in value_array_names if name in self.__dict__])
+
     ############################################################################
     # Methods for operator overloading
     ############################################################################
@@ -681,20 +705,23 @@ class Quantity:
         Pre-condition: vertex_values have been set
         """
         from quantity_ext import interpolate
-        interpolate(self)
+        _in_double_precision(interpolate, ['vertex_values'],
+                             ['edge_values', 'centroid_values'])(self)
 
 
     def interpolate_from_vertices_to_edges(self):
         # Call correct module function (either from this module or C-extension)
 
         from quantity_ext import interpolate_from_vertices_to_edges
-        interpolate_from_vertices_to_edges(self)
+        _in_double_precision(interpolate_from_vertices_to_edges,
+                             ['vertex_values'], ['edge_values'])(self)
 
     def interpolate_from_edges_to_vertices(self):
         # Call correct module function (either from this module or C-extension)
 
         from quantity_ext import interpolate_from_edges_to_vertices
-        interpolate_from_edges_to_vertices(self)
+        _in_double_precision(interpolate_from_edges_to_vertices,
+                             ['edge_values'], ['vertex_values'])(self)
 
     #---------------------------------------------
     # Public interface for setting quantity values
@@ -2050,12 +2077,12 @@ class Quantity:
                 if self.domain.get_using_discontinuous_elevation():
                     average_centroid_values(ensure_numeric(self.domain.vertex_value_indices),
                                       ensure_numeric(self.domain.number_of_triangles_per_node),
-                                      ensure_numeric(self.centroid_values),
+                                      ensure_numeric(self.centroid_values, num.float),
                                       A)
                 else:
                     average_vertex_values(ensure_numeric(self.domain.vertex_value_indices),
                                       ensure_numeric(self.domain.number_of_triangles_per_node),
-                                      ensure_numeric(self.vertex_values),
+                                      ensure_numeric(self.vertex_values, num.float),
                                       A)
                 A = A.astype(precision)
             else:
@@ -2232,12 +2259,33 @@ class Quantity:
     def backup_centroid_values(self):
         # Call correct module function
         # (either from this module or C-extension)
-        backup_centroid_values(self)
+        if self.centroid_values.dtype == num.float64:
+            backup_centroid_values(self)
+        else:
+            self.centroid_backup_values[:] = self.centroid_values
 
     def saxpy_centroid_values(self, a, b):
         # Call correct module function
         # (either from this module or C-extension)
-        saxpy_centroid_values(self, a, b)
+        if self.centroid_values.dtype == num.float64:
+            saxpy_centroid_values(self, a, b)
+        else:
+            self.centroid_values[:] = a*self.centroid_values + \
+                                      b*self.centroid_backup_values
+
+    def set_precision(self, dtype):
+        """Store the values, gradients and updates of this quantity
+        as arrays of floating point type dtype (num.float32 or num.float64)
+        """
+
+        for name in self.get_allocated_arrays().keys():
+            setattr(self, name, getattr(self, name).astype(dtype))
+
+    def get_precision(self):
+        """Return the floating point type of the values of this quantity
+        """
+
+        return self.centroid_values.dtype
 
 
 class Conserved_quantity(Quantity):
@@ -2248,6 +2296,76 @@ class Conserved_quantity(Quantity):
         raise Exception(msg)
 
 
+# Arrays of a quantity that follow its precision
+value_array_names = ['vertex_values', 'centroid_values', 'edge_values',
+                     'x_gradient', 'y_gradient', 'phi', 'boundary_values',
+                     'explicit_update', 'semi_implicit_update',
+                     'centroid_backup_values']
+
+# Arrays allocated with a quantity of each role. Evolved quantities are
+# updated by the numerical scheme, static ones (e.g. elevation, friction)
+# are only set by the user and diagnostic ones (e.g. velocities) are
+# derived from the evolved quantities.
+quantity_roles = {'evolved': value_array_names,
+                  'static': ['vertex_values', 'centroid_values', 'edge_values'],
+                  'diagnostic': ['centroid_values']}
+
+
+def _in_double_precision(function, inputs, outputs, argument_inputs=()):
+    """Wrap a quantity_ext function, which works on float64 arrays only,
+    so that it can also be applied to single precision quantities.
+
+    Only the arrays used by the function are copied to float64 for the
+    call: inputs are only read, outputs are (also) written and copied back
+    afterwards. argument_inputs are the arrays read from a quantity passed
+    as the first extra argument.
+    """
+
+    arrays = list(inputs) + [name for name in outputs if name not in inputs]
+
+    def double_precision_function(quantity, *args):
+        if quantity.centroid_values.dtype == num.float64:
+            return function(quantity, *args)
+
+        dtype = quantity.centroid_values.dtype
+        allocated = quantity.get_allocated_arrays().keys()
+
+        old_values = [getattr(quantity, name) for name in arrays]
+        for name, values in zip(arrays, old_values):
+            setattr(quantity, name, values.astype(num.float64))
+
+        if argument_inputs and args[0].centroid_values.dtype != num.float64:
+            other = args[0]
+            other_values = [getattr(other, name) for name in argument_inputs]
+            for name, values in zip(argument_inputs, other_values):
+                setattr(other, name, values.astype(num.float64))
+        else:
+            other = None
+
+        try:
+            return function(quantity, *args)
+        finally:
+            for name, values in zip(arrays, old_values):
+                if name in outputs:
+                    values[:] = getattr(quantity, name)
+                setattr(quantity, name, values)
+
+            if other is not None:
+                for name, values in zip(argument_inputs, other_values):
+                    setattr(other, name, values)
+
+            # Arrays allocated by the call
+            for name in quantity.get_allocated_arrays().keys():
+                if name not in arrays and name not in allocated:
+                    setattr(quantity, name,
+                            getattr(quantity, name).astype(dtype))
+
+    double_precision_function.__name__ = function.__name__
+    double_precision_function.__doc__ = function.__doc__
+
+    return double_precision_function
+
+
 ######
 # Prepare the C extensions.
 ######
@@ -2272,3 +2390,49 @@ from quantity_ext import \
          interpolate_from_edges_to_vertices,\
          set_vertex_values_c, \
          update
+
+# Arrays read and written by each function
+_gradients = ['x_gradient', 'y_gradient']
+_limited = ['vertex_values', 'edge_values'] + _gradients
+
+compute_gradients = _in_double_precision(compute_gradients,
+         ['centroid_values'], _gradients)
+compute_local_gradients = _in_double_precision(compute_local_gradients,
+         ['vertex_values'], _gradients)
+limit_old = _in_double_precision(limit_old,
+         ['centroid_values'], ['vertex_values'])
+limit_vertices_by_all_neighbours = \
+         _in_double_precision(limit_vertices_by_all_neighbours,
+                              ['centroid_values'], _limited)
+limit_edges_by_all_neighbours = \
+         _in_double_precision(limit_edges_by_all_neighbours,
+                              ['centroid_values'], _limited)
+limit_edges_by_neighbour = _in_double_precision(limit_edges_by_neighbour,
+         ['centroid_values'], ['vertex_values', 'edge_values'])
+limit_gradient_by_neighbour = _in_double_precision(limit_gradient_by_neighbour,
+         ['centroid_values'], _limited)
+extrapolate_from_gradient = _in_double_precision(extrapolate_from_gradient,
+         ['centroid_values'] + _gradients, ['vertex_values', 'edge_values'])
+extrapolate_second_order_and_limit_by_edge = \
+         _in_double_precision(extrapolate_second_order_and_limit_by_edge,
+                              ['centroid_values'], _limited + ['phi'])
+extrapolate_second_order_and_limit_by_vertex = \
+         _in_double_precision(extrapolate_second_order_and_limit_by_vertex,
+                              ['centroid_values'], _limited + ['phi'])
+bound_vertices_below_by_constant = \
+         _in_double_precision(bound_vertices_below_by_constant,
+                              ['centroid_values'], _limited)
+bound_vertices_below_by_quantity = \
+         _in_double_precision(bound_vertices_below_by_quantity,
+                              ['centroid_values'], _limited,
+                              argument_inputs=['vertex_values'])
+interpolate_from_vertices_to_edges = \
+         _in_double_precision(interpolate_from_vertices_to_edges,
+                              ['vertex_values'], ['edge_values'])
+interpolate_from_edges_to_vertices = \
+         _in_double_precision(interpolate_from_edges_to_vertices,
+                              ['edge_values'], ['vertex_values'])
+set_vertex_values_c = _in_double_precision(set_vertex_values_c,
+         [], ['vertex_values'])
+update = _in_double_precision(update,
+         ['explicit_update'], ['centroid_values', 'semi_implicit_update'])
@@ -191,9 +191,76 @@ class Test_Generic_Boundary_Conditions(unittest.TestCase):
 
 
         q = T.evaluate(1, 1)  #Vol=1, edge=1
-        assert num.allclose(q, domain.get_edge_midpoint_coordinate(1,1))        
+        assert num.allclose(q, domain.get_edge_midpoint_coordinate(1,1))
 
 
+    def test_time_space_boundary_tabulated(self):
+
+        a = [0.0, 0.0]
+        b = [0.0, 2.0]
+        c = [2.0,0.0]
+        d = [0.0, 4.0]
+        e = [2.0, 2.0]
+        f = [4.0,0.0]
+
+        points = [a, b, c, d, e, f]
+
+        #bac, bce, ecf, dbe
+        elements = [ [1,0,2], [1,2,4], [4,2,5], [3,1,4] ]
+
+        domain = Generic_Domain(points, elements)
+
+        domain.conserved_quantities = ['stage', 'ymomentum']
+        domain.evolved_quantities = ['stage', 'ymomentum']
+        domain.quantities['stage'] = Quantity(domain)
+        domain.quantities['ymomentum'] = Quantity(domain)
+
+        # Linear in time so tabulation is exact
+        def function(t,x,y):
+            return [x + 2*t, y - t]
+
+        def time_function(t):
+            return [2*t, -t]
+
+        time_grid = [0.0, 1.0, 2.5, 4.0]
+        T = Time_space_boundary(domain, function, time_grid=time_grid)
+        B = Time_boundary(domain, time_function, time_grid=time_grid)
+
+        from anuga.config import default_boundary_tag
+        domain.set_boundary( {default_boundary_tag: T} )
+
+        ids = num.arange(len(domain.boundary_cells))
+        E = T.get_segment_midpoints(domain, ids)
+        for t in [0.0, 0.3, 1.0, 3.7, 4.0]:
+            domain.set_time(t)
+            domain.update_boundary()
+
+            assert num.allclose(domain.quantities['stage'].boundary_values,
+                                E[:,0] + 2*t)
+            assert num.allclose(domain.quantities['ymomentum'].boundary_values,
+                                E[:,1] - t)
+
+            assert num.allclose(B.evaluate(), time_function(t))
+
+        # Every edge is tabulated exactly once
+        assert T.table.shape == (len(time_grid), len(ids), 2)
+
+        # Outside the time grid without a default boundary
+        domain.set_time(4.5)
+        try:
+            domain.update_boundary()
+        except:
+            pass
+        else:
+            raise Exception('Should have raised exception')
+
+        try:
+            B.evaluate()
+        except Modeltime_too_late:
+            pass
+        else:
+            raise Exception('Should have raised exception')
+
 
 
 
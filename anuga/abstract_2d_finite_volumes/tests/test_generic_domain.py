@@ -56,6 +56,27 @@ class Test_Domain(unittest.TestCase):
 
 
 
+    def test_memory_report(self):
+        points, vertices, boundary = anuga.rectangular_cross(4, 4)
+
+        domain = Generic_Domain(points, vertices, boundary,
+                                ['stage'], ['stage'],
+                                ['elevation', 'velocity'],
+                                diagnostic_quantities=['velocity'])
+
+        assert domain.quantities['stage'].get_role() == 'evolved'
+        assert domain.quantities['elevation'].get_role() == 'static'
+        assert domain.quantities['velocity'].get_role() == 'diagnostic'
+
+        assert 'explicit_update' in \
+               domain.quantities['stage'].get_allocated_arrays()
+        assert 'explicit_update' not in \
+               domain.quantities['elevation'].get_allocated_arrays()
+
+        report = domain.memory_report()
+        for name in ['stage', 'elevation', 'velocity', 'total']:
+            assert name in report
+
     def test_CFL(self):
         a = [0.0, 0.0]
         b = [0.0, 2.0]
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+
+import anuga
+import numpy as num
+
+from anuga.abstract_2d_finite_volumes.mesh_reordering import *
+from anuga.file.netcdf import NetCDFFile
+
+
+class Test_Mesh_Reordering(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        for filename in ['reordered.sww']:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+    def test_hilbert_keys(self):
+        # First order Hilbert curve visits the corners of a square
+        points = [[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0]]
+
+        keys = hilbert_keys(points, bits=1)
+        assert num.allclose(keys, [0, 3, 2, 1])
+
+    def test_morton_keys(self):
+        points = [[0.0, 0.0], [1.0, 0.0], [0.0, 1.0], [1.0, 1.0]]
+
+        keys = morton_keys(points, bits=1)
+        assert num.allclose(keys.astype(num.int), [0, 1, 2, 3])
+
+    def test_reorder_mesh(self):
+        points, vertices, boundary = anuga.rectangular_cross(5, 4)
+        points = num.array(points)
+        vertices = num.array(vertices)
+
+        tagged_elements = {'first': [0, 3, 7], 'empty': []}
+
+        for method in reordering_methods:
+            new_points, new_vertices, new_boundary, new_tagged_elements, \
+                tri_perm, node_perm = \
+                reorder_mesh(points, vertices, boundary,
+                             tagged_elements, method=method)
+
+            M = len(vertices)
+            N = len(points)
+            assert num.allclose(num.sort(tri_perm), num.arange(M))
+            assert num.allclose(num.sort(node_perm), num.arange(N))
+
+            # Same triangles, vertex by vertex
+            assert num.allclose(new_points[new_vertices],
+                                points[vertices[tri_perm]])
+
+            new_id = num.argsort(tri_perm)
+            for (vol_id, edge_id), tag in boundary.items():
+                assert new_boundary[(new_id[vol_id], edge_id)] == tag
+            assert len(new_boundary) == len(boundary)
+
+            assert num.allclose(tri_perm[new_tagged_elements['first']],
+                                [0, 3, 7])
+            assert new_tagged_elements['empty'] == []
+
+            # Same number of interior edges
+            i, j = triangle_adjacency(new_vertices)
+            k, l = triangle_adjacency(vertices)
+            assert len(i) == len(k)
+
+    def test_reorder_shuffled_mesh(self):
+        points, vertices, boundary = anuga.rectangular_cross(10, 10)
+        points = num.array(points)
+
+        # Scramble the triangle numbering
+        shuffle = num.random.RandomState(13).permutation(len(vertices))
+        vertices = num.array(vertices)[shuffle]
+
+        i, j = triangle_adjacency(vertices)
+        scrambled_gap = num.mean(num.abs(i-j))
+
+        for method in reordering_methods:
+            new_points, new_vertices, _, _, _, node_perm = \
+                reorder_mesh(points, vertices, method=method)
+
+            # Neighbouring triangles are numbered close together
+            i, j = triangle_adjacency(new_vertices)
+            assert num.mean(num.abs(i-j)) < scrambled_gap/4
+
+            # Nodes are numbered in order of first use
+            first_use = num.unique(new_vertices.flatten(), return_index=True)[1]
+            assert num.all(num.diff(first_use) > 0)
+
+    def test_reordered_domain(self):
+        points, vertices, boundary = anuga.rectangular_cross(8, 6,
+                                                             len1=8.0,
+                                                             len2=6.0)
+
+        def topography(x, y):
+            return -x/10.0 + 0.05*y
+
+        def stage(x, y):
+            return num.where(x < 3.0, 0.2, -0.5)
+
+        domains = []
+        for reorder in [None, 'hilbert']:
+            domain = anuga.Domain(points, vertices, boundary,
+                                  reorder=reorder)
+            domain.set_name('reordered')
+            domain.set_store(reorder is not None)
+            domain.set_quantity('elevation', topography)
+            domain.set_quantity('stage', stage)
+
+            Br = anuga.Reflective_boundary(domain)
+            domain.set_boundary({'left': Br, 'right': Br,
+                                 'top': Br, 'bottom': Br})
+
+            for t in domain.evolve(yieldstep=0.5, finaltime=1.0):
+                pass
+
+            domains.append(domain)
+
+        domain, reordered = domains
+
+        assert domain.triangle_permutation is None
+        perm = reordered.triangle_permutation
+
+        assert num.allclose(reordered.centroid_coordinates,
+                            domain.centroid_coordinates[perm])
+        assert num.allclose(reordered.nodes,
+                            domain.nodes[reordered.node_permutation])
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            assert num.allclose(
+                reordered.quantities[name].centroid_values,
+                domain.quantities[name].centroid_values[perm])
+
+        fid = NetCDFFile('reordered.sww')
+        assert num.allclose(fid.variables['tri_permutation'][:], perm)
+        assert num.allclose(fid.variables['node_permutation'][:],
+                            reordered.node_permutation)
+        fid.close()
+
+    def test_reorder_parallel_domain(self):
+        points, vertices, boundary = anuga.rectangular_cross(2, 2)
+
+        try:
+            anuga.Domain(points, vertices, boundary,
+                         full_send_dict={}, ghost_recv_dict={},
+                         reorder='rcm')
+        except AssertionError:
+            pass
+        else:
+            msg = 'Reordering a parallel domain should raise an error'
+            raise Exception(msg)
+
+
+#-------------------------------------------------------------
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_Mesh_Reordering, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
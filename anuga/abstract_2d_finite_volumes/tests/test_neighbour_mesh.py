@@ -524,6 +524,44 @@ class Test_Mesh(unittest.TestCase):
         assert T.surrogate_neighbours[tid, 1] == tid
         assert T.surrogate_neighbours[tid, 2] == tid
 
+    def test_edge_structure(self):
+        a = [0.0, 0.0]
+        b = [0.0, 2.0]
+        c = [2.0,0.0]
+        d = [0.0, 4.0]
+        e = [2.0, 2.0]
+        f = [4.0,0.0]
+
+        points = [a, b, c, d, e, f]
+
+        #bac, bce, ecf, dbe
+        vertices = [ [1,0,2], [1,2,4], [4,2,5], [3,1,4] ]
+        mesh = Mesh(points, vertices)
+
+        # 12 triangle edges, 3 of which are shared
+        assert mesh.number_of_unique_edges == 9
+
+        assert num.allclose(mesh.edge_left_cells, [0, 0, 0, 1, 1, 2, 2, 3, 3])
+        assert num.allclose(mesh.edge_left_edges, [0, 1, 2, 0, 1, 0, 1, 1, 2])
+        assert num.allclose(mesh.edge_right_edges, [-1, 2, -1, 2, 0, -1, -1, -1, -1])
+
+        for j in range(mesh.number_of_unique_edges):
+            k = mesh.edge_left_cells[j]
+            i = mesh.edge_left_edges[j]
+            n = mesh.edge_right_cells[j]
+
+            assert n == mesh.neighbours[k, i]
+            if n >= 0:
+                assert k < n
+                assert mesh.edge_index[3*n + mesh.edge_right_edges[j]] == j
+            assert mesh.edge_index[3*k + i] == j
+
+            assert num.allclose(mesh.edge_normals[j], mesh.normals[k, 2*i:2*i+2])
+            assert num.allclose(mesh.edge_lengths[j], mesh.edgelengths[k, i])
+
+        # Every triangle edge is in the table
+        assert num.all(mesh.edge_index >= 0)
+
 
     def test_boundary_inputs(self):
         a = [0.0, 0.0]
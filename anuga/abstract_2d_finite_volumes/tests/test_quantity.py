@@ -147,6 +147,43 @@ class Test_Quantity(unittest.TestCase):
         assert num.allclose(quantity.vertex_values, [[0., 0., 0.], [0., 0., 0.],
                                                      [0., 0., 0.], [0., 0., 0.]])
 
+    def test_lazy_allocation(self):
+
+        quantity = Quantity(self.mesh4, role='diagnostic')
+        assert quantity.get_role() == 'diagnostic'
+        assert quantity.get_allocated_arrays().keys() == ['centroid_values']
+
+        # Other arrays are allocated on first access
+        assert num.allclose(quantity.explicit_update, [0., 0., 0., 0.])
+        assert quantity.vertex_values.shape == (4, 3)
+        assert quantity.boundary_values.shape == (self.mesh4.boundary_length,)
+        quantity.vertex_values[:] = 1.0
+        assert num.allclose(quantity.vertex_values, 1.0)
+
+        allocated = quantity.get_allocated_arrays()
+        assert sorted(allocated.keys()) == ['boundary_values',
+                                            'centroid_values',
+                                            'explicit_update',
+                                            'vertex_values']
+        assert allocated['vertex_values'] == 4*3*8
+
+        # Including by the C extensions
+        quantity.set_values(2.0, location='centroids')
+        quantity.extrapolate_second_order()
+        assert num.allclose(quantity.edge_values, 2.0)
+        assert num.allclose(quantity.x_gradient, 0.0)
+
+        quantity = Quantity(self.mesh4, role='evolved')
+        assert sorted(quantity.get_allocated_arrays().keys()) == \
+               sorted(value_array_names)
+
+        try:
+            quantity.no_such_array
+        except AttributeError:
+            pass
+        else:
+            raise Exception('Should have raised AttributeError')
+
     def test_set_boundary_values(self):
 
         quantity = Quantity(self.mesh1)
@@ -2787,6 +2824,35 @@ class Test_Quantity(unittest.TestCase):
                             exact_centroid_values)  # Centroid
         assert num.allclose(quantity.edge_values, exact_edge_values)
 
+    def test_single_precision_kernels(self):
+        values = [[1, 2, 3], [5, 5, 5], [0, 0, 9], [-6, 3, 3]]
+
+        quantity1 = Quantity(self.mesh4, values)
+        quantity2 = Quantity(self.mesh4, values)
+        quantity2.set_precision(num.float32)
+
+        bound1 = Quantity(self.mesh4, [[1.5]*3, [4.5]*3, [2.0]*3, [-1.0]*3])
+        bound2 = Quantity(self.mesh4, bound1.vertex_values)
+        bound2.set_precision(num.float32)
+
+        for quantity, bound in [(quantity1, bound1), (quantity2, bound2)]:
+            quantity.bound_vertices_below_by_quantity(bound)
+            quantity.interpolate_from_vertices_to_edges()
+            quantity.compute_gradients()
+            quantity.explicit_update[:] = [1.0, 2.0, 3.0, 4.0]
+            quantity.semi_implicit_update[:] = [1.0, 0.0, -1.0, 0.0]
+            quantity.update(0.1)
+
+        for name in ['centroid_values', 'vertex_values', 'edge_values',
+                     'x_gradient', 'y_gradient', 'semi_implicit_update']:
+            A1 = getattr(quantity1, name)
+            A2 = getattr(quantity2, name)
+            assert A2.dtype == num.float32
+            assert num.allclose(A1, A2)
+
+        assert num.allclose(quantity1.vertex_values[0], [1.5, 2.0, 2.5])
+        assert bound2.vertex_values.dtype == num.float32
+
 
 #-------------------------------------------------------------
 
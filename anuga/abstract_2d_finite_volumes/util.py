@@ -37,11 +37,15 @@ def file_function(filename,
                   verbose=False,
                   use_cache=False,
                   boundary_polygon=None,
-                  output_centroids=False):
+                  output_centroids=False,
+                  streaming=False,
+                  block_size=1,
+                  prefetch=False):
     from file_function import file_function as file_function_new
     return file_function_new(filename, domain, quantities, interpolation_points,
                       time_thinning, time_limit, verbose, use_cache,
-                      boundary_polygon, output_centroids)
+                      boundary_polygon, output_centroids, streaming,
+                      block_size, prefetch)
 
 
 
@@ -205,6 +205,19 @@ use_psyco = False      # Use psyco optimisations
 optimise_dry_cells = True # Exclude dry and still cells from flux computation
 optimised_gradient_limiter = True # Use hardwired gradient limiter
 
+omp_num_threads = 1 # Number of OpenMP threads used by the DE algorithms
+use_edge_flux_loop = False # Compute DE fluxes with a loop over unique edges
+use_active_cells = False # Restrict the DE kernels to wet cells and their neighbours
+use_fused_rk2_step = False # Run the DE rk2 timesteps in a single C call
+use_c_boundaries = True # Apply the built-in boundaries of DE domains in C
+multirate_levels = 0 # Number of multi-rate local timestepping levels for DE0
+                     # (triangle timesteps up to 2**multirate_levels times
+                     # the smallest one)
+precision = 'double' # Floating point precision ('single' or 'double') of
+                     # the DE conserved quantities
+mesh_reordering = None # Renumber triangles and nodes at domain construction
+                       # for memory locality ('hilbert', 'morton' or 'rcm')
+
 points_file_block_line_size = 1e6 # Number of lines read in from a points file
                                   # when blocking
 
@@ -22,9 +22,14 @@ precision = netcdf_float # So if we want to change the precision its done here
 
 
 
-def NetCDFFile(file_name, netcdf_mode=netcdf_mode_r):
+def NetCDFFile(file_name, netcdf_mode=netcdf_mode_r, netcdf_format=None):
     """Wrapper to isolate changes of the netcdf libray.
 
+    netcdf_format is the format of new files, 'NETCDF3_64BIT' by
+    default. 'NETCDF4' creates HDF5 based files which allow compressed
+    and chunked variables (requires netCDF4). Existing files are read
+    and appended to in whatever format they are.
+
     In theory we should be able to change over to NetCDF4 via this
     wrapper, by ensuring the interface to the NetCDF library isthe same as the
     the old Scientific.IO.NetCDF library.
@@ -52,14 +57,20 @@ def NetCDFFile(file_name, netcdf_mode=netcdf_mode_r):
 
     assert using_scientific or using_netcdf4
 
+    if netcdf_format is None:
+        netcdf_format = 'NETCDF3_64BIT'
+
     if using_scientific:
+        if netcdf_format.startswith('NETCDF4'):
+            msg = 'NetCDF format %s requires the netCDF4 module' % netcdf_format
+            raise Exception(msg)
         return NetCDFFile(file_name, netcdf_mode)
 
     if using_netcdf4:
         if netcdf_mode == 'wl' :
-            return Dataset(file_name, 'w', format='NETCDF3_64BIT')
+            return Dataset(file_name, 'w', format=netcdf_format)
         else:
-            return Dataset(file_name, netcdf_mode, format='NETCDF3_64BIT')
+            return Dataset(file_name, netcdf_mode, format=netcdf_format)
 
 
 
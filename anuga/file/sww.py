@@ -8,6 +8,12 @@ class NewQuantity(exceptions.Exception): pass
 class DataDomainError(exceptions.Exception): pass
 class DataTimeError(exceptions.Exception): pass
 
+import os
+import sys
+import copy
+import threading
+import Queue
+
 import numpy
 from anuga.coordinate_transforms.geo_reference import Geo_reference
 from anuga.config import netcdf_mode_r, netcdf_mode_w, netcdf_mode_a
@@ -27,6 +33,15 @@ from anuga.coordinate_transforms.geo_reference import \
 from anuga.utilities.file_utils import create_filename
 import numpy as num
 
+
+# Chunks of the time dependent quantities of NETCDF4 sww files hold up to
+# max_frames_per_chunk timesteps of a block of points of about chunk_size
+# bytes. A timestep is written into all the chunks of a row, which should
+# fit in the netCDF chunk cache (4MB per variable by default).
+chunk_size = 2**20
+chunk_cache_size = 2**22
+max_frames_per_chunk = 64
+
 class Data_format:
     """Generic interface to data formats
     """
@@ -87,9 +102,22 @@ class SWW_file(Data_format):
         else:
             self.minimum_storable_height = default_minimum_storable_height
 
+        if hasattr(domain, 'sww_format'):
+            self.format = domain.sww_format
+            self.compression = domain.sww_compression
+        else:
+            self.format = 'NETCDF3_64BIT'
+            self.compression = None
+
         # Call parent constructor
         Data_format.__init__(self, domain, 'sww', mode)
 
+        # File held open by open(), with its background writer
+        self.fid = None
+        self.frames = None
+        self.write_thread = None
+        self.write_error = None
+
         # Get static and dynamic quantities from domain
         static_quantities = []
         dynamic_quantities = []
@@ -114,7 +142,7 @@ class SWW_file(Data_format):
 
 
         # NetCDF file definition
-        fid = NetCDFFile(self.filename, mode)
+        fid = NetCDFFile(self.filename, mode, netcdf_format=self.format)
         if mode[0] == 'w':
             description = 'Output from anuga.file.sww ' \
                           'suitable for plotting'
@@ -122,7 +150,8 @@ class SWW_file(Data_format):
             self.writer = Write_sww(static_quantities,
                                     dynamic_quantities,
                                     static_c_quantities,
-                                    dynamic_c_quantities)
+                                    dynamic_c_quantities,
+                                    compression=self.compression)
 
             self.writer.store_header(fid,
                                      domain.starttime,
@@ -209,6 +238,11 @@ class SWW_file(Data_format):
                                         domain.tri_l2g,
                                         domain.node_l2g)
 
+        if getattr(domain, 'triangle_permutation', None) is not None:
+            self.writer.store_permutation_data(fid,
+                                        domain.triangle_permutation,
+                                        domain.node_permutation)
+
 
         # Get names of static quantities
         static_quantities = {}
@@ -234,22 +268,96 @@ class SWW_file(Data_format):
         fid.close()
 
 
-    def store_timestep(self):
-        """Store time and time dependent quantities
+    def open(self, background=True):
+        """Open the file for appending and keep it open until close is
+        called, e.g. for the duration of an evolve.
+
+        If background is True the timesteps stored while the file is
+        open are written by a background thread, so the caller can carry
+        on while the previous timestep is written. A timestep is copied
+        into a buffer when it is stored, and at most one timestep waits
+        while another is written. Otherwise each timestep is written and
+        synced to disk when it is stored.
         """
 
-        #import types
-        from time import sleep
-        from os import stat
+        if self.fid is not None:
+            return
 
+        self.fid = self.open_for_append()
+        self.number_of_frames = len(self.fid.variables['time'])
+        self.file_size = os.stat(self.filename)[6]
+
+        if background:
+            self.frames = Queue.Queue(maxsize=1)
+            self.write_error = None
+            self.write_thread = threading.Thread(target=self.write_frames)
+            self.write_thread.daemon = True
+            self.write_thread.start()
+
+
+    def flush(self):
+        """Wait for the timesteps being written in the background and
+        flush the file to disk
+        """
+
+        if self.write_thread is not None:
+            self.frames.join()
+
+            if self.write_error is not None:
+                error, self.write_error = self.write_error, None
+                raise error[0], error[1], error[2]
+
+        if self.fid is not None:
+            self.fid.sync()
+
+
+    def close(self):
+        """Write all the stored timesteps and close the file. Called at
+        the end of an evolve.
+        """
+
+        if self.fid is None:
+            return
+
+        try:
+            self.flush()
+        finally:
+            if self.write_thread is not None:
+                self.frames.put(None)
+                self.write_thread.join()
+                self.write_thread = None
+                self.frames = None
+
+            self.fid.close()
+            self.fid = None
+
+
+    def __getstate__(self):
+        """Open files and threads can not be pickled, e.g. when the
+        domain is checkpointed. The file is reopened by the next evolve.
+        """
+
+        state = self.__dict__.copy()
+        state['fid'] = None
+        state['frames'] = None
+        state['write_thread'] = None
+        state['write_error'] = None
+
+        return state
+
+
+    def open_for_append(self):
+        """Open the NetCDF file for appending, retrying if the file is
+        being read
+        """
+
+        from time import sleep
 
-        # Get NetCDF
         retries = 0
-        file_open = False
-        while not file_open and retries < 10:
+        while retries < 10:
             try:
                 # Open existing file
-                fid = NetCDFFile(self.filename, netcdf_mode_a)
+                return NetCDFFile(self.filename, netcdf_mode_a)
             except IOError:
                 # This could happen if someone was reading the file.
                 # In that case, wait a while and try again
@@ -259,159 +367,252 @@ class SWW_file(Data_format):
                 log.critical(msg)
                 retries += 1
                 sleep(1)
+
+        msg = 'File %s could not be opened for append' % self.filename
+        raise DataFileNotOpenError, msg
+
+
+    def store_timestep(self):
+        """Store time and time dependent quantities
+
+        If the file has been opened (see open) the timestep is added to
+        the open file, otherwise the file is opened, the timestep written
+        and the file closed again.
+        """
+
+        if self.fid is None:
+            fid = self.open_for_append()
+            try:
+                number_of_frames = len(fid.variables['time'])
+                file_size = os.stat(self.filename)[6]
+                frame_size = file_size/(number_of_frames + 1)
+
+                if self.split_file(file_size, frame_size, fid):
+                    return
+
+                self.write_frame(fid, self.get_frame())
+            finally:
+                fid.close()
+        else:
+            frame_size = self.get_frame_size()
+            if self.split_file(self.file_size, frame_size):
+                return
+
+            frame = self.get_frame()
+            self.number_of_frames += 1
+            self.file_size += frame_size
+
+            if self.write_thread is not None:
+                if self.write_error is not None:
+                    self.flush()
+                self.frames.put(frame)
             else:
-                file_open = True
-
-        if not file_open:
-            msg = 'File %s could not be opened for append' % self.filename
-            raise DataFileNotOpenError, msg
-
-        # Check to see if the file is already too big:
-        time = fid.variables['time'][:]
-
-        i = len(time) + 1
-        file_size = stat(self.filename)[6]
-        file_size_increase = file_size / i
-        if file_size + file_size_increase > self.max_size * 2**self.recursion:
-            # In order to get the file name and start time correct,
-            # I change the domain.filename and domain.starttime.
-            # This is the only way to do this without changing
-            # other modules (I think).
-
-            # Write a filename addon that won't break the anuga viewers
-            # (10.sww is bad)
-            filename_ext = '_time_%s' % self.domain.time
-            filename_ext = filename_ext.replace('.', '_')
-
-            # Remember the old filename, then give domain a
-            # name with the extension
-            old_domain_filename = self.domain.get_name()
-            if not self.recursion:
-                self.domain.set_name(old_domain_filename + filename_ext)
-
-            # Temporarily change the domain starttime to the current time
-            old_domain_starttime = self.domain.starttime
-            self.domain.starttime = self.domain.get_time()
-
-            # Build a new data_structure.
-            next_data_structure = SWW_file(self.domain, mode=self.mode,
-                                           max_size=self.max_size,
-                                           recursion=self.recursion+1)
-            if not self.recursion:
-                log.critical('    file_size = %s' % file_size)
-                log.critical('    saving file to %s'
-                             % next_data_structure.filename)
-
-            # Set up the new data_structure
-            self.domain.writer = next_data_structure
-
-            # Store connectivity and first timestep
-            next_data_structure.store_connectivity()
-            next_data_structure.store_timestep()
+                # Keep the file readable between timesteps
+                self.write_frame(self.fid, frame)
+                self.fid.sync()
+
+
+    def split_file(self, file_size, frame_size, fid=None):
+        """Continue in a new file if the file would grow beyond max_size.
+        Returns True if the timestep was stored in a new file.
+        """
+
+        if file_size + frame_size <= self.max_size * 2**self.recursion:
+            self.recursion = False
+            return False
+
+        # In order to get the file name and start time correct,
+        # I change the domain.filename and domain.starttime.
+        # This is the only way to do this without changing
+        # other modules (I think).
+
+        # Write a filename addon that won't break the anuga viewers
+        # (10.sww is bad)
+        filename_ext = '_time_%s' % self.domain.time
+        filename_ext = filename_ext.replace('.', '_')
+
+        # Remember the old filename, then give domain a
+        # name with the extension
+        old_domain_filename = self.domain.get_name()
+        if not self.recursion:
+            self.domain.set_name(old_domain_filename + filename_ext)
+
+        # Temporarily change the domain starttime to the current time
+        old_domain_starttime = self.domain.starttime
+        self.domain.starttime = self.domain.get_time()
+
+        # Finish with this file if it is held open
+        background = self.write_thread is not None
+        persistent = self.fid is not None
+        self.close()
+
+        # Build a new data_structure.
+        next_data_structure = SWW_file(self.domain, mode=self.mode,
+                                       max_size=self.max_size,
+                                       recursion=self.recursion+1)
+        if not self.recursion:
+            log.critical('    file_size = %s' % file_size)
+            log.critical('    saving file to %s'
+                         % next_data_structure.filename)
+
+        # Set up the new data_structure
+        self.domain.writer = next_data_structure
+
+        # Store connectivity and first timestep
+        next_data_structure.store_connectivity()
+        if persistent:
+            next_data_structure.open(background)
+        next_data_structure.store_timestep()
+
+        if fid is not None:
             fid.sync()
-            fid.close()
 
-            # Restore the old starttime and filename
-            self.domain.starttime = old_domain_starttime
-            self.domain.set_name(old_domain_filename)
+        # Restore the old starttime and filename
+        self.domain.starttime = old_domain_starttime
+        self.domain.set_name(old_domain_filename)
+
+        return True
+
+
+    def get_frame_size(self):
+        """Estimate of the bytes added to the file by a timestep
+        """
+
+        # Vertices are stored for each triangle unless smoothed
+        if self.domain.smooth:
+            number_of_points = self.number_of_nodes
         else:
-            self.recursion = False
-            domain = self.domain
+            number_of_points = 3*self.number_of_volumes
 
-            # Get the variables
-            time = fid.variables['time'][:]
-            i = len(time)
+        size = 8
+        for name in self.writer.dynamic_quantities:
+            size += number_of_points*num.dtype(self.precision).itemsize
+        for name in self.writer.dynamic_c_quantities:
+            size += self.number_of_volumes*num.dtype(self.precision).itemsize
 
+        return size
 
-            if 'stage' in self.writer.dynamic_quantities:
-                # Select only those values for stage,
-                # xmomentum and ymomentum (if stored) where
-                # depth exceeds minimum_storable_height
-                #
-                # In this branch it is assumed that elevation
-                # is also available as a quantity
 
+    def get_frame(self):
+        """Return a copy of the time and time dependent quantities to
+        be written, so the domain can carry on evolving while they are
+        written
+        """
 
-                # Smoothing for the get_vertex_values will be obtained
-                # from the smooth setting in domain
+        domain = self.domain
 
-                Q = domain.quantities['stage']
-                w, _ = Q.get_vertex_values(xy=False)
+        if 'stage' in self.writer.dynamic_quantities:
+            # Select only those values for stage,
+            # xmomentum and ymomentum (if stored) where
+            # depth exceeds minimum_storable_height
+            #
+            # In this branch it is assumed that elevation
+            # is also available as a quantity
 
-                Q = domain.quantities['elevation']
-                z, _ = Q.get_vertex_values(xy=False)
 
-                storable_indices = num.array(w-z >= self.minimum_storable_height)
+            # Smoothing for the get_vertex_values will be obtained
+            # from the smooth setting in domain
 
-                #print numpy.sum(storable_indices), len(z), self.minimum_storable_height, numpy.min(w-z)
-            else:
-                # Very unlikely branch
-                storable_indices = None # This means take all
+            Q = domain.quantities['stage']
+            w, _ = Q.get_vertex_values(xy=False)
 
-            # Now store dynamic quantities
-            dynamic_quantities = {}
-            dynamic_quantities_centroid = {}
+            Q = domain.quantities['elevation']
+            z, _ = Q.get_vertex_values(xy=False)
 
-            for name in self.writer.dynamic_quantities:
-                #netcdf_array = fid.variables[name]
+            storable_indices = w-z >= self.minimum_storable_height
+        else:
+            # Very unlikely branch
+            storable_indices = None # This means take all
 
-                Q = domain.quantities[name]
-                A, _ = Q.get_vertex_values(xy=False,
-                                           precision=self.precision)
+        # Now store dynamic quantities
+        dynamic_quantities = {}
+        dynamic_quantities_centroid = {}
 
-                if storable_indices is not None:
-                    if name == 'stage':
-                        A = num.choose(storable_indices, (z, A))
+        for name in self.writer.dynamic_quantities:
+            Q = domain.quantities[name]
+            A, _ = Q.get_vertex_values(xy=False,
+                                       precision=self.precision)
 
-                    if name in ['xmomentum', 'ymomentum']:
-                        # Get xmomentum where depth exceeds
-                        # minimum_storable_height
+            if storable_indices is not None:
+                if name == 'stage':
+                    A = num.where(storable_indices, A, z)
 
-                        # Define a zero vector of same size and type as A
-                        # for use with momenta
-                        null = num.zeros(num.size(A), A.dtype.char)
-                        A = num.choose(storable_indices, (null, A))
+                if name in ['xmomentum', 'ymomentum']:
+                    # Get momentum where depth exceeds
+                    # minimum_storable_height
+                    A = num.where(storable_indices, A, 0.0).astype(A.dtype)
 
-                dynamic_quantities[name] = A
+            dynamic_quantities[name] = A
 
-            for name in self.writer.dynamic_c_quantities:
-                Q = domain.quantities[name[:-2]]
-                dynamic_quantities_centroid[name] = Q.centroid_values
+        for name in self.writer.dynamic_c_quantities:
+            Q = domain.quantities[name[:-2]]
+            dynamic_quantities_centroid[name] = Q.centroid_values.copy()
 
+        # Extrema if requested
+        if domain.quantities_to_be_monitored is not None:
+            extrema = copy.deepcopy(domain.quantities_to_be_monitored)
+        else:
+            extrema = None
 
-            # Store dynamic quantities
-            slice_index = self.writer.store_quantities(fid,
-                                         time=self.domain.time,
-                                         sww_precision=self.precision,
-                                         **dynamic_quantities)
+        return (self.domain.time, dynamic_quantities,
+                dynamic_quantities_centroid, extrema)
 
-            # Store dynamic quantities
-            if self.store_centroids:
-                self.writer.store_quantities_centroid(fid,
-                                                      slice_index= slice_index,
-                                                      sww_precision=self.precision,
-                                                      **dynamic_quantities_centroid)
 
+    def write_frame(self, fid, frame):
+        """Write a timestep returned by get_frame to the open file fid
+        """
 
-            # Update extrema if requested
-            domain = self.domain
-            if domain.quantities_to_be_monitored is not None:
-                for q, info in domain.quantities_to_be_monitored.items():
-                    if info['min'] is not None:
-                        fid.variables[q + '.extrema'][0] = info['min']
-                        fid.variables[q + '.min_location'][:] = \
-                                        info['min_location']
-                        fid.variables[q + '.min_time'][0] = info['min_time']
+        time, dynamic_quantities, dynamic_quantities_centroid, extrema = frame
+
+        # Store dynamic quantities
+        slice_index = self.writer.store_quantities(fid,
+                                     time=time,
+                                     sww_precision=self.precision,
+                                     **dynamic_quantities)
+
+        # Store dynamic quantities
+        if self.store_centroids:
+            self.writer.store_quantities_centroid(fid,
+                                                  slice_index= slice_index,
+                                                  sww_precision=self.precision,
+                                                  **dynamic_quantities_centroid)
+
+
+        # Update extrema if requested
+        if extrema is not None:
+            for q, info in extrema.items():
+                if info['min'] is not None:
+                    fid.variables[q + '.extrema'][0] = info['min']
+                    fid.variables[q + '.min_location'][:] = \
+                                    info['min_location']
+                    fid.variables[q + '.min_time'][0] = info['min_time']
+
+                if info['max'] is not None:
+                    fid.variables[q + '.extrema'][1] = info['max']
+                    fid.variables[q + '.max_location'][:] = \
+                                    info['max_location']
+                    fid.variables[q + '.max_time'][0] = info['max_time']
+
+
+    def write_frames(self):
+        """Body of the background thread, write the queued timesteps
+        until None is queued
+        """
 
-                    if info['max'] is not None:
-                        fid.variables[q + '.extrema'][1] = info['max']
-                        fid.variables[q + '.max_location'][:] = \
-                                        info['max_location']
-                        fid.variables[q + '.max_time'][0] = info['max_time']
+        while True:
+            frame = self.frames.get()
+            try:
+                if frame is None:
+                    return
 
-            # Flush and close
-            #fid.sync()
-            fid.close()
+                # After an error the frames are dropped until the
+                # error has been raised by flush
+                if self.write_error is None:
+                    self.write_frame(self.fid, frame)
+            except:
+                self.write_error = sys.exc_info()
+            finally:
+                self.frames.task_done()
 
 
 class Read_sww:
@@ -515,7 +716,8 @@ class Write_sww(Write_sts):
                  static_quantities,
                  dynamic_quantities,
                  static_c_quantities = [],
-                 dynamic_c_quantities = []):
+                 dynamic_c_quantities = [],
+                 compression = None):
 
         """Initialise Write_sww with two (or 4) list af quantity names:
 
@@ -533,11 +735,16 @@ class Write_sww(Write_sts):
             Stored every timestep in a 2D array with
             dimensions number_of_triangles X number_of_timesteps
 
+        compression (optional):
+            Dictionary with the zlib 'complevel', 'shuffle' flag and
+            'quantisation' of the quantities (see Domain.set_sww_format).
+            Only used if the file is in NETCDF4 format.
         """
         self.static_quantities = static_quantities
         self.dynamic_quantities = dynamic_quantities
         self.static_c_quantities = static_c_quantities
         self.dynamic_c_quantities = dynamic_c_quantities
+        self.compression = compression
 
         self.store_centroids = False
         if static_c_quantities or dynamic_c_quantities:
@@ -635,17 +842,17 @@ class Write_sww(Write_sts):
         outfile.createDimension('number_of_timesteps', number_of_times)
 
         # variable definitions
-        outfile.createVariable('x', sww_precision, ('number_of_points',))
-        outfile.createVariable('y', sww_precision, ('number_of_points',))
+        self.create_variable(outfile, 'x', sww_precision, ('number_of_points',))
+        self.create_variable(outfile, 'y', sww_precision, ('number_of_points',))
 
-        outfile.createVariable('volumes', netcdf_int , ('number_of_volumes',
-                                                       'number_of_vertices'))
+        self.create_variable(outfile, 'volumes', netcdf_int, ('number_of_volumes',
+                                                              'number_of_vertices'))
 
 
         for q in self.static_quantities:
 
-            outfile.createVariable(q, sww_precision,
-                                   ('number_of_points',))
+            self.create_variable(outfile, q, sww_precision,
+                                 ('number_of_points',))
 
             outfile.createVariable(q + Write_sww.RANGE, sww_precision,
                                    ('numbers_in_range',))
@@ -657,8 +864,8 @@ class Write_sww(Write_sts):
 
 
         for q in self.static_c_quantities:
-            outfile.createVariable(q, sww_precision,
-                                   ('number_of_volumes',))
+            self.create_variable(outfile, q, sww_precision,
+                                 ('number_of_volumes',))
 
 
         self.write_dynamic_quantities(outfile, times, precis = sww_precision)
@@ -786,8 +993,8 @@ class Write_sww(Write_sts):
 
 
         for q in self.dynamic_quantities:
-            outfile.createVariable(q, precis, ('number_of_timesteps',
-                                               'number_of_points'))
+            self.create_variable(outfile, q, precis, ('number_of_timesteps',
+                                                      'number_of_points'))
             outfile.createVariable(q + Write_sts.RANGE, precis,
                                    ('numbers_in_range',))
 
@@ -797,8 +1004,8 @@ class Write_sww(Write_sts):
             outfile.variables[q+Write_sts.RANGE][1] = -max_float # Max
 
         for q in self.dynamic_c_quantities:
-            outfile.createVariable(q, precis, ('number_of_timesteps',
-                                                    'number_of_volumes'))
+            self.create_variable(outfile, q, precis, ('number_of_timesteps',
+                                                      'number_of_volumes'))
 
         # Doing sts_precision instead of Float gives cast errors.
         outfile.createVariable('time', netcdf_float, ('number_of_timesteps',))
@@ -812,6 +1019,49 @@ class Write_sww(Write_sts):
             log.critical('    t in [%f, %f], len(t) == %d'
                          % (num.min(times), num.max(times), len(times.flat)))
 
+    def create_variable(self, outfile, name, precision, dimensions):
+        """Create a variable of the sww file, compressed and chunked if
+        compression is set and the file is in NETCDF4 format
+        """
+
+        if self.compression is None or \
+               not getattr(outfile, 'data_model', '').startswith('NETCDF4'):
+            return outfile.createVariable(name, precision, dimensions)
+
+        options = {}
+
+        complevel = self.compression.get('complevel', 0)
+        if complevel > 0:
+            options['zlib'] = True
+            options['complevel'] = complevel
+            options['shuffle'] = self.compression.get('shuffle', True)
+
+        # Quantisation of quantity q also applies to q_c
+        quantisation = self.compression.get('quantisation', None)
+        if quantisation is not None and num.dtype(precision).kind == 'f':
+            if name.endswith('_c'):
+                precision_name = name[:-2]
+            else:
+                precision_name = name
+            if precision_name in quantisation:
+                options['least_significant_digit'] = \
+                    get_least_significant_digit(quantisation[precision_name])
+
+        if dimensions[0] == 'number_of_timesteps':
+            times = outfile.dimensions[dimensions[0]]
+            if times.isunlimited():
+                number_of_times = None
+            else:
+                number_of_times = len(times)
+
+            n = len(outfile.dimensions[dimensions[1]])
+            if n > 0 and number_of_times != 0:
+                options['chunksizes'] = get_chunk_sizes(n, num.dtype(precision).itemsize,
+                                                        number_of_times)
+
+        return outfile.createVariable(name, precision, dimensions, **options)
+
+
     def store_parallel_data(self,
                             outfile,
                             number_of_global_triangles,
@@ -856,6 +1106,24 @@ class Write_sww(Write_sts):
         outfile.variables['tri_full_flag'][:] = tri_full_flag.astype(num.int32)
 
 
+    def store_permutation_data(self,
+                               outfile,
+                               tri_permutation,
+                               node_permutation):
+        """Store the map from reordered to original triangle and node ids
+        for a domain created with mesh reordering.
+        """
+
+        outfile.createVariable('tri_permutation', netcdf_int,
+                               ('number_of_volumes',))
+        outfile.createVariable('node_permutation', netcdf_int,
+                               ('number_of_triangle_vertices',))
+
+        outfile.variables['tri_permutation'][:] = \
+                                        tri_permutation.astype(num.int32)
+        outfile.variables['node_permutation'][:] = \
+                                        node_permutation.astype(num.int32)
+
 
     def store_static_quantities(self,
                                 outfile,
@@ -1098,6 +1366,66 @@ class Write_sww(Write_sts):
 
 
 
+def get_chunk_sizes(number_of_points, itemsize, number_of_times=None):
+    """Return the (timesteps, points) chunk shape of a time dependent
+    quantity of a NETCDF4 sww file. number_of_times is None if the
+    time dimension is unlimited.
+
+    Chunks span as many timesteps as the chunk cache allows, which keeps
+    reading the time series at a point (e.g. for gauges) cheap, and as
+    many points as fit in chunk_size bytes, which keeps reading a
+    timestep cheap.
+    """
+
+    frames = chunk_cache_size // (number_of_points*itemsize)
+    frames = max(1, min(max_frames_per_chunk, frames))
+    if number_of_times is not None:
+        frames = min(frames, number_of_times)
+
+    points = chunk_size // (frames*itemsize)
+    points = max(1, min(number_of_points, points))
+
+    return (frames, points)
+
+
+def get_least_significant_digit(precision):
+    """Return the netCDF4 least_significant_digit which stores values to
+    the given precision, e.g. 3 for 0.001. The precision is rounded down
+    to a power of ten.
+    """
+
+    import math
+
+    return int(math.ceil(-math.log10(precision) - 1.0e-9))
+
+
+def get_sww_format(fid):
+    """Return the format and compression of an open sww file, as used
+    by Domain.set_sww_format, e.g. to write a merged sww file the same way
+    """
+
+    data_model = getattr(fid, 'data_model', 'NETCDF3_64BIT')
+    if not data_model.startswith('NETCDF4'):
+        return 'NETCDF3_64BIT', None
+
+    compression = {'complevel': 0, 'shuffle': False, 'quantisation': None}
+    quantisation = {}
+    for name, variable in fid.variables.items():
+        filters = variable.filters()
+        if filters is not None and filters.get('zlib', False):
+            compression['complevel'] = filters['complevel']
+            compression['shuffle'] = filters['shuffle']
+
+        digits = getattr(variable, 'least_significant_digit', None)
+        if digits is not None and not name.endswith('_c'):
+            quantisation[name] = 10.0**(-digits)
+
+    if quantisation:
+        compression['quantisation'] = quantisation
+
+    return data_model, compression
+
+
 def extent_sww(file_name):
     """Read in an sww file, then get its extents
 
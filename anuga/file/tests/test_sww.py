@@ -875,6 +875,150 @@ class Test_sww(unittest.TestCase):
                                            new_origin)),points_utm)
         os.remove(filename)
 
+
+    def test_sww_background_writes(self):
+        """Test that the sww file written in the background during
+        evolve is the same as the one written synchronously
+        """
+
+        import cPickle
+
+        results = []
+        for background in [False, True]:
+            points, vertices, boundary = rectangular(8, 4)
+            domain = Domain(points, vertices, boundary)
+            domain.set_name('test_sww_background_writes_%d' % background)
+            domain.set_quantity('elevation', lambda x, y: -x/2)
+            domain.set_quantity('stage', lambda x, y: num.where(x < 0.3, 0.2, -x/2))
+            domain.set_store_background_writes(background)
+
+            Br = Reflective_boundary(domain)
+            domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+            for t in domain.evolve(yieldstep=0.1, finaltime=0.5):
+                if background:
+                    assert domain.writer.fid is not None
+                    assert domain.writer.write_thread is not None
+
+            # The writer is closed at the end of the evolve
+            assert domain.writer.fid is None
+            assert domain.writer.write_thread is None
+
+            # and can be pickled, e.g. for checkpointing
+            cPickle.dumps(domain.writer)
+
+            # Continue in the same file
+            for t in domain.evolve(yieldstep=0.1, finaltime=1.0):
+                pass
+
+            fid = NetCDFFile(domain.writer.filename)
+            results.append((fid.variables['time'][:],
+                            fid.variables['stage'][:],
+                            fid.variables['xmomentum_c'][:]))
+            fid.close()
+            os.remove(domain.writer.filename)
+
+        (time0, stage0, xmom0), (time1, stage1, xmom1) = results
+
+        assert len(time0) == 11
+        assert num.allclose(time0, time1)
+        assert num.allclose(stage0, stage1)
+        assert num.allclose(xmom0, xmom1)
+
+
+    def test_sww_frame_size(self):
+        """Test that the estimated size of a timestep is the size of
+        the time dependent variables in the file
+        """
+
+        for smooth in [True, False]:
+            points, vertices, boundary = rectangular(8, 4)
+            domain = Domain(points, vertices, boundary)
+            domain.set_name('test_sww_frame_size')
+            domain.set_store_vertices_uniquely(not smooth)
+            domain.set_quantity('elevation', lambda x, y: -x/2)
+
+            Br = Reflective_boundary(domain)
+            domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+            for t in domain.evolve(yieldstep=0.1, finaltime=0.1):
+                pass
+
+            fid = NetCDFFile(domain.writer.filename)
+            size = 0
+            for name, variable in fid.variables.items():
+                if variable.dimensions[0] == 'number_of_timesteps':
+                    size += variable[0].size*variable.dtype.itemsize
+            fid.close()
+            os.remove(domain.writer.filename)
+
+            assert domain.writer.get_frame_size() == size
+
+
+    def test_sww_netcdf4_format(self):
+        """Test that compressed and quantised NETCDF4 sww files are
+        read like NETCDF3 files, and merged in the same format
+        """
+
+        from anuga.file.sww import Read_sww, get_sww_format
+        from anuga.utilities.sww_merge import _sww_merge
+
+        results = []
+        for format in ['NETCDF3_64BIT', 'NETCDF4']:
+            points, vertices, boundary = rectangular(8, 4)
+            domain = Domain(points, vertices, boundary)
+            domain.set_name('test_sww_netcdf4_format_%s' % format)
+            domain.set_quantity('elevation', lambda x, y: -x/2)
+            domain.set_quantity('stage', lambda x, y: num.where(x < 0.3, 0.2, -x/2))
+            domain.set_sww_format(format, quantisation={'stage': 0.001})
+
+            Br = Reflective_boundary(domain)
+            domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+            for t in domain.evolve(yieldstep=0.1, finaltime=0.5):
+                pass
+
+            results.append(Read_sww(domain.writer.filename))
+
+        sww3, sww4 = results
+
+        fid = NetCDFFile(sww4.source)
+        assert fid.data_model == 'NETCDF4'
+        stage = fid.variables['stage']
+        assert stage.filters()['zlib']
+        assert stage.filters()['complevel'] == 4
+        assert stage.chunking()[1] == len(fid.dimensions['number_of_points'])
+        assert fid.variables['stage_c'].least_significant_digit == 3
+        assert not hasattr(fid.variables['xmomentum'], 'least_significant_digit')
+
+        format, compression = get_sww_format(fid)
+        assert format == 'NETCDF4'
+        assert compression['complevel'] == 4
+        assert num.allclose(compression['quantisation']['stage'], 0.001)
+        fid.close()
+
+        assert num.allclose(sww3.time, sww4.time)
+        assert num.allclose(sww3.x, sww4.x)
+        assert num.allclose(sww3.vertices, sww4.vertices)
+        for frame in range(len(sww3.time)):
+            sww3.read_quantities(frame)
+            sww4.read_quantities(frame)
+            assert num.allclose(sww3.quantities['stage'],
+                                sww4.quantities['stage'], atol=1.0e-3)
+            assert num.allclose(sww3.quantities['xmomentum'],
+                                sww4.quantities['xmomentum'])
+
+        # Merged files keep the format
+        output = 'test_sww_netcdf4_format_merged.sww'
+        _sww_merge([sww4.source, sww4.source], output)
+        fid = NetCDFFile(output)
+        assert get_sww_format(fid)[0] == 'NETCDF4'
+        assert fid.variables['stage'].filters()['zlib']
+        fid.close()
+
+        for filename in [sww3.source, sww4.source, output]:
+            os.remove(filename)
+
 #################################################################################
 
 if __name__ == "__main__":
@@ -21,7 +21,7 @@ from anuga.shallow_water.boundaries import Reflective_boundary, \
             Transmissive_stage_zero_momentum_boundary
 from anuga.abstract_2d_finite_volumes.generic_boundary_conditions\
      import Transmissive_boundary, Dirichlet_boundary, \
-            Time_boundary, File_boundary, AWI_boundary
+            Time_boundary, File_boundary, Sts_boundary, AWI_boundary
 
 from anuga.pmesh.mesh_interface import create_mesh_from_regions
 
@@ -1811,8 +1811,98 @@ class Test_Urs2Sts(Test_Mux):
         os.remove(sts_file+'.sts')
         os.remove(meshname)
 
-        
-        
+
+    def test_sts_boundary_blocks(self):
+        """test_sts_boundary_blocks(self):
+
+         Sts_boundary reading the file in small blocks with prefetching
+         must agree with File_boundary reading the whole file.
+         """
+
+        bounding_polygon=[[6.0,97.0],[6.01,97.0],[6.02,97.0],[6.02,97.02],[6.00,97.02]]
+        tide = 0.37
+        time_step_count = 11
+        time_step = 2
+        lat_long_points =bounding_polygon[0:3]
+        n=len(lat_long_points)
+        first_tstep=num.ones(n,num.int)
+        last_tstep=(time_step_count)*num.ones(n,num.int)
+
+        gauge_depth=20*num.ones(n,num.float)
+        ha=num.zeros((n,time_step_count),num.float)
+        for i in range(n):
+            ha[i,:] = 0.1*num.arange(time_step_count) + 0.05*i
+        ua=10*num.ones((n,time_step_count),num.float)
+        va=-10*num.ones((n,time_step_count),num.float)
+        base_name, files = self.write_mux2(lat_long_points,
+                                           time_step_count, time_step,
+                                           first_tstep, last_tstep,
+                                           depth=gauge_depth,
+                                           ha=ha,
+                                           ua=ua,
+                                           va=va)
+
+        sts_file=base_name
+        urs2sts(base_name,
+                sts_file,
+                mean_stage=tide,
+                verbose=False)
+        self.delete_mux(files)
+
+        for i in range(len(bounding_polygon)):
+            zone,bounding_polygon[i][0],bounding_polygon[i][1]=redfearn(bounding_polygon[i][0],bounding_polygon[i][1])
+        meshname = 'urs_test_mesh' + '.tsh'
+        boundary_tags={'ocean': [0,1], 'otherocean': [2,3,4]}
+        create_mesh_from_regions(bounding_polygon,
+                                 boundary_tags=boundary_tags,
+                                 maximum_triangle_area=1000000,
+                                 filename=meshname,
+                                 verbose=False)
+
+        domain = Domain(meshname)
+
+        # Blocks of thinned timesteps when thinning
+        for time_thinning in [1, 2]:
+            Bf = File_boundary(sts_file+'.sts',
+                               domain,
+                               time_thinning=time_thinning,
+                               boundary_polygon=bounding_polygon)
+            Bs = Sts_boundary(sts_file+'.sts',
+                              domain,
+                              time_thinning=time_thinning,
+                              boundary_polygon=bounding_polygon,
+                              block_size=3)
+
+            assert Bs.F.precomputed_values == {}
+
+            ids = num.arange(len(Bf.midpoint_coordinates))
+            t = 0.0
+            while t <= time_step*(time_step_count-1):
+                assert num.allclose(Bs.F.evaluate_points(t, ids),
+                                    Bf.F.evaluate_points(t, ids))
+
+                # No more than the current and the prefetched block is held
+                for name in domain.conserved_quantities:
+                    reader = Bs.F.quantities[name]
+                    assert reader.number_of_timesteps == len(Bs.F.time)
+                    assert len(reader.block) <= 3
+                    assert reader.next_block is None or \
+                           len(reader.next_block) <= 3
+                t += 0.7
+
+            # Closing the boundary waits for the prefetch and closes the file
+            readers = Bs.F.quantities.values()
+            Bs.close()
+            assert Bs.F.quantities is None
+            for reader in readers:
+                assert reader.thread is None
+                assert reader.block is None
+
+        os.remove(sts_file+'.sts')
+        os.remove(meshname)
+
+
+
     def test_file_boundary_stsIII_ordering(self):
         """test_file_boundary_stsIII_ordering(self):
         Read correct points from ordering file and apply sts to boundary
@@ -702,12 +702,19 @@ class Interpolation_function:
                  time_thinning=1,
                  verbose=False,
                  gauge_neighbour_id=None,
-                 output_centroids=False):
+                 output_centroids=False,
+                 streaming=False):
         """Initialise object and build spatial interpolation if required
 
         Time_thinning_number controls how many timesteps to use. Only timesteps
         with index%time_thinning_number == 0 will used, or in other words a
         value of 3, say, will cause the algorithm to use every third time step.
+
+        If streaming is True the quantities are not precomputed for all
+        timesteps. Instead the two time slices bracketing the current time
+        are read from quantities (e.g. open NetCDF variables) and
+        interpolated on demand, so memory use does not depend on the
+        number of timesteps.
         """
 
         from anuga.config import time_format
@@ -755,27 +762,41 @@ class Interpolation_function:
         # Thin timesteps if needed
         # Note array() is used to make the thinned arrays contiguous in memory
         self.time = num.array(time[::time_thinning])
-        for name in quantity_names:
-            if len(quantities[name].shape) == 2:
-                quantities[name] = num.array(quantities[name][::time_thinning,:])
+        self.time_thinning = time_thinning
+        self.streaming = streaming
+        if not streaming:
+            for name in quantity_names:
+                if len(quantities[name].shape) == 2:
+                    quantities[name] = num.array(quantities[name][::time_thinning,:])
 
         if verbose is True:
             log.critical('Interpolation_function: precomputing')
 
         # Save for use with statistics
+        # (not available when streaming as it requires all timesteps)
         self.quantities_range = {}
-        for name in quantity_names:
-            q = quantities[name][:].flatten()
-            self.quantities_range[name] = [min(q), max(q)]
+        if not streaming:
+            for name in quantity_names:
+                q = quantities[name][:].flatten()
+                self.quantities_range[name] = [min(q), max(q)]
 
         self.quantity_names = quantity_names
         self.vertex_coordinates = vertex_coordinates
         self.interpolation_points = interpolation_points
+        self.triangles = triangles
+        self.gauge_neighbour_id = gauge_neighbour_id
+        self.output_centroids = output_centroids
 
         self.index = 0    # Initial time index
         self.precomputed_values = {}
         self.centroids = []
 
+        # Spatial interpolator, source quantities and the time slices
+        # currently held in memory when streaming
+        self.interpolator = None
+        self.quantities = None
+        self.window = {}
+
         # Precomputed spatial interpolation if requested
         if interpolation_points is not None:
             #no longer true. sts files have spatial = True but
@@ -864,16 +885,6 @@ class Interpolation_function:
                                   figname='points_boundary',
                                   label=title)
 
-            m = len(self.interpolation_points)
-            p = len(self.time)
-
-            for name in quantity_names:
-                self.precomputed_values[name] = num.zeros((p, m), num.float)
-
-            if verbose is True:
-                log.critical('Build interpolator')
-
-
             # Build interpolator
             if triangles is not None and vertex_coordinates is not None:
                 if verbose:
@@ -884,15 +895,25 @@ class Interpolation_function:
                     log.critical(msg)
 
                 # This one is no longer needed for STS files
-                interpol = Interpolate(vertex_coordinates,
-                                       triangles,
-                                       verbose=verbose)
+                self.interpolator = Interpolate(vertex_coordinates,
+                                                triangles,
+                                                verbose=verbose)
 
             elif triangles is None and vertex_coordinates is not None:
                 if verbose:
                     log.critical('Interpolation from STS file')
 
+        if streaming:
+            # Keep the source and interpolate the first time slice to
+            # check it (and to set self.centroids)
+            self.quantities = quantities
+            self._get_time_slice(0)
+        elif interpolation_points is not None:
+            m = len(self.interpolation_points)
+            p = len(self.time)
 
+            for name in quantity_names:
+                self.precomputed_values[name] = num.zeros((p, m), num.float)
 
             if verbose:
                 log.critical('Interpolating (%d interpolation points, %d timesteps).'
@@ -921,23 +942,9 @@ class Interpolation_function:
                         log.critical('    quantity %s, size=%d' % (name, len(Q)))
 
                     # Interpolate
-                    if triangles is not None and vertex_coordinates is not None:
-                        result = interpol.interpolate(Q,
-                                                      point_coordinates=\
-                                                      self.interpolation_points,
-                                                      verbose=False,
-                                                      output_centroids=output_centroids)
-                        self.centroids = interpol.centroids                                                          
-                    elif triangles is None and vertex_coordinates is not None:
-                        result = interpolate_polyline(Q,
-                                                      vertex_coordinates,
-                                                      gauge_neighbour_id,
-                                                      interpolation_points=\
-                                                          self.interpolation_points)
-
-                    #assert len(result), len(interpolation_points)
-                    self.precomputed_values[name][i, :] = result                                    
-                    
+                    self.precomputed_values[name][i, :] = \
+                        self._interpolate_to_points(Q)
+
             # Report
             if verbose:
                 log.critical(self.statistics())            
@@ -946,6 +953,69 @@ class Interpolation_function:
             for name in quantity_names:
                 self.precomputed_values[name] = quantities[name]
 
+    def _interpolate_to_points(self, Q):
+        """Interpolate values Q at the source vertices or gauges to
+        the interpolation points.
+        """
+
+        if self.interpolator is not None:
+            # Reuse the interpolation matrix once it has been built
+            if self.interpolator._A_can_be_reused is True:
+                point_coordinates = None
+            else:
+                point_coordinates = self.interpolation_points
+
+            result = self.interpolator.interpolate(Q,
+                                                   point_coordinates=\
+                                                   point_coordinates,
+                                                   verbose=False,
+                                                   output_centroids=self.output_centroids)
+            self.centroids = self.interpolator.centroids
+        else:
+            result = interpolate_polyline(Q,
+                                          self.vertex_coordinates,
+                                          self.gauge_neighbour_id,
+                                          interpolation_points=\
+                                              self.interpolation_points)
+
+        return result
+
+    def _get_time_slice(self, index):
+        """Return dictionary of values for each quantity at time index,
+        either precomputed or, when streaming, read from the source and
+        interpolated to the interpolation points.
+
+        Only the slices bracketing the current time are kept when
+        streaming.
+        """
+
+        if not self.streaming:
+            values = {}
+            for name in self.quantity_names:
+                values[name] = self.precomputed_values[name][index]
+            return values
+
+        if index not in self.window:
+            for i in self.window.keys():
+                if i != self.index and i != self.index+1:
+                    del self.window[i]
+
+            values = {}
+            for name in self.quantity_names:
+                Q = self.quantities[name]
+                if len(Q.shape) == 2 or self.spatial is False:
+                    Q = Q[index*self.time_thinning]
+                else:
+                    Q = Q[:]              # No time dependency
+
+                if self.interpolation_points is not None:
+                    Q = self._interpolate_to_points(num.array(Q, num.float))
+                values[name] = Q
+
+            self.window[index] = values
+
+        return self.window[index]
+
 #     def __repr__(self):
 #         # return 'Interpolation function (spatio-temporal)'
 #         return self.statistics()
@@ -955,7 +1025,10 @@ class Interpolation_function:
 
         Inputs:
           t:        time - Model time. Must lie within existing timesteps
-          point_id: index of one of the preprocessed points.
+          point_id: index of one of the preprocessed points or an array
+                    of such indices, in which case a
+                    len(quantity_names) x len(point_id) array is returned
+                    (see evaluate_points).
 
           If spatial info is present and all of point_id
           are None an exception is raised
@@ -964,7 +1037,6 @@ class Interpolation_function:
           making f a function of time only.
 
           FIXME: f(t, x, y) x, y could overrided location, point_id ignored
-          FIXME: point_id could also be a slice
           FIXME: What if x and y are vectors?
           FIXME: What about f(x,y) without t?
         """
@@ -983,46 +1055,31 @@ class Interpolation_function:
                           'parameter point_id can be used'
                     raise Exception(msg)
 
-        msg = 'Model time %.16f' % t
-        msg += ' is not contained in function domain [%.16f:%.16f].\n' % (self.time[0], self.time[-1])
-        if t < self.time[0]: raise Modeltime_too_early(msg)
-        if t > self.time[-1]: raise Modeltime_too_late(msg)
-
-        oldindex = self.index #Time index
+                if not num.isscalar(point_id):
+                    return self.evaluate_points(t, point_id)
 
-        # Find current time slot
-        while t > self.time[self.index]: self.index += 1
-        while t < self.time[self.index]: self.index -= 1
+        ratio = self._update_time_index(t)
 
-        if t == self.time[self.index]:
-            # Protect against case where t == T[-1] (last time)
-            #  - also works in general when t == T[i]
-            ratio = 0
-        else:
-            # t is now between index and index+1
-            ratio = ((t - self.time[self.index]) /
-                         (self.time[self.index+1] - self.time[self.index]))
+        values0 = self._get_time_slice(self.index)
+        if ratio > 0:
+            values1 = self._get_time_slice(self.index+1)
 
         # Compute interpolated values
         q = num.zeros(len(self.quantity_names), num.float)
         for i, name in enumerate(self.quantity_names):
-            Q = self.precomputed_values[name]
-
             if self.spatial is False:
                 # If there is no spatial info
-                assert len(Q.shape) == 1
-
-                Q0 = Q[self.index]
-                if ratio > 0: Q1 = Q[self.index+1]
+                Q0 = values0[name]
+                if ratio > 0: Q1 = values1[name]
             else:
                 if x is not None and y is not None:
                     # Interpolate to x, y
                     raise Exception('x,y interpolation not yet implemented')
                 else:
                     # Use precomputed point
-                    Q0 = Q[self.index, point_id]
+                    Q0 = values0[name][point_id]
                     if ratio > 0:
-                        Q1 = Q[self.index+1, point_id]
+                        Q1 = values1[name][point_id]
 
             # Linear temporal interpolation
             if ratio > 0:
@@ -1057,11 +1114,101 @@ class Interpolation_function:
 
                 return res
 
+    def _update_time_index(self, t):
+        """Move self.index to the time slot containing t and return the
+        ratio used for linear temporal interpolation within that slot.
+        """
+
+        msg = 'Model time %.16f' % t
+        msg += ' is not contained in function domain [%.16f:%.16f].\n' % (self.time[0], self.time[-1])
+        if t < self.time[0]: raise Modeltime_too_early(msg)
+        if t > self.time[-1]: raise Modeltime_too_late(msg)
+
+        # Find current time slot
+        while t > self.time[self.index]: self.index += 1
+        while t < self.time[self.index]: self.index -= 1
+
+        if t == self.time[self.index]:
+            # Protect against case where t == T[-1] (last time)
+            #  - also works in general when t == T[i]
+            ratio = 0
+        else:
+            # t is now between index and index+1
+            ratio = ((t - self.time[self.index]) /
+                         (self.time[self.index+1] - self.time[self.index]))
+
+        return ratio
+
+    def evaluate_points(self, t, point_ids):
+        """Evaluate f(t, point_id) for an array of precomputed points
+
+        Inputs:
+          t:         time - Model time. Must lie within existing timesteps
+          point_ids: array of indices of the preprocessed points.
+
+        Returns a len(quantity_names) x len(point_ids) array where column k
+        holds the same values as self(t, point_id=point_ids[k]).
+        """
+
+        if self.spatial is False or self.interpolation_points is None:
+            msg = 'Interpolation_function must be instantiated ' + \
+                  'with a list of interpolation points before ' + \
+                  'evaluate_points can be used'
+            raise Exception(msg)
+
+        point_ids = ensure_numeric(point_ids, num.int)
+
+        ratio = self._update_time_index(t)
+
+        values0 = self._get_time_slice(self.index)
+        if ratio > 0:
+            values1 = self._get_time_slice(self.index+1)
+
+        q = num.zeros((len(self.quantity_names), len(point_ids)), num.float)
+        for i, name in enumerate(self.quantity_names):
+            Q0 = values0[name][point_ids]
+            if ratio > 0:
+                # Linear temporal interpolation keeping points which
+                # are NAN at both ends of the time slot
+                Q1 = values1[name][point_ids]
+                q[i] = num.where((Q0 == NAN) & (Q1 == NAN),
+                                 Q0, Q0 + ratio*(Q1 - Q0))
+            else:
+                q[i] = Q0
+
+        return q
+
     def get_time(self):
         """Return model time as a vector of timesteps
         """
         return self.time
 
+    def close(self):
+        """Close the sources read when streaming (e.g. the NetCDF file
+        of Netcdf_quantity_reader), joining their prefetch threads.
+        The function can not be evaluated afterwards.
+        """
+
+        if not getattr(self, 'streaming', False) or self.quantities is None:
+            return
+
+        fids = []
+        for Q in self.quantities.values():
+            if hasattr(Q, 'close'):
+                Q.close()
+                fid = getattr(Q, 'fid', None)
+                if fid is not None and fid not in fids:
+                    fids.append(fid)
+
+        for fid in fids:
+            fid.close()
+
+        self.quantities = None
+        self.window = {}
+
+    def __del__(self):
+        self.close()
+
     def statistics(self):
         """Output statistics about interpolation_function
         """
@@ -1088,6 +1235,12 @@ class Interpolation_function:
 
         msg += '    t in [%f, %f], len(t) == %d\n'\
                %(min(self.time), max(self.time), len(self.time))
+        if self.streaming:
+            msg += '  Quantities are streamed from their source:\n'
+            msg += '    %d time slices in memory\n' %len(self.window)
+            msg += '------------------------------------------------\n'
+            return msg
+
         msg += '  Quantities:\n'
         for name in quantity_names:
             minq, maxq = self.quantities_range[name]
@@ -1509,6 +1509,63 @@ class Test_Interpolate(unittest.TestCase):
             raise Exception('Should raise exception')
 
 
+    def test_interpolation_function_streaming(self):
+        # Test that streaming and batched evaluation agree with
+        # precomputed, one point at a time evaluation
+
+        time = [1.0, 5.0, 6.0, 7.5]
+
+        a = [0.0, 0.0]
+        b = [0.0, 2.0]
+        c = [2.0, 0.0]
+        d = [0.0, 4.0]
+        e = [2.0, 2.0]
+        f = [4.0, 0.0]
+
+        points = [a, b, c, d, e, f]
+        triangles = [[1,0,2], [1,2,4], [4,2,5], [3,1,4]]
+
+        interpolation_points = [[ 0.0, 0.0],
+                                [ 0.5, 0.5],
+                                [ 0.7, 0.7],
+                                [ 1.0, 0.5],
+                                [ 2.0, 0.4]]
+
+        Q = num.zeros( (4,6), num.float )
+        for i, t in enumerate(time):
+            Q[i, :] = t*linear_function(points)
+
+        I = Interpolation_function(time, {'Attribute': Q},
+                                   vertex_coordinates = points,
+                                   triangles = triangles,
+                                   interpolation_points = interpolation_points)
+
+        S = Interpolation_function(time, {'Attribute': Q},
+                                   vertex_coordinates = points,
+                                   triangles = triangles,
+                                   interpolation_points = interpolation_points,
+                                   streaming = True)
+
+        assert S.precomputed_values == {}
+
+        ids = num.arange(len(interpolation_points))
+        answer = linear_function(interpolation_points)
+
+        t = time[0]
+        for j in range(65): #t in [1, 7.5]
+            res = S(t, ids)
+            assert res.shape == (1, len(ids))
+            assert num.allclose(res[0], t*answer)
+            assert num.allclose(I.evaluate_points(t, ids), res)
+
+            for id in ids:
+                assert num.allclose(S(t, id), I(t, id))
+
+            # Only the bracketing time slices are held
+            assert len(S.window) <= 2
+            t += 0.1
+
+
     def test_interpolation_function_time(self):
         #Test a long time series with an error in it (this did cause an
         #error once)
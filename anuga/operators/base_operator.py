@@ -70,6 +70,24 @@ class Operator:
         """
         return False
 
+    def get_changed_indices(self):
+        """Indices of the triangles whose stage, elevation or momentum the
+        operator may change, None if it may change any triangle. Used to
+        update the active cells of the domain.
+
+        By default the indices of the region of the operator
+        """
+        return getattr(self, 'indices', None)
+
+    def get_changed_quantities(self):
+        """Names of the quantities other than the evolved quantities
+        (e.g. elevation or friction) that the operator may change. Used by
+        checkpoints to decide which of these quantities to store.
+
+        By default the operator does not change them
+        """
+        return []
+
     def statistics(self):
 
         message = 'You need to implement operator statistics for your operator'
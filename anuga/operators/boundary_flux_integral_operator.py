@@ -67,6 +67,11 @@ class boundary_flux_integral_operator(Operator):
         """
         return True
 
+    def get_changed_indices(self):
+        """Only reads the boundary fluxes
+        """
+        return []
+
     def statistics(self):
 
         message = self.label + ': Boundary_flux_integral operator'
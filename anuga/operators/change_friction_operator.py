@@ -122,6 +122,11 @@ class Erosion_operator(Operator):
         """
         return False
 
+    def get_changed_quantities(self):
+        """Changes the elevation
+        """
+        return ['elevation']
+
     def statistics(self):
 
         message = self.label + ': Erosion_operator'
@@ -112,6 +112,11 @@ class collect_max_quantities_operator(Operator):
         """
         return True
 
+    def get_changed_indices(self):
+        """Only reads the quantities
+        """
+        return []
+
     def statistics(self):
 
         message = self.label + ': Collect_max_quantity operator'
@@ -58,6 +58,11 @@ class Collect_max_stage_operator(Operator):
         """
         return True
 
+    def get_changed_indices(self):
+        """Only reads the quantities
+        """
+        return []
+
     def statistics(self):
 
         message = self.label + ': Collect_max_stage operator'
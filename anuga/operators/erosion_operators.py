@@ -233,6 +233,11 @@ class Erosion_operator(Operator, Region):
         else:
             return False
 
+    def get_changed_quantities(self):
+        """Changes the elevation
+        """
+        return ['elevation']
+
     def statistics(self):
 
         message = self.label + ': Erosion_operator'
@@ -11,9 +11,13 @@ __date__ ="$09/03/2012 4:46:39 PM$"
 
 
 from anuga.config import indent
+import sys
 import numpy as num
+import threading
 import anuga.utilities.log as log
 from anuga.utilities.function_utils import evaluate_temporal_function
+from anuga.fit_interpolate.interpolate import Modeltime_too_early
+from anuga.fit_interpolate.interpolate import Modeltime_too_late
 
 
 from anuga import Quantity
@@ -31,6 +35,12 @@ class Rate_operator(Operator,Region):
 
     Other units can be used by using the factor argument.
 
+    Spatial rates are evaluated at the centroids of the triangles.
+    Rates of type 'x,y' are evaluated once and cached (see
+    invalidate_rate_cache). Rates of type 'x,y,t' are reevaluated every
+    step, or only every rate_update_interval seconds if it is given
+    (for rates that are piecewise constant or slowly varying in time).
+
     """
 
     def __init__(self,
@@ -43,6 +53,7 @@ class Rate_operator(Operator,Region):
                  radius=None,
                  relative_time=True,
                  default_rate=0.0,
+                 rate_update_interval=None,
                  description = None,
                  label = None,
                  logging = False,
@@ -71,6 +82,8 @@ class Rate_operator(Operator,Region):
         self.rate_callable = False
         self.rate_spatial = False
 
+        self.set_coordinates()
+        self.set_rate_update_interval(rate_update_interval)
         self.set_rate(rate)
         self.set_default_rate(default_rate)
 
@@ -102,14 +115,7 @@ class Rate_operator(Operator,Region):
 
 
         if self.rate_spatial:
-            if indices is None:
-                x = self.coord_c[:,0]
-                y = self.coord_c[:,1]
-            else:
-                x = self.coord_c[indices,0]
-                y = self.coord_c[indices,1]
-
-            rate = self.get_spatial_rate(x,y,t)
+            rate = self.get_spatial_rate(t=t)
         elif self.rate_type == 'quantity':
             if indices is None:
                 rate  = self.rate.centroid_values
@@ -164,7 +170,7 @@ class Rate_operator(Operator,Region):
         """
 
         if t is None:
-            t = self.get_time()
+            t = self.domain.get_time(relative_time=self.relative_time)
 
         assert not self.rate_spatial
 
@@ -182,21 +188,35 @@ class Rate_operator(Operator,Region):
     def get_spatial_rate(self, x=None, y=None, t=None):
         """Provide a rate to calculate added volume
         only call if self.rate_spatial = True
+
+        If x and y are not given the rate at the centroids of the
+        operator's triangles is returned, from the cache if it is
+        still valid at time t.
         """
 
         assert self.rate_spatial
 
         if t is None:
-            t = self.get_time()
+            t = self.domain.get_time(relative_time=self.relative_time)
 
         if x is None:
             assert y is None
-            if self.indices is None:
-                x = self.coord_c[:,0]
-                y = self.coord_c[:,1]
-            else:
-                x = self.coord_c[self.indices,0]
-                y = self.coord_c[self.indices,1]
+
+            if self.rate_cache is not None:
+                if self.rate_type == 'x,y':
+                    return self.rate_cache
+
+                t0 = self.rate_cache_time
+                interval = self.rate_update_interval
+                if t == t0 or (interval is not None and t0 <= t < t0 + interval):
+                    return self.rate_cache
+
+            rate = self.get_spatial_rate(self.x_c, self.y_c, t)
+
+            self.rate_cache = num.array(rate, num.float)*num.ones(len(self.x_c))
+            self.rate_cache_time = t
+
+            return self.rate_cache
 
         assert x is not None
         assert y is not None
@@ -232,6 +252,7 @@ class Rate_operator(Operator,Region):
 
 
         self.rate = rate
+        self.invalidate_rate_cache()
 
 
         if self.rate_type == 'scalar':
@@ -252,6 +273,41 @@ class Rate_operator(Operator,Region):
 
 
 
+    def set_rate_update_interval(self, interval=None):
+        """Reevaluate spatial rates of type 'x,y,t' only every interval
+        seconds, None to reevaluate them every step.
+        """
+
+        msg = 'rate_update_interval must be None or positive. I got %s' % interval
+        assert interval is None or interval > 0, msg
+
+        self.rate_update_interval = interval
+        self.invalidate_rate_cache()
+
+
+    def invalidate_rate_cache(self):
+        """Forget the cached spatial rate, e.g. when the data used by the
+        rate function has changed. The rate is reevaluated on next use.
+        """
+
+        self.rate_cache = None
+        self.rate_cache_time = None
+
+
+    def set_coordinates(self):
+        """Store the centroid coordinates of the triangles at which
+        spatial rates are evaluated.
+        """
+
+        if self.indices is None:
+            self.x_c = self.coord_c[:,0]
+            self.y_c = self.coord_c[:,1]
+            return
+
+        self.x_c = self.coord_c[self.indices,0]
+        self.y_c = self.coord_c[self.indices,1]
+
+
     def set_areas(self):
 
         if self.indices is None:
@@ -438,3 +494,286 @@ class Polygonal_rate_operator(Rate_operator):
                                polygon=polygon,
                                default_rate=default_rate,
                                verbose=verbose)
+
+
+#===============================================================================
+# Rate Operator for gridded (radar) rainfall
+#===============================================================================
+class Radar_rate_operator(Rate_operator):
+    """
+    Add rain from a time series of rainfall grids (e.g. calibrated radar
+    rain, see anuga/rain/grid_data.py) over triangles specified by
+    indices, polygon or center and radius.
+
+    rain provides the attributes x and y (increasing pixel centre
+    coordinates), times (end of the accumulation period of each grid),
+    time_step (accumulation period) and either data_slices or a method
+    get_data_slice(tid, rows, cols). Each grid holds the depth of rain (m)
+    over the time_step ending at times[tid], with rows from north to
+    south and columns from west to east (as Raster_time_slice_data).
+
+    The rate on each triangle is the area weighted mean of the pixel
+    rates over the triangle, computed by sampling the triangle at the
+    centroids of a regular subdivision. Each edge is divided into twice
+    the length of the longest edge in pixel sizes (rounded up), but at
+    most max_subdivisions, parts. The weights are stored once as a sparse matrix
+    restricted to the pixels covering the local mesh (so each process of
+    a parallel domain only reads its own part of the grids), and each new
+    grid costs one sparse matrix-vector product. If prefetch is True the
+    next grid is read and mapped onto the mesh in a background thread, an
+    error doing so is raised when that grid is needed.
+
+    Pixels outside the grids have no rain. Times outside the grids use
+    default_rate. Times are absolute (see domain.set_starttime) unless
+    relative_time is True.
+    """
+
+    def __init__(self, domain,
+                 rain=None,
+                 factor=1.0,
+                 indices=None,
+                 polygon=None,
+                 center=None,
+                 radius=None,
+                 relative_time=False,
+                 default_rate=0.0,
+                 max_subdivisions=16,
+                 prefetch=True,
+                 description = None,
+                 label = None,
+                 logging = False,
+                 verbose = False,
+                 monitor = False):
+
+        if rain is None:
+            msg = 'Radar_rate_operator needs rainfall grids (rain=...)'
+            raise Exception(msg)
+
+        Rate_operator.__init__(self,
+                               domain,
+                               rate=0.0,
+                               factor=factor,
+                               indices=indices,
+                               polygon=polygon,
+                               center=center,
+                               radius=radius,
+                               relative_time=relative_time,
+                               default_rate=default_rate,
+                               description=description,
+                               label=label,
+                               logging=logging,
+                               verbose=verbose,
+                               monitor=monitor)
+
+        self.rate = rain
+        self.rate_type = 'radar'
+        self.rate_callable = True
+        self.rate_spatial = True
+
+        self.times = num.array(rain.times, num.float)
+        self.time_step = float(rain.time_step)
+        self.prefetch = prefetch
+
+        self.set_weights(max_subdivisions)
+
+        # Rates of the current grid and of the next one (read ahead)
+        self.tid = None
+        self.rates = None
+        self.next_tid = None
+        self.next_rates = None
+        self.thread = None
+        self.prefetch_error = None
+
+
+    def set_weights(self, max_subdivisions=16):
+        """Compute the sparse matrix of weights of the pixels of the
+        local window of the grids (self.rows, self.cols) for the triangles
+        of the operator.
+        """
+
+        from anuga.utilities.sparse import Sparse_CSR
+
+        x = num.array(self.rate.x, num.float)
+        y = num.array(self.rate.y, num.float)
+
+        if self.indices is None:
+            ids = num.arange(len(self.domain))
+        else:
+            ids = num.array(self.indices, num.int)
+        N = len(ids)
+
+        vertices = self.domain.get_vertex_coordinates(absolute=True)
+        vertices = vertices.reshape(-1, 3, 2)[ids]
+
+        pixel_size = min(num.min(num.diff(x)), num.min(num.diff(y)))
+
+        # Number of subdivisions of each triangle edge
+        edges = vertices - num.roll(vertices, 1, axis=1)
+        diameter = num.max(num.sqrt(num.sum(edges**2, axis=2)), axis=1)
+        subdivisions = num.ceil(2*diameter/pixel_size)
+        subdivisions = subdivisions.clip(1, max_subdivisions).astype(num.int)
+
+        rows = []
+        samples = []
+        weights = []
+        for n in num.unique(subdivisions):
+            k = num.where(subdivisions == n)[0]
+
+            # Barycentric coordinates of the centroids of the n**2 equal
+            # subtriangles
+            a = []
+            b = []
+            for i in range(n):
+                for j in range(n - i):
+                    a.append(i + 1.0/3); b.append(j + 1.0/3)
+                    if i + j < n - 1:
+                        a.append(i + 2.0/3); b.append(j + 2.0/3)
+            a = num.array(a)/n
+            b = num.array(b)/n
+
+            V = vertices[k]
+            P = V[:,0,num.newaxis,:] + \
+                a[num.newaxis,:,num.newaxis]*(V[:,1,num.newaxis,:] - V[:,0,num.newaxis,:]) + \
+                b[num.newaxis,:,num.newaxis]*(V[:,2,num.newaxis,:] - V[:,0,num.newaxis,:])
+
+            rows.append(num.repeat(k, n*n))
+            samples.append(P.reshape(-1, 2))
+            weights.append(num.ones(len(k)*n*n)/(n*n))
+
+        rows = num.concatenate(rows)
+        samples = num.concatenate(samples)
+        weights = num.concatenate(weights)
+
+        # Pixel of each sample, dropping those outside the grids
+        ix = num.searchsorted(0.5*(x[1:] + x[:-1]), samples[:,0])
+        iy = num.searchsorted(0.5*(y[1:] + y[:-1]), samples[:,1])
+
+        x_min = x[0] - 0.5*(x[1] - x[0])
+        x_max = x[-1] + 0.5*(x[-1] - x[-2])
+        y_min = y[0] - 0.5*(y[1] - y[0])
+        y_max = y[-1] + 0.5*(y[-1] - y[-2])
+        inside = (samples[:,0] >= x_min) & (samples[:,0] <= x_max) & \
+                 (samples[:,1] >= y_min) & (samples[:,1] <= y_max)
+
+        rows = rows[inside]
+        weights = weights[inside]
+        cols = ix[inside]
+        grid_rows = len(y) - 1 - iy[inside]    # Rows from north to south
+
+        # Local window of the grids
+        if len(rows) > 0:
+            r0, r1 = num.min(grid_rows), num.max(grid_rows) + 1
+            c0, c1 = num.min(cols), num.max(cols) + 1
+        else:
+            r0 = r1 = c0 = c1 = 0
+        self.rows = slice(r0, r1)
+        self.cols = slice(c0, c1)
+
+        colind = (grid_rows - r0)*(c1 - c0) + (cols - c0)
+
+        order = num.argsort(rows, kind='mergesort')
+        row_ptr = num.zeros(N + 1, num.int)
+        row_ptr[1:] = num.cumsum(num.bincount(rows, minlength=N))
+
+        self.weights = Sparse_CSR(None, weights[order], colind[order],
+                                  row_ptr, N, (r1 - r0)*(c1 - c0))
+
+        if self.verbose:
+            log.critical('Radar_rate_operator: %d triangles, %d x %d pixels'
+                         % (N, r1 - r0, c1 - c0))
+
+
+    def get_grid_rates(self, tid):
+        """Return the rates on the triangles from grid tid
+        """
+
+        rain = self.rate
+
+        if self.weights.N == 0:
+            return num.zeros(self.weights.M, num.float)
+
+        if hasattr(rain, 'get_data_slice'):
+            data = rain.get_data_slice(tid, self.rows, self.cols)
+        else:
+            data = num.asarray(rain.data_slices[tid])[self.rows, self.cols]
+
+        data = num.array(data, num.float).flatten()
+
+        return (self.weights*data)/self.time_step
+
+
+    def get_grid_index(self, t):
+        """Return the index of the grid covering time t, or None
+        """
+
+        tid = num.searchsorted(self.times, t)
+
+        if tid == len(self.times) or t <= self.times[tid] - self.time_step:
+            return None
+
+        return int(tid)
+
+
+    def get_spatial_rate(self, x=None, y=None, t=None):
+        """Rates on the triangles of the operator at time t. The
+        coordinates x, y are ignored as the mapping is precomputed.
+        """
+
+        if t is None:
+            t = self.domain.get_time(relative_time=self.relative_time)
+
+        tid = self.get_grid_index(t)
+
+        if tid is None:
+            if self.default_rate is None:
+                msg = 'Time %g is not covered by the rainfall grids' % t
+                if t <= self.times[0]:
+                    raise Modeltime_too_early(msg)
+                raise Modeltime_too_late(msg)
+
+            rate = self.default_rate(t)
+            return rate*num.ones(self.weights.M, num.float)
+
+        if tid != self.tid:
+            self.set_grid(tid)
+
+        return self.rates
+
+
+    def set_grid(self, tid):
+        """Make grid tid current and start reading the next one
+        """
+
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        if self.prefetch_error is not None:
+            error, self.prefetch_error = self.prefetch_error, None
+            if self.next_tid == tid:
+                raise error[0], error[1], error[2]
+
+        if self.next_tid == tid and self.next_rates is not None:
+            self.rates = self.next_rates
+        else:
+            self.rates = self.get_grid_rates(tid)
+        self.tid = tid
+
+        self.next_tid = self.next_rates = None
+        if self.prefetch and tid + 1 < len(self.times):
+            self.next_tid = tid + 1
+            self.thread = threading.Thread(target=self._prefetch_grid,
+                                           args=(tid + 1,))
+            self.thread.daemon = True
+            self.thread.start()
+
+
+    def _prefetch_grid(self, tid):
+        """Read grid tid in the background. An error is recorded and
+        raised by set_grid when the grid is needed.
+        """
+
+        try:
+            self.next_rates = self.get_grid_rates(tid)
+        except Exception:
+            self.prefetch_error = sys.exc_info()
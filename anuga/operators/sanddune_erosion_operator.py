@@ -291,5 +291,10 @@ class Sanddune_erosion_operator(Operator, Region)  :
             return True
         else:
             return False
+
+    def get_changed_quantities(self):
+        """Changes the elevation
+        """
+        return ['elevation']
         
                         
@@ -61,6 +61,11 @@ class Set_elevation_operator(Operator, Set_elevation):
         """
         return True
 
+    def get_changed_quantities(self):
+        """Changes the elevation
+        """
+        return ['elevation']
+
     def statistics(self):
 
         message = self.label + ': Set_elevation_operator'
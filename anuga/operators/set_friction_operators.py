@@ -84,6 +84,16 @@ class Depth_friction_operator(Operator, Region):
         """
         return True
 
+    def get_changed_indices(self):
+        """Only changes the friction
+        """
+        return []
+
+    def get_changed_quantities(self):
+        """Changes the friction
+        """
+        return ['friction']
+
     def statistics(self):
 
         message = self.label + ': Set_depth_friction_operator'
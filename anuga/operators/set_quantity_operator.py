@@ -75,6 +75,11 @@ class Set_quantity_operator(Operator, Set_quantity):
         """
         return True
 
+    def get_changed_quantities(self):
+        """Changes the quantity it sets
+        """
+        return [self.quantity]
+
     def statistics(self):
 
         message = self.label + ': Set_elevation_operator'
@@ -983,6 +983,185 @@ class Test_rate_operators(unittest.TestCase):
         assert num.allclose(float(rr[3]), 0.0)
 
 
+    def test_rate_operator_cached_spatial_rate(self):
+
+        domain = rectangular_cross_domain(4, 4, len1=4., len2=4.)
+        domain.set_quantity('elevation', 0.0)
+        domain.set_quantity('stage', 1.0)
+
+        calls = []
+
+        def rate_xy(x, y):
+            calls.append(1)
+            return 0.001*(x + y)
+
+        indices = [0, 3, 7]
+        operator = Rate_operator(domain, rate=rate_xy, indices=indices)
+        del calls[:]
+
+        x = domain.centroid_coordinates[indices,0]
+        y = domain.centroid_coordinates[indices,1]
+
+        domain.timestep = 1.0
+        for t in [0.0, 1.0, 2.0]:
+            domain.set_time(t)
+            operator()
+        assert len(calls) == 1
+
+        stage = domain.quantities['stage'].centroid_values
+        assert num.allclose(stage[indices], 1.0 + 3*0.001*(x + y))
+        assert num.allclose(operator.get_Q(), num.sum(domain.areas[indices]*0.001*(x + y)))
+        assert len(calls) == 1
+
+        # Explicit invalidation
+        operator.invalidate_rate_cache()
+        operator()
+        assert len(calls) == 2
+
+        # Time dependent rates are evaluated every step, or every
+        # rate_update_interval seconds
+        def rate_xyt(x, y, t):
+            calls.append(1)
+            return 0.001*(x + y)*num.floor(t/10.0)
+
+        operator = Rate_operator(domain, rate=rate_xyt, indices=indices)
+        del calls[:]
+        for t in [0.0, 1.0, 2.0, 2.0]:
+            domain.set_time(t)
+            operator()
+        assert len(calls) == 3
+
+        operator = Rate_operator(domain, rate=rate_xyt, indices=indices,
+                                 rate_update_interval=10.0)
+        del calls[:]
+        for t in [0.0, 5.0, 9.9, 10.0, 15.0, 5.0]:
+            domain.set_time(t)
+            rate = operator.get_spatial_rate()
+            assert num.allclose(rate, 0.001*(x + y)*num.floor(t/10.0))
+        assert len(calls) == 3
+
+        operator.set_rate(rate_xy)
+        domain.set_time(0.0)
+        assert num.allclose(operator.get_spatial_rate(), 0.001*(x + y))
+
+        # The operator and get_Q evaluate the rate at the same (absolute)
+        # time, so they share the cache
+        domain.set_starttime(100.0)
+        operator = Rate_operator(domain, rate=rate_xyt, indices=indices,
+                                 relative_time=False)
+        del calls[:]
+        domain.set_time(5.0)
+        operator()
+        Q = operator.get_Q()
+        assert len(calls) == 1
+        assert num.allclose(Q, num.sum(domain.areas[indices]*0.01*(x + y)))
+
+    def test_radar_rate_operator(self):
+
+        class Rain:
+            # Rainfall grids as Raster_time_slice_data, with rows from
+            # north to south
+            pass
+
+        def create_rain(nx, ny, dx):
+            rain = Rain()
+            rain.x = (num.arange(nx) + 0.5)*dx
+            rain.y = (num.arange(ny) + 0.5)*dx
+            rain.times = num.array([600.0, 1200.0, 1800.0])
+            rain.time_step = 600.0
+
+            # Depth (m) in the pixel of column i and row j (from south)
+            I, J = num.meshgrid(num.arange(nx), num.arange(ny))
+            rain.data_slices = [num.flipud(0.001*(k + 1)*(I + nx*J))
+                                for k in range(len(rain.times))]
+            return rain
+
+        domain = rectangular_cross_domain(10, 10, len1=10., len2=10.)
+        domain.set_quantity('elevation', 0.0)
+        domain.set_quantity('stage', 1.0)
+        domain.set_starttime(0.0)
+
+        # Pixels aligned with the mesh, so each triangle has the value
+        # of the pixel containing it
+        rain = create_rain(10, 10, 1.0)
+        operator = Radar_rate_operator(domain, rain=rain)
+
+        x = domain.centroid_coordinates[:,0]
+        y = domain.centroid_coordinates[:,1]
+        pixel = num.floor(x) + 10*num.floor(y)
+
+        for t, k in [(600.0, 0), (700.0, 1), (1200.0, 1), (1500.0, 2)]:
+            domain.set_time(t)
+            rate = operator.get_spatial_rate()
+            assert num.allclose(rate, 0.001*(k + 1)*pixel/600.0)
+            assert operator.tid == k
+        assert operator.next_tid is None
+
+        for t in [0.0, 1900.0]:
+            domain.set_time(t)
+            assert num.allclose(operator.get_spatial_rate(), 0.0)
+
+        # Rain is added to the stage
+        domain.set_time(700.0)
+        domain.timestep = 10.0
+        operator()
+        stage = domain.quantities['stage'].centroid_values
+        assert num.allclose(stage, 1.0 + 10.0*0.002*pixel/600.0)
+
+        # Coarse mesh on fine pixels conserves the volume of rain
+        domain = rectangular_cross_domain(2, 2, len1=10., len2=10.)
+        rain = create_rain(10, 10, 1.0)
+        operator = Radar_rate_operator(domain, rain=rain, prefetch=False)
+
+        domain.set_time(600.0)
+        Q = operator.get_Q()
+        assert num.allclose(Q, num.sum(rain.data_slices[0])/600.0, rtol=1.0e-2)
+
+        # Pixels outside the grid have no rain, and only the pixels
+        # covering the operator's triangles are read
+        domain = rectangular_cross_domain(10, 10, len1=10., len2=10.)
+        rain = create_rain(4, 6, 2.0)
+        polygon = [[0.0, 4.0], [3.9, 4.0], [3.9, 10.0], [0.0, 10.0]]
+        operator = Radar_rate_operator(domain, rain=rain, polygon=polygon)
+
+        assert operator.rows == slice(1, 4)
+        assert operator.cols == slice(0, 2)
+
+        domain.set_time(600.0)
+        rate = operator.get_spatial_rate()
+        x = domain.centroid_coordinates[operator.indices,0]
+        y = domain.centroid_coordinates[operator.indices,1]
+        pixel = num.floor(x/2.0) + 4*num.floor(y/2.0)
+        assert num.allclose(rate, num.where(y < 12.0, 0.001*pixel/600.0, 0.0))
+
+        domain = rectangular_cross_domain(10, 10, len1=10., len2=14.)
+        operator = Radar_rate_operator(domain, rain=rain)
+        domain.set_time(600.0)
+        rate = operator.get_spatial_rate()
+        assert num.all(rate[domain.centroid_coordinates[:,1] > 12.0] == 0.0)
+
+        # An error reading the next grid in the background is raised
+        # when that grid is needed
+        rain = create_rain(10, 10, 1.0)
+        def get_data_slice(tid, rows, cols):
+            if tid == 1:
+                raise IOError('Grid %d can not be read' % tid)
+            return rain.data_slices[tid][rows, cols]
+        rain.get_data_slice = get_data_slice
+
+        operator = Radar_rate_operator(domain, rain=rain)
+        domain.set_time(600.0)
+        operator.get_spatial_rate()
+
+        domain.set_time(700.0)
+        try:
+            operator.get_spatial_rate()
+        except IOError:
+            pass
+        else:
+            raise Exception('Should have raised IOError')
+
+
 if __name__ == "__main__":
     suite = unittest.makeSuite(Test_rate_operators, 'test')
     runner = unittest.TextTestRunner(verbosity=1)
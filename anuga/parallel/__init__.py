@@ -22,6 +22,7 @@ if pypar_available:
     from parallel_advection     import Parallel_domain as Parallel_advection_domain
     from parallel_operator_factory import Inlet_operator, Boyd_box_operator, Boyd_pipe_operator
     from parallel_operator_factory import Weir_orifice_trapezoid_operator
+    from parallel_structure_scheduler import Parallel_structure_scheduler
 else:
     from anuga import rectangular_cross as parallel_rectangle
     from anuga import Domain as Parallel_shallow_water_domain
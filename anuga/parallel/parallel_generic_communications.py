@@ -12,6 +12,35 @@ import numpy as num
 import anuga.utilities.parallel_abstraction as pypar
 
 
+class Pypar_communicator:
+    """Communication between the processors of a parallel run. Any object
+    with the same rank, size, send, receive and allreduce attributes can
+    be used instead, e.g. to test the parallel classes without mpi.
+    """
+
+    def __init__(self):
+
+        self.rank = pypar.rank()
+        self.size = pypar.size()
+
+    def send(self, x, destination):
+
+        pypar.send(x, destination)
+
+    def receive(self, source):
+
+        return pypar.receive(source)
+
+    def allreduce(self, x, buffer):
+        """Sum the array x over all processors into buffer
+        """
+
+        import anuga.parallel.pypar_ext as par_exts
+
+        par_exts.allreduce(x, pypar.SUM, buffer=buffer, bypass=True)
+
+
+
 
 
 def setup_buffers(domain):
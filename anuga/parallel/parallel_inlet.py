@@ -8,6 +8,7 @@ import math
 
 import numpy as num
 from anuga.structures.inlet import Inlet
+from anuga.parallel.parallel_generic_communications import Pypar_communicator
 import warnings
 
 class Parallel_Inlet(Inlet):
@@ -22,10 +23,14 @@ class Parallel_Inlet(Inlet):
     
     procs - is the list of all processors associated with this inlet.
 
+    communicator - sends values between the processors, by default a
+    Pypar_communicator.
+
     (We assume that the above arguments are determined correctly by the parallel_operator_factory)
     """
 
-    def __init__(self, domain, poly, master_proc = 0, procs = None, verbose=False):
+    def __init__(self, domain, poly, master_proc = 0, procs = None, verbose=False,
+                 communicator=None):
 
         self.domain = domain
         self.poly = num.asarray(poly, dtype=num.float64)
@@ -42,8 +47,11 @@ class Parallel_Inlet(Inlet):
         else:
             self.procs = procs
 
-        import pypar
-        self.myid = pypar.rank()
+        if communicator is None:
+            communicator = Pypar_communicator()
+
+        self.communicator = communicator
+        self.myid = communicator.rank
 
         self.compute_triangle_indices()
         self.compute_area()
@@ -118,7 +126,6 @@ class Parallel_Inlet(Inlet):
         # WARNING: requires synchronization, must be called by all procs associated
         # with this inlet
 
-        import pypar
         local_area = self.area
         area = local_area
 
@@ -127,10 +134,10 @@ class Parallel_Inlet(Inlet):
             for i in self.procs:
                 if i == self.master_proc: continue
 
-                val = pypar.receive(i)
+                val = self.communicator.receive(i)
                 area = area + val
         else:
-            pypar.send(area, self.master_proc)
+            self.communicator.send(area, self.master_proc)
 
         return area
 
@@ -159,7 +166,6 @@ class Parallel_Inlet(Inlet):
         # WARNING: requires synchronization, must be called by all procs associated
         # with this inlet
 
-        import pypar
         local_stage = num.sum(self.get_stages()*self.get_areas())
         global_area = self.get_global_area()
 
@@ -171,10 +177,10 @@ class Parallel_Inlet(Inlet):
             for i in self.procs:
                 if i == self.master_proc: continue
 
-                val = pypar.receive(i)
+                val = self.communicator.receive(i)
                 global_stage = global_stage + val
         else:
-            pypar.send(local_stage, self.master_proc)
+            self.communicator.send(local_stage, self.master_proc)
 
 
         if global_area > 0.0:
@@ -200,7 +206,6 @@ class Parallel_Inlet(Inlet):
         # WARNING: requires synchronization, must be called by all procs associated
         # with this inlet
 
-        import pypar
         local_elevation = num.sum(self.get_elevations()*self.get_areas())
         global_area = self.get_global_area()
 
@@ -212,10 +217,10 @@ class Parallel_Inlet(Inlet):
             for i in self.procs:
                 if i == self.master_proc: continue
 
-                val = pypar.receive(i)
+                val = self.communicator.receive(i)
                 global_elevation = global_elevation + val
         else:
-            pypar.send(local_elevation, self.master_proc)
+            self.communicator.send(local_elevation, self.master_proc)
 
 
         if global_area > 0.0:
@@ -241,7 +246,6 @@ class Parallel_Inlet(Inlet):
         # WARNING: requires synchronization, must be called by all procs associated
         # with this inlet
 
-        import pypar
         global_area = self.get_global_area()
         local_xmoms = num.sum(self.get_xmoms()*self.get_areas())
         global_xmoms = local_xmoms
@@ -250,10 +254,10 @@ class Parallel_Inlet(Inlet):
             for i in self.procs:
                 if i == self.master_proc: continue
 
-                val = pypar.receive(i)
+                val = self.communicator.receive(i)
                 global_xmoms = global_xmoms + val
         else:
-            pypar.send(local_xmoms, self.master_proc)
+            self.communicator.send(local_xmoms, self.master_proc)
 
 
         if global_area > 0.0:
@@ -276,7 +280,6 @@ class Parallel_Inlet(Inlet):
         # WARNING: requires synchronization, must be called by all procs associated
         # with this inlet
 
-        import pypar
         global_area = self.get_global_area()
         local_ymoms = num.sum(self.get_ymoms()*self.get_areas())
         global_ymoms = local_ymoms
@@ -285,10 +288,10 @@ class Parallel_Inlet(Inlet):
             for i in self.procs:
                 if i == self.master_proc: continue
 
-                val = pypar.receive(i)
+                val = self.communicator.receive(i)
                 global_ymoms = global_ymoms + val
         else:
-            pypar.send(local_ymoms, self.master_proc)
+            self.communicator.send(local_ymoms, self.master_proc)
 
 
         if global_area > 0.0:
@@ -310,7 +313,6 @@ class Parallel_Inlet(Inlet):
         # WARNING: requires synchronization, must be called by all procs associated
         # with this inlet
 
-        import pypar
         local_volume = num.sum(self.get_depths()*self.get_areas())
         volume = local_volume
 
@@ -319,10 +321,10 @@ class Parallel_Inlet(Inlet):
             for i in self.procs:
                 if i == self.master_proc: continue
 
-                val = pypar.receive(i)
+                val = self.communicator.receive(i)
                 volume = volume + val
         else:
-            pypar.send(volume, self.master_proc)
+            self.communicator.send(volume, self.master_proc)
 
         return volume
 
@@ -428,7 +430,6 @@ class Parallel_Inlet(Inlet):
         # WARNING: requires synchronization, must be called by all procs associated
         # with this inlet
 
-        import pypar
         centroid_coordinates = self.domain.get_full_centroid_coordinates(absolute=True)
         areas = self.get_areas()
         stages = self.get_stages()
@@ -450,16 +451,16 @@ class Parallel_Inlet(Inlet):
             # Recieve areas, stages, and stages order
             for i in self.procs:
                 if i != self.master_proc:
-                    s_areas[i] = pypar.receive(i)
-                    s_stages[i] = pypar.receive(i)
-                    s_stages_order[i] = pypar.receive(i)
+                    s_areas[i] = self.communicator.receive(i)
+                    s_stages[i] = self.communicator.receive(i)
+                    s_stages_order[i] = self.communicator.receive(i)
                     total_stages = total_stages + len(s_stages[i])
 
         else:
             # Send areas, stages, and stages order to master proc of inlet
-            pypar.send(areas, self.master_proc)
-            pypar.send(stages, self.master_proc)
-            pypar.send(stages_order, self.master_proc)
+            self.communicator.send(areas, self.master_proc)
+            self.communicator.send(stages, self.master_proc)
+            self.communicator.send(stages_order, self.master_proc)
 
         # merge sorted stage order
         if self.myid == self.master_proc:
@@ -518,14 +519,14 @@ class Parallel_Inlet(Inlet):
             # Send postion and new stage to all processors
             for i in self.procs:
                 if i != self.master_proc:
-                    pypar.send(pos[i], i)
-                    pypar.send(new_stage, i)
+                    self.communicator.send(pos[i], i)
+                    self.communicator.send(new_stage, i)
 
             # Update own depth
             stages[stages_order[0:pos[self.myid]]] = new_stage
         else:
-            pos = pypar.receive(self.master_proc)
-            new_stage = pypar.receive(self.master_proc)
+            pos = self.communicator.receive(self.master_proc)
+            new_stage = self.communicator.receive(self.master_proc)
             stages[stages_order[0:pos]] = new_stage
 
         self.set_stages(stages)
@@ -551,7 +552,6 @@ class Parallel_Inlet(Inlet):
         # WARNING: requires synchronization, must be called by all procs associated
         # with this inlet
 
-        import pypar
 
         message = ''
 
@@ -563,10 +563,10 @@ class Parallel_Inlet(Inlet):
             for proc in self.procs:
                 if proc == self.master_proc: continue
                 
-                tri_indices[proc] = pypar.receive(proc)
+                tri_indices[proc] = self.communicator.receive(proc)
 
         else:
-            pypar.send(self.triangle_indices, self.master_proc)
+            self.communicator.send(self.triangle_indices, self.master_proc)
 
 
         if self.myid == self.master_proc:
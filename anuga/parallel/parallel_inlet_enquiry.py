@@ -23,13 +23,13 @@ class Parallel_Inlet_enquiry(parallel_inlet.Parallel_Inlet):
                  master_proc = 0,
                  procs = None,
                  enquiry_proc = -1,
-                 verbose=False):
+                 verbose=False,
+                 communicator=None):
 
    
         parallel_inlet.Parallel_Inlet.__init__(self, domain, polyline,
-                                                master_proc = master_proc, procs = procs, verbose=verbose)
-
-        import pypar
+                                                master_proc = master_proc, procs = procs, verbose=verbose,
+                                                communicator = communicator)
 
         self.enquiry_pt = enquiry_pt
         self.invert_elevation = invert_elevation
@@ -9,6 +9,7 @@ import anuga.structures.inlet
 from anuga.utilities.system_tools import log_to_file
 from anuga.structures.inlet_operator import Inlet_operator
 import parallel_inlet
+from anuga.parallel.parallel_generic_communications import Pypar_communicator
 
 
 class Parallel_Inlet_operator(Inlet_operator):
@@ -27,6 +28,7 @@ class Parallel_Inlet_operator(Inlet_operator):
     master_proc - index of the processor which coordinates all processors
     associated with this inlet operator.
     procs - list of all processors associated with this inlet operator
+    communicator - sends values between the processors (default Pypar_communicator)
 
     """
 
@@ -41,9 +43,9 @@ class Parallel_Inlet_operator(Inlet_operator):
                  logging = False,
                  master_proc = 0,
                  procs = None,
-                 verbose = False):
+                 verbose = False,
+                 communicator = None):
 
-        import pypar
         self.domain = domain
         self.domain.set_fractional_step_operator(self)
         self.poly = numpy.array(poly, dtype='d')
@@ -54,7 +56,11 @@ class Parallel_Inlet_operator(Inlet_operator):
         else:
             self.procs = procs
 
-        self.myid = pypar.rank()
+        if communicator is None:
+            communicator = Pypar_communicator()
+
+        self.communicator = communicator
+        self.myid = communicator.rank
 
         # should set this up to be a function of time and or space)
         self.Q = Q
@@ -86,7 +92,8 @@ class Parallel_Inlet_operator(Inlet_operator):
 
         #self.outward_vector = self.poly
         self.inlet = parallel_inlet.Parallel_Inlet(self.domain, self.poly, master_proc = master_proc,
-                                                    procs = procs, verbose= verbose)
+                                                    procs = procs, verbose= verbose,
+                                                    communicator = communicator)
 
         if velocity is not None:
             assert len(velocity)==2
@@ -101,7 +108,6 @@ class Parallel_Inlet_operator(Inlet_operator):
 
     def __call__(self):
 
-        import pypar
         volume = 0
 
         # Need to run global command on all processors
@@ -125,9 +131,9 @@ class Parallel_Inlet_operator(Inlet_operator):
             for i in self.procs:
                 if i == self.master_proc: continue
 
-                pypar.send((volume, current_volume, total_area, timestep), i)
+                self.communicator.send((volume, current_volume, total_area, timestep), i)
         else:
-            volume, current_volume, total_area, timestep = pypar.receive(self.master_proc)
+            volume, current_volume, total_area, timestep = self.communicator.receive(self.master_proc)
 
 
         #print self.myid, volume, current_volume, total_area, timestep
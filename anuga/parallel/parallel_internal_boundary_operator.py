@@ -40,7 +40,8 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
                  procs = None,
                  inlet_master_proc = [0,0],
                  inlet_procs = None,
-                 enquiry_proc = [0,0]):
+                 enquiry_proc = [0,0],
+                 communicator = None):
 
         if verbose:
             print '########################################'
@@ -82,7 +83,8 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
                                           procs=procs,
                                           inlet_master_proc=inlet_master_proc,
                                           inlet_procs=inlet_procs,
-                                          enquiry_proc=enquiry_proc)
+                                          enquiry_proc=enquiry_proc,
+                                          communicator=communicator)
        
  
         self.internal_boundary_function = internal_boundary_function
@@ -154,8 +156,6 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
 
     def discharge_routine_explicit(self):
 
-        import pypar
-
         local_debug = False
         
         # If the structure has been closed, then no water gets through
@@ -178,25 +178,25 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
                 enq_total_energy0 = self.inlets[0].get_enquiry_total_energy()
                 enq_stage0 = self.inlets[0].get_enquiry_stage()
             else:
-                enq_total_energy0 = pypar.receive(self.enquiry_proc[0])
-                enq_stage0 = pypar.receive(self.enquiry_proc[0])
+                enq_total_energy0 = self.communicator.receive(self.enquiry_proc[0])
+                enq_stage0 = self.communicator.receive(self.enquiry_proc[0])
 
 
             if self.myid == self.enquiry_proc[1]:
                 enq_total_energy1 = self.inlets[1].get_enquiry_total_energy()
                 enq_stage1 = self.inlets[1].get_enquiry_stage()
             else:
-                enq_total_energy1 = pypar.receive(self.enquiry_proc[1])
-                enq_stage1 = pypar.receive(self.enquiry_proc[1])
+                enq_total_energy1 = self.communicator.receive(self.enquiry_proc[1])
+                enq_stage1 = self.communicator.receive(self.enquiry_proc[1])
 
         else:
             if self.myid == self.enquiry_proc[0]:
-                pypar.send(self.inlets[0].get_enquiry_total_energy(), self.master_proc)
-                pypar.send(self.inlets[0].get_enquiry_stage(), self.master_proc)
+                self.communicator.send(self.inlets[0].get_enquiry_total_energy(), self.master_proc)
+                self.communicator.send(self.inlets[0].get_enquiry_stage(), self.master_proc)
 
             if self.myid == self.enquiry_proc[1]:
-                pypar.send(self.inlets[1].get_enquiry_total_energy(), self.master_proc)
-                pypar.send(self.inlets[1].get_enquiry_stage(), self.master_proc)
+                self.communicator.send(self.inlets[1].get_enquiry_total_energy(), self.master_proc)
+                self.communicator.send(self.inlets[1].get_enquiry_stage(), self.master_proc)
 
 
         # Determine the direction of the flow
@@ -269,14 +269,14 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
 
                 for i in self.procs:
                     if i == self.master_proc: continue
-                    pypar.send(True, i)
+                    self.communicator.send(True, i)
             else:
                 for i in self.procs:
                     if i == self.master_proc: continue
-                    pypar.send(False, i)
+                    self.communicator.send(False, i)
 
         else:
-            reverse = pypar.receive(self.master_proc)
+            reverse = self.communicator.receive(self.master_proc)
 
             if reverse:
                 self.inflow_index = 1
@@ -307,8 +307,6 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
 
         """
 
-        import pypar
-
         local_debug = False
         
         # If the structure has been closed, then no water gets through
@@ -331,25 +329,25 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
                 enq_total_energy0 = self.inlets[0].get_enquiry_total_energy()
                 enq_stage0 = self.inlets[0].get_enquiry_stage()
             else:
-                enq_total_energy0 = pypar.receive(self.enquiry_proc[0])
-                enq_stage0 = pypar.receive(self.enquiry_proc[0])
+                enq_total_energy0 = self.communicator.receive(self.enquiry_proc[0])
+                enq_stage0 = self.communicator.receive(self.enquiry_proc[0])
 
 
             if self.myid == self.enquiry_proc[1]:
                 enq_total_energy1 = self.inlets[1].get_enquiry_total_energy()
                 enq_stage1 = self.inlets[1].get_enquiry_stage()
             else:
-                enq_total_energy1 = pypar.receive(self.enquiry_proc[1])
-                enq_stage1 = pypar.receive(self.enquiry_proc[1])
+                enq_total_energy1 = self.communicator.receive(self.enquiry_proc[1])
+                enq_stage1 = self.communicator.receive(self.enquiry_proc[1])
 
         else:
             if self.myid == self.enquiry_proc[0]:
-                pypar.send(self.inlets[0].get_enquiry_total_energy(), self.master_proc)
-                pypar.send(self.inlets[0].get_enquiry_stage(), self.master_proc)
+                self.communicator.send(self.inlets[0].get_enquiry_total_energy(), self.master_proc)
+                self.communicator.send(self.inlets[0].get_enquiry_stage(), self.master_proc)
 
             if self.myid == self.enquiry_proc[1]:
-                pypar.send(self.inlets[1].get_enquiry_total_energy(), self.master_proc)
-                pypar.send(self.inlets[1].get_enquiry_stage(), self.master_proc)
+                self.communicator.send(self.inlets[1].get_enquiry_total_energy(), self.master_proc)
+                self.communicator.send(self.inlets[1].get_enquiry_stage(), self.master_proc)
 
         # Send inlet areas to the master proc. FIXME: Inlet areas don't change
         # -- perhaps we could just do this once?
@@ -360,9 +358,9 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
 
         if self.myid == self.master_proc:
             if self.myid != self.inlet_master_proc[0]:
-                area0 = pypar.receive(self.inlet_master_proc[0])
+                area0 = self.communicator.receive(self.inlet_master_proc[0])
         elif self.myid == self.inlet_master_proc[0]:
-            pypar.send(area0, self.master_proc)
+            self.communicator.send(area0, self.master_proc)
         
         # area1
         if self.myid in self.inlet_procs[1]:
@@ -370,9 +368,9 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
 
         if self.myid == self.master_proc:
             if self.myid != self.inlet_master_proc[1]:
-                area1 = pypar.receive(self.inlet_master_proc[1])
+                area1 = self.communicator.receive(self.inlet_master_proc[1])
         elif self.myid == self.inlet_master_proc[1]:
-            pypar.send(area1, self.master_proc)
+            self.communicator.send(area1, self.master_proc)
 
         # Compute discharge
         if self.myid == self.master_proc:
@@ -439,14 +437,14 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
 
                 for i in self.procs:
                     if i == self.master_proc: continue
-                    pypar.send(True, i)
+                    self.communicator.send(True, i)
             else:
                 for i in self.procs:
                     if i == self.master_proc: continue
-                    pypar.send(False, i)
+                    self.communicator.send(False, i)
 
         else:
-            reverse = pypar.receive(self.master_proc)
+            reverse = self.communicator.receive(self.master_proc)
 
             if reverse:
                 self.inflow_index = 1
@@ -31,6 +31,7 @@ import anuga.structures.weir_orifice_trapezoid_operator
 
 from anuga.utilities.numerical_tools import ensure_numeric
 from anuga.parallel.parallel_shallow_water import Parallel_domain
+from anuga.parallel.parallel_generic_communications import Pypar_communicator
 
 import math
 
@@ -53,7 +54,8 @@ def Inlet_operator(domain,
                    logging = False,
                    master_proc = 0,
                    procs = None,
-                   verbose = False):
+                   verbose = False,
+                   communicator = None):
 
     # If not parallel domain then allocate serial Inlet operator
     if isinstance(domain, Parallel_domain) is False:
@@ -68,11 +70,13 @@ def Inlet_operator(domain,
                                                               logging = logging,
                                                               verbose = verbose)
 
-    import pypar
+    if communicator is None:
+        communicator = Pypar_communicator()
+
     if procs is None:
-        procs = range(0,pypar.size())
+        procs = range(0, communicator.size)
 
-    myid = pypar.rank()
+    myid = communicator.rank
 
     poly = num.array(poly, dtype='d')
 
@@ -80,7 +84,8 @@ def Inlet_operator(domain,
                                                                                poly,
                                                                                master_proc = master_proc,
                                                                                procs = procs,
-                                                                               verbose = verbose)
+                                                                               verbose = verbose,
+                                                                               communicator = communicator)
 
 
 
@@ -102,7 +107,8 @@ def Inlet_operator(domain,
                                        logging = logging,
                                        master_proc = inlet_master_proc,
                                        procs = inlet_procs,
-                                       verbose = verbose)
+                                       verbose = verbose,
+                                       communicator = communicator)
     else:
         return None
 
@@ -139,7 +145,8 @@ def Boyd_box_operator(domain,
                        logging=False,
                        verbose=False,
                        master_proc=0,
-                       procs=None):
+                       procs=None,
+                       communicator=None):
 
     # If not parallel domain then allocate serial Boyd box operator
     if isinstance(domain, Parallel_domain) is False:
@@ -168,11 +175,13 @@ def Boyd_box_operator(domain,
                                                                     logging=logging,
                                                                     verbose=verbose)
 
-    import pypar
+    if communicator is None:
+        communicator = Pypar_communicator()
+
     if procs is None:
-        procs = range(0,pypar.size())
+        procs = range(0, communicator.size)
 
-    myid = pypar.rank()
+    myid = communicator.rank
 
     end_points = ensure_numeric(end_points)
     exchange_lines = ensure_numeric(exchange_lines)
@@ -199,25 +208,25 @@ def Boyd_box_operator(domain,
 
             for i in procs:
                 if i == master_proc: continue
-                pypar.send(enquiry_points_tmp, i)
+                communicator.send(enquiry_points_tmp, i)
 
         elif end_points is not None:
             exchange_lines_tmp, enquiry_points_tmp = __process_non_skew_culvert(end_points, width,
                                                                                 enquiry_points, apron, enquiry_gap)
             for i in procs:
                 if i == master_proc: continue
-                pypar.send(exchange_lines_tmp, i)
-                pypar.send(enquiry_points_tmp, i)
+                communicator.send(exchange_lines_tmp, i)
+                communicator.send(enquiry_points_tmp, i)
         else:
             raise Exception, 'Define either exchange_lines or end_points'
 
     else:
         if exchange_lines is not None:
             exchange_lines_tmp = exchange_lines
-            enquiry_points_tmp = pypar.receive(master_proc)
+            enquiry_points_tmp = communicator.receive(master_proc)
         elif end_points is not None:
-            exchange_lines_tmp = pypar.receive(master_proc)
-            enquiry_points_tmp = pypar.receive(master_proc)
+            exchange_lines_tmp = communicator.receive(master_proc)
+            enquiry_points_tmp = communicator.receive(master_proc)
 
     # Determine processors associated with first inlet
     line0 = exchange_lines_tmp[0]
@@ -225,7 +234,8 @@ def Boyd_box_operator(domain,
 
     alloc0, inlet0_master_proc, inlet0_procs, enquiry0_proc = allocate_inlet_procs(domain, line0, enquiry_point =  enquiry_point0,
                                                                                    master_proc = master_proc,
-                                                                                   procs = procs, verbose=verbose)
+                                                                                   procs = procs, verbose=verbose,
+                                                                                   communicator = communicator)
 
     # Determine processors associated with second inlet
     line1 = exchange_lines_tmp[1]
@@ -233,7 +243,8 @@ def Boyd_box_operator(domain,
 
     alloc1, inlet1_master_proc, inlet1_procs, enquiry1_proc = allocate_inlet_procs(domain, line1, enquiry_point =  enquiry_point1,
                                                                                    master_proc = master_proc,
-                                                                                   procs = procs, verbose=verbose)
+                                                                                   procs = procs, verbose=verbose,
+                                                                                   communicator = communicator)
 
     structure_procs = list(set(inlet0_procs + inlet1_procs))
     inlet_master_proc = [inlet0_master_proc, inlet1_master_proc]
@@ -277,7 +288,8 @@ def Boyd_box_operator(domain,
                                          procs = structure_procs,
                                          inlet_master_proc = inlet_master_proc,
                                          inlet_procs = inlet_procs,
-                                         enquiry_proc = enquiry_proc)
+                                         enquiry_proc = enquiry_proc,
+                                         communicator = communicator)
     else:
         return None
 
@@ -313,7 +325,8 @@ def Boyd_pipe_operator(domain,
                        logging=False,
                        verbose=False,
                        master_proc=0,
-                       procs=None):
+                       procs=None,
+                       communicator=None):
 
     # If not parallel domain then allocate serial Boyd box operator
     if isinstance(domain, Parallel_domain) is False:
@@ -339,11 +352,13 @@ def Boyd_pipe_operator(domain,
                                                                     logging=logging,
                                                                     verbose=verbose)
 
-    import pypar
+    if communicator is None:
+        communicator = Pypar_communicator()
+
     if procs is None:
-        procs = range(0,pypar.size())
+        procs = range(0, communicator.size)
 
-    myid = pypar.rank()
+    myid = communicator.rank
 
     end_points = ensure_numeric(end_points)
     exchange_lines = ensure_numeric(exchange_lines)
@@ -364,25 +379,25 @@ def Boyd_pipe_operator(domain,
 
             for i in procs:
                 if i == master_proc: continue
-                pypar.send(enquiry_points_tmp, i)
+                communicator.send(enquiry_points_tmp, i)
 
         elif end_points is not None:
             exchange_lines_tmp, enquiry_points_tmp = __process_non_skew_culvert(end_points, width,
                                                                                 enquiry_points, apron, enquiry_gap)
             for i in procs:
                 if i == master_proc: continue
-                pypar.send(exchange_lines_tmp, i)
-                pypar.send(enquiry_points_tmp, i)
+                communicator.send(exchange_lines_tmp, i)
+                communicator.send(enquiry_points_tmp, i)
         else:
             raise Exception, 'Define either exchange_lines or end_points'
 
     else:
         if exchange_lines is not None:
             exchange_lines_tmp = exchange_lines
-            enquiry_points_tmp = pypar.receive(master_proc)
+            enquiry_points_tmp = communicator.receive(master_proc)
         elif end_points is not None:
-            exchange_lines_tmp = pypar.receive(master_proc)
-            enquiry_points_tmp = pypar.receive(master_proc)
+            exchange_lines_tmp = communicator.receive(master_proc)
+            enquiry_points_tmp = communicator.receive(master_proc)
 
     # Determine processors associated with first inlet
     line0 = exchange_lines_tmp[0]
@@ -390,7 +405,8 @@ def Boyd_pipe_operator(domain,
 
     alloc0, inlet0_master_proc, inlet0_procs, enquiry0_proc = allocate_inlet_procs(domain, line0, enquiry_point =  enquiry_point0,
                                                                                    master_proc = master_proc,
-                                                                                   procs = procs, verbose=verbose)
+                                                                                   procs = procs, verbose=verbose,
+                                                                                   communicator = communicator)
 
     # Determine processors associated with second inlet
     line1 = exchange_lines_tmp[1]
@@ -398,7 +414,8 @@ def Boyd_pipe_operator(domain,
 
     alloc1, inlet1_master_proc, inlet1_procs, enquiry1_proc = allocate_inlet_procs(domain, line1, enquiry_point =  enquiry_point1,
                                                                                    master_proc = master_proc,
-                                                                                   procs = procs, verbose=verbose)
+                                                                                   procs = procs, verbose=verbose,
+                                                                                   communicator = communicator)
 
     structure_procs = list(set(inlet0_procs + inlet1_procs))
     inlet_master_proc = [inlet0_master_proc, inlet1_master_proc]
@@ -441,7 +458,8 @@ def Boyd_pipe_operator(domain,
                                          procs = structure_procs,
                                          inlet_master_proc = inlet_master_proc,
                                          inlet_procs = inlet_procs,
-                                         enquiry_proc = enquiry_proc)
+                                         enquiry_proc = enquiry_proc,
+                                         communicator = communicator)
     else:
         return None
 
@@ -484,7 +502,8 @@ def Weir_orifice_trapezoid_operator(domain,
                        logging=False,
                        verbose=False,
                        master_proc=0,
-                       procs=None):
+                       procs=None,
+                       communicator=None):
 
     # If not parallel domain then allocate serial Weir orifice trapezoid operator
     if isinstance(domain, Parallel_domain) is False:
@@ -514,11 +533,13 @@ def Weir_orifice_trapezoid_operator(domain,
                                                                     logging=logging,
                                                                     verbose=verbose)
 
-    import pypar
+    if communicator is None:
+        communicator = Pypar_communicator()
+
     if procs is None:
-        procs = range(0,pypar.size())
+        procs = range(0, communicator.size)
 
-    myid = pypar.rank()
+    myid = communicator.rank
 
     end_points = ensure_numeric(end_points)
     exchange_lines = ensure_numeric(exchange_lines)
@@ -545,25 +566,25 @@ def Weir_orifice_trapezoid_operator(domain,
 
             for i in procs:
                 if i == master_proc: continue
-                pypar.send(enquiry_points_tmp, i)
+                communicator.send(enquiry_points_tmp, i)
 
         elif end_points is not None:
             exchange_lines_tmp, enquiry_points_tmp = __process_non_skew_culvert(end_points, width,
                                                                                 enquiry_points, apron, enquiry_gap)
             for i in procs:
                 if i == master_proc: continue
-                pypar.send(exchange_lines_tmp, i)
-                pypar.send(enquiry_points_tmp, i)
+                communicator.send(exchange_lines_tmp, i)
+                communicator.send(enquiry_points_tmp, i)
         else:
             raise Exception, 'Define either exchange_lines or end_points'
 
     else:
         if exchange_lines is not None:
             exchange_lines_tmp = exchange_lines
-            enquiry_points_tmp = pypar.receive(master_proc)
+            enquiry_points_tmp = communicator.receive(master_proc)
         elif end_points is not None:
-            exchange_lines_tmp = pypar.receive(master_proc)
-            enquiry_points_tmp = pypar.receive(master_proc)
+            exchange_lines_tmp = communicator.receive(master_proc)
+            enquiry_points_tmp = communicator.receive(master_proc)
 
     # Determine processors associated with first inlet
     line0 = exchange_lines_tmp[0]
@@ -571,7 +592,8 @@ def Weir_orifice_trapezoid_operator(domain,
 
     alloc0, inlet0_master_proc, inlet0_procs, enquiry0_proc = allocate_inlet_procs(domain, line0, enquiry_point =  enquiry_point0,
                                                                                    master_proc = master_proc,
-                                                                                   procs = procs, verbose=verbose)
+                                                                                   procs = procs, verbose=verbose,
+                                                                                   communicator = communicator)
 
     # Determine processors associated with second inlet
     line1 = exchange_lines_tmp[1]
@@ -579,7 +601,8 @@ def Weir_orifice_trapezoid_operator(domain,
 
     alloc1, inlet1_master_proc, inlet1_procs, enquiry1_proc = allocate_inlet_procs(domain, line1, enquiry_point =  enquiry_point1,
                                                                                    master_proc = master_proc,
-                                                                                   procs = procs, verbose=verbose)
+                                                                                   procs = procs, verbose=verbose,
+                                                                                   communicator = communicator)
 
     structure_procs = list(set(inlet0_procs + inlet1_procs))
     inlet_master_proc = [inlet0_master_proc, inlet1_master_proc]
@@ -626,7 +649,8 @@ def Weir_orifice_trapezoid_operator(domain,
                                          procs = structure_procs,
                                          inlet_master_proc = inlet_master_proc,
                                          inlet_procs = inlet_procs,
-                                         enquiry_proc = enquiry_proc)
+                                         enquiry_proc = enquiry_proc,
+                                         communicator = communicator)
     else:
         return None
 
@@ -664,7 +688,8 @@ def Internal_boundary_operator(domain,
                                procs = None,
                                inlet_master_proc = [0,0],
                                inlet_procs = None,
-                               enquiry_proc = [0,0]):
+                               enquiry_proc = [0,0],
+                               communicator = None):
 
     # If not parallel domain then allocate serial Internal boundary operator
     if isinstance(domain, Parallel_domain) is False:
@@ -690,11 +715,13 @@ def Internal_boundary_operator(domain,
                                                                     logging=logging,
                                                                     verbose=verbose)
 
-    import pypar
+    if communicator is None:
+        communicator = Pypar_communicator()
+
     if procs is None:
-        procs = range(0,pypar.size())
+        procs = range(0, communicator.size)
 
-    myid = pypar.rank()
+    myid = communicator.rank
 
     end_points = ensure_numeric(end_points)
     exchange_lines = ensure_numeric(exchange_lines)
@@ -717,25 +744,25 @@ def Internal_boundary_operator(domain,
 
             for i in procs:
                 if i == master_proc: continue
-                pypar.send(enquiry_points_tmp, i)
+                communicator.send(enquiry_points_tmp, i)
 
         elif end_points is not None:
             exchange_lines_tmp, enquiry_points_tmp = __process_non_skew_culvert(end_points, width,
                                                                                 enquiry_points, apron, enquiry_gap)
             for i in procs:
                 if i == master_proc: continue
-                pypar.send(exchange_lines_tmp, i)
-                pypar.send(enquiry_points_tmp, i)
+                communicator.send(exchange_lines_tmp, i)
+                communicator.send(enquiry_points_tmp, i)
         else:
             raise Exception, 'Define either exchange_lines or end_points'
 
     else:
         if exchange_lines is not None:
             exchange_lines_tmp = exchange_lines
-            enquiry_points_tmp = pypar.receive(master_proc)
+            enquiry_points_tmp = communicator.receive(master_proc)
         elif end_points is not None:
-            exchange_lines_tmp = pypar.receive(master_proc)
-            enquiry_points_tmp = pypar.receive(master_proc)
+            exchange_lines_tmp = communicator.receive(master_proc)
+            enquiry_points_tmp = communicator.receive(master_proc)
 
     # Determine processors associated with first inlet
     line0 = exchange_lines_tmp[0]
@@ -743,7 +770,8 @@ def Internal_boundary_operator(domain,
 
     alloc0, inlet0_master_proc, inlet0_procs, enquiry0_proc = allocate_inlet_procs(domain, line0, enquiry_point =  enquiry_point0,
                                                                                    master_proc = master_proc,
-                                                                                   procs = procs, verbose=verbose)
+                                                                                   procs = procs, verbose=verbose,
+                                                                                   communicator = communicator)
 
     # Determine processors associated with second inlet
     line1 = exchange_lines_tmp[1]
@@ -751,7 +779,8 @@ def Internal_boundary_operator(domain,
 
     alloc1, inlet1_master_proc, inlet1_procs, enquiry1_proc = allocate_inlet_procs(domain, line1, enquiry_point =  enquiry_point1,
                                                                                    master_proc = master_proc,
-                                                                                   procs = procs, verbose=verbose)
+                                                                                   procs = procs, verbose=verbose,
+                                                                                   communicator = communicator)
 
     structure_procs = list(set(inlet0_procs + inlet1_procs))
     inlet_master_proc = [inlet0_master_proc, inlet1_master_proc]
@@ -794,7 +823,8 @@ def Internal_boundary_operator(domain,
                                          procs = structure_procs,
                                          inlet_master_proc = inlet_master_proc,
                                          inlet_procs = inlet_procs,
-                                         enquiry_proc = enquiry_proc)
+                                         enquiry_proc = enquiry_proc,
+                                         communicator = communicator)
     else:
         return None
 
@@ -870,19 +900,20 @@ def __process_skew_culvert(exchange_lines, end_points, enquiry_points, apron, en
     return enquiry_points
 
 
-def allocate_inlet_procs(domain, poly, enquiry_point = None, master_proc = 0, procs = None, verbose = False):
+def allocate_inlet_procs(domain, poly, enquiry_point = None, master_proc = 0, procs = None, verbose = False, communicator = None):
 
+    if communicator is None:
+        communicator = Pypar_communicator()
 
-    import pypar
     if procs is None:
-        procs = range(0, pypar.size())
+        procs = range(0, communicator.size)
 
-    myid = pypar.rank()
+    myid = communicator.rank
     vertex_coordinates = domain.get_full_vertex_coordinates(absolute=True)
     domain_centroids = domain.centroid_coordinates
     size = 0
     has_enq_point = False
-    numprocs = pypar.size()
+    numprocs = communicator.size
 
     inlet_procs = []
     max_size = -1
@@ -937,8 +968,8 @@ def allocate_inlet_procs(domain, poly, enquiry_point = None, master_proc = 0, pr
         # Recieve size of overlap
         for i in procs:
             if i == master_proc: continue
-            x = pypar.receive(i)
-            y = pypar.receive(i)
+            x = communicator.receive(i)
+            y = communicator.receive(i)
 
             if x > 0:
                 inlet_procs.append(i)
@@ -963,17 +994,17 @@ def allocate_inlet_procs(domain, poly, enquiry_point = None, master_proc = 0, pr
         # Send inlet_master_proc and inlet_procs to all processors in inlet_procs
         for i in procs:
             if i != master_proc:
-                pypar.send(inlet_master_proc, i)
-                pypar.send(inlet_procs, i)
-                pypar.send(inlet_enq_proc, i)
+                communicator.send(inlet_master_proc, i)
+                communicator.send(inlet_procs, i)
+                communicator.send(inlet_enq_proc, i)
 
     else:
-        pypar.send(size, master_proc)
-        pypar.send(has_enq_point, master_proc)
+        communicator.send(size, master_proc)
+        communicator.send(has_enq_point, master_proc)
 
-        inlet_master_proc = pypar.receive(master_proc)
-        inlet_procs = pypar.receive(master_proc)
-        inlet_enq_proc = pypar.receive(master_proc)
+        inlet_master_proc = communicator.receive(master_proc)
+        inlet_procs = communicator.receive(master_proc)
+        inlet_enq_proc = communicator.receive(master_proc)
         if has_enq_point: assert inlet_enq_proc == myid, "Enquiry found in proc, but not declared globally"
 
     if size > 0:
@@ -106,6 +106,8 @@ class Parallel_domain(Domain):
 
         self.ghost_counter = 0
 
+        self.store_global_sww = False
+
 
     def set_name(self, name):
         """Assign name based on processor number 
@@ -125,6 +127,34 @@ class Parallel_domain(Domain):
         return self.global_name
 
 
+    def set_store_global_sww(self, flag=True):
+        """Store the output of all processors in the single sww file
+        global_name.sww instead of one sww file per processor, so there
+        is no need for sww_merge after the evolve.
+        """
+
+        self.store_global_sww = flag
+
+
+    def get_store_global_sww(self):
+
+        return self.store_global_sww
+
+
+    def initialise_storage(self):
+        """Create and initialise self.writer object for storing data.
+        Collective if store_global_sww is set.
+        """
+
+        if self.store_global_sww:
+            from anuga.parallel.parallel_sww import Parallel_sww_file
+
+            self.writer = Parallel_sww_file(self)
+            self.writer.store_connectivity()
+        else:
+            Domain.initialise_storage(self)
+
+
     def update_timestep(self, yieldstep, finaltime):
         """Calculate local timestep
         """
@@ -145,8 +175,8 @@ class Parallel_domain(Domain):
 
     def apply_fractional_steps(self):
 
-        for operator in self.fractional_step_operators:
-            operator()
+        # Also keeps the active cell set up to date
+        Domain.apply_fractional_steps(self)
 
         # PETE: Make sure that there are no deadlocks here
 
@@ -154,19 +184,23 @@ class Parallel_domain(Domain):
 
 
 
-    def sww_merge(self, verbose=False, delete_old=False):
+    def sww_merge(self, verbose=False, delete_old=False,
+                  memory_budget=None, processes=None):
 
         # make sure all the computations have finished
 
         pypar.barrier()
 
-        # now on processor 0 pull all the separate sww files together
-        if self.processor == 0 and self.numproc > 1 and self.store :
+        # now on processor 0 pull all the separate sww files together,
+        # unless they have been written to the global sww file
+        if self.processor == 0 and self.numproc > 1 and self.store \
+               and not self.store_global_sww:
             import anuga.utilities.sww_merge as merge
 
             global_name = join(self.get_datadir(),self.get_global_name())
             
-            merge.sww_merge_parallel(global_name,self.numproc,verbose,delete_old)
+            merge.sww_merge_parallel(global_name,self.numproc,verbose,delete_old,
+                                     memory_budget, processes)
 
         # make sure all the merge completes on processor 0 before other
         # processors complete (like when finalize is forgotten in main script)
@@ -2,11 +2,11 @@ import anuga
 import numpy as num
 import math
 import parallel_inlet_enquiry 
-import pypar
 
 from anuga.utilities.system_tools import log_to_file
 from anuga.utilities.numerical_tools import ensure_numeric
 from anuga.structures.inlet_enquiry import Inlet_enquiry
+from anuga.parallel.parallel_generic_communications import Pypar_communicator
 
 
 class Parallel_Structure_operator(anuga.Operator):
@@ -32,6 +32,7 @@ class Parallel_Structure_operator(anuga.Operator):
      inlet_master_proc - master_proc of the first and second inlet (List[2])
      inlet_procs - list of processors associated with the first and second inlet (LIST[2][INT])
      enquiry_proc - processor associated the first and second enquiry point (List[2])
+     communicator - sends values between the processors (default Pypar_communicator)
     """
 
     def __init__(self,
@@ -64,11 +65,15 @@ class Parallel_Structure_operator(anuga.Operator):
                  procs = None,
                  inlet_master_proc = [0,0],
                  inlet_procs = None,
-                 enquiry_proc = None):
+                 enquiry_proc = None,
+                 communicator = None):
 
+        if communicator is None:
+            communicator = Pypar_communicator()
 
-        self.myid = pypar.rank()
-        self.num_procs = pypar.size()
+        self.communicator = communicator
+        self.myid = communicator.rank
+        self.num_procs = communicator.size
         
         anuga.Operator.__init__(self,domain)
 
@@ -198,7 +203,8 @@ class Parallel_Structure_operator(anuga.Operator):
                                master_proc = self.inlet_master_proc[0],
                                procs = self.inlet_procs[0],
                                enquiry_proc = self.enquiry_proc[0],
-                               verbose = self.verbose))
+                               verbose = self.verbose,
+                               communicator = self.communicator))
 
             if force_constant_inlet_elevations: 
                 # Try to enforce a constant inlet elevation 
@@ -235,7 +241,8 @@ class Parallel_Structure_operator(anuga.Operator):
                                master_proc = self.inlet_master_proc[1],
                                procs = self.inlet_procs[1],
                                enquiry_proc = self.enquiry_proc[1],
-                               verbose = self.verbose))
+                               verbose = self.verbose,
+                               communicator = self.communicator))
 
             if force_constant_inlet_elevations: 
                 # Try to enforce a constant inlet elevation 
@@ -268,17 +275,17 @@ class Parallel_Structure_operator(anuga.Operator):
         # Master proc of inflow inlet sends attributes to master proc of structure
         if self.myid == self.master_proc:
             if self.myid != self.inlet_master_proc[self.inflow_index]:
-                old_inflow_depth = pypar.receive(self.inlet_master_proc[self.inflow_index])
-                old_inflow_stage = pypar.receive(self.inlet_master_proc[self.inflow_index])
-                old_inflow_xmom = pypar.receive(self.inlet_master_proc[self.inflow_index])
-                old_inflow_ymom = pypar.receive(self.inlet_master_proc[self.inflow_index])
-                inflow_area = pypar.receive(self.inlet_master_proc[self.inflow_index])
+                old_inflow_depth = self.communicator.receive(self.inlet_master_proc[self.inflow_index])
+                old_inflow_stage = self.communicator.receive(self.inlet_master_proc[self.inflow_index])
+                old_inflow_xmom = self.communicator.receive(self.inlet_master_proc[self.inflow_index])
+                old_inflow_ymom = self.communicator.receive(self.inlet_master_proc[self.inflow_index])
+                inflow_area = self.communicator.receive(self.inlet_master_proc[self.inflow_index])
         elif self.myid == self.inlet_master_proc[self.inflow_index]:
-            pypar.send(old_inflow_depth, self.master_proc)
-            pypar.send(old_inflow_stage, self.master_proc)
-            pypar.send(old_inflow_xmom, self.master_proc)
-            pypar.send(old_inflow_ymom, self.master_proc)
-            pypar.send(inflow_area, self.master_proc)
+            self.communicator.send(old_inflow_depth, self.master_proc)
+            self.communicator.send(old_inflow_stage, self.master_proc)
+            self.communicator.send(old_inflow_xmom, self.master_proc)
+            self.communicator.send(old_inflow_ymom, self.master_proc)
+            self.communicator.send(inflow_area, self.master_proc)
 
         # Implement the update of flow over a timestep by
         # using a semi-implict update. This ensures that
@@ -351,13 +358,13 @@ class Parallel_Structure_operator(anuga.Operator):
         if self.myid == self.master_proc:
             for i in self.inlet_procs[self.inflow_index]:
                 if i == self.master_proc: continue
-                pypar.send(new_inflow_depth, i)
-                pypar.send(new_inflow_xmom, i)
-                pypar.send(new_inflow_ymom, i)
+                self.communicator.send(new_inflow_depth, i)
+                self.communicator.send(new_inflow_xmom, i)
+                self.communicator.send(new_inflow_ymom, i)
         elif self.myid in self.inlet_procs[self.inflow_index]:
-            new_inflow_depth = pypar.receive(self.master_proc)
-            new_inflow_xmom = pypar.receive(self.master_proc)
-            new_inflow_ymom = pypar.receive(self.master_proc)
+            new_inflow_depth = self.communicator.receive(self.master_proc)
+            new_inflow_xmom = self.communicator.receive(self.master_proc)
+            new_inflow_ymom = self.communicator.receive(self.master_proc)
 
         # Inflow inlet procs sets new attributes
         if self.myid in self.inlet_procs[self.inflow_index]:
@@ -376,17 +383,17 @@ class Parallel_Structure_operator(anuga.Operator):
         # Master proc of outflow inlet sends attribute to master proc of structure
         if self.myid == self.master_proc:
             if self.myid != self.inlet_master_proc[self.outflow_index]:
-                outflow_area = pypar.receive(self.inlet_master_proc[self.outflow_index])
-                outflow_average_depth = pypar.receive(self.inlet_master_proc[self.outflow_index])
-                outflow_outward_culvert_vector = pypar.receive(self.inlet_master_proc[self.outflow_index])
-                outflow_average_xmom = pypar.receive(self.inlet_master_proc[self.outflow_index])
-                outflow_average_ymom = pypar.receive(self.inlet_master_proc[self.outflow_index])
+                outflow_area = self.communicator.receive(self.inlet_master_proc[self.outflow_index])
+                outflow_average_depth = self.communicator.receive(self.inlet_master_proc[self.outflow_index])
+                outflow_outward_culvert_vector = self.communicator.receive(self.inlet_master_proc[self.outflow_index])
+                outflow_average_xmom = self.communicator.receive(self.inlet_master_proc[self.outflow_index])
+                outflow_average_ymom = self.communicator.receive(self.inlet_master_proc[self.outflow_index])
         elif self.myid == self.inlet_master_proc[self.outflow_index]:
-            pypar.send(outflow_area, self.master_proc)
-            pypar.send(outflow_average_depth, self.master_proc)
-            pypar.send(outflow_outward_culvert_vector, self.master_proc)
-            pypar.send(outflow_average_xmom, self.master_proc)
-            pypar.send(outflow_average_ymom, self.master_proc)
+            self.communicator.send(outflow_area, self.master_proc)
+            self.communicator.send(outflow_average_depth, self.master_proc)
+            self.communicator.send(outflow_outward_culvert_vector, self.master_proc)
+            self.communicator.send(outflow_average_xmom, self.master_proc)
+            self.communicator.send(outflow_average_ymom, self.master_proc)
 
         # Master proc of structure computes new outflow attributes
         if self.myid == self.master_proc:
@@ -449,14 +456,14 @@ class Parallel_Structure_operator(anuga.Operator):
             # master proc of structure sends outflow attributes to all outflow procs
             for i in self.inlet_procs[self.outflow_index]:
                 if i == self.myid: continue
-                pypar.send(new_outflow_depth, i)
-                pypar.send(new_outflow_xmom, i)
-                pypar.send(new_outflow_ymom, i)
+                self.communicator.send(new_outflow_depth, i)
+                self.communicator.send(new_outflow_xmom, i)
+                self.communicator.send(new_outflow_ymom, i)
         # outflow inlet procs receives new outflow attributes
         elif self.myid in self.inlet_procs[self.outflow_index]:
-            new_outflow_depth = pypar.receive(self.master_proc)
-            new_outflow_xmom = pypar.receive(self.master_proc)
-            new_outflow_ymom = pypar.receive(self.master_proc)
+            new_outflow_depth = self.communicator.receive(self.master_proc)
+            new_outflow_xmom = self.communicator.receive(self.master_proc)
+            new_outflow_ymom = self.communicator.receive(self.master_proc)
 
         # outflow inlet procs sets new outflow attributes
         if self.myid in self.inlet_procs[self.outflow_index]:
@@ -620,9 +627,9 @@ class Parallel_Structure_operator(anuga.Operator):
 
             if self.myid == self.master_proc:
                 if self.myid != self.inlet_master_proc[i]:
-                    stats = pypar.receive(self.inlet_master_proc[i])                    
+                    stats = self.communicator.receive(self.inlet_master_proc[i])                    
             elif self.myid == self.inlet_master_proc[i]:
-                pypar.send(stats, self.master_proc)
+                self.communicator.send(stats, self.master_proc)
 
             if self.myid == self.master_proc: message += stats
  
@@ -787,6 +794,17 @@ class Parallel_Structure_operator(anuga.Operator):
         return True
 
 
+    def get_changed_indices(self):
+        """Only the triangles of the inlets on this processor are changed
+        """
+
+        indices = [inlet.triangle_indices for inlet in self.inlets
+                   if inlet is not None]
+        if not indices:
+            return []
+        return num.unique(num.concatenate(indices))
+
+
     def get_enquiry_stages(self):
         # Should be called from all processors associated with operator
 
@@ -801,22 +819,22 @@ class Parallel_Structure_operator(anuga.Operator):
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
             else:
-                enq0 = pypar.receive(self.enquiry_proc[0])
+                enq0 = self.communicator.receive(self.enquiry_proc[0])
 
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
             else:
-                enq1 = pypar.receive(self.enquiry_proc[1])
+                enq1 = self.communicator.receive(self.enquiry_proc[1])
 
         else:
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
-                pypar.send(enq0, self.master_proc)
+                self.communicator.send(enq0, self.master_proc)
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
-                pypar.send(enq1, self.master_proc)
+                self.communicator.send(enq1, self.master_proc)
 
 
         return [enq0, enq1]
@@ -835,22 +853,22 @@ class Parallel_Structure_operator(anuga.Operator):
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
             else:
-                enq0 = pypar.receive(self.enquiry_proc[0])
+                enq0 = self.communicator.receive(self.enquiry_proc[0])
 
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
             else:
-                enq1 = pypar.receive(self.enquiry_proc[1])
+                enq1 = self.communicator.receive(self.enquiry_proc[1])
 
         else:
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
-                pypar.send(enq0, self.master_proc)
+                self.communicator.send(enq0, self.master_proc)
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
-                pypar.send(enq1, self.master_proc)
+                self.communicator.send(enq1, self.master_proc)
 
 
         return [enq0, enq1]
@@ -871,22 +889,22 @@ class Parallel_Structure_operator(anuga.Operator):
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
             else:
-                enq0 = pypar.receive(self.enquiry_proc[0])
+                enq0 = self.communicator.receive(self.enquiry_proc[0])
 
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
             else:
-                enq1 = pypar.receive(self.enquiry_proc[1])
+                enq1 = self.communicator.receive(self.enquiry_proc[1])
 
         else:
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
-                pypar.send(enq0, self.master_proc)
+                self.communicator.send(enq0, self.master_proc)
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
-                pypar.send(enq1, self.master_proc)
+                self.communicator.send(enq1, self.master_proc)
 
 
         return [enq0, enq1]
@@ -906,22 +924,22 @@ class Parallel_Structure_operator(anuga.Operator):
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
             else:
-                enq0 = pypar.receive(self.enquiry_proc[0])
+                enq0 = self.communicator.receive(self.enquiry_proc[0])
 
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
             else:
-                enq1 = pypar.receive(self.enquiry_proc[1])
+                enq1 = self.communicator.receive(self.enquiry_proc[1])
 
         else:
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
-                pypar.send(enq0, self.master_proc)
+                self.communicator.send(enq0, self.master_proc)
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
-                pypar.send(enq1, self.master_proc)
+                self.communicator.send(enq1, self.master_proc)
 
 
         return [enq0, enq1]
@@ -940,22 +958,22 @@ class Parallel_Structure_operator(anuga.Operator):
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
             else:
-                enq0 = pypar.receive(self.enquiry_proc[0])
+                enq0 = self.communicator.receive(self.enquiry_proc[0])
 
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
             else:
-                enq1 = pypar.receive(self.enquiry_proc[1])
+                enq1 = self.communicator.receive(self.enquiry_proc[1])
 
         else:
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
-                pypar.send(enq0, self.master_proc)
+                self.communicator.send(enq0, self.master_proc)
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
-                pypar.send(enq1, self.master_proc)
+                self.communicator.send(enq1, self.master_proc)
 
 
         return [enq0, enq1]
@@ -975,22 +993,22 @@ class Parallel_Structure_operator(anuga.Operator):
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
             else:
-                enq0 = pypar.receive(self.enquiry_proc[0])
+                enq0 = self.communicator.receive(self.enquiry_proc[0])
 
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
             else:
-                enq1 = pypar.receive(self.enquiry_proc[1])
+                enq1 = self.communicator.receive(self.enquiry_proc[1])
 
         else:
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
-                pypar.send(enq0, self.master_proc)
+                self.communicator.send(enq0, self.master_proc)
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
-                pypar.send(enq1, self.master_proc)
+                self.communicator.send(enq1, self.master_proc)
 
 
         return [enq0, enq1]
@@ -1011,22 +1029,22 @@ class Parallel_Structure_operator(anuga.Operator):
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
             else:
-                enq0 = pypar.receive(self.enquiry_proc[0])
+                enq0 = self.communicator.receive(self.enquiry_proc[0])
 
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
             else:
-                enq1 = pypar.receive(self.enquiry_proc[1])
+                enq1 = self.communicator.receive(self.enquiry_proc[1])
 
         else:
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
-                pypar.send(enq0, self.master_proc)
+                self.communicator.send(enq0, self.master_proc)
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
-                pypar.send(enq1, self.master_proc)
+                self.communicator.send(enq1, self.master_proc)
 
 
         return [enq0, enq1]
@@ -1046,22 +1064,22 @@ class Parallel_Structure_operator(anuga.Operator):
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
             else:
-                enq0 = pypar.receive(self.enquiry_proc[0])
+                enq0 = self.communicator.receive(self.enquiry_proc[0])
 
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
             else:
-                enq1 = pypar.receive(self.enquiry_proc[1])
+                enq1 = self.communicator.receive(self.enquiry_proc[1])
 
         else:
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
-                pypar.send(enq0, self.master_proc)
+                self.communicator.send(enq0, self.master_proc)
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
-                pypar.send(enq1, self.master_proc)
+                self.communicator.send(enq1, self.master_proc)
 
 
         return [enq0, enq1]
@@ -1080,22 +1098,22 @@ class Parallel_Structure_operator(anuga.Operator):
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
             else:
-                enq0 = pypar.receive(self.enquiry_proc[0])
+                enq0 = self.communicator.receive(self.enquiry_proc[0])
 
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
             else:
-                enq1 = pypar.receive(self.enquiry_proc[1])
+                enq1 = self.communicator.receive(self.enquiry_proc[1])
 
         else:
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
-                pypar.send(enq0, self.master_proc)
+                self.communicator.send(enq0, self.master_proc)
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
-                pypar.send(enq1, self.master_proc)
+                self.communicator.send(enq1, self.master_proc)
 
 
         return [enq0, enq1]
@@ -1114,22 +1132,22 @@ class Parallel_Structure_operator(anuga.Operator):
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
             else:
-                enq0 = pypar.receive(self.enquiry_proc[0])
+                enq0 = self.communicator.receive(self.enquiry_proc[0])
 
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
             else:
-                enq1 = pypar.receive(self.enquiry_proc[1])
+                enq1 = self.communicator.receive(self.enquiry_proc[1])
 
         else:
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
-                pypar.send(enq0, self.master_proc)
+                self.communicator.send(enq0, self.master_proc)
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
-                pypar.send(enq1, self.master_proc)
+                self.communicator.send(enq1, self.master_proc)
 
 
         return [enq0, enq1]
@@ -1148,22 +1166,22 @@ class Parallel_Structure_operator(anuga.Operator):
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
             else:
-                enq0 = pypar.receive(self.enquiry_proc[0])
+                enq0 = self.communicator.receive(self.enquiry_proc[0])
 
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
             else:
-                enq1 = pypar.receive(self.enquiry_proc[1])
+                enq1 = self.communicator.receive(self.enquiry_proc[1])
 
         else:
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
-                pypar.send(enq0, self.master_proc)
+                self.communicator.send(enq0, self.master_proc)
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
-                pypar.send(enq1, self.master_proc)
+                self.communicator.send(enq1, self.master_proc)
 
 
         return [enq0, enq1]
@@ -1183,22 +1201,22 @@ class Parallel_Structure_operator(anuga.Operator):
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
             else:
-                enq0 = pypar.receive(self.enquiry_proc[0])
+                enq0 = self.communicator.receive(self.enquiry_proc[0])
 
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
             else:
-                enq1 = pypar.receive(self.enquiry_proc[1])
+                enq1 = self.communicator.receive(self.enquiry_proc[1])
 
         else:
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
-                pypar.send(enq0, self.master_proc)
+                self.communicator.send(enq0, self.master_proc)
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
-                pypar.send(enq1, self.master_proc)
+                self.communicator.send(enq1, self.master_proc)
 
 
         return [enq0, enq1]
@@ -1217,22 +1235,22 @@ class Parallel_Structure_operator(anuga.Operator):
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
             else:
-                enq0 = pypar.receive(self.enquiry_proc[0])
+                enq0 = self.communicator.receive(self.enquiry_proc[0])
 
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
             else:
-                enq1 = pypar.receive(self.enquiry_proc[1])
+                enq1 = self.communicator.receive(self.enquiry_proc[1])
 
         else:
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
-                pypar.send(enq0, self.master_proc)
+                self.communicator.send(enq0, self.master_proc)
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
-                pypar.send(enq1, self.master_proc)
+                self.communicator.send(enq1, self.master_proc)
 
 
         return [enq0, enq1]
@@ -1251,22 +1269,22 @@ class Parallel_Structure_operator(anuga.Operator):
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
             else:
-                enq0 = pypar.receive(self.enquiry_proc[0])
+                enq0 = self.communicator.receive(self.enquiry_proc[0])
 
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
             else:
-                enq1 = pypar.receive(self.enquiry_proc[1])
+                enq1 = self.communicator.receive(self.enquiry_proc[1])
 
         else:
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
-                pypar.send(enq0, self.master_proc)
+                self.communicator.send(enq0, self.master_proc)
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
-                pypar.send(enq1, self.master_proc)
+                self.communicator.send(enq1, self.master_proc)
 
 
         return [enq0, enq1]
@@ -1285,22 +1303,22 @@ class Parallel_Structure_operator(anuga.Operator):
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
             else:
-                enq0 = pypar.receive(self.enquiry_proc[0])
+                enq0 = self.communicator.receive(self.enquiry_proc[0])
 
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
             else:
-                enq1 = pypar.receive(self.enquiry_proc[1])
+                enq1 = self.communicator.receive(self.enquiry_proc[1])
 
         else:
             if self.myid == self.enquiry_proc[0]:
                 enq0 = eval(get0)
-                pypar.send(enq0, self.master_proc)
+                self.communicator.send(enq0, self.master_proc)
 
             if self.myid == self.enquiry_proc[1]:
                 enq1 = eval(get1)
-                pypar.send(enq1, self.master_proc)
+                self.communicator.send(enq1, self.master_proc)
 
 
         return [enq0, enq1]
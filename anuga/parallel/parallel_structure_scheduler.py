@@ -0,0 +1,537 @@
+"""
+Parallel structure scheduler - apply the parallel culverts of a domain
+with one collective communication per timestep.
+
+Each Parallel_Structure_operator exchanges its enquiry values, inlet
+averages and updated inlet values with a sequence of point to point
+sends and receives between the master processor of the structure
+and the processors of its inlets. That is a dozen or so messages per
+structure per timestep, each paying the full message latency.
+
+The Parallel_structure_scheduler takes over a set of parallel culverts
+(Parallel_Boyd_box_operator, Parallel_Boyd_pipe_operator and
+Parallel_Weir_orifice_trapezoid_operator). Every timestep each processor
+packs, for the inlets of all the structures, the values at the enquiry
+points it holds and the sums of depth, xmomentum and ymomentum times
+area over its part of each inlet into one array, and a single allreduce
+gives every processor the enquiry values and inlet totals of all the
+structures. Each processor then evaluates the discharge and the
+semi-implicit inlet update of all the structures (the array forms in
+anuga.structures.structure_manager) and sets the part of the inlets it
+holds, so no further communication is needed.
+
+Usage (on all processors):
+
+    culvert = anuga.Boyd_box_operator(domain, ...)
+    ...
+    scheduler = Parallel_structure_scheduler(domain)
+
+Structures can also be registered one at a time, followed by a call of
+setup on all processors:
+
+    scheduler = Parallel_structure_scheduler(domain, structures=[])
+    scheduler.register(culvert)
+    scheduler.setup()
+
+The scheduler is applied at the position in the fractional step
+operators at which it was created, which is the same on all processors
+so that it can not deadlock with the other parallel operators. As with
+the Structure_manager, structures whose inlets overlap or whose enquiry
+points lie in the inlet of another structure are left as separate
+operators. Internal boundary operators are not scheduled.
+
+All communication goes through a communicator (by default a
+Pypar_communicator), which has to be the one the parallel culverts were
+created with.
+"""
+
+import numpy as num
+
+import anuga
+import anuga.utilities.log as log
+
+from anuga.structures.structure_manager import BOYD_BOX, BOYD_PIPE
+from anuga.structures.structure_manager import WEIR_ORIFICE_TRAPEZOID
+from anuga.structures.structure_manager import culvert_parameter_names
+from anuga.structures.structure_manager import get_culvert_parameters
+from anuga.structures.structure_manager import get_enquiry_energies
+from anuga.structures.structure_manager import culvert_discharge_routine
+from anuga.structures.structure_manager import structure_inlet_update
+
+from anuga.parallel.parallel_generic_communications import Pypar_communicator
+
+from parallel_boyd_box_operator import Parallel_Boyd_box_operator
+from parallel_boyd_pipe_operator import Parallel_Boyd_pipe_operator
+from parallel_weir_orifice_trapezoid_operator import Parallel_Weir_orifice_trapezoid_operator
+
+
+parallel_culvert_classes = {Parallel_Boyd_box_operator : BOYD_BOX,
+                            Parallel_Boyd_pipe_operator : BOYD_PIPE,
+                            Parallel_Weir_orifice_trapezoid_operator : WEIR_ORIFICE_TRAPEZOID}
+
+# Columns of the values exchanged every timestep, one row per inlet
+enquiry_columns = ['stage', 'elevation', 'xmom', 'ymom', 'invert_elevation']
+total_columns = ['depth', 'xmom', 'ymom']
+
+
+class Parallel_structure_scheduler(anuga.Operator):
+    """Apply a set of parallel culverts as one fractional step operator
+    with one allreduce per timestep
+
+    domain: the parallel domain
+    structures: list of parallel culverts on this processor. If None all
+                the parallel culverts in the fractional step operators
+                of the domain are used.
+    communicator: sends and sums values between the processors, by
+                default a Pypar_communicator
+
+    Must be created on all processors.
+    """
+
+    def __init__(self,
+                 domain,
+                 structures=None,
+                 description=None,
+                 label=None,
+                 logging=False,
+                 verbose=False,
+                 communicator=None):
+
+        anuga.Operator.__init__(self, domain, description, label, logging, verbose)
+
+        if communicator is None:
+            communicator = Pypar_communicator()
+
+        self.communicator = communicator
+        self.myid = communicator.rank
+        self.num_procs = communicator.size
+
+        self.registered = []
+        self.structures = []
+        self.unmanaged_structures = []
+
+        if structures is None:
+            structures = [op for op in domain.fractional_step_operators
+                          if op.__class__ in parallel_culvert_classes]
+
+        for structure in structures:
+            self.register(structure)
+
+        self.setup()
+
+
+    def register(self, structure):
+        """Register a parallel culvert with the scheduler. Call setup
+        on all processors once all the structures are registered.
+        """
+
+        if structure is None:
+            # Not on this processor, see parallel_operator_factory
+            return
+
+        if structure.__class__ not in parallel_culvert_classes:
+            msg = 'Parallel_structure_scheduler can not schedule %s' % structure.label
+            raise Exception(msg)
+
+        if structure not in self.registered:
+            self.registered.append(structure)
+
+
+    def setup(self):
+        """Number the registered structures consistently across the
+        processors, set up the inlet index sets and read the parameters.
+        Must be called on all processors.
+        """
+
+        # Structures already scheduled go back to being operators until
+        # they are checked again
+        operators = self.domain.fractional_step_operators
+        for structure in self.structures:
+            if structure not in operators:
+                operators.insert(operators.index(self), structure)
+
+        self.set_structure_ids()
+
+        # The same order on all processors, statistics communicate
+        self.registered.sort(key=lambda s: self.structure_ids[s])
+
+        self.set_inlets()
+
+        dependent = self.get_dependent_structures()
+
+        ns = self.number_of_structures
+        parameters = self.exchange_parameters(dependent)
+        self.is_scheduled = parameters[:, -1] == 0.0
+
+        self.structures = [s for s in self.registered
+                           if self.is_scheduled[self.structure_ids[s]]]
+        self.unmanaged_structures = [s for s in self.registered
+                                     if not self.is_scheduled[self.structure_ids[s]]]
+
+        for structure in self.structures:
+            if structure in operators:
+                operators.remove(structure)
+
+        if self.verbose and self.myid == 0:
+            log.critical('Parallel_structure_scheduler: scheduling %d structures, %d left as operators'
+                         % (num.sum(self.is_scheduled), ns - num.sum(self.is_scheduled)))
+
+        # Buffers for the exchange every timestep
+        self.local_values = num.zeros((2*ns, len(enquiry_columns) + len(total_columns)), num.float)
+        self.global_values = num.zeros_like(self.local_values)
+
+
+    def set_structure_ids(self):
+        """Give each structure a global number from its geometry, the same
+        on all the processors holding the structure
+        """
+
+        keys = {}
+        for structure in self.registered:
+            key = self.get_structure_key(structure)
+            if key in keys:
+                msg = 'Structures %s and %s have the same geometry' \
+                      % (keys[key].label, structure.label)
+                raise Exception(msg)
+            keys[key] = structure
+
+        # Gather the keys on processor 0 and send back the sorted list
+        if self.myid == 0:
+            all_keys = set(keys.keys())
+            for i in range(1, self.num_procs):
+                all_keys.update(self.communicator.receive(i))
+            all_keys = sorted(all_keys)
+            for i in range(1, self.num_procs):
+                self.communicator.send(all_keys, i)
+        else:
+            self.communicator.send(keys.keys(), 0)
+            all_keys = self.communicator.receive(0)
+
+        ids = dict((key, i) for i, key in enumerate(all_keys))
+
+        self.number_of_structures = len(all_keys)
+        self.structure_ids = dict((structure, ids[key]) for key, structure in keys.items())
+
+
+    def get_structure_key(self, structure):
+
+        geometry = num.concatenate([num.ravel(structure.exchange_lines),
+                                    num.ravel(structure.enquiry_points)])
+
+        return tuple(num.round(geometry, 6).tolist())
+
+
+    def set_inlets(self):
+        """Local index sets of the inlet triangles and enquiry points held
+        by this processor. Inlet 2*i+j is inlets[j] of structure i.
+        """
+
+        segments = []
+        triangles = []
+        enquiry_segments = []
+        enquiry_indices = []
+        invert_elevations = []
+
+        for structure in self.registered:
+            i = self.structure_ids[structure]
+            for j, inlet in enumerate(structure.inlets):
+                if inlet is None:
+                    continue
+
+                segments.append(num.repeat(2*i+j, len(inlet.triangle_indices)))
+                triangles.append(num.asarray(inlet.triangle_indices, num.int))
+
+                if self.myid == structure.enquiry_proc[j]:
+                    enquiry_segments.append(2*i+j)
+                    enquiry_indices.append(inlet.enquiry_index)
+                    if inlet.invert_elevation is None:
+                        invert_elevations.append(num.nan)
+                    else:
+                        invert_elevations.append(inlet.invert_elevation)
+
+        if triangles:
+            self.inlet_segments = num.concatenate(segments).astype(num.int)
+            self.inlet_triangles = num.concatenate(triangles)
+        else:
+            self.inlet_segments = num.zeros(0, num.int)
+            self.inlet_triangles = num.zeros(0, num.int)
+
+        self.triangle_areas = self.domain.areas[self.inlet_triangles]
+        self.enquiry_segments = num.array(enquiry_segments, num.int)
+        self.enquiry_indices = num.array(enquiry_indices, num.int)
+        self.enquiry_invert_elevations = num.array(invert_elevations, num.float)
+
+        self.stage_c = self.domain.quantities['stage'].centroid_values
+        self.elev_c = self.domain.quantities['elevation'].centroid_values
+        self.xmom_c = self.domain.quantities['xmomentum'].centroid_values
+        self.ymom_c = self.domain.quantities['ymomentum'].centroid_values
+
+
+    def get_dependent_structures(self):
+        """Return a flag for each structure which shares inlet triangles
+        with another structure, or has an enquiry point in the inlet of
+        another structure, on this processor
+        """
+
+        dependent = num.zeros(self.number_of_structures, num.bool)
+
+        owner = {}
+        for k, segment in zip(self.inlet_triangles.tolist(), self.inlet_segments.tolist()):
+            if k in owner and owner[k]//2 != segment//2:
+                dependent[owner[k]//2] = dependent[segment//2] = True
+            owner[k] = segment
+
+        for k, segment in zip(self.enquiry_indices.tolist(), self.enquiry_segments.tolist()):
+            if k in owner and owner[k]//2 != segment//2:
+                dependent[owner[k]//2] = dependent[segment//2] = True
+
+        return dependent
+
+
+    def exchange_parameters(self, dependent=None):
+        """Share the parameters, options, outward vectors, smoothing state
+        and inlet areas of all the structures with all the processors,
+        with one allreduce. The master processor of each structure fills
+        its row. Must be called on all processors.
+        """
+
+        ns = self.number_of_structures
+        npar = len(culvert_parameter_names)
+
+        # parameters, type, 4 options, 2 outward vectors, smoothing
+        # state, 2 inlet areas, dependent flag
+        local = num.zeros((ns, npar + 14), num.float)
+
+        for structure in self.registered:
+            i = self.structure_ids[structure]
+            if self.myid != structure.master_proc:
+                continue
+            local[i, :npar] = get_culvert_parameters([structure])[0]
+            local[i, npar] = parallel_culvert_classes[structure.__class__]
+            local[i, npar+1:npar+5] = [structure.always_use_Q_wetdry_adjustment,
+                                       structure.use_old_momentum_method,
+                                       structure.use_momentum_jet,
+                                       structure.zero_outflow_momentum]
+            local[i, npar+5:npar+7] = structure.culvert_vector
+            local[i, npar+7:npar+9] = -num.asarray(structure.culvert_vector)
+            local[i, npar+9] = structure.smooth_delta_total_energy
+            local[i, npar+10] = structure.smooth_Q
+
+        # Each processor adds the area of its part of the inlets
+        areas = num.bincount(self.inlet_segments, weights=self.triangle_areas,
+                             minlength=2*ns)
+        local[:, npar+11:npar+13] = areas.reshape(ns, 2)
+
+        if dependent is not None:
+            local[:, -1] = dependent
+
+        parameters = num.zeros_like(local)
+        self.communicator.allreduce(local, parameters)
+
+        self.culvert_parameters = parameters[:, :npar].copy()
+        self.culvert_types = parameters[:, npar].astype(num.int)
+        self.always_use_Q_wetdry_adjustment = parameters[:, npar+1] > 0.0
+        self.use_old_momentum_method = parameters[:, npar+2] > 0.0
+        self.use_momentum_jet = parameters[:, npar+3] > 0.0
+        self.zero_outflow_momentum = parameters[:, npar+4] > 0.0
+        self.outward_vectors = parameters[:, npar+5:npar+9].reshape(2*ns, 2).copy()
+        self.smooth_delta_total_energy = parameters[:, npar+9].copy()
+        self.smooth_Q = parameters[:, npar+10].copy()
+        self.inlet_areas = parameters[:, npar+11:npar+13].ravel().copy()
+
+        return parameters
+
+
+    def update_parameters(self):
+        """Read the parameters of the structures again, after they have
+        been changed during the evolve. Must be called on all processors.
+        """
+
+        # The smoothing state is held by the scheduler
+        for structure in self.structures:
+            i = self.structure_ids[structure]
+            structure.smooth_delta_total_energy = self.smooth_delta_total_energy[i]
+            structure.smooth_Q = self.smooth_Q[i]
+
+        is_scheduled = self.is_scheduled
+        self.exchange_parameters(~is_scheduled)
+        self.is_scheduled = is_scheduled
+
+
+    def __call__(self):
+
+        ns = self.number_of_structures
+        if ns == 0:
+            return
+
+        timestep = self.domain.get_timestep()
+
+        values = self.exchange_values()
+
+        enquiry = get_enquiry_energies(values[:, 0], values[:, 1], values[:, 2],
+                                       values[:, 3], values[:, 4])
+        for name in enquiry:
+            enquiry[name] = enquiry[name].reshape(-1, 2)
+
+        Q, barrel_speed, outlet_culvert_depth, direction, case, \
+            delta_total_energy, driving_energy, is_open, wet = \
+            culvert_discharge_routine(self.culvert_types,
+                                      self.culvert_parameters,
+                                      self.smooth_delta_total_energy,
+                                      self.smooth_Q,
+                                      enquiry,
+                                      timestep)
+
+        # Structures left as operators apply themselves
+        Q[~self.is_scheduled] = 0.0
+
+        averages = values[:, len(enquiry_columns):]/self.inlet_areas[:, num.newaxis]
+
+        inflow = 2*num.arange(ns) + direction
+        outflow = 2*num.arange(ns) + 1 - direction
+
+        new_inflow, new_outflow, gain, loss, timestep_star = \
+            structure_inlet_update(timestep, Q, barrel_speed,
+                                   averages[inflow], averages[outflow],
+                                   self.inlet_areas[inflow],
+                                   self.inlet_areas[outflow],
+                                   -self.outward_vectors[outflow],
+                                   self.always_use_Q_wetdry_adjustment,
+                                   self.use_old_momentum_method,
+                                   self.use_momentum_jet,
+                                   self.zero_outflow_momentum)
+
+        new_values = num.empty((2*ns, 3), num.float)
+        new_values[inflow] = new_inflow
+        new_values[outflow] = new_outflow
+
+        # Set the parts of the scheduled inlets held by this processor
+        scheduled = self.is_scheduled[self.inlet_segments//2]
+        tris = self.inlet_triangles[scheduled]
+        segments = self.inlet_segments[scheduled]
+        self.stage_c[tris] = self.elev_c[tris] + new_values[segments, 0]
+        self.xmom_c[tris] = new_values[segments, 1]
+        self.ymom_c[tris] = new_values[segments, 2]
+
+        # Stats, held by the master processor of each structure
+        yieldstep = self.domain.yieldstep
+        for structure in self.structures:
+            i = self.structure_ids[structure]
+
+            structure.inflow_index = direction[i]
+            structure.outflow_index = 1 - direction[i]
+
+            if self.myid != structure.master_proc:
+                continue
+
+            structure.case = case[i]
+            if is_open[i]:
+                structure.delta_total_energy = delta_total_energy[i]
+                structure.smooth_delta_total_energy = self.smooth_delta_total_energy[i]
+            if wet[i]:
+                structure.driving_energy = driving_energy[i]
+                structure.smooth_Q = self.smooth_Q[i]
+
+            structure.discharge = Q[i]*timestep_star[i]/timestep
+            structure.discharge_abs_timemean += Q[i]*timestep_star[i]/yieldstep
+            structure.velocity = barrel_speed[i]
+            structure.outlet_depth = new_outflow[i, 0]
+
+
+    def exchange_values(self):
+        """Return the enquiry values and inlet totals of all the inlets,
+        packed into one array and summed over the processors with one
+        allreduce. Must be called on all processors.
+        """
+
+        ns = self.number_of_structures
+        local = self.local_values
+        local[:] = 0.0
+
+        ids = self.enquiry_indices
+        segments = self.enquiry_segments
+        if len(ids) > 0:
+            elevation = self.elev_c[ids]
+            local[segments, 0] = self.stage_c[ids]
+            local[segments, 1] = elevation
+            local[segments, 2] = self.xmom_c[ids]
+            local[segments, 3] = self.ymom_c[ids]
+            local[segments, 4] = num.where(num.isnan(self.enquiry_invert_elevations),
+                                           elevation, self.enquiry_invert_elevations)
+
+        tris = self.inlet_triangles
+        areas = self.triangle_areas
+        n = len(enquiry_columns)
+        local[:, n] = num.bincount(self.inlet_segments,
+                                   weights=(self.stage_c[tris] - self.elev_c[tris])*areas,
+                                   minlength=2*ns)
+        local[:, n+1] = num.bincount(self.inlet_segments,
+                                     weights=self.xmom_c[tris]*areas,
+                                     minlength=2*ns)
+        local[:, n+2] = num.bincount(self.inlet_segments,
+                                     weights=self.ymom_c[tris]*areas,
+                                     minlength=2*ns)
+
+        self.communicator.allreduce(local, self.global_values)
+
+        return self.global_values
+
+
+    def parallel_safe(self):
+
+        return True
+
+
+    def get_changed_indices(self):
+        """Only the triangles of the inlets of the structures are changed
+        """
+
+        if not self.structures:
+            return []
+        return num.unique(num.concatenate([s.get_changed_indices()
+                                           for s in self.structures]))
+
+
+    def statistics(self):
+        # Warning: requires synchronization, must be called by all procs
+
+        message = 'Parallel_structure_scheduler: %d structures\n' % len(self.structures)
+        for structure in self.structures:
+            message += structure.statistics()
+
+        return message
+
+
+    def timestepping_statistics(self):
+
+        message = ''
+        for structure in self.structures:
+            if self.myid == structure.master_proc:
+                message += structure.timestepping_statistics() + '\n'
+
+        return message
+
+
+    def print_statistics(self):
+        # Warning: requires synchronization, must be called by all procs
+
+        for structure in self.structures:
+            structure.print_statistics()
+
+
+    def print_timestepping_statistics(self):
+
+        for structure in self.structures:
+            if self.myid == structure.master_proc:
+                structure.print_timestepping_statistics()
+
+
+    def log_timestepping_statistics(self):
+
+        for structure in self.structures:
+            structure.log_timestepping_statistics()
+
+
+    def get_structures(self):
+
+        return self.structures
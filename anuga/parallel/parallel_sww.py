@@ -0,0 +1,302 @@
+"""Store the output of a parallel run in a single global sww file
+
+Each processor sends the values of its full (non ghost) triangles to
+processor 0, which writes them into the global sww file at the positions
+given by the tri_l2g and node_l2g maps. The resulting file has the same
+layout as the file produced by anuga.utilities.sww_merge.sww_merge_parallel
+so there is no need to merge the processor sww files after the run.
+"""
+
+import numpy as num
+
+
+from anuga.config import netcdf_mode_w, netcdf_float32
+from anuga.config import minimum_storable_height as default_minimum_storable_height
+from anuga.file.netcdf import NetCDFFile
+from anuga.file.sww import SWW_file, Write_sww
+from anuga.utilities.file_utils import create_filename
+from anuga.parallel.parallel_generic_communications import Pypar_communicator
+
+
+class Parallel_sww_file(SWW_file):
+    """Interface to the global sww file of a parallel domain
+
+    store_connectivity and store_timestep are collective, i.e. they have
+    to be called by all processors. Only processor 0 (the writer) opens
+    the file, so the other processors carry on with the evolve as soon as
+    they have sent their values. With open(background=True) the writer
+    also overlaps the writing of a timestep with the next evolve step.
+
+    Quantities to be monitored are not stored, and the file is not split
+    when it grows beyond max_size.
+    """
+
+    writer_rank = 0
+
+    def __init__(self, domain, communicator=None, mode=netcdf_mode_w):
+
+        if communicator is None:
+            communicator = Pypar_communicator()
+
+        self.communicator = communicator
+        self.is_writer = communicator.rank == self.writer_rank
+
+        self.precision = netcdf_float32 # Use single precision for quantities
+        self.recursion = False
+        self.mode = mode
+        self.max_size = None
+
+        if hasattr(domain, 'store_centroids'):
+            self.store_centroids = domain.store_centroids
+        else:
+            self.store_centroids = False
+
+        if hasattr(domain, 'minimum_storable_height'):
+            self.minimum_storable_height = domain.minimum_storable_height
+        else:
+            self.minimum_storable_height = default_minimum_storable_height
+
+        if hasattr(domain, 'sww_format'):
+            self.format = domain.sww_format
+            self.compression = domain.sww_compression
+        else:
+            self.format = 'NETCDF3_64BIT'
+            self.compression = None
+
+        self.filename = create_filename(domain.get_datadir(),
+                                        domain.get_global_name(), 'sww')
+
+        self.timestep = 0
+        self.domain = domain
+
+        # The global file has no ghost triangles
+        self.number_of_volumes = domain.number_of_global_triangles
+        if domain.smooth:
+            self.number_of_nodes = domain.number_of_global_nodes
+        else:
+            self.number_of_nodes = 3*self.number_of_volumes
+
+        self.fid = None
+        self.frames = None
+        self.write_thread = None
+        self.write_error = None
+
+        static_quantities = []
+        dynamic_quantities = []
+        static_c_quantities = []
+        dynamic_c_quantities = []
+
+        for q in domain.quantities_to_be_stored:
+            flag = domain.quantities_to_be_stored[q]
+
+            msg = 'Quantity %s is requested to be stored ' % q
+            msg += 'but it does not exist in domain.quantities'
+            assert q in domain.quantities, msg
+
+            assert flag in [1,2]
+            if flag == 1:
+                static_quantities.append(q)
+                if self.store_centroids: static_c_quantities.append(q+'_c')
+
+            if flag == 2:
+                dynamic_quantities.append(q)
+                if self.store_centroids: dynamic_c_quantities.append(q+'_c')
+
+        self.writer = Write_sww(static_quantities,
+                                dynamic_quantities,
+                                static_c_quantities,
+                                dynamic_c_quantities,
+                                compression=self.compression)
+
+        # Local indices of the full triangles and of the points they
+        # use, and their positions in the global file
+        full_ids = num.flatnonzero(domain.tri_full_flag == 1)
+        full_gids = num.asarray(domain.tri_l2g)[full_ids]
+
+        if domain.smooth:
+            point_ids = num.unique(domain.triangles[full_ids])
+            point_gids = num.asarray(domain.node_l2g)[point_ids]
+        else:
+            point_ids = (3*full_ids[:,num.newaxis] + [0,1,2]).flatten()
+            point_gids = (3*full_gids[:,num.newaxis] + [0,1,2]).flatten()
+
+        self.full_ids = full_ids
+        self.point_ids = point_ids
+
+        # Global positions of the values sent by each processor, only
+        # needed by the writer
+        self.full_gids = None
+        self.point_gids = None
+
+        if self.is_writer:
+            self.full_gids = [full_gids]
+            self.point_gids = [point_gids]
+            for p in range(1, communicator.size):
+                self.full_gids.append(communicator.receive(p))
+                self.point_gids.append(communicator.receive(p))
+        else:
+            communicator.send(full_gids, self.writer_rank)
+            communicator.send(point_gids, self.writer_rank)
+
+        if self.is_writer:
+            fid = NetCDFFile(self.filename, mode, netcdf_format=self.format)
+            try:
+                self.writer.store_header(fid,
+                                         domain.starttime,
+                                         self.number_of_volumes,
+                                         self.number_of_nodes,
+                                         description='Output from anuga.parallel '
+                                         'suitable for plotting',
+                                         smoothing=domain.smooth,
+                                         order=domain.default_order,
+                                         sww_precision=self.precision)
+            finally:
+                fid.close()
+
+
+    def gather(self, local_values):
+        """Send the local values of the full triangles (volumes and keys
+        ending in _c) and of their points to the writer, which returns them
+        assembled into global arrays. The other processors return None.
+        """
+
+        communicator = self.communicator
+
+        if not self.is_writer:
+            communicator.send(local_values, self.writer_rank)
+            return None
+
+        global_values = {}
+        for p in range(communicator.size):
+            if p == self.writer_rank:
+                values = local_values
+            else:
+                values = communicator.receive(p)
+
+            for name, A in values.items():
+                if name == 'volumes' or name.endswith('_c'):
+                    n, gids = self.number_of_volumes, self.full_gids[p]
+                else:
+                    n, gids = self.number_of_nodes, self.point_gids[p]
+
+                if name not in global_values:
+                    global_values[name] = num.zeros((n,)+A.shape[1:], A.dtype)
+                global_values[name][gids] = A
+
+        return global_values
+
+
+    def store_connectivity(self):
+        """Store the global triangulation and the static quantities
+        """
+
+        domain = self.domain
+
+        Q = domain.quantities.values()[0]
+        X,Y,_,V = Q.get_vertex_values(xy=True, precision=self.precision)
+
+        local_values = {}
+        local_values['x'] = X[self.point_ids]
+        local_values['y'] = Y[self.point_ids]
+
+        # Triangles in terms of global points
+        if domain.smooth:
+            node_l2g = num.asarray(domain.node_l2g)
+            local_values['volumes'] = node_l2g[V[self.full_ids]]
+
+        for name in self.writer.static_quantities:
+            A, _ = domain.quantities[name].get_vertex_values(xy=False,
+                                                    precision=self.precision)
+            local_values[name] = A[self.point_ids]
+
+        for name in self.writer.static_c_quantities:
+            C = domain.quantities[name[:-2]].centroid_values
+            local_values[name] = C[self.full_ids]
+
+        global_values = self.gather(local_values)
+
+        if not self.is_writer:
+            return
+
+        if domain.smooth:
+            volumes = global_values.pop('volumes')
+        else:
+            volumes = num.arange(self.number_of_nodes).reshape(-1,3)
+
+        x = global_values.pop('x')
+        y = global_values.pop('y')
+        points = num.concatenate((x[:,num.newaxis], y[:,num.newaxis]), axis=1)
+
+        static_quantities = {}
+        static_quantities_centroid = {}
+        for name, A in global_values.items():
+            if name.endswith('_c'):
+                static_quantities_centroid[name] = A
+            else:
+                static_quantities[name] = A
+
+        fid = self.open_for_append()
+        try:
+            self.writer.store_triangulation(fid,
+                                            points,
+                                            volumes.astype(num.int32),
+                                            points_georeference=\
+                                            domain.geo_reference)
+
+            self.writer.store_static_quantities(fid, **static_quantities)
+            self.writer.store_static_quantities_centroid(fid,
+                                            **static_quantities_centroid)
+        finally:
+            fid.close()
+
+
+    def open(self, background=True):
+        """Open the file on the writer, see SWW_file.open
+        """
+
+        if self.is_writer:
+            SWW_file.open(self, background)
+
+
+    def store_timestep(self):
+        """Store time and time dependent quantities
+        """
+
+        time, dynamic_quantities, dynamic_quantities_centroid, _ = \
+              self.get_frame()
+
+        local_values = {}
+        for name, A in dynamic_quantities.items():
+            local_values[name] = A[self.point_ids]
+        for name, C in dynamic_quantities_centroid.items():
+            local_values[name] = C[self.full_ids]
+
+        global_values = self.gather(local_values)
+
+        if not self.is_writer:
+            return
+
+        dynamic_quantities = {}
+        dynamic_quantities_centroid = {}
+        for name, A in global_values.items():
+            if name in self.writer.dynamic_c_quantities:
+                dynamic_quantities_centroid[name] = A
+            else:
+                dynamic_quantities[name] = A
+
+        frame = (time, dynamic_quantities, dynamic_quantities_centroid, None)
+
+        if self.fid is None:
+            fid = self.open_for_append()
+            try:
+                self.write_frame(fid, frame)
+            finally:
+                fid.close()
+        elif self.write_thread is not None:
+            if self.write_error is not None:
+                self.flush()
+            self.frames.put(frame)
+        else:
+            # Keep the file readable between timesteps
+            self.write_frame(self.fid, frame)
+            self.fid.sync()
@@ -47,7 +47,8 @@ class Parallel_Weir_orifice_trapezoid_operator(Parallel_Structure_operator):
                  procs = None,
                  inlet_master_proc = [0,0],
                  inlet_procs = None,
-                 enquiry_proc = [0,0]):
+                 enquiry_proc = [0,0],
+                 communicator = None):
                      
         Parallel_Structure_operator.__init__(self,
                                           domain=domain,
@@ -80,7 +81,8 @@ class Parallel_Weir_orifice_trapezoid_operator(Parallel_Structure_operator):
                                           procs=procs,
                                           inlet_master_proc=inlet_master_proc,
                                           inlet_procs=inlet_procs,
-                                          enquiry_proc=enquiry_proc)
+                                          enquiry_proc=enquiry_proc,
+                                          communicator=communicator)
         
         if isinstance(losses, dict):
             self.sum_loss = sum(losses.values())
@@ -153,8 +155,6 @@ class Parallel_Weir_orifice_trapezoid_operator(Parallel_Structure_operator):
         Get info from inlets and then call sequential function
         """
 
-        import pypar
-
         local_debug = False
 
         #Send attributes of both enquiry points to the master proc
@@ -164,25 +164,25 @@ class Parallel_Weir_orifice_trapezoid_operator(Parallel_Structure_operator):
                 enq_total_energy0 = self.inlets[0].get_enquiry_total_energy()
                 enq_stage0 = self.inlets[0].get_enquiry_stage()
             else:
-                enq_total_energy0 = pypar.receive(self.enquiry_proc[0])
-                enq_stage0 = pypar.receive(self.enquiry_proc[0])
+                enq_total_energy0 = self.communicator.receive(self.enquiry_proc[0])
+                enq_stage0 = self.communicator.receive(self.enquiry_proc[0])
 
 
             if self.myid == self.enquiry_proc[1]:
                 enq_total_energy1 = self.inlets[1].get_enquiry_total_energy()
                 enq_stage1 = self.inlets[1].get_enquiry_stage()
             else:
-                enq_total_energy1 = pypar.receive(self.enquiry_proc[1])
-                enq_stage1 = pypar.receive(self.enquiry_proc[1])
+                enq_total_energy1 = self.communicator.receive(self.enquiry_proc[1])
+                enq_stage1 = self.communicator.receive(self.enquiry_proc[1])
 
         else:
             if self.myid == self.enquiry_proc[0]:
-                pypar.send(self.inlets[0].get_enquiry_total_energy(), self.master_proc)
-                pypar.send(self.inlets[0].get_enquiry_stage(), self.master_proc)
+                self.communicator.send(self.inlets[0].get_enquiry_total_energy(), self.master_proc)
+                self.communicator.send(self.inlets[0].get_enquiry_stage(), self.master_proc)
 
             if self.myid == self.enquiry_proc[1]:
-                pypar.send(self.inlets[1].get_enquiry_total_energy(), self.master_proc)
-                pypar.send(self.inlets[1].get_enquiry_stage(), self.master_proc)
+                self.communicator.send(self.inlets[1].get_enquiry_total_energy(), self.master_proc)
+                self.communicator.send(self.inlets[1].get_enquiry_stage(), self.master_proc)
 
 
         # Determine the direction of the flow
@@ -226,16 +226,16 @@ class Parallel_Weir_orifice_trapezoid_operator(Parallel_Structure_operator):
 
                 for i in self.procs:
                     if i == self.master_proc: continue
-                    pypar.send(True, i)
+                    self.communicator.send(True, i)
             else:
                 self.delta_total_energy = self.smooth_delta_total_energy
                 for i in self.procs:
                     if i == self.master_proc: continue
-                    pypar.send(False, i)
+                    self.communicator.send(False, i)
 
             #print "ZZZZ: Delta total energy = %f" %(self.delta_total_energy)
         else:
-            reverse = pypar.receive(self.master_proc)
+            reverse = self.communicator.receive(self.master_proc)
 
             if reverse:
                 self.inflow_index = 1
@@ -248,12 +248,12 @@ class Parallel_Weir_orifice_trapezoid_operator(Parallel_Structure_operator):
                     inflow_enq_depth = self.inlets[self.inflow_index].get_enquiry_depth()
                     inflow_enq_specific_energy = self.inlets[self.inflow_index].get_enquiry_specific_energy()
             else:
-                    inflow_enq_depth = pypar.receive(self.enquiry_proc[self.inflow_index])
-                    inflow_enq_specific_energy = pypar.receive(self.enquiry_proc[self.inflow_index])
+                    inflow_enq_depth = self.communicator.receive(self.enquiry_proc[self.inflow_index])
+                    inflow_enq_specific_energy = self.communicator.receive(self.enquiry_proc[self.inflow_index])
         else:
             if self.myid == self.enquiry_proc[self.inflow_index]:
-                pypar.send(self.inlets[self.inflow_index].get_enquiry_depth(), self.master_proc)
-                pypar.send(self.inlets[self.inflow_index].get_enquiry_specific_energy(), self.master_proc)
+                self.communicator.send(self.inlets[self.inflow_index].get_enquiry_depth(), self.master_proc)
+                self.communicator.send(self.inlets[self.inflow_index].get_enquiry_specific_energy(), self.master_proc)
 
         # Get attribute from outflow enquiry point
         if self.myid == self.master_proc:
@@ -261,13 +261,13 @@ class Parallel_Weir_orifice_trapezoid_operator(Parallel_Structure_operator):
             if self.myid == self.enquiry_proc[self.outflow_index]:
                 outflow_enq_depth = self.inlets[self.outflow_index].get_enquiry_depth()
             else:
-                outflow_enq_depth = pypar.receive(self.enquiry_proc[self.outflow_index])
+                outflow_enq_depth = self.communicator.receive(self.enquiry_proc[self.outflow_index])
 
             #print "ZZZZZ: outflow_enq_depth = %f" %(outflow_enq_depth)
 
         else:
             if self.myid == self.enquiry_proc[self.outflow_index]:
-                pypar.send(self.inlets[self.outflow_index].get_enquiry_depth(), self.master_proc)
+                self.communicator.send(self.inlets[self.outflow_index].get_enquiry_depth(), self.master_proc)
 
 
 
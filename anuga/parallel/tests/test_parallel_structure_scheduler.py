@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+
+"""
+Test a set of parallel culverts, applied as separate operators and with
+the Parallel_structure_scheduler, against the serial Structure_manager
+on the full domain. The processors are stood in for by local processes
+talking through pipes, so the test does not need mpi.
+"""
+
+import unittest
+import shutil
+import tempfile
+import multiprocessing
+from os.path import join
+
+import numpy as num
+
+import anuga
+from anuga.structures.structure_manager import Structure_manager
+from anuga.parallel.sequential_distribute import sequential_distribute_dump
+from anuga.parallel.sequential_distribute import sequential_distribute_load_pickle_file
+from anuga.parallel.parallel_operator_factory import Boyd_box_operator
+from anuga.parallel.parallel_operator_factory import Boyd_pipe_operator
+from anuga.parallel.parallel_structure_scheduler import Parallel_structure_scheduler
+
+import warnings
+warnings.simplefilter("ignore")
+
+verbose = False
+numprocs = 3
+
+length = 40.
+width = 16.
+
+timestep = 0.05
+number_of_steps = 10
+
+
+class Pipe_communicator:
+    """Stand in for Pypar_communicator using multiprocessing pipes, one
+    pipe between each pair of processors
+    """
+
+    def __init__(self, rank, size, connections):
+
+        self.rank = rank
+        self.size = size
+        self.connections = connections
+
+    def send(self, x, destination):
+
+        self.connections[destination].send(x)
+
+    def receive(self, source):
+
+        return self.connections[source].recv()
+
+    def allreduce(self, x, buffer):
+
+        if self.rank == 0:
+            buffer[:] = x
+            for p in range(1, self.size):
+                buffer += self.receive(p)
+            for p in range(1, self.size):
+                self.send(buffer, p)
+        else:
+            self.send(x, 0)
+            buffer[:] = self.receive(0)
+
+
+def create_domain():
+
+    domain = anuga.rectangular_cross_domain(int(length), int(width),
+                                            len1=length, len2=width)
+    domain.set_name('domain')
+    domain.set_store(False)
+
+    domain.set_quantity('elevation', lambda x, y: -x/length)
+    def stage(x, y):
+        # Water at the inlets of the box culverts and the pipes
+        z = -x/length
+        return num.where(x < 8.0, 1.0, num.where((x > 22.0) & (x < 26.0), z + 0.5, z))
+
+    domain.set_quantity('stage', stage)
+    domain.set_quantity('friction', 0.01)
+
+    Br = anuga.Reflective_boundary(domain)
+    domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+    return domain
+
+
+def create_structures(domain, communicator=None):
+    """Create the culverts, in parallel via the operator factory if a
+    communicator is given
+    """
+
+    if communicator is None:
+        Box = anuga.Boyd_box_operator
+        Pipe = anuga.Boyd_pipe_operator
+        kwargs = {}
+    else:
+        Box = Boyd_box_operator
+        Pipe = Boyd_pipe_operator
+        kwargs = {'communicator' : communicator}
+
+    structures = []
+    for j, y in enumerate([2.5, 7.5, 12.5]):
+        structures.append(Box(domain,
+                              end_points=[[6.0, y], [18.0+2*j, y]],
+                              losses=1.5,
+                              width=1.0,
+                              height=0.5,
+                              smoothing_timescale=0.1*j,
+                              verbose=False,
+                              **kwargs))
+
+        structures.append(Pipe(domain,
+                               end_points=[[24.0, y+1], [36.0, y+1]],
+                               losses=1.5,
+                               diameter=0.6,
+                               verbose=False,
+                               **kwargs))
+
+    return structures
+
+
+def apply_structures(domain):
+    """Apply the fractional step operators with a fixed timestep, without
+    the rest of the evolve
+    """
+
+    domain.yieldstep = timestep*number_of_steps
+
+    for i in range(number_of_steps):
+        domain.timestep = timestep
+        domain.apply_fractional_steps()
+
+
+def get_discharges(structures):
+
+    return dict((tuple(s.end_points.flatten()), s.discharge)
+                for s in structures if s is not None)
+
+
+def run_parallel(pickle_name, rank, connections, schedule):
+    """Apply the parallel culverts on a subdomain and send the values of
+    the full triangles and the discharges to processor 0
+    """
+
+    communicator = Pipe_communicator(rank, numprocs, connections)
+
+    domain = sequential_distribute_load_pickle_file(pickle_name, numprocs)
+    structures = create_structures(domain, communicator)
+
+    if schedule:
+        scheduler = Parallel_structure_scheduler(domain, structures,
+                                                 communicator=communicator)
+        assert len(scheduler.get_structures()) == len([s for s in structures if s is not None])
+
+    apply_structures(domain)
+
+    full = num.flatnonzero(domain.tri_full_flag == 1)
+    values = dict((name, domain.quantities[name].centroid_values[full])
+                  for name in ['stage', 'xmomentum', 'ymomentum'])
+    discharges = get_discharges([s for s in structures
+                                 if s is not None and s.get_master_proc() == rank])
+    procs = [len(s.procs) for s in structures if s is not None]
+
+    result = (domain.tri_l2g[full], values, discharges, procs)
+    if rank == 0:
+        return [result] + [communicator.receive(p) for p in range(1, numprocs)]
+
+    communicator.send(result, 0)
+
+
+class Test_parallel_structure_scheduler(unittest.TestCase):
+
+    def setUp(self):
+
+        self.partition_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.partition_dir)
+
+
+    def run_parallel_structures(self, schedule):
+
+        domain = create_domain()
+        domain.set_datadir(self.partition_dir)
+        sequential_distribute_dump(domain, numprocs,
+                                   partition_dir=self.partition_dir)
+
+        pickle_names = [join(self.partition_dir, 'domain_P%d_%d.pickle' % (numprocs, p))
+                        for p in range(numprocs)]
+
+        connections = [{} for p in range(numprocs)]
+        for p in range(numprocs):
+            for q in range(p+1, numprocs):
+                connections[p][q], connections[q][p] = multiprocessing.Pipe()
+
+        # Processor 0 runs in this process
+        processes = []
+        for p in range(1, numprocs):
+            process = multiprocessing.Process(target=run_parallel,
+                                              args=(pickle_names[p], p,
+                                                    connections[p], schedule))
+            process.start()
+            processes.append(process)
+
+        results = run_parallel(pickle_names[0], 0, connections[0], schedule)
+
+        for process in processes:
+            process.join()
+            assert process.exitcode == 0
+
+        return results
+
+
+    def check_against_structure_manager(self, schedule):
+
+        domain = create_domain()
+        structures = create_structures(domain)
+        manager = Structure_manager(domain)
+        assert len(manager.get_structures()) == len(structures)
+
+        apply_structures(domain)
+        discharges = get_discharges(structures)
+
+        results = self.run_parallel_structures(schedule)
+
+        # The culverts have to cross the subdomains to test the exchange
+        assert max(max(procs) for l2g, values, d, procs in results) > 1
+
+        parallel_discharges = {}
+        number_of_full_triangles = 0
+        for l2g, values, d, procs in results:
+            number_of_full_triangles += len(l2g)
+            for name in values:
+                if verbose:
+                    print name, num.max(num.abs(values[name] -
+                                    domain.quantities[name].centroid_values[l2g]))
+                assert num.allclose(values[name],
+                                    domain.quantities[name].centroid_values[l2g],
+                                    rtol=1.0e-10, atol=1.0e-10)
+            parallel_discharges.update(d)
+
+        assert number_of_full_triangles == len(domain)
+
+        assert sorted(parallel_discharges.keys()) == sorted(discharges.keys())
+        for key in discharges:
+            if verbose:
+                print key, discharges[key], parallel_discharges[key]
+            assert discharges[key] > 0.0
+            assert num.allclose(parallel_discharges[key], discharges[key],
+                                rtol=1.0e-10, atol=1.0e-10)
+
+
+    def test_parallel_structure_operators(self):
+
+        self.check_against_structure_manager(schedule=False)
+
+
+    def test_parallel_structure_scheduler(self):
+
+        self.check_against_structure_manager(schedule=True)
+
+
+# =========================================================================
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_parallel_structure_scheduler, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
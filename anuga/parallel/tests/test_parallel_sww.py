@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+"""
+Test the global sww file of a parallel domain against the merged
+processor sww files. The processors are stood in for by local processes
+talking through pipes, so the test does not need mpi.
+"""
+
+import unittest
+import shutil
+import tempfile
+import multiprocessing
+from os.path import join
+
+import numpy as num
+
+import anuga
+from anuga.file.netcdf import NetCDFFile
+from anuga.config import netcdf_mode_r
+from anuga.utilities.sww_merge import sww_merge_parallel
+from anuga.parallel.sequential_distribute import sequential_distribute_dump
+from anuga.parallel.sequential_distribute import sequential_distribute_load_pickle_file
+from anuga.parallel.parallel_sww import Parallel_sww_file
+
+verbose = False
+numprocs = 3
+
+
+class Pipe_communicator:
+    """Stand in for Pypar_communicator using multiprocessing pipes
+    """
+
+    def __init__(self, rank, size, connections):
+
+        self.rank = rank
+        self.size = size
+        self.connections = connections
+
+    def send(self, x, destination):
+
+        self.connections[destination].send(x)
+
+    def receive(self, source):
+
+        return self.connections[source].recv()
+
+
+def stage(t):
+
+    return lambda x, y: num.where(x < 5.0 + t, 0.5 - 0.1*t, -x/10.0)
+
+
+def store_output(pickle_name, communicator=None):
+    """Store three timesteps of a subdomain, in the global sww file if a
+    communicator is given, otherwise in the processor sww file
+    """
+
+    domain = sequential_distribute_load_pickle_file(pickle_name, numprocs)
+
+    if communicator is None:
+        domain.set_name('merged')
+        domain.initialise_storage()
+    else:
+        domain.set_name('global')
+        domain.set_store_global_sww()
+        domain.writer = Parallel_sww_file(domain, communicator)
+        domain.writer.store_connectivity()
+
+    for t in [0.0, 1.0, 2.0]:
+        domain.set_time(t)
+        domain.set_quantity('stage', stage(t))
+        domain.set_quantity('xmomentum', lambda x, y: x*y + t)
+        domain.store_timestep()
+
+
+def store_global_output(pickle_name, rank, connections):
+
+    communicator = Pipe_communicator(rank, numprocs, connections)
+    store_output(pickle_name, communicator)
+
+
+class Test_parallel_sww(unittest.TestCase):
+
+    def setUp(self):
+
+        self.partition_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.partition_dir)
+
+
+    def distribute_domain(self, smooth=True, store_centroids=False):
+
+        domain = anuga.rectangular_cross_domain(10, 6, len1=10.0, len2=6.0)
+        domain.set_name('domain')
+        domain.set_datadir(self.partition_dir)
+        domain.set_quantity('elevation', lambda x, y: -x/10.0)
+        domain.set_quantity('friction', 0.03)
+        domain.set_store_vertices_uniquely(not smooth)
+        domain.set_store_centroids(store_centroids)
+
+        Br = anuga.Reflective_boundary(domain)
+        domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+        sequential_distribute_dump(domain, numprocs,
+                                   partition_dir=self.partition_dir)
+
+        pickle_names = [join(self.partition_dir, 'domain_P%d_%d.pickle' % (numprocs, p))
+                        for p in range(numprocs)]
+
+        return domain, pickle_names
+
+
+    def run_parallel_sww(self, smooth=True, store_centroids=False):
+
+        domain, pickle_names = self.distribute_domain(smooth, store_centroids)
+
+        # Processor sww files merged after the run
+        for pickle_name in pickle_names:
+            store_output(pickle_name)
+        sww_merge_parallel(join(self.partition_dir, 'merged'), numprocs)
+
+        # Global sww file, processor 0 runs in this process
+        connections = {}
+        processes = []
+        for p in range(1, numprocs):
+            connections[p], connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=store_global_output,
+                                              args=(pickle_names[p], p,
+                                                    {0: connection}))
+            process.start()
+            processes.append(process)
+
+        store_global_output(pickle_names[0], 0, connections)
+
+        for process in processes:
+            process.join()
+            assert process.exitcode == 0
+
+        merged = NetCDFFile(join(self.partition_dir, 'merged.sww'), netcdf_mode_r)
+        fid = NetCDFFile(join(self.partition_dir, 'global.sww'), netcdf_mode_r)
+
+        assert set(fid.variables.keys()) == set(merged.variables.keys())
+        # sww_merge labels all merged files as smoothed
+        if smooth:
+            assert fid.smoothing == 'Yes'
+        else:
+            assert fid.smoothing == 'No'
+        assert fid.xllcorner == merged.xllcorner
+        assert fid.yllcorner == merged.yllcorner
+
+        for name in fid.variables:
+            if verbose:
+                print name, fid.variables[name].shape
+            assert num.allclose(fid.variables[name][:], merged.variables[name][:])
+
+        assert len(fid.variables['time']) == 3
+        assert fid.variables['volumes'].shape[0] == domain.number_of_triangles
+
+        fid.close()
+        merged.close()
+
+
+    def test_parallel_sww_smooth(self):
+
+        self.run_parallel_sww(smooth=True)
+
+
+    def test_parallel_sww_non_smooth(self):
+
+        self.run_parallel_sww(smooth=False, store_centroids=True)
+
+
+    def test_sww_merge_blocks(self):
+
+        for smooth in [True, False]:
+            domain, pickle_names = self.distribute_domain(smooth, store_centroids=True)
+
+            for pickle_name in pickle_names:
+                store_output(pickle_name)
+
+            global_name = join(self.partition_dir, 'merged')
+
+            sww_merge_parallel(global_name, numprocs)
+            fid = NetCDFFile(global_name + '.sww', netcdf_mode_r)
+            merged = {}
+            for name in fid.variables:
+                merged[name] = fid.variables[name][:]
+            fid.close()
+
+            # One timestep at a time, in two processes
+            sww_merge_parallel(global_name, numprocs, memory_budget=1, processes=2)
+            fid = NetCDFFile(global_name + '.sww', netcdf_mode_r)
+
+            assert set(fid.variables.keys()) == set(merged.keys())
+            for name in fid.variables:
+                assert num.allclose(fid.variables[name][:], merged[name])
+
+            fid.close()
+
+
+# =========================================================================
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_parallel_sww, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
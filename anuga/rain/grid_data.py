@@ -58,6 +58,15 @@ class Raster_time_slice_data(object):
     def get_extent(self):
         
         return self.extent
+
+
+    def get_data_slice(self, tid, rows=slice(None), cols=slice(None)):
+        """
+        Data of time slice tid, restricted to the given rows (north to 
+        south) and columns (west to east)
+        """
+        
+        return self.data_slices[tid][rows, cols]
     
 
     def read_data_files(self):
@@ -365,11 +374,15 @@ class Calibrated_radar_rain(Raster_time_slice_data):
                  radar_dir = None,
                  start_time = None,
                  final_time = None,
+                 load_data = True,
                  verbose=False, 
                  debug=False):
         """
         start_time: seconds since epoch  or string of form 20120229_1210
         final_time: seconds since epoch  or string of form 20120229_1210
+        load_data: If False only the grid and times are read, and time 
+                   slices are read from the files when requested by 
+                   get_data_slice (e.g. by Radar_rate_operator)
         
         The BoM data is assumed to be stored as a raster, ie. columns  
         in the x direction (eastings) and rows in the vertical y direction
@@ -387,6 +400,7 @@ class Calibrated_radar_rain(Raster_time_slice_data):
                                         debug = debug)
 
         self.radar_dir = radar_dir
+        self.load_data = load_data
         
         # process the radar files
         if not radar_dir is None:
@@ -406,6 +420,7 @@ class Calibrated_radar_rain(Raster_time_slice_data):
         data_max_in_period = 0.0
         
         data_slices = []
+        data_files = []
         times = []
         
         self.radar_dir = radar_dir
@@ -474,6 +489,9 @@ class Calibrated_radar_rain(Raster_time_slice_data):
                             print 'BOM Reference name tag in this file:'
                             print precip_name
 
+                if not self.load_data:
+                    # Remember where the slice is, read it when needed
+                    data_files.append((os.path.join(root, filename), precip_name))
                 
                 if first:
                     first = False
@@ -500,13 +518,21 @@ class Calibrated_radar_rain(Raster_time_slice_data):
                     self.x = self.x*1000 + self.offset_x
                     self.y = self.y*1000 + self.offset_y
                     
-                    data_slice = data.variables[precip_name][:]/1000  # convert from mm to m
+                    if self.load_data:
+                        data_slice = data.variables[precip_name][:]/1000  # convert from mm to m
                     
-                    data_accumulated = data_slice.copy() # Put into new Accumulating ARRRAY
+                        data_accumulated = data_slice.copy() # Put into new Accumulating ARRRAY
                     
-                    data_max_in_period  = max(np.max(data_slice),data_max_in_period)  
+                        data_max_in_period  = max(np.max(data_slice),data_max_in_period)  
+                    else:
+                        data_slice = None
+                        data_accumulated = None
                         
     
+                elif not self.load_data:
+                    data_slice = None
+                    assert np.allclose(self.time_step,new_time_step), "Timesteps not equal"
+
                 else:  # ---If NOT FIRST !!!
                     data_slice = data.variables[precip_name][:]/1000 # convert from mm to m
 
@@ -530,14 +556,18 @@ class Calibrated_radar_rain(Raster_time_slice_data):
         #pdb.set_trace()
         if len(times) > 0:
             self.times = times[ids]   
-            self.data_slices = np.array([ data_slices[tid] for tid in ids ])
+            if self.load_data:
+                self.data_slices = np.array([ data_slices[tid] for tid in ids ])
+            else:
+                self.data_slices = None
+                self.data_files = [ data_files[tid] for tid in ids ]
             self.start_time = self.times[0]-self.time_step
             self.data_accumulated = data_accumulated 
-            print "+++++", np.sum(data_accumulated)
             # Test sorting
             for i, tid in enumerate(ids):
                 np.allclose(times[tid], self.times[i])
-                np.allclose(data_slices[tid], self.data_slices[i])
+                if self.load_data:
+                    np.allclose(data_slices[tid], self.data_slices[i])
         else:
             self.times = []  
             self.data_slices = []
@@ -552,6 +582,27 @@ class Calibrated_radar_rain(Raster_time_slice_data):
             print "    To UTC time:   %s"% datetime.datetime.utcfromtimestamp(self.final_time).strftime('%c')
             print "    Read in %g time slices" % len(self.times)
 
+
+    def get_data_slice(self, tid, rows=slice(None), cols=slice(None)):
+        """
+        Data of time slice tid (m), restricted to the given rows (north to 
+        south) and columns (west to east). Read from the radar file if the 
+        data was not loaded.
+        """
+        
+        if self.load_data:
+            return self.data_slices[tid][rows, cols]
+        
+        filename, precip_name = self.data_files[tid]
+        
+        data = NetCDFFile(filename, 'r')
+        try:
+            data_slice = data.variables[precip_name][rows, cols]/1000 # convert from mm to m
+        finally:
+            data.close()
+        
+        return data_slice
+
     
     
 if __name__ == "__main__":
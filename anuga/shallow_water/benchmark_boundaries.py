@@ -0,0 +1,68 @@
+"""
+Benchmark the per step cost of domain.update_boundary for the built-in
+shallow water boundaries, evaluated in python and in C (see
+Domain.set_use_c_boundaries).
+
+Each boundary type is set on all four sides of a 200 x 200 domain.
+
+Run as
+    python benchmark_boundaries.py
+"""
+
+import time
+
+import numpy as num
+import anuga
+
+from anuga.shallow_water.boundaries import Dirichlet_discharge_boundary
+from anuga.shallow_water.boundaries import Inflow_boundary
+
+
+number_of_steps = 200
+
+cases = [
+    ('Reflective',
+     lambda domain: anuga.Reflective_boundary(domain)),
+    ('Transmissive',
+     lambda domain: anuga.Transmissive_boundary(domain)),
+    ('Dirichlet',
+     lambda domain: anuga.Dirichlet_boundary([0.2, 0.0, 0.0])),
+    ('Time',
+     lambda domain: anuga.Time_boundary(domain,
+                                        function=lambda t: [0.1, 0.0, 0.0])),
+    ('Transmissive_stage_zero_momentum',
+     lambda domain: anuga.Transmissive_stage_zero_momentum_boundary(domain)),
+    ('Transmissive_momentum_set_stage',
+     lambda domain: anuga.Transmissive_momentum_set_stage_boundary(domain,
+                                        function=lambda t: 0.1)),
+    ('Dirichlet_discharge',
+     lambda domain: Dirichlet_discharge_boundary(domain, 0.2, 0.1)),
+    ('Inflow',
+     lambda domain: Inflow_boundary(domain, rate=1.0))]
+
+
+def time_update_boundary(create_boundary, use_c_boundaries):
+    """Return wall time per call of update_boundary
+    """
+
+    domain = anuga.rectangular_cross_domain(200, 200)
+    domain.set_use_c_boundaries(use_c_boundaries)
+    B = create_boundary(domain)
+    domain.set_boundary({'left': B, 'right': B, 'top': B, 'bottom': B})
+
+    # First call groups the boundary edges
+    domain.update_boundary()
+
+    t0 = time.time()
+    for i in range(number_of_steps):
+        domain.update_boundary()
+
+    return (time.time() - t0)/number_of_steps
+
+
+print '%d boundary edges, %d steps' % (4*2*200, number_of_steps)
+print '%-35s %15s %15s' % ('Boundary', 'python (ms)', 'C (ms)')
+for label, create_boundary in cases:
+    python_step = time_update_boundary(create_boundary, False)
+    c_step = time_update_boundary(create_boundary, True)
+    print '%-35s %15.3f %15.3f' % (label, 1000*python_step, 1000*c_step)
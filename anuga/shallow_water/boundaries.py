@@ -24,7 +24,9 @@ ModifiedBy:
 
 
 from anuga.abstract_2d_finite_volumes.generic_boundary_conditions\
-     import Boundary, File_boundary
+     import Boundary, File_boundary, Sts_boundary
+from anuga.abstract_2d_finite_volumes.generic_boundary_conditions\
+     import Dirichlet_boundary, Transmissive_boundary, Time_boundary
 import numpy as num
 
 import anuga.utilities.log as log
@@ -207,6 +209,24 @@ class Transmissive_momentum_set_stage_boundary(Boundary):
         """
 
         q = self.domain.get_conserved_quantities(vol_id, edge = edge_id)
+        q[0] = self.get_stage()
+           
+        return q
+
+        # FIXME: Consider this (taken from File_boundary) to allow
+        # spatial variation
+        # if vol_id is not None and edge_id is not None:
+        #     i = self.boundary_indices[ vol_id, edge_id ]
+        #     return self.F(t, point_id = i)
+        # else:
+        #     return self.F(t)
+
+
+    def get_stage(self):
+        """Return the stage set by the boundary function at the
+        current time.
+        """
+
         t = self.domain.get_time()
 
         if hasattr(self.function, 'time'):
@@ -225,17 +245,7 @@ class Transmissive_momentum_set_stage_boundary(Boundary):
         except:
             x = float(value[0])
 
-        q[0] = x
-           
-        return q
-
-        # FIXME: Consider this (taken from File_boundary) to allow
-        # spatial variation
-        # if vol_id is not None and edge_id is not None:
-        #     i = self.boundary_indices[ vol_id, edge_id ]
-        #     return self.F(t, point_id = i)
-        # else:
-        #     return self.F(t)
+        return x
 
 
 class Transmissive_n_momentum_zero_t_momentum_set_stage_boundary(Boundary):
@@ -312,13 +322,7 @@ class Transmissive_n_momentum_zero_t_momentum_set_stage_boundary(Boundary):
         ## except:
         ##     x = float(value[0])
 
-        value = self.get_boundary_values()
-        try:
-            x = float(value)
-        except:
-            x = float(value[0])
-
-        q[0] = x
+        q[0] = self.get_stage()
 
         ndotq = (normal[0]*q[1] + normal[1]*q[2])
         q[1] = normal[0]*ndotq
@@ -346,15 +350,8 @@ class Transmissive_n_momentum_zero_t_momentum_set_stage_boundary(Boundary):
         n1  = Normals[vol_ids,2*edge_ids]
         n2  = Normals[vol_ids,2*edge_ids+1]
        
-        # Call the boundary function which returns stage 
-        value = self.get_boundary_values()
-        try:
-            x = float(value)
-        except:
-            x = float(value[0])
-       
         # Set stage 
-        Stage.boundary_values[ids]  = x
+        Stage.boundary_values[ids]  = self.get_stage()
        
         # Compute flux normal to edge
         q1 = Xmom.edge_values[vol_ids,edge_ids]
@@ -365,6 +362,20 @@ class Transmissive_n_momentum_zero_t_momentum_set_stage_boundary(Boundary):
         Ymom.boundary_values[ids] = ndotq * n2
 
 
+    def get_stage(self):
+        """Return the stage set by the boundary function at the
+        current time.
+        """
+
+        value = self.get_boundary_values()
+        try:
+            x = float(value)
+        except:
+            x = float(value[0])
+
+        return x
+
+
 class Transmissive_stage_zero_momentum_boundary(Boundary):
     """Return same stage as those present in its neighbour volume.
     Set momentum to zero.
@@ -451,6 +462,7 @@ class Time_stage_zero_momentum_boundary(Boundary):
 
 
         self.f = function
+        self.function = function
         self.domain = domain
 
     def __repr__(self):
@@ -811,7 +823,8 @@ class Field_boundary(Boundary):
                  boundary_polygon=None,
                  default_boundary=None,
                  use_cache=False,
-                 verbose=False):
+                 verbose=False,
+                 streaming=False):
         """Constructor
 
         filename: Name of sww file containing stage and x/ymomentum
@@ -839,6 +852,8 @@ class Field_boundary(Boundary):
         boundary_polygon: 
         use_cache:        True if caching is to be used.
         verbose:          True if this method is to be verbose.
+        streaming:        True if time slices are to be read from the
+                          file on demand rather than all at once.
 
         """
 
@@ -850,7 +865,8 @@ class Field_boundary(Boundary):
                                            boundary_polygon=boundary_polygon,
                                            default_boundary=default_boundary,
                                            use_cache=use_cache,
-                                           verbose=verbose)
+                                           verbose=verbose,
+                                           streaming=streaming)
 
         # Record information from File_boundary
         self.F = self.file_boundary.F
@@ -865,6 +881,13 @@ class Field_boundary(Boundary):
         return 'Field boundary'
 
 
+    def close(self):
+        """Close the file read when streaming
+        """
+
+        self.file_boundary.close()
+
+
     def evaluate(self, vol_id=None, edge_id=None):
         """ Calculate 'field' boundary results.
             vol_id and edge_id are ignored
@@ -882,6 +905,28 @@ class Field_boundary(Boundary):
         return q
 
 
+    def evaluate_segment(self, domain, segment_edges):
+        """ Set 'field' boundary values on all edges of segment_edges
+
+            Return linearly interpolated values based on domain.time
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        # Evaluate file boundary
+        q = self.file_boundary.get_segment_values(domain, segment_edges)
+
+        # Adjust stage
+        for j, name in enumerate(self.domain.conserved_quantities):
+            if name == 'stage':
+                q[:,j] += self.mean_stage
+
+        self.file_boundary.set_segment_values(domain, segment_edges, q)
+
+
 
 
 
@@ -1122,3 +1167,94 @@ class Flather_external_stage_zero_velocity_boundary(Boundary):
 
 
         
+
+
+
+#---------------------------------------------------------------------------
+# Boundaries applied in C
+#---------------------------------------------------------------------------
+
+# Types of the boundaries applied by update_boundaries in
+# swDE1_domain_ext.c. Must match the defines there
+REFLECTIVE_BOUNDARY = 0
+TRANSMISSIVE_BOUNDARY = 1
+DIRICHLET_BOUNDARY = 2
+TRANSMISSIVE_STAGE_ZERO_MOMENTUM_BOUNDARY = 3
+TRANSMISSIVE_MOMENTUM_SET_STAGE_BOUNDARY = 4
+TRANSMISSIVE_N_MOMENTUM_ZERO_T_MOMENTUM_SET_STAGE_BOUNDARY = 5
+DIRICHLET_DISCHARGE_BOUNDARY = 6
+INFLOW_BOUNDARY = 7
+
+c_boundary_types = {
+    Reflective_boundary : REFLECTIVE_BOUNDARY,
+    Transmissive_boundary : TRANSMISSIVE_BOUNDARY,
+    Dirichlet_boundary : DIRICHLET_BOUNDARY,
+    Time_boundary : DIRICHLET_BOUNDARY,
+    Time_stage_zero_momentum_boundary : DIRICHLET_BOUNDARY,
+    Transmissive_stage_zero_momentum_boundary :
+        TRANSMISSIVE_STAGE_ZERO_MOMENTUM_BOUNDARY,
+    Transmissive_momentum_set_stage_boundary :
+        TRANSMISSIVE_MOMENTUM_SET_STAGE_BOUNDARY,
+    Transmissive_n_momentum_zero_t_momentum_set_stage_boundary :
+        TRANSMISSIVE_N_MOMENTUM_ZERO_T_MOMENTUM_SET_STAGE_BOUNDARY,
+    Dirichlet_discharge_boundary : DIRICHLET_DISCHARGE_BOUNDARY,
+    Inflow_boundary : INFLOW_BOUNDARY}
+
+
+def get_c_boundary_type(B, domain):
+    """Return the type code used by the C boundary update for boundary
+    object B, or None if B must be evaluated in python.
+
+    Only the built-in classes themselves are applied in C, subclasses
+    may override evaluate and are left to python.
+    """
+
+    c_type = c_boundary_types.get(B.__class__)
+
+    if c_type is None:
+        return None
+
+    if len(domain.conserved_quantities) != 3 or \
+       len(domain.evolved_quantities) != 3:
+        return None
+
+    if B.__class__ is Dirichlet_boundary and len(B.dirichlet_values) != 3:
+        return None
+
+    return c_type
+
+
+def get_c_boundary_parameters(B, domain):
+    """Return the three parameters of boundary object B used by the
+    C boundary update at the current time (see get_c_boundary_type).
+    """
+
+    c_type = c_boundary_types[B.__class__]
+
+    if c_type == REFLECTIVE_BOUNDARY or \
+       c_type == TRANSMISSIVE_STAGE_ZERO_MOMENTUM_BOUNDARY:
+        return [0.0, 0.0, 0.0]
+
+    if c_type == TRANSMISSIVE_BOUNDARY:
+        return [float(domain.centroid_transmissive_bc), 0.0, 0.0]
+
+    if B.__class__ is Dirichlet_boundary:
+        return B.dirichlet_values
+
+    if B.__class__ is Time_boundary:
+        return B.get_boundary_values()
+
+    if B.__class__ is Time_stage_zero_momentum_boundary:
+        return [float(B.get_boundary_values()), 0.0, 0.0]
+
+    if c_type == TRANSMISSIVE_MOMENTUM_SET_STAGE_BOUNDARY or \
+       c_type == TRANSMISSIVE_N_MOMENTUM_ZERO_T_MOMENTUM_SET_STAGE_BOUNDARY:
+        return [B.get_stage(), 0.0, 0.0]
+
+    if c_type == DIRICHLET_DISCHARGE_BOUNDARY:
+        return [B.stage0, B.wh0, 0.0]
+
+    if c_type == INFLOW_BOUNDARY:
+        # Inflow_boundary has a fixed depth of 1m above the bed
+        # (see Inflow_boundary.evaluate)
+        return [B.average_momentum, 1.0, 0.0]
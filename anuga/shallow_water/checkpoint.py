@@ -14,11 +14,338 @@ read in the last stored domain. Do that via
 
 domain = load_last_checkpoint_file(domain_name, checkpoint_dir)
 
+With domain.set_checkpointing(..., checkpoint_format='arrays') the domain is
+pickled once (domain_name.checkpoint) and each checkpoint only stores the
+evolving state in domain_name_time.state, written in the background. The
+domain is then restored from the pickled domain and the latest state.
+
+The state holds:
+
+  - the number and string attributes of the domain (time, counters, name)
+  - the centroid values of the conserved quantities
+  - the values of the static quantities (e.g. elevation) that one of the
+    operators may change, see Operator.get_changed_quantities
+  - the number, string and array attributes of the operators
+  - the number and string attributes of the sww writer (file name, number
+    of timesteps and frames)
+  - the extrema of the monitored quantities
+
+The other static quantities are taken from the pickled domain and the
+diagnostic quantities (height and velocities) are rebuilt from the
+conserved quantities. Other attributes of the operators, e.g. their
+regions and inlets, are also taken from the pickled domain, i.e. as they
+were at the first checkpoint.
+
 """
 
+import os
+import sys
+import copy
+import threading
+import Queue
+
+import numpy as num
+
 from anuga import send, receive, myid, numprocs, barrier
 from time import time as walltime
 
+try:
+    import dill as cPickle
+except:
+    import cPickle
+
+
+class Checkpoint_writer:
+    """Store array checkpoints of a domain in checkpoint_dir
+
+    The domain itself is pickled at the first checkpoint. The checkpoints
+    store the state returned by get_domain_state. If background is True a
+    checkpoint is copied when it is stored and written by a background
+    thread, at most one checkpoint waits while another is written.
+    """
+
+    def __init__(self, domain, checkpoint_dir, background=True):
+
+        self.domain = domain
+        self.checkpoint_dir = checkpoint_dir
+        self.background = background
+
+        self.static_filename = None
+        self.states = None
+        self.write_thread = None
+        self.write_error = None
+
+
+    def __getstate__(self):
+        """The writer is pickled with the domain, threads can not be
+        """
+
+        state = self.__dict__.copy()
+        state['static_filename'] = None
+        state['states'] = None
+        state['write_thread'] = None
+        state['write_error'] = None
+
+        return state
+
+
+    def get_static_filename(self):
+
+        return os.path.join(self.checkpoint_dir, self.domain.get_name())+'.checkpoint'
+
+
+    def get_state_filename(self, time):
+
+        return os.path.join(self.checkpoint_dir, self.domain.get_name())+'_'+str(time)+'.state'
+
+
+    def store_checkpoint(self):
+        """Store the current state of the domain, and the domain itself
+        if it has not been stored yet under its current name
+        """
+
+        static_filename = self.get_static_filename()
+        if self.static_filename != static_filename:
+            # Wait for the states of an older domain
+            self.flush()
+            write_pickle(static_filename, self.domain)
+            self.static_filename = static_filename
+
+        filename = self.get_state_filename(self.domain.get_time())
+        state = get_domain_state(self.domain)
+
+        if not self.background:
+            write_pickle(filename, state)
+            return
+
+        if self.write_thread is None:
+            self.states = Queue.Queue(maxsize=1)
+            self.write_error = None
+            self.write_thread = threading.Thread(target=self.write_states)
+            self.write_thread.daemon = True
+            self.write_thread.start()
+
+        if self.write_error is not None:
+            self.flush()
+
+        self.states.put((filename, state))
+
+
+    def flush(self):
+        """Wait for the checkpoints being written in the background
+        """
+
+        if self.write_thread is not None:
+            self.states.join()
+
+            if self.write_error is not None:
+                error, self.write_error = self.write_error, None
+                raise error[0], error[1], error[2]
+
+
+    def close(self):
+        """Write all the stored checkpoints and stop the background
+        thread. Called at the end of an evolve.
+        """
+
+        if self.write_thread is None:
+            return
+
+        try:
+            self.flush()
+        finally:
+            self.states.put(None)
+            self.write_thread.join()
+            self.write_thread = None
+            self.states = None
+
+
+    def write_states(self):
+        """Body of the background thread, write the queued checkpoints
+        until None is queued
+        """
+
+        while True:
+            item = self.states.get()
+            try:
+                if item is None:
+                    return
+
+                # After an error the checkpoints are dropped until the
+                # error has been raised by flush
+                if self.write_error is None:
+                    write_pickle(*item)
+            except:
+                self.write_error = sys.exc_info()
+            finally:
+                self.states.task_done()
+
+
+def write_pickle(filename, x):
+    """Pickle x to filename, via a temporary file so that an interrupted
+    write does not leave a broken checkpoint
+    """
+
+    tmp_name = filename+'.tmp'
+    f = open(tmp_name, 'wb')
+    try:
+        cPickle.dump(x, f, protocol=cPickle.HIGHEST_PROTOCOL)
+    finally:
+        f.close()
+
+    os.rename(tmp_name, filename)
+
+
+state_types = (int, long, float, num.number, basestring)
+
+
+def get_object_state(obj, arrays=False, shared_arrays=()):
+    """Return a copy of the number and string attributes of obj, and of
+    its array attributes if arrays is True. Arrays that share memory with
+    one of shared_arrays are left out.
+    """
+
+    state = {}
+    for name, value in obj.__dict__.items():
+        if isinstance(value, state_types):
+            state[name] = value
+        elif arrays and isinstance(value, num.ndarray):
+            if not any(num.may_share_memory(value, A) for A in shared_arrays):
+                state[name] = value.copy()
+
+    return state
+
+
+def set_object_state(obj, state):
+    """Restore a state returned by get_object_state. Arrays are updated
+    in place as they may be shared, e.g. by operators.
+    """
+
+    for name, value in state.items():
+        old_value = getattr(obj, name, None)
+        if isinstance(old_value, num.ndarray) and isinstance(value, num.ndarray) \
+               and old_value.shape == value.shape:
+            old_value[...] = value
+        else:
+            setattr(obj, name, value)
+
+
+def get_domain_arrays(domain):
+    """Return the arrays of the domain and of its quantities, which
+    operators often refer to
+    """
+
+    arrays = [A for A in domain.__dict__.values() if isinstance(A, num.ndarray)]
+    for Q in domain.quantities.values():
+        # Only the allocated arrays of the quantity
+        arrays.extend(A for A in Q.__dict__.values() if isinstance(A, num.ndarray))
+
+    return arrays
+
+
+def get_changed_quantities(domain):
+    """Return the names of the quantities that are not evolved but may
+    be changed by the operators of the domain
+    """
+
+    names = set()
+    for operator in domain.fractional_step_operators:
+        names.update(operator.get_changed_quantities())
+
+    return [name for name in names
+            if name in domain.quantities
+            and domain.quantities[name].get_role() != 'evolved']
+
+
+def get_domain_state(domain):
+    """Return a copy of the evolving state of the domain, see the module
+    documentation for what is stored
+    """
+
+    state = {}
+
+    state['attributes'] = get_object_state(domain)
+
+    # The vertex and edge values of the conserved quantities are
+    # reconstructed from the centroid values at the start of an evolve.
+    # Static quantities only change through operators, diagnostic
+    # quantities are rebuilt by set_domain_state
+    changed_quantities = get_changed_quantities(domain)
+
+    state['quantities'] = {}
+    for name, Q in domain.quantities.items():
+        if name in domain.conserved_quantities:
+            state['quantities'][name] = (Q.centroid_values.copy(), None, None)
+        elif Q.get_role() == 'evolved' or name in changed_quantities:
+            state['quantities'][name] = (Q.centroid_values.copy(),
+                                         Q.vertex_values.copy(),
+                                         Q.edge_values.copy())
+
+    # The arrays of the domain are restored with the domain
+    domain_arrays = get_domain_arrays(domain)
+    state['operators'] = [get_object_state(operator, arrays=True,
+                                           shared_arrays=domain_arrays)
+                          for operator in domain.fractional_step_operators]
+
+    writer = getattr(domain, 'writer', None)
+    if writer is not None:
+        state['writer'] = get_object_state(writer)
+
+    state['extrema'] = copy.deepcopy(domain.quantities_to_be_monitored)
+
+    return state
+
+
+def set_domain_state(domain, state):
+    """Restore a state returned by get_domain_state. Arrays are updated
+    in place as they may be shared, e.g. by operators.
+    """
+
+    set_object_state(domain, state['attributes'])
+
+    for name, (centroid_values, vertex_values, edge_values) in state['quantities'].items():
+        Q = domain.quantities[name]
+        Q.centroid_values[:] = centroid_values
+        if vertex_values is not None:
+            Q.vertex_values[:] = vertex_values
+            Q.edge_values[:] = edge_values
+
+    if hasattr(domain, 'update_centroids_of_velocities_and_height'):
+        domain.update_centroids_of_velocities_and_height()
+
+    msg = 'Checkpoint has %d operators, domain has %d' \
+          % (len(state['operators']), len(domain.fractional_step_operators))
+    assert len(state['operators']) == len(domain.fractional_step_operators), msg
+
+    for operator, operator_state in zip(domain.fractional_step_operators, state['operators']):
+        set_object_state(operator, operator_state)
+
+    # The writer may have moved on to another file since the domain was
+    # pickled, e.g. when the sww file was split
+    writer = getattr(domain, 'writer', None)
+    if writer is not None and 'writer' in state:
+        set_object_state(writer, state['writer'])
+
+    domain.quantities_to_be_monitored = state['extrema']
+
+
+def load_state_checkpoint(domain_name, checkpoint_dir, time):
+    """Restore the domain from domain_name.checkpoint and its state at
+    time
+    """
+
+    from os.path import join
+
+    state_name = join(checkpoint_dir,domain_name)+'_'+str(time)+'.state'
+    state = cPickle.load(open(state_name, 'rb'))
+
+    static_name = join(checkpoint_dir,domain_name)+'.checkpoint'
+    domain = cPickle.load(open(static_name, 'rb'))
+
+    set_domain_state(domain, state)
+
+    return domain
+
 
 
 def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = None):
@@ -30,7 +357,10 @@ def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = No
 
     if time is None:
         # will pull out the last available time
-        times = _get_checkpoint_times(domain_name, checkpoint_dir)
+        # Pickled domains and array checkpoints
+        times = set()
+        for extension in ['.pickle', '.state']:
+            times |= _get_checkpoint_times(domain_name, checkpoint_dir, extension) or set()
 
         times = list(times)
         times.sort()
@@ -46,11 +376,10 @@ def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = No
         #print pickle_name
 
         try:
-            try:
-                import dill as cPickle
-            except:
-                import cPickle
-            domain = cPickle.load(open(pickle_name, 'rb'))
+            if os.path.exists(pickle_name):
+                domain = cPickle.load(open(pickle_name, 'rb'))
+            else:
+                domain = load_state_checkpoint(domain_name, checkpoint_dir, time)
             success = True
         except:
             success = False
@@ -81,9 +410,8 @@ def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = No
     return domain
 
 
-def _get_checkpoint_times(domain_name, checkpoint_dir):
+def _get_checkpoint_times(domain_name, checkpoint_dir, extension='.pickle'):
 
-    import os
     times = set()
 
     for (path, directory, filenames) in os.walk(checkpoint_dir):
@@ -94,6 +422,8 @@ def _get_checkpoint_times(domain_name, checkpoint_dir):
             return None
         else:
             for filename in filenames:
+                if os.path.splitext(filename)[1] != extension:
+                    continue
                 filebase = os.path.splitext(filename)[0].rpartition("_")
                 time = filebase[-1]
                 domain_name_base = filebase[0]
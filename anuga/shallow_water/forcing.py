@@ -10,6 +10,7 @@ ModifiedBy:
 
 from warnings import warn
 import numpy as num
+import threading
 from copy import copy
 
 from anuga.abstract_2d_finite_volumes.neighbour_mesh import segment_midpoints
@@ -21,6 +22,7 @@ from anuga.geometry.polygon import is_inside_polygon, inside_polygon, \
 from anuga.geospatial_data.geospatial_data import ensure_geospatial
 from anuga.file.netcdf import NetCDFFile
 from anuga.config import netcdf_mode_r, netcdf_mode_w, netcdf_mode_a
+import anuga.utilities.log as log
 
 
 def check_forcefield(f):
@@ -1343,3 +1345,322 @@ class Wind_stress_fast:
             for i in range(self.next_windspeed_centroid_values.shape[0]):
                 self.next_windspeed_centroid_values[i]=self.speed(self.file_time[self.index+1],i) 
                 self.next_windangle_centroid_values[i]=self.phi(self.file_time[self.index+1],i) 
+
+
+class Gridded_met_forcing:
+    """ Apply wind stress and barometric pressure gradients from gridded
+        meteorological data, e.g. the hourly fields of a cyclone hindcast.
+
+        The data file is a NetCDF file (the field sts format converted by
+        sts2sww_mesh) with the variables x, y (relative to its
+        georeference) of the points of a rectilinear grid, time, and
+        wind_speed [m/s], wind_angle [degrees] and barometric_pressure
+        [hPa] with one row per time.
+
+        The bilinear interpolation from the grid onto the centroids (wind)
+        and the pressure gradient on each triangle are precomputed as
+        sparse matrices, so that each frame read from the file costs one
+        sparse matrix-vector product. Frames are read lazily, two at a
+        time, and values at model times in between are linearly
+        interpolated. The wind is interpolated as velocity components so
+        that directions wrap correctly.
+
+        The data file is kept open until close() is called (or the
+        forcing is garbage collected).
+    """
+
+    def __init__(self, filename, domain, wind=True, pressure=True,
+                 block_size=1, prefetch=True, verbose=False):
+        """Initialise met forcing from the gridded data in filename for
+        the given domain.
+
+        wind and pressure select the forcing applied. block_size frames
+        are read from the file at a time and the following block is read
+        in a background thread if prefetch is True (see
+        Netcdf_quantity_reader).
+
+        The instantiated object F can be appended to the list of
+        forcing_terms as in
+
+        domain.forcing_terms.append(F)
+        """
+
+        from anuga.config import rho_a, rho_w, eta_w
+        from anuga.coordinate_transforms.geo_reference import Geo_reference
+        from anuga.abstract_2d_finite_volumes.file_function import \
+             Netcdf_quantity_reader
+
+        if not (wind or pressure):
+            raise Exception('Gridded_met_forcing needs wind and/or pressure')
+
+        self.filename = filename
+        self.wind = wind
+        self.pressure = pressure
+        self.verbose = verbose
+
+        self.const = eta_w*rho_a/rho_w
+        self.rho_w = rho_w
+
+        # Open NetCDF file, kept open to read frames as they are needed
+        self.fid = fid = NetCDFFile(filename, netcdf_mode_r)
+
+        starttime = getattr(fid, 'starttime', 0.0)
+        self.file_time = num.array(fid.variables['time'][:], num.float) + \
+                         starttime
+
+        msg = 'Gridded met file %s must have at least two times' % filename
+        assert len(self.file_time) >= 2, msg
+
+        geo_reference = Geo_reference(NetCDFObject=fid)
+        x = num.array(fid.variables['x'][:], num.float) + \
+            geo_reference.get_xllcorner()
+        y = num.array(fid.variables['y'][:], num.float) + \
+            geo_reference.get_yllcorner()
+
+        grid_index = get_grid_index(x, y)
+
+        if verbose:
+            log.critical('Gridded_met_forcing: %d x %d grid, %d frames'
+                         % (grid_index.shape + (len(self.file_time),)))
+
+        # Reads of the file (also from prefetch threads) are serialised
+        lock = threading.Lock()
+
+        N = len(domain)
+        self.readers = {}
+        if wind:
+            # Bilinear interpolation onto the centroids
+            xc = domain.get_centroid_coordinates(absolute=True)
+            self.wind_matrix = get_bilinear_matrix(x, y, grid_index, xc)
+
+            for name in ['wind_speed', 'wind_angle']:
+                self.readers[name] = Netcdf_quantity_reader(fid, name,
+                                              block_size=block_size,
+                                              prefetch=prefetch, lock=lock)
+
+        if pressure:
+            # Gradient of the linear interpolant of the bilinearly
+            # interpolated vertex values. Rows 0..N-1 give the x and rows
+            # N..2N-1 the y derivative on each triangle.
+            vertices = domain.get_vertex_coordinates(absolute=True)
+            self.pressure_matrix = get_gradient_matrix(x, y, grid_index,
+                                                       vertices)
+
+            self.readers['barometric_pressure'] = \
+                Netcdf_quantity_reader(fid, 'barometric_pressure',
+                                       block_size=block_size,
+                                       prefetch=prefetch, lock=lock)
+
+        # Frames index and index+1 mapped onto the mesh
+        self.index = None
+        self.prev_frame = None
+        self.next_frame = None
+
+    def __call__(self, domain):
+        """Apply the met forcing at the current model time"""
+
+        xmom_update = domain.quantities['xmomentum'].explicit_update
+        ymom_update = domain.quantities['ymomentum'].explicit_update
+
+        t = domain.get_time(relative_time=False)
+
+        self.update_stored_frames(t)
+
+        # Linear temporal interpolation of the mesh values
+        t0 = self.file_time[self.index]
+        t1 = self.file_time[self.index+1]
+        ratio = (t - t0)/(t1 - t0)
+        values = {}
+        for name in self.prev_frame:
+            q0 = self.prev_frame[name]
+            q1 = self.next_frame[name]
+            values[name] = q0 + ratio*(q1 - q0)
+
+        if self.wind:
+            # Wind stress const*|u|*u, as in assign_windfield_values.
+            # Applied with numpy as the explicit updates are single
+            # precision after domain.set_precision('single')
+            u = values['xvelocity']
+            v = values['yvelocity']
+            S = self.const*num.sqrt(u*u + v*v)
+            xmom_update += S*u
+            ymom_update += S*v
+
+        if self.pressure:
+            N = len(domain)
+            stage = domain.quantities['stage']
+            elevation = domain.quantities['elevation']
+
+            height = stage.centroid_values - elevation.centroid_values
+
+            gradient = values['pressure_gradient']
+            xmom_update += height*gradient[:N]/self.rho_w
+            ymom_update += height*gradient[N:]/self.rho_w
+
+    def update_stored_frames(self, t):
+        """Make sure that the frames index and index+1 mapped onto the
+        mesh bracket time t.
+        """
+
+        file_time = self.file_time
+
+        msg = 'Model time %.16f' % t
+        msg += ' is not contained in the gridded met data [%.16f:%.16f] ' \
+               % (file_time[0], file_time[-1])
+        msg += 'of file %s' % self.filename
+        if t < file_time[0]: raise Modeltime_too_early(msg)
+        if t > file_time[-1]: raise Modeltime_too_late(msg)
+
+        index = num.searchsorted(file_time, t, side='right') - 1
+        index = int(min(index, len(file_time) - 2))
+
+        if index == self.index:
+            return
+
+        if self.index is not None and index == self.index + 1:
+            self.prev_frame = self.next_frame
+        else:
+            self.prev_frame = self.get_frame(index)
+        self.next_frame = self.get_frame(index + 1)
+
+        self.index = index
+
+    def get_frame(self, index):
+        """Return the met data of frame index mapped onto the mesh as a
+        dictionary with the wind velocity components at the centroids
+        ('xvelocity', 'yvelocity') and the pressure gradient on the
+        triangles ('pressure_gradient', x then y derivatives).
+        """
+
+        frame = {}
+        if self.wind:
+            s = self.readers['wind_speed'][index]
+            phi = self.readers['wind_angle'][index]*(num.pi/180.0)
+
+            uv = num.zeros((len(s), 2), num.float)
+            uv[:,0] = s*num.cos(phi)
+            uv[:,1] = s*num.sin(phi)
+
+            uv = self.wind_matrix*uv
+            frame['xvelocity'] = uv[:,0]
+            frame['yvelocity'] = uv[:,1]
+
+        if self.pressure:
+            p = self.readers['barometric_pressure'][index]
+            frame['pressure_gradient'] = self.pressure_matrix*p
+
+        return frame
+
+    def close(self):
+        """Wait for the prefetch threads and close the data file"""
+
+        if getattr(self, 'fid', None) is None:
+            return
+
+        # The readers may not exist if the initialisation failed
+        for reader in getattr(self, 'readers', {}).values():
+            reader.close()
+
+        self.fid.close()
+        self.fid = None
+
+    def __del__(self):
+        self.close()
+
+
+def get_grid_index(x, y):
+    """Return the array grid_index of shape (nx, ny) so that point
+    grid_index[i,j] of the points x, y lies at xs[i], ys[j], where xs and
+    ys are the sorted unique x and y coordinates.
+    """
+
+    xs = num.unique(x)
+    ys = num.unique(y)
+
+    msg = 'Points of gridded data must form a rectilinear grid of at '
+    msg += 'least 2 x 2 points'
+    assert len(xs) >= 2 and len(ys) >= 2, msg
+    assert len(xs)*len(ys) == len(x), msg
+
+    grid_index = -num.ones((len(xs), len(ys)), num.int)
+    grid_index[num.searchsorted(xs, x), num.searchsorted(ys, y)] = \
+        num.arange(len(x))
+
+    assert num.all(grid_index >= 0), msg
+
+    return grid_index
+
+
+def get_bilinear_weights(x, y, grid_index, points):
+    """Return arrays (columns, weights) of shape (len(points), 4) giving
+    the bilinear interpolation of the gridded data with points x, y (see
+    get_grid_index) at points. Points outside the grid take the value at
+    the nearest grid edge.
+    """
+
+    xs = num.unique(x)
+    ys = num.unique(y)
+    points = ensure_numeric(points, num.float)
+
+    i = num.searchsorted(xs, points[:,0]).clip(1, len(xs)-1) - 1
+    j = num.searchsorted(ys, points[:,1]).clip(1, len(ys)-1) - 1
+
+    fx = ((points[:,0] - xs[i])/(xs[i+1] - xs[i])).clip(0.0, 1.0)
+    fy = ((points[:,1] - ys[j])/(ys[j+1] - ys[j])).clip(0.0, 1.0)
+
+    columns = num.array([grid_index[i,j], grid_index[i+1,j],
+                         grid_index[i,j+1], grid_index[i+1,j+1]])
+    weights = num.array([(1-fx)*(1-fy), fx*(1-fy), (1-fx)*fy, fx*fy])
+
+    return num.transpose(columns), num.transpose(weights)
+
+
+def get_bilinear_matrix(x, y, grid_index, points):
+    """Return the sparse matrix interpolating the gridded data with points
+    x, y bilinearly onto points.
+    """
+
+    from anuga.utilities.sparse import Sparse_CSR
+
+    columns, weights = get_bilinear_weights(x, y, grid_index, points)
+
+    M = len(points)
+    return Sparse_CSR(None, weights.flatten(), columns.flatten(),
+                      num.arange(0, 4*M+1, 4), M, len(x))
+
+
+def get_gradient_matrix(x, y, grid_index, vertices):
+    """Return the sparse matrix mapping the gridded data with points x, y
+    to the gradient on each triangle of its bilinear interpolation at the
+    triangle vertices (3*N x 2 array ordered as in
+    get_vertex_coordinates). Rows 0..N-1 give the x and rows N..2N-1
+    the y derivatives.
+    """
+
+    from anuga.utilities.sparse import Sparse_CSR
+
+    vertices = ensure_numeric(vertices, num.float)
+    N = len(vertices)/3
+
+    x0 = vertices[0::3,0]; y0 = vertices[0::3,1]
+    x1 = vertices[1::3,0]; y1 = vertices[1::3,1]
+    x2 = vertices[2::3,0]; y2 = vertices[2::3,1]
+
+    # Derivatives of the linear function through the vertex values
+    # (see numerical_tools.gradient) as weights of the vertex values
+    det = (y2-y0)*(x1-x0) - (y1-y0)*(x2-x0)
+    a = num.array([y1-y2, y2-y0, y0-y1])/det
+    b = num.array([x2-x1, x0-x2, x1-x0])/det
+
+    columns, weights = get_bilinear_weights(x, y, grid_index, vertices)
+    columns = columns.reshape(N, 12)
+    weights = weights.reshape(N, 3, 4)
+
+    data = num.zeros((2*N, 12), num.float)
+    data[:N] = (weights*num.transpose(a)[:,:,num.newaxis]).reshape(N, 12)
+    data[N:] = (weights*num.transpose(b)[:,:,num.newaxis]).reshape(N, 12)
+
+    colind = num.concatenate([columns, columns])
+
+    return Sparse_CSR(None, data.flatten(), colind.flatten(),
+                      num.arange(0, 24*N+1, 12), 2*N, len(x))
@@ -173,6 +173,7 @@ class Domain(Generic_Domain):
                  number_of_full_nodes=None,
                  number_of_full_triangles=None,
                  ghost_layer_width=2,
+                 reorder=None,
                  **kwargs):
 
         """
@@ -218,7 +219,10 @@ class Domain(Generic_Domain):
                             numproc,
                             number_of_full_nodes=number_of_full_nodes,
                             number_of_full_triangles=number_of_full_triangles,
-                            ghost_layer_width=ghost_layer_width)
+                            ghost_layer_width=ghost_layer_width,
+                            reorder=reorder,
+                            diagnostic_quantities=['height', 'xvelocity',
+                                                   'yvelocity'])
 
         #-------------------------------
         # Operator Data Structures
@@ -248,6 +252,8 @@ class Domain(Generic_Domain):
         #-------------------------------
         self.set_store(True)
         self.set_store_centroids(True)
+        self.set_store_background_writes(False)
+        self.set_sww_format('NETCDF3_64BIT')
         self.set_store_vertices_uniquely(False)
         self.quantities_to_be_stored = {'elevation': 1,
                                         'friction':1,
@@ -262,6 +268,8 @@ class Domain(Generic_Domain):
         self.checkpoint = False
         self.yieldstep_id = 1
         self.checkpoint_step = 10
+        self.checkpoint_format = 'pickle'
+        self.checkpoint_writer = None
 
         #-------------------------------
         # Useful auxiliary quantity
@@ -279,6 +287,9 @@ class Domain(Generic_Domain):
         #                   2 == ?
         #                   etc
         self.edge_flux_type=num.zeros(len(self.edge_coordinates[:,0])).astype(int)
+        # Index of the riverwall data for each unique edge (-1 if the edge
+        # is not a riverwall)
+        self.edge_river_wall_ids=num.zeros(self.number_of_unique_edges).astype(int)-1
 
         # Riverwalls -- initialise with dummy values
         # Presently only works with DE algorithms, will fail otherwise
@@ -303,6 +314,7 @@ class Domain(Generic_Domain):
         self.pressuregrad_work=num.zeros(len(self.edge_coordinates[:,0])) # Gravity related terms
         self.x_centroid_work=num.zeros(len(self.edge_coordinates[:,0])/3)
         self.y_centroid_work=num.zeros(len(self.edge_coordinates[:,0])/3)
+        self.edge_max_speed_work=num.zeros(self.number_of_unique_edges)
 
         ############################################################################
         ## Local-timestepping information
@@ -329,6 +341,42 @@ class Domain(Generic_Domain):
         # extrapolation/flux updating is used)
         self.allow_timestep_increase=num.zeros(1).astype(int)+1
 
+        # Timestep computed by the last flux computation (kept between calls
+        # when local extrapolation/flux updating is used)
+        self.flux_local_timestep=num.zeros(1)+1.0e+100
+
+        # Number of threads used by the multithreaded DE algorithms
+        from anuga.config import omp_num_threads
+        self.set_omp_num_threads(omp_num_threads)
+
+        # Compute the DE fluxes with a loop over the unique edges
+        from anuga.config import use_edge_flux_loop
+        self.set_use_edge_flux_loop(use_edge_flux_loop)
+
+        # Restrict the DE kernels to the wet cells and their neighbours
+        from anuga.config import use_active_cells
+        self.set_use_active_cells(use_active_cells)
+
+        # Run the rk2 timesteps of the DE algorithms in a single C call
+        from anuga.config import use_fused_rk2_step
+        self.set_use_fused_rk2_step(use_fused_rk2_step)
+
+        # Apply the built-in boundaries in a single C call
+        from anuga.config import use_c_boundaries
+        self.set_use_c_boundaries(use_c_boundaries)
+
+        # Floating point precision of the conserved quantities
+        from anuga.config import precision
+        self.precision = 'double'
+        if precision != 'double':
+            self.set_precision(precision)
+
+        # Multi-rate local timestepping for the DE algorithms
+        from anuga.config import multirate_levels
+        self.multirate_levels = 0
+        if multirate_levels > 0:
+            self.set_multirate_timestepping(multirate_levels)
+
     def _set_config_defaults(self):
         """Set the default values in this routine. That way we can inherit class
         and just redefine the defaults for the new class
@@ -1059,7 +1107,61 @@ class Domain(Generic_Domain):
 
         return self.store_centroids
 
-    def set_checkpointing(self, checkpoint= True, checkpoint_dir = 'CHECKPOINTS', checkpoint_step=10, checkpoint_time = None):
+    def set_store_background_writes(self, flag=True):
+        """Set whether the sww file is written by a background thread
+        during evolve, so the computation carries on while a timestep
+        is written. The sww file is then only complete once the evolve
+        has finished (or after domain.writer.flush()), so it should not
+        be read inside the evolve loop.
+        """
+
+        self.store_background_writes = flag
+
+    def get_store_background_writes(self):
+        """Get whether the sww file is written by a background thread.
+        """
+
+        return self.store_background_writes
+
+    def set_sww_format(self, format='NETCDF4', complevel=4, shuffle=True,
+                       quantisation=None):
+        """Set the format of the sww file.
+
+        format: 'NETCDF3_64BIT' (the default for domains) or 'NETCDF4',
+                HDF5 based files with compressed and chunked variables
+        complevel: zlib compression level of NETCDF4 files, 0 (none) to 9
+        shuffle: use the HDF5 shuffle filter before compression
+        quantisation: dictionary of the precision quantities are stored
+                      to, e.g. {'stage': 0.001} to store stage (and
+                      stage_c) to the nearest mm. Precisions are rounded
+                      down to a power of ten. Quantised values compress
+                      much better.
+
+        Read_sww, sww2dem, sww2csv_gauges, File_boundary and sww_merge
+        read either format.
+        """
+
+        if format not in ['NETCDF3_64BIT', 'NETCDF3_CLASSIC', 'NETCDF4', 'NETCDF4_CLASSIC']:
+            msg = 'Unknown sww format %s' % format
+            raise Exception(msg)
+
+        self.sww_format = format
+
+        if format.startswith('NETCDF4'):
+            self.sww_compression = {'complevel': complevel,
+                                    'shuffle': shuffle,
+                                    'quantisation': quantisation}
+        else:
+            self.sww_compression = None
+
+    def get_sww_format(self):
+        """Get the format of the sww file.
+        """
+
+        return self.sww_format
+
+    def set_checkpointing(self, checkpoint= True, checkpoint_dir = 'CHECKPOINTS', checkpoint_step=10, checkpoint_time = None,
+                          checkpoint_format = 'pickle', checkpoint_background = True):
         """
         Set up checkpointing.
 
@@ -1068,8 +1170,15 @@ class Domain(Generic_Domain):
         @param checkpoint_step: Save checkpoint files after this many yieldsteps
         @param checkpoint_time: If set, over-rides checkpoint_step. save checkpoint files
                         after this amount of walltime
+        @param checkpoint_format: 'pickle' pickles the whole domain at each checkpoint,
+                        'arrays' pickles the domain once and then only stores the
+                        evolving state (see anuga.shallow_water.checkpoint)
+        @param checkpoint_background: Write 'arrays' checkpoints in a background thread
         """
 
+        msg = "checkpoint_format must be 'pickle' or 'arrays'"
+        assert checkpoint_format in ['pickle', 'arrays'], msg
+
 
 
         if checkpoint:
@@ -1087,6 +1196,14 @@ class Domain(Generic_Domain):
             else:
                 self.checkpoint_step = checkpoint_step
             self.checkpoint = True
+            self.checkpoint_format = checkpoint_format
+
+            if checkpoint_format == 'arrays':
+                from anuga.shallow_water.checkpoint import Checkpoint_writer
+                self.checkpoint_writer = Checkpoint_writer(self, checkpoint_dir,
+                                                           background=checkpoint_background)
+            else:
+                self.checkpoint_writer = None
             #print self.checkpoint_dir, self.checkpoint_step
         else:
             self.checkpoint = False
@@ -1148,6 +1265,47 @@ class Domain(Generic_Domain):
                 raise Exception, 'Local extrapolation and flux updating only supported for discontinuous flow algorithms'
 
 
+    def set_multirate_timestepping(self, nlevels=3):
+        """
+            Use multi-rate local timestepping
+
+            Each triangle is advanced with its own timestep, a power of
+            two multiple (up to 2**nlevels) of the smallest timestep,
+            instead of the global CFL timestep. The flux across an edge is
+            computed at the rate of the finer of its triangles and summed
+            for the coarser one, so the scheme is conservative. Forcing
+            terms and operators are applied once per (large) timestep.
+
+            nlevels == 0 switches multi-rate timestepping off
+        """
+
+        nlevels = int(nlevels)
+        assert nlevels >= 0
+
+        if nlevels > 0:
+            if self.timestepping_method != 'euler':
+                raise Exception('Multi-rate timestepping only supported with euler timestepping')
+            if self.compute_fluxes_method != 'DE':
+                raise Exception('Multi-rate timestepping only supported for discontinuous flow algorithms')
+            if self.max_flux_update_frequency != 1:
+                raise Exception('Multi-rate timestepping cannot be combined with local extrapolation and flux updating')
+            if self.parallel:
+                raise Exception('Multi-rate timestepping not supported for parallel domains')
+
+        N = self.number_of_elements
+        self.multirate_levels = nlevels
+        self.multirate_cell_levels = num.zeros(N, num.int)
+        self.multirate_flux_sums = num.zeros((N, 3), num.float)
+
+
+    def get_multirate_levels(self):
+        """Get the number of multi-rate timestepping levels
+        (0 if not in use).
+        """
+
+        return self.multirate_levels
+
+
     def get_compute_fluxes_method(self):
         """Get method for computing fluxes.
 
@@ -1345,6 +1503,200 @@ class Domain(Generic_Domain):
 
 
 
+    def set_omp_num_threads(self, omp_num_threads=1):
+        """Set the number of OpenMP threads used by the DE algorithms.
+        Only has an effect if the extensions were compiled with OpenMP.
+        """
+
+        omp_num_threads = int(omp_num_threads)
+        assert omp_num_threads >= 1
+
+        self.omp_num_threads = omp_num_threads
+
+    def get_omp_num_threads(self):
+        """Get the number of OpenMP threads used by the DE algorithms
+        """
+
+        return self.omp_num_threads
+
+    def set_use_edge_flux_loop(self, flag=True):
+        """Compute the DE fluxes with a single loop over the table of
+        unique edges, rather than a loop over triangles and their edges
+        """
+
+        if flag is True:
+            self.use_edge_flux_loop = int(True)
+        elif flag is False:
+            self.use_edge_flux_loop = int(False)
+
+    def set_use_active_cells(self, flag=True):
+        """Restrict the DE flux, extrapolation, protection and update
+        kernels to the active cells: the wet cells and their neighbours,
+        the boundary and ghost cells and any cells changed by operators or
+        forcing terms. The active set is updated incrementally as the wet
+        area moves, so dry regions cost almost nothing per timestep.
+        All cells are visited if max_flux_update_frequency > 1.
+        """
+
+        if flag is True:
+            self.use_active_cells = int(True)
+        elif flag is False:
+            self.use_active_cells = int(False)
+
+        if self.use_active_cells:
+            N = self.number_of_elements
+            self.active_cells = num.zeros(N, num.int)
+            self.active_cell_flags = num.zeros(N, num.int)
+            ghost_cells = num.where(self.tri_full_flag == 0)[0]
+            self.always_active_cells = num.unique(
+                num.concatenate((self.boundary_cells, ghost_cells))).astype(num.int)
+        else:
+            self.active_cells = num.zeros(0, num.int)
+            self.active_cell_flags = num.zeros(0, num.int)
+            self.always_active_cells = num.zeros(0, num.int)
+
+        self.changed_cells = num.zeros(0, num.int)
+        self.number_of_active_cells = num.zeros(1, num.int) - 1
+
+    def set_use_fused_rk2_step(self, flag=True):
+        """Run each rk2 timestep of the DE algorithms in a single C call
+        rather than a sequence of python calls. The built-in boundaries
+        (see set_use_c_boundaries) and the implicit Manning friction are
+        applied in C, other boundaries and forcing terms are called back
+        in python.
+        """
+
+        if flag is True:
+            self.use_fused_rk2_step = int(True)
+        elif flag is False:
+            self.use_fused_rk2_step = int(False)
+
+        self.fused_step_data = None
+
+    def set_use_c_boundaries(self, flag=True):
+        """Apply the built-in shallow water boundaries of the DE algorithms
+        in a single C call per boundary update. Boundary edges are grouped
+        by type when the boundary objects change; user defined boundaries
+        (including subclasses of the built-in ones) are evaluated in python.
+        """
+
+        if flag is True:
+            self.use_c_boundaries = int(True)
+        elif flag is False:
+            self.use_c_boundaries = int(False)
+
+        self.boundary_engine_data = None
+
+    def set_precision(self, precision='double'):
+        """Set the floating point precision ('single' or 'double') of
+        the conserved quantities stage, xmomentum and ymomentum.
+
+        In single precision these are stored as float32 and evolved by a
+        single precision build of the DE algorithms, which halves their
+        memory traffic. Elevation, height and friction remain double
+        precision, as do the timestep and flux computations.
+
+        Must be called before boundaries and operators are set, as these
+        keep references to the arrays of the quantities.
+        """
+
+        if precision not in ['single', 'double']:
+            raise Exception('Precision must be either single or double')
+
+        if precision == 'single' and self.compute_fluxes_method != 'DE':
+            raise Exception('Single precision only supported for discontinuous flow algorithms')
+
+        from anuga.operators.boundary_flux_integral_operator import \
+             boundary_flux_integral_operator
+
+        operators = [op for op in self.fractional_step_operators
+                     if not isinstance(op, boundary_flux_integral_operator)]
+        if operators or self.boundary_map is not None:
+            raise Exception('Precision must be set before boundaries and operators')
+
+        if precision == 'single':
+            dtype = num.float32
+        else:
+            dtype = num.float64
+
+        for name in self.conserved_quantities:
+            self.quantities[name].set_precision(dtype)
+
+        # Update the aliases of the remaining operators
+        for op in self.fractional_step_operators:
+            op.stage_c = self.quantities['stage'].centroid_values
+            op.xmom_c = self.quantities['xmomentum'].centroid_values
+            op.ymom_c = self.quantities['ymomentum'].centroid_values
+
+        self.precision = precision
+        self.fused_step_data = None
+
+    def get_precision(self):
+        """Get the floating point precision of the conserved quantities
+        """
+
+        return self.precision
+
+    def _swDE1_ext(self):
+        """Return the build of the DE algorithms matching the precision
+        of the conserved quantities
+        """
+
+        if self.precision == 'single':
+            import swDE1_domain_single_ext
+            return swDE1_domain_single_ext
+
+        import swDE1_domain_ext
+        return swDE1_domain_ext
+
+    def reset_active_cells(self):
+        """Rebuild the active cell set from all cells on the next step,
+        e.g. after quantities have been changed outside of evolve
+        """
+
+        self.number_of_active_cells[0] = -1
+
+    def get_number_of_active_cells(self):
+        """Return the number of cells visited by the DE kernels
+        """
+
+        if self.use_active_cells and self.number_of_active_cells[0] >= 0:
+            return int(self.number_of_active_cells[0])
+
+        return self.number_of_elements
+
+    def update_active_cells(self):
+        """Update the active cell set from the cells visited on the
+        previous step and the cells changed since
+        """
+
+        update_active_cells = self._swDE1_ext().update_active_cells
+
+        # Fluxes of inactive cells could be reused with local timestepping
+        if self.max_flux_update_frequency != 1:
+            self.reset_active_cells()
+            return
+
+        update_active_cells(self, self.changed_cells)
+        self.changed_cells = num.zeros(0, num.int)
+
+    def _add_changed_cells(self, indices):
+        """Add cells changed outside of the DE kernels to the active set
+        """
+
+        if len(indices) > 0:
+            self.changed_cells = num.union1d(self.changed_cells,
+                                             indices).astype(num.int)
+
+    def set_timestepping_method(self, timestepping_method):
+        """Set the timestepping method and restart the count of
+        flux computations (used to find the substep within a timestep)
+        """
+
+        Generic_Domain.set_timestepping_method(self, timestepping_method)
+
+        self.flux_call_count=num.zeros(1).astype(int)
+
     def set_use_kinematic_viscosity(self, flag=True):
 
         from anuga.operators.kinematic_viscosity_operator import Kinematic_viscosity_operator
@@ -1915,8 +2267,7 @@ class Domain(Generic_Domain):
             # Flux calculation and gravity incorporated in same
             # procedure
 
-            from swDE1_domain_ext import compute_fluxes_ext_central \
-                                      as compute_fluxes_ext
+            compute_fluxes_ext = self._swDE1_ext().compute_fluxes_ext_central
 
             timestep = self.evolve_max_timestep
 
@@ -1996,8 +2347,11 @@ class Domain(Generic_Domain):
 
             # Do protection step
             self.protect_against_infinitesimal_and_negative_heights()
+            # Update the cells visited by the DE kernels
+            if self.use_active_cells:
+                self.update_active_cells()
             # Do extrapolation step
-            from swDE1_domain_ext import extrapolate_second_order_edge_sw as extrapol2
+            extrapol2 = self._swDE1_ext().extrapolate_second_order_edge_sw
             extrapol2(self)
 
         else:
@@ -2130,7 +2484,7 @@ class Domain(Generic_Domain):
 
         elif self.compute_fluxes_method == 'DE':
 
-            from swDE1_domain_ext import protect_new
+            protect_new = self._swDE1_ext().protect_new
 
 
             mass_error = protect_new(self)
@@ -2202,6 +2556,307 @@ class Domain(Generic_Domain):
                                    xmomc, ymomc, xmomv, ymomv)
 
 
+    def evolve_one_euler_step(self, yieldstep, finaltime):
+        """One Euler Time Step, or one multi-rate step if
+        multi-rate timestepping is in use.
+        """
+
+        if self.multirate_levels > 0:
+            self.evolve_one_multirate_step(yieldstep, finaltime)
+        else:
+            Generic_Domain.evolve_one_euler_step(self, yieldstep, finaltime)
+
+
+    def evolve_one_rk2_step(self, yieldstep, finaltime):
+        """One 2nd order RK timestep, in a single C call if the fused
+        rk2 step is in use (see set_use_fused_rk2_step).
+        """
+
+        if not (self.use_fused_rk2_step and self.compute_fluxes_method == 'DE'):
+            Generic_Domain.evolve_one_rk2_step(self, yieldstep, finaltime)
+            return
+
+        evolve_one_rk2_step = self._swDE1_ext().evolve_one_rk2_step
+
+        ids, edges, boundary_index, types, params, c_boundaries, \
+            python_tags = self._get_boundary_engine_data()
+
+        friction, python_forcing_terms = self._get_fused_step_data()
+
+        update_ghosts = self.parallel and self.ghost_layer_width < 4
+
+        t0 = time.time()
+        evolve_one_rk2_step(self, yieldstep, finaltime,
+                            ids, edges, boundary_index, types, params,
+                            python_tags,
+                            int(friction), int(python_forcing_terms),
+                            int(update_ghosts))
+        self._record_timing('fused_rk2_step', t0)
+
+
+    def _get_fused_step_data(self):
+        """Split the forcing terms into the implicit Manning friction,
+        applied in C by the fused rk2 step, and those called back in
+        python. The split is recomputed when the forcing terms change.
+        The boundaries are grouped by _get_boundary_engine_data.
+        """
+
+        key = list(self.forcing_terms)
+
+        if self.fused_step_data is not None and self.fused_step_data[0] == key:
+            return self.fused_step_data[1]
+
+        friction = manning_friction_implicit in self.forcing_terms
+        self.python_forcing_terms = [f for f in self.forcing_terms
+                                     if f is not manning_friction_implicit]
+
+        data = (friction, len(self.python_forcing_terms) > 0)
+
+        self.fused_step_data = (key, data)
+
+        return data
+
+
+    def update_boundary(self):
+        """Update the boundary values of all boundary objects, applying
+        the built-in boundaries in C if set_use_c_boundaries is in use.
+        """
+
+        if not (self.use_c_boundaries and self.compute_fluxes_method == 'DE'):
+            Generic_Domain.update_boundary(self)
+            return
+
+        ids, edges, boundary_index, types, params, c_boundaries, \
+            python_tags = self._get_boundary_engine_data()
+
+        self._update_boundary_tags(python_tags)
+
+        if len(ids) == 0:
+            return
+
+        self._set_c_boundary_parameters()
+
+        self._swDE1_ext().update_boundaries(self, ids, edges, boundary_index,
+                                            types, params)
+
+
+    def _get_boundary_engine_data(self):
+        """Group the boundary edges by the boundary object applied to them
+        for the C boundary update. Boundaries that are not built-in are
+        returned as python_tags. The grouping is recomputed when the
+        boundary objects change.
+        """
+
+        from anuga.shallow_water.boundaries import get_c_boundary_type, \
+             INFLOW_BOUNDARY
+
+        key = [(tag, id(B)) for tag, B in self.boundary_map.items()]
+
+        if self.boundary_engine_data is not None and \
+               self.boundary_engine_data[0] == key:
+            return self.boundary_engine_data[1]
+
+        ids = []
+        boundary_index = []
+        types = []
+        c_boundaries = []
+        python_tags = []
+        for tag, segment_edges in self.tag_boundary_cells.items():
+            B = self.boundary_map[tag]
+            if B is None:
+                continue
+
+            c_type = get_c_boundary_type(B, self)
+            if c_type is None:
+                python_tags.append(tag)
+                continue
+
+            if c_type == INFLOW_BOUNDARY and B.tag is None and \
+                   len(segment_edges) > 0:
+                # Inflow_boundary computes its momentum on first use
+                i = segment_edges[0]
+                B.evaluate(self.boundary_cells[i], self.boundary_edges[i])
+
+            if B in c_boundaries:
+                b = c_boundaries.index(B)
+            else:
+                b = len(c_boundaries)
+                c_boundaries.append(B)
+                types.append(c_type)
+
+            ids.extend(segment_edges)
+            boundary_index.extend([b]*len(segment_edges))
+
+        ids = num.array(ids, num.int)
+        edges = 3*self.boundary_cells[ids] + self.boundary_edges[ids]
+
+        data = (ids, num.array(edges, num.int),
+                num.array(boundary_index, num.int),
+                num.array(types, num.int),
+                num.zeros((len(c_boundaries), 3), num.float),
+                c_boundaries, python_tags)
+
+        self.boundary_engine_data = (key, data)
+
+        return data
+
+
+    def _set_c_boundary_parameters(self):
+        """Set the parameters of the boundaries applied in C for the
+        current time
+        """
+
+        from anuga.shallow_water.boundaries import get_c_boundary_parameters
+
+        params, c_boundaries = self._get_boundary_engine_data()[4:6]
+
+        for i, B in enumerate(c_boundaries):
+            params[i,:] = get_c_boundary_parameters(B, self)
+
+
+    def _update_boundary_tags(self, tags):
+        """Update the boundary values for the given tags only
+        """
+
+        for tag in tags:
+            B = self.boundary_map[tag]
+            B.evaluate_segment(self, self.tag_boundary_cells[tag])
+
+
+    def _compute_python_forcing_terms(self):
+        """Forcing terms not applied in C by the fused rk2 step
+        """
+
+        for f in self.python_forcing_terms:
+            f(self)
+
+
+    def evolve_one_multirate_step(self, yieldstep, finaltime):
+        """One multi-rate Euler step (see set_multirate_timestepping)
+
+        The step is made of 2**nlevels substeps of the smallest timestep
+        dt0. Triangle k is updated every 2**level[k] substeps, with the
+        level chosen from the CFL condition of the triangle and differing
+        by at most one between neighbours.
+        """
+
+        multirate_set_flux_updates = self._swDE1_ext().multirate_set_flux_updates
+        multirate_accumulate = self._swDE1_ext().multirate_accumulate
+
+        msg = 'Multi-rate timestepping only supported for discontinuous flow algorithms'
+        assert self.compute_fluxes_method == 'DE', msg
+
+        levels = self.multirate_cell_levels
+        flux_sums = self.multirate_flux_sums
+        initial_time = self.get_time()
+        boundary_flux_sum = self.boundary_flux_sum[0]
+
+        # First substep computes all the fluxes, which give the timestep
+        # of each triangle
+        self.update_next_flux[:] = 1
+        self.update_extrapolation[:] = 1
+        t0 = time.time()
+        self.distribute_to_vertices_and_edges()
+        t0 = self._record_timing('extrapolation', t0)
+        self.update_boundary()
+        t0 = self._record_timing('boundaries', t0)
+        self.compute_fluxes()
+        t0 = self._record_timing('fluxes', t0)
+
+        nlevels = self.multirate_levels
+        dt0 = self.CFL*self.flux_timestep
+        self.flux_timestep = self.flux_timestep*2**nlevels
+
+        # Update timestep to fit yieldstep and finaltime, using fewer
+        # levels if the step has to be shortened
+        self.update_timestep(yieldstep, finaltime)
+        timestep = self.timestep
+        while nlevels > 0 and timestep <= dt0*2**(nlevels-1):
+            nlevels -= 1
+        dt0 = timestep/2**nlevels
+
+        cell_timestep = self.CFL*num.min(self.edge_timestep.reshape(-1, 3), axis=1)
+        ratio = num.maximum(cell_timestep/dt0, 1.0)
+        levels[:] = num.floor(num.log2(ratio)).clip(0, nlevels)
+
+        # Neighbouring triangles differ by at most one level
+        neighbours = self.neighbours
+        for i in range(nlevels):
+            neighbour_levels = num.where(neighbours >= 0, levels[neighbours], nlevels)
+            levels[:] = num.minimum(levels, num.min(neighbour_levels, axis=1) + 1)
+        t0 = self._record_timing('timestep', t0)
+
+        boundary_flux = 0.0
+        for substep in range(2**nlevels):
+            if substep > 0:
+                self.set_time(initial_time + substep*dt0)
+                multirate_set_flux_updates(self, levels, substep)
+                self.distribute_to_vertices_and_edges()
+                t0 = self._record_timing('extrapolation', t0)
+                self.update_boundary()
+                t0 = self._record_timing('boundaries', t0)
+                self.compute_fluxes()
+                t0 = self._record_timing('fluxes', t0)
+
+            boundary_flux += multirate_accumulate(self, levels, flux_sums,
+                                                  substep, dt0)
+            t0 = self._record_timing('update', t0)
+
+        if self.use_active_cells:
+            # Cells dropped from the active set during the step
+            ids = num.flatnonzero(num.any(flux_sums != 0.0, axis=1))
+            if len(ids) > 0:
+                for i, name in enumerate(['stage', 'xmomentum', 'ymomentum']):
+                    Q = self.quantities[name]
+                    Q.centroid_values[ids] += flux_sums[ids, i]/self.areas[ids]
+                flux_sums[ids] = 0.0
+                self._add_changed_cells(ids)
+
+        self.set_time(initial_time)
+        self.update_next_flux[:] = 1
+        self.update_extrapolation[:] = 1
+
+        # The fluxes have been applied, only the forcing terms are left
+        self.boundary_flux_sum[0] = boundary_flux_sum + boundary_flux/timestep
+        for name in self.conserved_quantities:
+            self.quantities[name].explicit_update[:] = 0.0
+
+        self.compute_forcing_terms()
+        t0 = self._record_timing('forcing_terms', t0)
+        self.update_conserved_quantities()
+        self._record_timing('update', t0)
+
+
+    def apply_fractional_steps(self):
+        """Apply the fractional step operators. If the active cell set is
+        in use the cells reported by the operators (see
+        Operator.get_changed_indices) are added to it.
+        """
+
+        Generic_Domain.apply_fractional_steps(self)
+
+        if not self.use_active_cells:
+            return
+
+        indices = []
+        for operator in self.fractional_step_operators:
+            get_changed_indices = getattr(operator, 'get_changed_indices', None)
+            if get_changed_indices is None:
+                operator_indices = None
+            else:
+                operator_indices = get_changed_indices()
+
+            if operator_indices is None:
+                # The operator may change any triangle
+                self.reset_active_cells()
+                return
+
+            indices.append(num.asarray(operator_indices, num.int).ravel())
+
+        if indices:
+            self._add_changed_cells(num.concatenate(indices))
+
+
     def update_conserved_quantities(self):
         """Update vectors of conserved quantities using previously
         computed fluxes and specified forcing functions.
@@ -2223,9 +2878,44 @@ class Domain(Generic_Domain):
         Xmom = self.quantities['xmomentum']
         Ymom = self.quantities['ymomentum']
 
-        Stage.update(timestep)
-        Xmom.update(timestep)
-        Ymom.update(timestep)
+        if self.compute_fluxes_method == 'DE' and \
+               (self.use_active_cells or self.precision == 'single'):
+            other_forcing_terms = [f for f in self.forcing_terms
+                                   if f not in [manning_friction_implicit,
+                                                manning_friction_explicit]]
+            update_conserved_quantities = self._swDE1_ext().update_conserved_quantities
+
+            indices = []
+            if self.use_active_cells:
+                # Forcing terms may change inactive cells, those with
+                # exchange_indices (e.g. General_forcing) report them
+                for f in other_forcing_terms:
+                    f_indices = getattr(f, 'exchange_indices', None)
+                    if f_indices is None:
+                        indices = None
+                        break
+                    indices.append(num.asarray(f_indices, num.int).ravel())
+
+            if indices is None:
+                self.reset_active_cells()
+                Stage.update(timestep)
+                Xmom.update(timestep)
+                Ymom.update(timestep)
+            else:
+                update_conserved_quantities(self, timestep)
+
+                if indices:
+                    indices = num.unique(num.concatenate(indices))
+                    number_of_active_cells = self.number_of_active_cells[0]
+                    if number_of_active_cells >= 0:
+                        active_cells = self.active_cells[:number_of_active_cells]
+                        self._update_inactive_cells(num.setdiff1d(indices, active_cells),
+                                                    timestep)
+                    self._add_changed_cells(indices)
+        else:
+            Stage.update(timestep)
+            Xmom.update(timestep)
+            Ymom.update(timestep)
 
         if self.get_using_discontinuous_elevation():
 
@@ -2247,6 +2937,35 @@ class Domain(Generic_Domain):
 
 
 
+    def _update_inactive_cells(self, indices, timestep):
+        """Update the conserved quantities of inactive cells changed by
+        forcing terms (as Quantity.update does for all triangles). Their
+        explicit updates are reset, as the fluxes do for active cells.
+        """
+
+        if len(indices) == 0:
+            return
+
+        for name in self.conserved_quantities:
+            Q = self.quantities[name]
+
+            x = Q.centroid_values[indices]
+            semi_implicit_update = Q.semi_implicit_update[indices]
+            nonzero = x != 0.0
+            semi_implicit_update[nonzero] /= x[nonzero]
+            semi_implicit_update[~nonzero] = 0.0
+
+            x += timestep*Q.explicit_update[indices]
+
+            denominator = 1.0 - timestep*semi_implicit_update
+            if num.any(denominator <= 0.0):
+                raise Exception('division by zero in semi implicit update')
+
+            Q.centroid_values[indices] = x/denominator
+            Q.semi_implicit_update[indices] = 0.0
+            Q.explicit_update[indices] = 0.0
+
+
     def update_other_quantities(self):
         """ There may be a need to calculates some of the other quantities
         based on the new values of conserved quantities
@@ -2426,6 +3145,12 @@ class Domain(Generic_Domain):
         msg = 'Attribute self.beta_w must be in the interval [0, 2]'
         assert 0 <= self.beta_w <= 2.0, msg
 
+        if self.precision == 'single' and self.compute_fluxes_method != 'DE':
+            raise Exception('Single precision only supported for discontinuous flow algorithms')
+
+        # Quantities may have been changed since the last call
+        self.reset_active_cells()
+
         # Initial update of vertex and edge values before any STORAGE
         # and or visualisation.
         # This is done again in the initialisation of the Generic_Domain
@@ -2433,9 +3158,45 @@ class Domain(Generic_Domain):
         self.distribute_to_vertices_and_edges()
 
         if self.store is True and self.get_time() == 0.0:
+            t0 = time.time()
             self.initialise_storage()
+            self._record_timing('storage', t0)
 
 
+        # Keep the sww file open for the evolve, it is closed when
+        # the evolve completes or fails
+        if self.store is True:
+            self.writer.open(background=self.store_background_writes)
+
+        try:
+            for t in self._evolve(yieldstep=yieldstep,
+                                  finaltime=finaltime, duration=duration,
+                                  skip_initial_step=skip_initial_step):
+                yield(t)
+        finally:
+            if self.store is True:
+                self.writer.close()
+            # Domains pickled by older versions have no checkpoint_writer
+            if getattr(self, 'checkpoint_writer', None) is not None:
+                self.checkpoint_writer.close()
+
+
+    def _stop_evolve_timing(self, evolve_start):
+        """Add the wall clock time since evolve_start to the evolve time.
+        The timing file is written by _evolve after the storage.
+        """
+
+        self.evolve_walltime += time.time() - evolve_start
+
+
+    def _evolve(self,
+                yieldstep=None,
+                finaltime=None,
+                duration=None,
+                skip_initial_step=False):
+        """Evolve loop with storage and checkpointing
+        """
+
         # Call basic machinery from parent class
         for t in self._evolve_base(yieldstep=yieldstep,
                                    finaltime=finaltime, duration=duration,
@@ -2447,9 +3208,12 @@ class Domain(Generic_Domain):
             #print t , self.get_time()
             # Store model data, e.g. for subsequent visualisation
             if self.store is True:
+                t0 = time.time()
                 self.store_timestep()
+                self._record_timing('storage', t0)
 
             if self.checkpoint:
+                t0 = time.time()
 
 
                 save_checkpoint=False
@@ -2468,17 +3232,33 @@ class Domain(Generic_Domain):
                         save_checkpoint = True
 
                 if save_checkpoint:
-                    pickle_name = os.path.join(self.checkpoint_dir,self.get_name())+'_'+str(self.get_time())+'.pickle'
-                    cPickle.dump(self, open(pickle_name, 'wb'))
+                    # The checkpoint should not be ahead of the sww file
+                    if self.store is True:
+                        self.writer.flush()
+
+                    if getattr(self, 'checkpoint_writer', None) is not None:
+                        self.checkpoint_writer.store_checkpoint()
+                    else:
+                        pickle_name = os.path.join(self.checkpoint_dir,self.get_name())+'_'+str(self.get_time())+'.pickle'
+                        cPickle.dump(self, open(pickle_name, 'wb'))
 
                     barrier()
                     self.walltime_prev = time.time()
 
                     #print 'Stored Checkpoint File '+pickle_name
 
+                self._record_timing('checkpoint', t0)
+
+            # Written once storage and checkpointing have been timed
+            if self.timing_file is not None:
+                self._write_timing_statistics()
+
             # Pass control on to outer loop for more specific actions
             yield(t)
 
+            # Quantities may have been changed by the outer loop
+            self.reset_active_cells()
+
 
     def initialise_storage(self):
         """Create and initialise self.writer object for storing data.
@@ -2769,8 +3549,7 @@ class Domain(Generic_Domain):
             Update the 'flux_update_frequency' and 'update_extrapolate' variables
             Used to control updating of fluxes / extrapolation for 'local-time-stepping'
         """
-        from swDE1_domain_ext import compute_flux_update_frequency \
-                                  as compute_flux_update_frequency_ext
+        compute_flux_update_frequency_ext = self._swDE1_ext().compute_flux_update_frequency
 
         compute_flux_update_frequency_ext(self, self.timestep)
 
@@ -3122,6 +3901,10 @@ def manning_friction_implicit(domain):
     Wrapper for c version
     """
 
+    if domain.get_precision() == 'single':
+        domain._swDE1_ext().manning_friction(domain, 1)
+        return
+
     from shallow_water_ext import manning_friction_flat
     from shallow_water_ext import manning_friction_sloped
 
@@ -3156,6 +3939,10 @@ def manning_friction_explicit(domain):
     Wrapper for c version
     """
 
+    if domain.get_precision() == 'single':
+        domain._swDE1_ext().manning_friction(domain, 0)
+        return
+
     from shallow_water_ext import manning_friction_flat
     from shallow_water_ext import manning_friction_sloped
 
@@ -21,6 +21,10 @@
 #include <stdio.h>
 //#include "numpy_shim.h"
 
+#ifdef _OPENMP
+#include "omp.h"
+#endif
+
 // Shared code snippets
 #include "util_ext.h"
 #include "sw_domain.h"
@@ -138,8 +142,8 @@ water model for two-dimensional dam-break type. Journal of Computational Physics
   double u_m, h_m, soundspeed_m, s_m;
   double denom, inverse_denominator;
   double uint, t1, t2, t3, min_speed, tmp, local_fr2;
-  // Workspace (allocate once, use many)
-  static double q_left_rotated[3], q_right_rotated[3], flux_right[3], flux_left[3];
+  // Workspace (local, so the function can be called from several threads)
+  double q_left_rotated[3], q_right_rotated[3], flux_right[3], flux_left[3];
 
 
   // Copy conserved quantities to protect from modification
@@ -317,8 +321,8 @@ int _flux_function_central(double *q_left, double *q_right,
   double s_min, s_max, soundspeed_left, soundspeed_right;
   double denom, inverse_denominator;
   double uint, t1, t2, t3, min_speed, tmp, local_fr, v_right, v_left;
-  // Workspace (allocate once, use many)
-  static double q_left_rotated[3], q_right_rotated[3], flux_right[3], flux_left[3];
+  // Workspace (local, so the function can be called from several threads)
+  double q_left_rotated[3], q_right_rotated[3], flux_right[3], flux_left[3];
 
   if(h_left==0. && h_right==0.){
     // Quick exit
@@ -740,251 +744,292 @@ double adjust_edgeflux_with_weir(double *edgeflux,
     return 0;
 }
 
-// Computational function for flux computation
-double _compute_fluxes_central(struct domain *D, double timestep){
+// Compute the flux across edge i of triangle k, and store it (with reversed
+// sign) for edge m of the neighbour n if n >= 0. If n < 0 the edge is on the
+// boundary with index -n-1. The advective fluxes and gravity terms are
+// stored in edge_flux_work and pressuregrad_work.
+//
+// Returns the maximum wave speed across the edge
+double _compute_edge_flux(struct domain *D, long k, long i, long n, long m,
+                          double n1, double n2, double length,
+                          long riverwall_index, long call){
 
     // Local variables
-    double max_speed_local, length, inv_area, zl, zr;
+    double max_speed_local, zl, zr;
     double h_left, h_right, z_half ;  // For andusse scheme
     // FIXME: limiting_threshold is not used for DE1
     double limiting_threshold = 10*D->H0;
-    long low_froude = D->low_froude;
-    //
-    int k, i, m, n,j, ii;
-    int ki,k3, nm = 0, ki2,ki3, nm3; // Index shorthands
-    // Workspace (making them static actually made function slightly slower (Ole))
+    long ii;
+    long ki, nm = 0, ki3, nm3 = 0; // Index shorthands
     double ql[3], qr[3], edgeflux[3]; // Work array for summing up fluxes
-    double stage_edges[3];//Work array
     double bedslope_work;
-    static double local_timestep;
-    int neighbours_wet[3];//Work array
-    long RiverWall_count, substep_count;
     double hle, hre, zc, zc_n, Qfactor, s1, s2, h1, h2;
-    double stage_edge_lim, outgoing_mass_edges, pressure_flux, hc, hc_n, tmp, tmp2;
+    double pressure_flux, hc, hc_n;
     double h_left_tmp, h_right_tmp;
-    static long call = 0; // Static local variable flagging already computed flux
-    static long timestep_fluxcalls=1;
-    static long base_call = 1;
-    double speed_max_last, vol, weir_height;
+    double weir_height;
 
-    call++; // Flag 'id' of flux calculation for this timestep
+    ki = k * 3 + i; // Linear index to edge i of triangle k
+    ki3 = 3*ki;
+    if (n >= 0) {
+        nm = n * 3 + m; // Linear index (triangle n, edge m)
+        nm3 = nm*3;
+    }
 
-    if (D->timestep_fluxcalls != timestep_fluxcalls) {
-    	timestep_fluxcalls = D->timestep_fluxcalls;
-    	base_call = call;
+    // Get left hand side values from triangle k, edge i
+    ql[0] = D->stage_edge_values[ki];
+    ql[1] = D->xmom_edge_values[ki];
+    ql[2] = D->ymom_edge_values[ki];
+    zl = D->bed_edge_values[ki];
+    hc = D->height_centroid_values[k];
+    zc = D->bed_centroid_values[k];
+    hle= D->height_edge_values[ki];
+
+    // Get right hand side values either from neighbouring triangle
+    // or from boundary array (Quantities at neighbour on nearest face).
+    hc_n = hc;
+    zc_n = D->bed_centroid_values[k];
+    if (n < 0) {
+        // Neighbour is a boundary condition
+        m = -n - 1; // Convert negative flag to boundary index
+
+        qr[0] = D->stage_boundary_values[m];
+        qr[1] = D->xmom_boundary_values[m];
+        qr[2] = D->ymom_boundary_values[m];
+        zr = zl; // Extend bed elevation to boundary
+        hre= max(qr[0]-zr,0.);//hle;
+    } else {
+        // Neighbour is a real triangle
+        hc_n = D->height_centroid_values[n];
+        zc_n = D->bed_centroid_values[n];
+
+        qr[0] = D->stage_edge_values[nm];
+        qr[1] = D->xmom_edge_values[nm];
+        qr[2] = D->ymom_edge_values[nm];
+        zr = D->bed_edge_values[nm];
+        hre = D->height_edge_values[nm];
     }
 
-    // Set explicit_update to zero for all conserved_quantities.
-    // This assumes compute_fluxes called before forcing terms
-    memset((char*) D->stage_explicit_update, 0, D->number_of_elements * sizeof (double));
-    memset((char*) D->xmom_explicit_update, 0, D->number_of_elements * sizeof (double));
-    memset((char*) D->ymom_explicit_update, 0, D->number_of_elements * sizeof (double));
+    // Audusse magic
+    z_half = max(zl, zr);
 
+    //// Account for riverwalls
+    if(D->edge_flux_type[ki] == 1){
+        if( n>=0 && D->edge_flux_type[nm] != 1){
+            printf("Riverwall Error\n");
+        }
+        // Set central bed to riverwall elevation
+        z_half = max(D->riverwall_elevation[riverwall_index], z_half) ;
 
-    // Counter for riverwall edges
-    RiverWall_count=0;
-    // Which substep of the timestepping method are we on?
-    substep_count=(call-base_call)%D->timestep_fluxcalls;
+    }
 
-    //printf("call = %d substep_count = %d base_call = %d \n",call,substep_count, base_call);
+    // Define h left/right for Audusse flux method
+    h_left = max(hle+zl-z_half,0.);
+    h_right = max(hre+zr-z_half,0.);
+
+    // Edge flux computation (triangle k, edge i)
+    _flux_function_central(ql, qr,
+    //_flux_function_toro(ql, qr,
+        h_left, h_right,
+        hle, hre,
+        n1, n2,
+        D->epsilon, z_half, limiting_threshold, D->g,
+        edgeflux, &max_speed_local, &pressure_flux, hc, hc_n, D->low_froude);
+
+    // Force weir discharge to match weir theory
+    // FIXME: Switched off at the moment
+    if(D->edge_flux_type[ki]==1){
+        weir_height = max(D->riverwall_elevation[riverwall_index] - min(zl, zr), 0.); // Reference weir height
+
+        // If the weir is not higher than both neighbouring cells, then
+        // do not try to match the weir equation. If we do, it seems we
+        // can get mass conservation issues (caused by large weir
+        // fluxes in such situations)
+        if(D->riverwall_elevation[riverwall_index] > max(zc, zc_n)){
+            ////////////////////////////////////////////////////////////////////////////////////
+            // Use first-order h's for weir -- as the 'upstream/downstream' heads are
+            //  measured away from the weir itself
+            h_left_tmp = max(D->stage_centroid_values[k] - z_half, 0.);
+            if(n >= 0){
+                h_right_tmp = max(D->stage_centroid_values[n] - z_half, 0.);
+            }else{
+                h_right_tmp = max(hc_n + zr - z_half, 0.);
+            }
 
-    // Fluxes are not updated every timestep,
-    // but all fluxes ARE updated when the following condition holds
-    if(D->allow_timestep_increase[0]==1){
-        // We can only increase the timestep if all fluxes are allowed to be updated
-        // If this is not done the timestep can't increase (since local_timestep is static)
-        local_timestep=1.0e+100;
-    }
+            if( (h_left_tmp > 0.) || (h_right_tmp > 0.)){
 
-    // For all triangles
-    for (k = 0; k < D->number_of_elements; k++) {
-        speed_max_last = 0.0;
+                //////////////////////////////////////////////////////////////////////////////////
+                // Get Qfactor index - multiply the idealised weir discharge by this constant factor
+                ii = D->riverwall_rowIndex[riverwall_index] * D->ncol_riverwall_hydraulic_properties;
+                Qfactor = D->riverwall_hydraulic_properties[ii];
 
-        // Loop through neighbours and compute edge flux for each
-        for (i = 0; i < 3; i++) {
-            ki = k * 3 + i; // Linear index to edge i of triangle k
-            ki2 = 2 * ki; //k*6 + i*2
-            ki3 = 3*ki;
-
-            if ((D->already_computed_flux[ki] == call) || (D->update_next_flux[ki]!=1)) {
-                // We've already computed the flux across this edge
-                // Check if it is a riverwall
-                if(D->edge_flux_type[ki] == 1){
-                    // Update counter of riverwall edges == index of
-                    // riverwall_elevation + riverwall_rowIndex
-                    RiverWall_count += 1;
-                }
-                continue;
-            }
+                // Get s1, submergence ratio at which we start blending with the shallow water solution
+                ii+=1;
+                s1 = D->riverwall_hydraulic_properties[ii];
 
-            // Get left hand side values from triangle k, edge i
-            ql[0] = D->stage_edge_values[ki];
-            ql[1] = D->xmom_edge_values[ki];
-            ql[2] = D->ymom_edge_values[ki];
-            zl = D->bed_edge_values[ki];
-            hc = D->height_centroid_values[k];
-            zc = D->bed_centroid_values[k];
-            hle= D->height_edge_values[ki];
-
-            // Get right hand side values either from neighbouring triangle
-            // or from boundary array (Quantities at neighbour on nearest face).
-            n = D->neighbours[ki];
-            hc_n = hc;
-            zc_n = D->bed_centroid_values[k];
-            if (n < 0) {
-                // Neighbour is a boundary condition
-                m = -n - 1; // Convert negative flag to boundary index
-
-                qr[0] = D->stage_boundary_values[m];
-                qr[1] = D->xmom_boundary_values[m];
-                qr[2] = D->ymom_boundary_values[m];
-                zr = zl; // Extend bed elevation to boundary
-                hre= max(qr[0]-zr,0.);//hle;
-            } else {
-                // Neighbour is a real triangle
-                hc_n = D->height_centroid_values[n];
-                zc_n = D->bed_centroid_values[n];
-                m = D->neighbour_edges[ki];
-                nm = n * 3 + m; // Linear index (triangle n, edge m)
-                nm3 = nm*3;
+                // Get s2, submergence ratio at which we entirely use the shallow water solution
+                ii+=1;
+                s2 = D->riverwall_hydraulic_properties[ii];
 
-                qr[0] = D->stage_edge_values[nm];
-                qr[1] = D->xmom_edge_values[nm];
-                qr[2] = D->ymom_edge_values[nm];
-                zr = D->bed_edge_values[nm];
-                hre = D->height_edge_values[nm];
+                // Get h1, tailwater head / weir height at which we start blending with the shallow water solution
+                ii+=1;
+                h1 = D->riverwall_hydraulic_properties[ii];
+
+                // Get h2, tailwater head / weir height at which we entirely use the shallow water solution
+                ii+=1;
+                h2 = D->riverwall_hydraulic_properties[ii];
+
+                // Weir flux adjustment
+                // FIXME
+                adjust_edgeflux_with_weir(edgeflux, h_left_tmp, h_right_tmp, D->g,
+                                          weir_height, Qfactor,
+                                          s1, s2, h1, h2, &max_speed_local);
             }
+        }
+    }
 
-            // Audusse magic
-            z_half = max(zl, zr);
+    // Multiply edgeflux by edgelength
+    edgeflux[0] *= length;
+    edgeflux[1] *= length;
+    edgeflux[2] *= length;
+
+    //// Don't allow an outward advective flux if the cell centroid
+    ////   stage is < the edge value. Is this important (??). Seems not
+    ////   to be with DE algorithms
+    //if((hc<H0) && edgeflux[0] > 0.){
+    //    edgeflux[0] = 0.;
+    //    edgeflux[1] = 0.;
+    //    edgeflux[2] = 0.;
+    //    //max_speed_local=0.;
+    //    //pressure_flux=0.;
+    //}
+    ////
+    //if((hc_n<H0) && edgeflux[0] < 0.){
+    //    edgeflux[0] = 0.;
+    //    edgeflux[1] = 0.;
+    //    edgeflux[2] = 0.;
+    //    //max_speed_local=0.;
+    //    //pressure_flux=0.;
+    //}
 
-            //// Account for riverwalls
-            if(D->edge_flux_type[ki] == 1){
-                if( n>=0 && D->edge_flux_type[nm] != 1){
-                    printf("Riverwall Error\n");
-                }
-                // Update counter of riverwall edges == index of
-                // riverwall_elevation + riverwall_rowIndex
-                RiverWall_count += 1;
+    D->edge_flux_work[ki3 + 0 ] = -edgeflux[0];
+    D->edge_flux_work[ki3 + 1 ] = -edgeflux[1];
+    D->edge_flux_work[ki3 + 2 ] = -edgeflux[2];
 
-                // Set central bed to riverwall elevation
-                z_half = max(D->riverwall_elevation[RiverWall_count-1], z_half) ;
+    // bedslope_work contains all gravity related terms
+    bedslope_work = length*(- D->g *0.5*(h_left*h_left - hle*hle -(hle+hc)*(zl-zc))+pressure_flux);
 
-            }
+    D->pressuregrad_work[ki] = bedslope_work;
 
-            // Define h left/right for Audusse flux method
-            h_left = max(hle+zl-z_half,0.);
-            h_right = max(hre+zr-z_half,0.);
-
-            // Edge flux computation (triangle k, edge i)
-            _flux_function_central(ql, qr,
-            //_flux_function_toro(ql, qr,
-                h_left, h_right,
-                hle, hre,
-                D->normals[ki2],D->normals[ki2 + 1],
-                D->epsilon, z_half, limiting_threshold, D->g,
-                edgeflux, &max_speed_local, &pressure_flux, hc, hc_n, low_froude);
-
-            // Force weir discharge to match weir theory
-            // FIXME: Switched off at the moment
-            if(D->edge_flux_type[ki]==1){
-                weir_height = max(D->riverwall_elevation[RiverWall_count-1] - min(zl, zr), 0.); // Reference weir height
-
-                // If the weir is not higher than both neighbouring cells, then
-                // do not try to match the weir equation. If we do, it seems we
-                // can get mass conservation issues (caused by large weir
-                // fluxes in such situations)
-                if(D->riverwall_elevation[RiverWall_count-1] > max(zc, zc_n)){
-                    ////////////////////////////////////////////////////////////////////////////////////
-                    // Use first-order h's for weir -- as the 'upstream/downstream' heads are
-                    //  measured away from the weir itself
-                    h_left_tmp = max(D->stage_centroid_values[k] - z_half, 0.);
-                    if(n >= 0){
-                        h_right_tmp = max(D->stage_centroid_values[n] - z_half, 0.);
-                    }else{
-                        h_right_tmp = max(hc_n + zr - z_half, 0.);
-                    }
+    D->already_computed_flux[ki] = call; // #k Done
 
-                    if( (h_left_tmp > 0.) || (h_right_tmp > 0.)){
+    // Update neighbour n with same flux but reversed sign
+    if (n >= 0) {
 
-                        //////////////////////////////////////////////////////////////////////////////////
-                        // Get Qfactor index - multiply the idealised weir discharge by this constant factor
-                        ii = D->riverwall_rowIndex[RiverWall_count-1] * D->ncol_riverwall_hydraulic_properties;
-                        Qfactor = D->riverwall_hydraulic_properties[ii];
+        D->edge_flux_work[nm3 + 0 ] = edgeflux[0];
+        D->edge_flux_work[nm3 + 1 ] = edgeflux[1];
+        D->edge_flux_work[nm3 + 2 ] = edgeflux[2];
+        bedslope_work = length*(-D->g * 0.5 *( h_right*h_right - hre*hre- (hre+hc_n)*(zr-zc_n)) + pressure_flux);
+        D->pressuregrad_work[nm] = bedslope_work;
 
-                        // Get s1, submergence ratio at which we start blending with the shallow water solution
-                        ii+=1;
-                        s1 = D->riverwall_hydraulic_properties[ii];
+        D->already_computed_flux[nm] = call; // #n Done
+    }
 
-                        // Get s2, submergence ratio at which we entirely use the shallow water solution
-                        ii+=1;
-                        s2 = D->riverwall_hydraulic_properties[ii];
+    return max_speed_local;
+}
 
-                        // Get h1, tailwater head / weir height at which we start blending with the shallow water solution
-                        ii+=1;
-                        h1 = D->riverwall_hydraulic_properties[ii];
+// Cells visited by the DE kernels. If the active cell set is in use (see
+// _update_active_cells) return its size and point *cells at the list of
+// active triangles, otherwise return the number of elements and set *cells
+// to NULL, in which case cell j is triangle j.
+long _get_cells_to_visit(struct domain *D, long **cells){
 
-                        // Get h2, tailwater head / weir height at which we entirely use the shallow water solution
-                        ii+=1;
-                        h2 = D->riverwall_hydraulic_properties[ii];
+    if (D->use_active_cells && D->number_of_active_cells[0] >= 0) {
+        *cells = D->active_cells;
+        return D->number_of_active_cells[0];
+    }
 
-                        // Weir flux adjustment
-                        // FIXME
-                        adjust_edgeflux_with_weir(edgeflux, h_left_tmp, h_right_tmp, D->g,
-                                                  weir_height, Qfactor,
-                                                  s1, s2, h1, h2, &max_speed_local);
-                    }
-                }
-            }
+    *cells = NULL;
+    return D->number_of_elements;
+}
 
-            // Multiply edgeflux by edgelength
-            length = D->edgelengths[ki];
-            edgeflux[0] *= length;
-            edgeflux[1] *= length;
-            edgeflux[2] *= length;
-
-            //// Don't allow an outward advective flux if the cell centroid
-            ////   stage is < the edge value. Is this important (??). Seems not
-            ////   to be with DE algorithms
-            //if((hc<H0) && edgeflux[0] > 0.){
-            //    edgeflux[0] = 0.;
-            //    edgeflux[1] = 0.;
-            //    edgeflux[2] = 0.;
-            //    //max_speed_local=0.;
-            //    //pressure_flux=0.;
-            //}
-            ////
-            //if((hc_n<H0) && edgeflux[0] < 0.){
-            //    edgeflux[0] = 0.;
-            //    edgeflux[1] = 0.;
-            //    edgeflux[2] = 0.;
-            //    //max_speed_local=0.;
-            //    //pressure_flux=0.;
-            //}
-
-            D->edge_flux_work[ki3 + 0 ] = -edgeflux[0];
-            D->edge_flux_work[ki3 + 1 ] = -edgeflux[1];
-            D->edge_flux_work[ki3 + 2 ] = -edgeflux[2];
-
-            // bedslope_work contains all gravity related terms
-            bedslope_work = length*(- D->g *0.5*(h_left*h_left - hle*hle -(hle+hc)*(zl-zc))+pressure_flux);
-
-            D->pressuregrad_work[ki] = bedslope_work;
-
-            D->already_computed_flux[ki] = call; // #k Done
-
-            // Update neighbour n with same flux but reversed sign
-            if (n >= 0) {
+// Computational function for flux computation
+//
+// The loops are shared between D->omp_num_threads OpenMP threads. Each edge
+// flux is computed once, either by the triangle which 'owns' the edge (the
+// lower numbered of the two triangles sharing it, or the only triangle for a
+// boundary edge), or, if D->use_edge_flux_loop, by looping over the table of
+// unique edges (edge_left_cells, ...). The flux is stored for both triangles
+// in edge_flux_work/pressuregrad_work. The explicit updates are then summed
+// per triangle, so no two threads write to the same location.
+//
+// If the active cell set is in use only the active triangles are visited
+// (with the loop over triangles), and an edge shared with an inactive
+// triangle is computed by the active one.
+double _compute_fluxes_central(struct domain *D, double timestep){
+
+    // Local variables
+    double max_speed_local, inv_area;
+    //
+    long k, i, m, n, e, j;
+    long number_of_cells, edge_loop;
+    long* cells;
+    long ki, nm = 0, ki2, ki3; // Index shorthands
+    double local_timestep;
+    long substep_count, call;
+    double tmp;
+    double speed_max_last;
+    double boundary_flux_sum_substep = 0.0;
+
+    // Flag 'id' of flux calculation for this timestep. The count is
+    // stored on the domain (rather than in static variables) so that
+    // several domains can be evolved in the one process.
+    // Which substep of the timestepping method are we on?
+    substep_count = D->flux_call_count[0] % D->timestep_fluxcalls;
+    D->flux_call_count[0] += 1;
+    call = D->flux_call_count[0];
+
+    //printf("call = %d substep_count = %d \n",call,substep_count);
+
+    // Fluxes are not updated every timestep,
+    // but all fluxes ARE updated when the following condition holds
+    if(D->allow_timestep_increase[0]==1){
+        // We can only increase the timestep if all fluxes are allowed to be updated
+        // If this is not done the timestep can't increase (since
+        // flux_local_timestep persists between calls)
+        D->flux_local_timestep[0]=1.0e+100;
+    }
+    local_timestep = D->flux_local_timestep[0];
+
+    number_of_cells = _get_cells_to_visit(D, &cells);
+    edge_loop = D->use_edge_flux_loop && (cells == NULL);
+
+    if (edge_loop) {
 
-                D->edge_flux_work[nm3 + 0 ] = edgeflux[0];
-                D->edge_flux_work[nm3 + 1 ] = edgeflux[1];
-                D->edge_flux_work[nm3 + 2 ] = edgeflux[2];
-                bedslope_work = length*(-D->g * 0.5 *( h_right*h_right - hre*hre- (hre+hc_n)*(zr-zc_n)) + pressure_flux);
-                D->pressuregrad_work[nm] = bedslope_work;
+        // For all unique edges
+        #pragma omp parallel for num_threads(D->omp_num_threads) schedule(static) \
+            private(e, k, i, m, n, ki, nm, max_speed_local, tmp) \
+            reduction(min:local_timestep)
+        for (e = 0; e < D->number_of_unique_edges; e++) {
+            k = D->edge_left_cells[e];
+            i = D->edge_left_edges[e];
+            n = D->edge_right_cells[e];
+            m = D->edge_right_edges[e];
+
+            ki = k * 3 + i; // Linear index to edge i of triangle k
+            if (n >= 0) {
+                nm = n * 3 + m; // Linear index (triangle n, edge m)
+            }
 
-                D->already_computed_flux[nm] = call; // #n Done
+            // Only compute the flux if either side wants it updated
+            if ((D->update_next_flux[ki]!=1) && ((n < 0) || (D->update_next_flux[nm]!=1))) {
+                if(substep_count==0) D->edge_max_speed_work[e] = 0.0;
+                continue;
             }
 
+            max_speed_local = _compute_edge_flux(D, k, i, n, m,
+                D->edge_normals[2*e], D->edge_normals[2*e + 1],
+                D->edge_lengths[e], D->edge_river_wall_ids[e], call);
+
             // Update timestep based on edge i and possibly neighbour n
             // NOTE: We should only change the timestep on the 'first substep'
             //  of the timestepping method [substep_count==0]
@@ -998,9 +1043,10 @@ double _compute_fluxes_central(struct domain *D, double timestep){
                 }
 
                 // Update the timestep
+                D->edge_max_speed_work[e] = 0.0;
                 if ((D->tri_full_flag[k] == 1)) {
 
-                    speed_max_last = max(speed_max_last, max_speed_local);
+                    D->edge_max_speed_work[e] = max_speed_local;
 
                     if (max_speed_local > D->epsilon) {
                         // Apply CFL condition for triangles joining this edge (triangle k and triangle n)
@@ -1016,12 +1062,83 @@ double _compute_fluxes_central(struct domain *D, double timestep){
                 }
             }
 
-        } // End edge i (and neighbour n)
-        // Keep track of maximal speeds
-        if(substep_count==0) D->max_speed[k] = speed_max_last; //max_speed;
+        } // End edge e
+
+    } else {
+
+        // For all (active) triangles
+        #pragma omp parallel for num_threads(D->omp_num_threads) schedule(static) \
+            private(j, k, i, m, n, ki, nm, ki2, max_speed_local, tmp, speed_max_last) \
+            reduction(min:local_timestep)
+        for (j = 0; j < number_of_cells; j++) {
+            k = (cells == NULL) ? j : cells[j];
+            speed_max_last = 0.0;
+
+            // Loop through neighbours and compute edge flux for each
+            for (i = 0; i < 3; i++) {
+                ki = k * 3 + i; // Linear index to edge i of triangle k
+                ki2 = 2 * ki; //k*6 + i*2
+
+                n = D->neighbours[ki];
+                m = -1;
+                if (n >= 0) {
+                    m = D->neighbour_edges[ki];
+                    nm = n * 3 + m; // Linear index (triangle n, edge m)
+                }
+
+                // The edge is computed by the lower numbered (visited) triangle,
+                // if either side wants its flux updated
+                if (n >= 0) {
+                    if (((n < k) && ((cells == NULL) || D->active_cell_flags[n])) ||
+                        ((D->update_next_flux[ki]!=1) && (D->update_next_flux[nm]!=1))) continue;
+                } else {
+                    if (D->update_next_flux[ki]!=1) continue;
+                }
+
+                max_speed_local = _compute_edge_flux(D, k, i, n, m,
+                    D->normals[ki2], D->normals[ki2 + 1],
+                    D->edgelengths[ki], D->edge_river_wall_ids[D->edge_index[ki]], call);
+
+                // Update timestep based on edge i and possibly neighbour n
+                // NOTE: We should only change the timestep on the 'first substep'
+                //  of the timestepping method [substep_count==0]
+                if(substep_count==0){
+
+                    // Compute the 'edge-timesteps' (useful for setting flux_update_frequency)
+                    tmp = 1.0 / max(max_speed_local, D->epsilon);
+                    D->edge_timestep[ki] = D->radii[k] * tmp ;
+                    if (n >= 0) {
+                        D->edge_timestep[nm] = D->radii[n] * tmp;
+                    }
+
+                    // Update the timestep
+                    if ((D->tri_full_flag[k] == 1)) {
+
+                        speed_max_last = max(speed_max_last, max_speed_local);
 
+                        if (max_speed_local > D->epsilon) {
+                            // Apply CFL condition for triangles joining this edge (triangle k and triangle n)
 
-    } // End triangle k
+                            // CFL for triangle k
+                            local_timestep = min(local_timestep, D->edge_timestep[ki]);
+
+                            if (n >= 0) {
+                                // Apply CFL condition for neigbour n (which is on the ith edge of triangle k)
+                                local_timestep = min(local_timestep, D->edge_timestep[nm]);
+                            }
+                        }
+                    }
+                }
+
+            } // End edge i (and neighbour n)
+            // Keep track of maximal speeds
+            if(substep_count==0) D->max_speed[k] = speed_max_last; //max_speed;
+
+
+        } // End triangle k
+    }
+
+    D->flux_local_timestep[0] = local_timestep;
 
     //// Limit edgefluxes, for mass conservation near wet/dry cells
     //// This doesn't seem to be needed anymore
@@ -1078,8 +1195,17 @@ double _compute_fluxes_central(struct domain *D, double timestep){
     // }
 
     // Now add up stage, xmom, ymom explicit updates
-    for(k=0; k < D->number_of_elements; k++){
-        hc = max(D->stage_centroid_values[k] - D->bed_centroid_values[k],0.);
+    // This also sets explicit_update to zero for all conserved_quantities.
+    // This assumes compute_fluxes called before forcing terms
+    #pragma omp parallel for num_threads(D->omp_num_threads) schedule(static) \
+        private(j, k, i, n, e, ki, ki2, ki3, inv_area, speed_max_last) \
+        reduction(+:boundary_flux_sum_substep)
+    for(j=0; j < number_of_cells; j++){
+        k = (cells == NULL) ? j : cells[j];
+        D->stage_explicit_update[k] = 0.0;
+        D->xmom_explicit_update[k] = 0.0;
+        D->ymom_explicit_update[k] = 0.0;
+        speed_max_last = 0.0;
 
         for(i=0;i<3;i++){
             // FIXME: Make use of neighbours to efficiently set things
@@ -1098,15 +1224,25 @@ double _compute_fluxes_central(struct domain *D, double timestep){
             if( (n<0 & D->tri_full_flag[k]==1) | ( n>=0 && (D->tri_full_flag[k]==1 & D->tri_full_flag[n]==0)) ){
                 // boundary_flux_sum is an array with length = timestep_fluxcalls
                 // For each sub-step, we put the boundary flux sum in.
-                D->boundary_flux_sum[substep_count] += D->edge_flux_work[ki3];
+                boundary_flux_sum_substep += D->edge_flux_work[ki3];
             }
 
             D->xmom_explicit_update[k] -= D->normals[ki2]*D->pressuregrad_work[ki];
             D->ymom_explicit_update[k] -= D->normals[ki2+1]*D->pressuregrad_work[ki];
 
+            // With the edge loop, the maximal speed of triangle k is taken
+            // over the edges it owns (as for the loop over triangles)
+            if(edge_loop && substep_count==0){
+                e = D->edge_index[ki];
+                if(D->edge_left_cells[e]==k){
+                    speed_max_last = max(speed_max_last, D->edge_max_speed_work[e]);
+                }
+            }
 
         } // end edge i
 
+        if(edge_loop && substep_count==0) D->max_speed[k] = speed_max_last;
+
         // Normalise triangle k by area and store for when all conserved
         // quantities get updated
         inv_area = 1.0 / D->areas[k];
@@ -1116,12 +1252,99 @@ double _compute_fluxes_central(struct domain *D, double timestep){
 
     }  // end cell k
 
+    D->boundary_flux_sum[substep_count] += boundary_flux_sum_substep;
+
     // Ensure we only update the timestep on the first call within each rk2/rk3 step
     if(substep_count == 0) timestep=local_timestep;
 
     return timestep;
 }
 
+// Multi-rate local timestepping (see Domain.evolve_one_multirate_step)
+//
+// Triangle k advances with the timestep 2**levels[k]*dt0, and the flux
+// across an edge is computed at the rate of the finer of the two triangles
+// sharing it. The edge fluxes times their timesteps are summed for each
+// triangle over its step and applied when the step is complete, so the
+// scheme is conservative.
+
+// Flag the edges whose fluxes are computed on this substep, and the
+// triangles whose extrapolation has to be updated for them
+void _multirate_set_flux_updates(struct domain *D, long* levels, long substep){
+
+  long k, i, n, ki, edge_level, update;
+
+  #pragma omp parallel for num_threads(D->omp_num_threads) schedule(static) \
+      private(k, i, n, ki, edge_level, update)
+  for (k = 0; k < D->number_of_elements; k++) {
+    update = 0;
+    for (i = 0; i < 3; i++) {
+      ki = 3*k + i;
+      n = D->neighbours[ki];
+      edge_level = (n >= 0) ? min(levels[k], levels[n]) : levels[k];
+
+      D->update_next_flux[ki] = (substep % (1 << edge_level) == 0);
+      update = update || D->update_next_flux[ki];
+    }
+    D->update_extrapolation[k] = update;
+  }
+}
+
+// Add the fluxes computed on this substep to the flux sums of each
+// triangle, and update the triangles whose step ends with this substep.
+// Return the time integrated flux through the boundary.
+double _multirate_accumulate(struct domain *D, long* levels,
+                             double* flux_sums, long substep, double dt0){
+
+  long j, k, i, n, ki, ki2, ki3, k3, edge_level, number_of_cells;
+  long* cells;
+  double edge_timestep, inv_area;
+  double boundary_flux = 0.0;
+
+  number_of_cells = _get_cells_to_visit(D, &cells);
+
+  #pragma omp parallel for num_threads(D->omp_num_threads) schedule(static) \
+      private(j, k, i, n, ki, ki2, ki3, k3, edge_level, edge_timestep, inv_area) \
+      reduction(+:boundary_flux)
+  for (j = 0; j < number_of_cells; j++) {
+    k = (cells == NULL) ? j : cells[j];
+    k3 = 3*k;
+
+    for (i = 0; i < 3; i++) {
+      ki = 3*k + i;
+      if (D->update_next_flux[ki] != 1) continue;
+
+      ki2 = 2*ki;
+      ki3 = 3*ki;
+      n = D->neighbours[ki];
+      edge_level = (n >= 0) ? min(levels[k], levels[n]) : levels[k];
+      edge_timestep = dt0*(1 << edge_level);
+
+      flux_sums[k3] += edge_timestep*D->edge_flux_work[ki3];
+      flux_sums[k3+1] += edge_timestep*(D->edge_flux_work[ki3+1] - D->normals[ki2]*D->pressuregrad_work[ki]);
+      flux_sums[k3+2] += edge_timestep*(D->edge_flux_work[ki3+2] - D->normals[ki2+1]*D->pressuregrad_work[ki]);
+
+      // Flux out of the domain (or into ghost cells), as in _compute_fluxes_central
+      if( (n<0 && D->tri_full_flag[k]==1) || ( n>=0 && (D->tri_full_flag[k]==1 && D->tri_full_flag[n]==0)) ){
+        boundary_flux += edge_timestep*D->edge_flux_work[ki3];
+      }
+    }
+
+    if ((substep + 1) % (1 << levels[k]) == 0) {
+      inv_area = 1.0/D->areas[k];
+      D->stage_centroid_values[k] += flux_sums[k3]*inv_area;
+      D->xmom_centroid_values[k] += flux_sums[k3+1]*inv_area;
+      D->ymom_centroid_values[k] += flux_sums[k3+2]*inv_area;
+
+      flux_sums[k3] = 0.0;
+      flux_sums[k3+1] = 0.0;
+      flux_sums[k3+2] = 0.0;
+    }
+  }
+
+  return boundary_flux;
+}
+
 // Protect against the water elevation falling below the triangle bed
 double  _protect(int N,
          double minimum_allowed_height,
@@ -1185,28 +1408,34 @@ double  _protect(int N,
   return mass_error;
 }
 
+// Number of triangles in each block of the mass error sum in _protect_new
+#define PROTECT_BLOCK_SIZE 1024
+
 // Protect against the water elevation falling below the triangle bed
+//
+// The mass error is summed over fixed blocks of triangles (in parallel) and
+// the block sums are then added in order, so the result does not depend on
+// the number of threads. Only the active triangles are visited if the active
+// cell set is in use.
 double  _protect_new(struct domain *D) {
 
-  int k;
-  double hc, bmin, bmax;
-  double u, v, reduced_speed;
+  long j, k, kb, j_end, number_of_blocks, number_of_cells;
+  long* cells;
+  double hc, bmin;
   double mass_error = 0.;
+  double block_mass_error;
+  double* block_mass_errors;
 
-  double* wc;
+  anuga_float* wc;
   double* zc;
-  double* wv;
-  double* xmomc;
-  double* ymomc;
+  anuga_float* wv;
+  anuga_float* xmomc;
+  anuga_float* ymomc;
   double* areas;
 
   double minimum_allowed_height;
-  double maximum_allowed_speed;
-  double epsilon;
 
   minimum_allowed_height = D->minimum_allowed_height;
-  maximum_allowed_speed  = D->maximum_allowed_speed;
-  epsilon = D->epsilon;
 
   wc = D->stage_centroid_values;
   zc = D->bed_centroid_values;
@@ -1215,15 +1444,18 @@ double  _protect_new(struct domain *D) {
   ymomc = D->ymom_centroid_values;
   areas = D->areas;
 
-  // This acts like minimum_allowed height, but scales with the vertical
-  // distance between the bed_centroid_value and the max bed_edge_value of
-  // every triangle.
-  //double minimum_relative_height=0.05;
-  int mass_added = 0;
+  number_of_cells = _get_cells_to_visit(D, &cells);
+  number_of_blocks = (number_of_cells + PROTECT_BLOCK_SIZE - 1)/PROTECT_BLOCK_SIZE;
+  block_mass_errors = malloc(max(number_of_blocks, 1)*sizeof(double));
 
   // Protect against inifintesimal and negative heights
-  //if (maximum_allowed_speed < epsilon) {
-    for (k=0; k<D->number_of_elements; k++) {
+  #pragma omp parallel for num_threads(D->omp_num_threads) schedule(static) \
+      private(kb, j, k, j_end, hc, bmin, block_mass_error)
+  for (kb=0; kb<number_of_blocks; kb++) {
+    block_mass_error = 0.;
+    j_end = (long) min((kb+1)*PROTECT_BLOCK_SIZE, number_of_cells);
+    for (j=kb*PROTECT_BLOCK_SIZE; j<j_end; j++) {
+      k = (cells == NULL) ? j : cells[j];
       hc = wc[k] - zc[k];
       if (hc < minimum_allowed_height*1.0 ){
             // Set momentum to zero and ensure h is non negative
@@ -1235,8 +1467,7 @@ double  _protect_new(struct domain *D) {
 
              // WARNING: ADDING MASS if wc[k]<bmin
              if(wc[k] < bmin){
-                 mass_error += (bmin-wc[k])*areas[k];
-                 mass_added = 1; //Flag to warn of added mass
+                 block_mass_error += (bmin-wc[k])*areas[k];
 
                  wc[k] = bmin;
 
@@ -1251,14 +1482,432 @@ double  _protect_new(struct domain *D) {
         }
       }
     }
+    block_mass_errors[kb] = block_mass_error;
+  }
 
-  //if(mass_added == 1){
+  for (kb=0; kb<number_of_blocks; kb++) {
+    mass_error += block_mass_errors[kb];
+  }
+
+  free(block_mass_errors);
+
+  //if(mass_error > 0.){
   //  printf("Cumulative mass protection: %f m^3 \n", mass_error);
   //}
 
   return mass_error;
 }
 
+// Comparison function used to sort the active cells
+int _compare_cells(const void *a, const void *b){
+  long ka = *(const long*) a;
+  long kb = *(const long*) b;
+
+  return (ka > kb) - (ka < kb);
+}
+
+// Add triangle k to the core of the active set (flag 1) unless it is there
+// already
+#define ADD_ACTIVE_CELL(k) \
+  if (D->active_cell_flags[k] != 1) { \
+    D->active_cell_flags[k] = 1; \
+    new_cells[count++] = k; \
+  }
+
+// Add triangle k and its neighbours to the core of the active set
+#define ADD_ACTIVE_CELL_AND_NEIGHBOURS(k) \
+  ADD_ACTIVE_CELL(k); \
+  for (i = 0; i < 3; i++) { \
+    n = D->neighbours[3*k + i]; \
+    if (n >= 0) { ADD_ACTIVE_CELL(n); } \
+  }
+
+// Update the set of triangles visited by the DE kernels (active_cells).
+//
+// The core of the set (active_cell_flags == 1) is the wet or moving
+// triangles, their neighbours, the always active (boundary and ghost)
+// triangles and the triangles changed outside the kernels (changed_cells)
+// together with their neighbours. Water moves at most one triangle per
+// (sub)step, so only the triangles visited on the previous step and the
+// changed triangles need to be checked. Triangles dropping out of the core
+// are visited once more (active_cell_flags == 2) so that their edge values
+// are extrapolated from their dry state, and then removed from the set.
+//
+// If number_of_active_cells is negative all triangles are checked and the
+// triangles outside the core are visited once.
+//
+// The active cells are sorted to keep memory access in triangle order.
+long _update_active_cells(struct domain *D, long* changed_cells,
+                          long number_of_changed_cells){
+
+  long j, k, i, n, count, full;
+  long number_of_old_cells, max_number_of_cells;
+  long* new_cells;
+
+  full = (D->number_of_active_cells[0] < 0);
+  number_of_old_cells = full ? 0 : D->number_of_active_cells[0];
+
+  if (full) {
+    max_number_of_cells = D->number_of_elements;
+  } else {
+    max_number_of_cells = min(D->number_of_elements,
+        4*(number_of_old_cells + number_of_changed_cells) + D->number_of_always_active_cells);
+  }
+  new_cells = malloc(max(max_number_of_cells, 1)*sizeof(long));
+  count = 0;
+
+  if (full) {
+    memset(D->active_cell_flags, 0, D->number_of_elements*sizeof(long));
+  } else {
+    // Remember which triangles were in the core (-1) and drop those
+    // which were leaving (0)
+    for (j = 0; j < number_of_old_cells; j++) {
+      k = D->active_cells[j];
+      D->active_cell_flags[k] = (D->active_cell_flags[k] == 1) ? -1 : 0;
+    }
+  }
+
+  for (j = 0; j < D->number_of_always_active_cells; j++) {
+    k = D->always_active_cells[j];
+    ADD_ACTIVE_CELL(k);
+  }
+
+  for (j = 0; j < number_of_changed_cells; j++) {
+    k = changed_cells[j];
+    ADD_ACTIVE_CELL_AND_NEIGHBOURS(k);
+  }
+
+  for (j = 0; j < (full ? D->number_of_elements : number_of_old_cells); j++) {
+    k = full ? j : D->active_cells[j];
+    if ((D->stage_centroid_values[k] > D->bed_centroid_values[k]) ||
+        (D->xmom_centroid_values[k] != 0.0) ||
+        (D->ymom_centroid_values[k] != 0.0)) {
+      ADD_ACTIVE_CELL_AND_NEIGHBOURS(k);
+    }
+  }
+
+  if (full) {
+    // Visit all remaining triangles once
+    for (k = 0; k < D->number_of_elements; k++) {
+      if (D->active_cell_flags[k] == 0) {
+        D->active_cell_flags[k] = 2;
+        new_cells[count++] = k;
+      }
+    }
+  } else {
+    for (j = 0; j < number_of_old_cells; j++) {
+      k = D->active_cells[j];
+      if (D->active_cell_flags[k] == -1) {
+        // Leaving the core
+        D->active_cell_flags[k] = 2;
+        new_cells[count++] = k;
+      } else if (D->active_cell_flags[k] == 0) {
+        // Dropped from the set, so must not contribute to the update
+        D->stage_explicit_update[k] = 0.0;
+        D->xmom_explicit_update[k] = 0.0;
+        D->ymom_explicit_update[k] = 0.0;
+        D->max_speed[k] = 0.0;
+      }
+    }
+  }
+
+  qsort(new_cells, count, sizeof(long), _compare_cells);
+
+  memcpy(D->active_cells, new_cells, count*sizeof(long));
+  D->number_of_active_cells[0] = count;
+
+  free(new_cells);
+
+  return count;
+}
+
+#undef ADD_ACTIVE_CELL
+#undef ADD_ACTIVE_CELL_AND_NEIGHBOURS
+
+// Update the conserved quantities of the active triangles from the explicit
+// and semi implicit updates (as Quantity.update does for all triangles)
+int _update_conserved_quantities(struct domain *D, double timestep){
+
+  long j, k, q, number_of_cells;
+  long* cells;
+  int err = 0;
+  double x, denominator;
+  anuga_float* centroid_values[3];
+  anuga_float* explicit_update[3];
+  anuga_float* semi_implicit_update[3];
+
+  centroid_values[0] = D->stage_centroid_values;
+  centroid_values[1] = D->xmom_centroid_values;
+  centroid_values[2] = D->ymom_centroid_values;
+  explicit_update[0] = D->stage_explicit_update;
+  explicit_update[1] = D->xmom_explicit_update;
+  explicit_update[2] = D->ymom_explicit_update;
+  semi_implicit_update[0] = D->stage_semi_implicit_update;
+  semi_implicit_update[1] = D->xmom_semi_implicit_update;
+  semi_implicit_update[2] = D->ymom_semi_implicit_update;
+
+  number_of_cells = _get_cells_to_visit(D, &cells);
+
+  #pragma omp parallel for num_threads(D->omp_num_threads) schedule(static) \
+      private(j, k, q, x, denominator) reduction(|:err)
+  for (j = 0; j < number_of_cells; j++) {
+    k = (cells == NULL) ? j : cells[j];
+
+    for (q = 0; q < 3; q++) {
+      // Divide semi implicit update by conserved quantity
+      x = centroid_values[q][k];
+      if (x == 0.0) {
+        semi_implicit_update[q][k] = 0.0;
+      } else {
+        semi_implicit_update[q][k] /= x;
+      }
+
+      // Explicit update
+      centroid_values[q][k] += timestep*explicit_update[q][k];
+
+      // Semi implicit update
+      denominator = 1.0 - timestep*semi_implicit_update[q][k];
+      if (denominator <= 0.0) {
+        err = 1;
+      } else {
+        centroid_values[q][k] /= denominator;
+      }
+
+      // Reset semi_implicit_update ready for next time step
+      semi_implicit_update[q][k] = 0.0;
+    }
+  }
+
+  return err ? -1 : 0;
+}
+
+// Add the Manning friction of the visited triangles to the semi implicit
+// or explicit momentum updates (as manning_friction_implicit and
+// manning_friction_explicit do for all triangles)
+void _manning_friction(struct domain *D, long use_sloped_mannings, long implicit){
+
+  long j, k, k3, k6, number_of_cells;
+  long* cells;
+  anuga_float* xmom_update = implicit ? D->xmom_semi_implicit_update : D->xmom_explicit_update;
+  anuga_float* ymom_update = implicit ? D->ymom_semi_implicit_update : D->ymom_explicit_update;
+  double S, h, z, z0, z1, z2, zs, zx, zy, eta, uh, vh;
+  double* x = D->vertex_coordinates;
+  const double one_third = 1.0/3.0;
+  const double seven_thirds = 7.0/3.0;
+
+  number_of_cells = _get_cells_to_visit(D, &cells);
+
+  #pragma omp parallel for num_threads(D->omp_num_threads) schedule(static) \
+      private(j, k, k3, k6, S, h, z, z0, z1, z2, zs, zx, zy, eta, uh, vh)
+  for (j = 0; j < number_of_cells; j++) {
+    k = (cells == NULL) ? j : cells[j];
+
+    eta = D->friction_centroid_values[k];
+    if (eta > D->minimum_allowed_height) {
+      k3 = 3*k;
+      z0 = D->bed_vertex_values[k3 + 0];
+      z1 = D->bed_vertex_values[k3 + 1];
+      z2 = D->bed_vertex_values[k3 + 2];
+
+      zs = 1.0;
+      if (use_sloped_mannings) {
+        k6 = 6*k;
+        _gradient(x[k6 + 0], x[k6 + 1], x[k6 + 2], x[k6 + 3], x[k6 + 4], x[k6 + 5],
+                  z0, z1, z2, &zx, &zy);
+        zs = sqrt(1.0 + zx*zx + zy*zy);
+      }
+
+      z = (z0 + z1 + z2)*one_third;
+      h = D->stage_centroid_values[k] - z;
+      if (h >= D->minimum_allowed_height) {
+        uh = D->xmom_centroid_values[k];
+        vh = D->ymom_centroid_values[k];
+
+        S = -D->g*eta*eta*zs*sqrt(uh*uh + vh*vh);
+        S /= pow(h, seven_thirds);
+
+        xmom_update[k] += S*uh;
+        ymom_update[k] += S*vh;
+      }
+    }
+  }
+}
+
+// Set full triangles with negative depth to zero depth and momentum (as
+// Domain.update_conserved_quantities does). Return the number changed.
+long _zero_negative_depths(struct domain *D){
+
+  long j, k, number_of_cells;
+  long* cells;
+  long count = 0;
+
+  number_of_cells = _get_cells_to_visit(D, &cells);
+
+  #pragma omp parallel for num_threads(D->omp_num_threads) schedule(static) \
+      private(j, k) reduction(+:count)
+  for (j = 0; j < number_of_cells; j++) {
+    k = (cells == NULL) ? j : cells[j];
+
+    if (D->tri_full_flag[k] > 0 &&
+        D->stage_centroid_values[k] - D->bed_centroid_values[k] < 0.0) {
+      D->stage_centroid_values[k] = D->bed_centroid_values[k];
+      D->xmom_centroid_values[k] = 0.0;
+      D->ymom_centroid_values[k] = 0.0;
+      count++;
+    }
+  }
+
+  return count;
+}
+
+// Copy the conserved quantities to their backup values
+void _backup_conserved_quantities(struct domain *D){
+
+  long N = D->number_of_elements;
+
+  memcpy(D->stage_centroid_backup_values, D->stage_centroid_values, N*sizeof(anuga_float));
+  memcpy(D->xmom_centroid_backup_values, D->xmom_centroid_values, N*sizeof(anuga_float));
+  memcpy(D->ymom_centroid_backup_values, D->ymom_centroid_values, N*sizeof(anuga_float));
+}
+
+// Q = a*Q + b*Q_backup for the conserved quantities
+void _saxpy_conserved_quantities(struct domain *D, double a, double b){
+
+  long k;
+
+  #pragma omp parallel for num_threads(D->omp_num_threads) schedule(static)
+  for (k = 0; k < D->number_of_elements; k++) {
+    D->stage_centroid_values[k] = a*D->stage_centroid_values[k] + b*D->stage_centroid_backup_values[k];
+    D->xmom_centroid_values[k] = a*D->xmom_centroid_values[k] + b*D->xmom_centroid_backup_values[k];
+    D->ymom_centroid_values[k] = a*D->ymom_centroid_values[k] + b*D->ymom_centroid_backup_values[k];
+  }
+}
+
+// Types of the boundaries applied by _apply_boundaries. Must match
+// c_boundary_types in boundaries.py
+#define REFLECTIVE_BOUNDARY 0
+#define TRANSMISSIVE_BOUNDARY 1
+#define DIRICHLET_BOUNDARY 2
+#define TRANSMISSIVE_STAGE_ZERO_MOMENTUM_BOUNDARY 3
+#define TRANSMISSIVE_MOMENTUM_SET_STAGE_BOUNDARY 4
+#define TRANSMISSIVE_N_MOMENTUM_ZERO_T_MOMENTUM_SET_STAGE_BOUNDARY 5
+#define DIRICHLET_DISCHARGE_BOUNDARY 6
+#define INFLOW_BOUNDARY 7
+
+// Built-in boundaries of all types in one pass. ids index the boundary
+// values and edges the triangle edges (3*k + i). Boundary ids[j] belongs
+// to boundary object boundary_index[j], which has type types[b] and the
+// three parameters params[3*b:3*b+3] set for the current time:
+//
+//   Reflective                  edge values with the momentum and
+//                               velocity reflected
+//   Transmissive                edge (centroid if p0 != 0) values
+//   Dirichlet                   (p0, p1, p2)
+//   Transmissive stage zero mom (edge stage, 0, 0)
+//   Transmissive mom set stage  (p0, edge momentum)
+//   Transmissive n mom set stage (p0, normal part of edge momentum)
+//   Dirichlet discharge         (p0, -p1*normal)
+//   Inflow                      (edge elevation + p1, -p0*normal)
+void _apply_boundaries(struct domain *D, long number_of_ids,
+                       long* ids, long* edges, long* boundary_index,
+                       long* types, double* params,
+                       double* xvel_edge_values, double* yvel_edge_values,
+                       double* xvel_boundary_values, double* yvel_boundary_values){
+
+  long j, i, ki, k;
+  double n1, n2, q1, q2, r1, r2, ndotq;
+  double *p;
+
+  for (j = 0; j < number_of_ids; j++) {
+    i = ids[j];
+    ki = edges[j];
+    p = params + 3*boundary_index[j];
+
+    n1 = D->normals[2*ki];
+    n2 = D->normals[2*ki + 1];
+
+    switch (types[boundary_index[j]]) {
+
+    case REFLECTIVE_BOUNDARY:
+      D->stage_boundary_values[i] = D->stage_edge_values[ki];
+      D->bed_boundary_values[i] = D->bed_edge_values[ki];
+      D->height_boundary_values[i] = D->height_edge_values[ki];
+
+      // Rotate and negate momentum
+      q1 = D->xmom_edge_values[ki];
+      q2 = D->ymom_edge_values[ki];
+
+      r1 = -q1*n1 - q2*n2;
+      r2 = -q1*n2 + q2*n1;
+
+      D->xmom_boundary_values[i] = n1*r1 - n2*r2;
+      D->ymom_boundary_values[i] = n2*r1 + n1*r2;
+
+      // Rotate and negate velocity
+      q1 = xvel_edge_values[ki];
+      q2 = yvel_edge_values[ki];
+
+      r1 = q1*n1 + q2*n2;
+      r2 = q1*n2 - q2*n1;
+
+      xvel_boundary_values[i] = n1*r1 - n2*r2;
+      yvel_boundary_values[i] = n2*r1 + n1*r2;
+      break;
+
+    case TRANSMISSIVE_BOUNDARY:
+      if (p[0] != 0.0) {
+        k = ki/3;
+        D->stage_boundary_values[i] = D->stage_centroid_values[k];
+        D->xmom_boundary_values[i] = D->xmom_centroid_values[k];
+        D->ymom_boundary_values[i] = D->ymom_centroid_values[k];
+      } else {
+        D->stage_boundary_values[i] = D->stage_edge_values[ki];
+        D->xmom_boundary_values[i] = D->xmom_edge_values[ki];
+        D->ymom_boundary_values[i] = D->ymom_edge_values[ki];
+      }
+      break;
+
+    case DIRICHLET_BOUNDARY:
+      D->stage_boundary_values[i] = p[0];
+      D->xmom_boundary_values[i] = p[1];
+      D->ymom_boundary_values[i] = p[2];
+      break;
+
+    case TRANSMISSIVE_STAGE_ZERO_MOMENTUM_BOUNDARY:
+      D->stage_boundary_values[i] = D->stage_edge_values[ki];
+      D->xmom_boundary_values[i] = 0.0;
+      D->ymom_boundary_values[i] = 0.0;
+      break;
+
+    case TRANSMISSIVE_MOMENTUM_SET_STAGE_BOUNDARY:
+      D->stage_boundary_values[i] = p[0];
+      D->xmom_boundary_values[i] = D->xmom_edge_values[ki];
+      D->ymom_boundary_values[i] = D->ymom_edge_values[ki];
+      break;
+
+    case TRANSMISSIVE_N_MOMENTUM_ZERO_T_MOMENTUM_SET_STAGE_BOUNDARY:
+      ndotq = n1*D->xmom_edge_values[ki] + n2*D->ymom_edge_values[ki];
+
+      D->stage_boundary_values[i] = p[0];
+      D->xmom_boundary_values[i] = ndotq*n1;
+      D->ymom_boundary_values[i] = ndotq*n2;
+      break;
+
+    case DIRICHLET_DISCHARGE_BOUNDARY:
+      D->stage_boundary_values[i] = p[0];
+      D->xmom_boundary_values[i] = -p[1]*n1;
+      D->ymom_boundary_values[i] = -p[1]*n2;
+      break;
+
+    case INFLOW_BOUNDARY:
+      D->stage_boundary_values[i] = D->bed_edge_values[ki] + p[1];
+      D->xmom_boundary_values[i] = -p[0]*n1;
+      D->ymom_boundary_values[i] = -p[0]*n2;
+      break;
+    }
+  }
+}
+
 
 
 
@@ -1363,10 +2012,17 @@ int _extrapolate_second_order_edge_sw(struct domain *D){
   double dqv[3], qmin, qmax, hmin, hmax, bedmax,bedmin, stagemin;
   double hc, h0, h1, h2, beta_tmp, hfactor, xtmp, ytmp, weight, tmp;
   double dk, dk_inv,dv0, dv1, dv2, de[3], demin, dcmax, r0scale, vel_norm, l1, l2, a_tmp, b_tmp, c_tmp,d_tmp;
+  int internal_neighbour_not_found = 0;
+  long j, number_of_cells;
+  long* cells;
 
+  // Only the active triangles are visited if the active cell set is in use
+  number_of_cells = _get_cells_to_visit(D, &cells);
 
-  memset((char*) D->x_centroid_work, 0, D->number_of_elements * sizeof (double));
-  memset((char*) D->y_centroid_work, 0, D->number_of_elements * sizeof (double));
+  if (cells == NULL) {
+    memset((char*) D->x_centroid_work, 0, D->number_of_elements * sizeof (double));
+    memset((char*) D->y_centroid_work, 0, D->number_of_elements * sizeof (double));
+  }
 
   // Parameters used to control how the limiter is forced to first-order near
   // wet-dry regions
@@ -1379,7 +2035,10 @@ int _extrapolate_second_order_edge_sw(struct domain *D){
 
       // Replace momentum centroid with velocity centroid to allow velocity
       // extrapolation This will be changed back at the end of the routine
-      for (k=0; k< D->number_of_elements; k++){
+      #pragma omp parallel for num_threads(D->omp_num_threads) schedule(static) \
+          private(j, k, dk, dk_inv)
+      for (j=0; j< number_of_cells; j++){
+          k = (cells == NULL) ? j : cells[j];
 
           D->height_centroid_values[k] = max(D->stage_centroid_values[k] - D->bed_centroid_values[k], 0.);
 
@@ -1405,7 +2064,10 @@ int _extrapolate_second_order_edge_sw(struct domain *D){
   // condition) set its momentum to zero too. This prevents 'pits' of
   // of water being trapped and unable to lose momentum, which can occur in
   // some situations
-  for (k=0; k< D->number_of_elements;k++){
+  #pragma omp parallel for num_threads(D->omp_num_threads) schedule(static) \
+      private(j, k, k0, k1, k2, k3)
+  for (j=0; j< number_of_cells; j++){
+      k = (cells == NULL) ? j : cells[j];
 
       k3=k*3;
       k0 = D->surrogate_neighbours[k3];
@@ -1427,8 +2089,17 @@ int _extrapolate_second_order_edge_sw(struct domain *D){
   }
 
   // Begin extrapolation routine
-  for (k = 0; k < D->number_of_elements; k++)
+  // (Each triangle only writes its own edge values, and only reads centroid
+  // values, so the triangles can be shared between threads)
+  #pragma omp parallel for num_threads(D->omp_num_threads) schedule(static) \
+      private(j, k, k0, k1, k2, k3, k6, coord_index, i, a, b, x, y, x0, y0, \
+              x1, y1, x2, y2, xv0, yv0, xv1, yv1, xv2, yv2, dx1, dx2, dy1, \
+              dy2, dxv0, dxv1, dxv2, dyv0, dyv1, dyv2, dq0, dq1, dq2, area2, \
+              inv_area2, dqv, qmin, qmax, hmin, hmax, hc, h0, h1, h2, \
+              beta_tmp, hfactor, dk)
+  for (j = 0; j < number_of_cells; j++)
   {
+    k = (cells == NULL) ? j : cells[j];
 
     // Don't update the extrapolation if the flux will not be computed on the
     // next timestep
@@ -1807,8 +2478,9 @@ int _extrapolate_second_order_edge_sw(struct domain *D){
       if ((k2 == k3 + 3))
       {
         // If we didn't find an internal neighbour
-        report_python_error(AT, "Internal neighbour not found");
-        return -1;
+        // (Can't return from inside the parallel loop, so flag it)
+        internal_neighbour_not_found = 1;
+        continue;
       }
 
       k1 = D->surrogate_neighbours[k2];
@@ -1984,9 +2656,17 @@ int _extrapolate_second_order_edge_sw(struct domain *D){
     } // else [number_of_boundaries==2]
   } // for k=0 to number_of_elements-1
 
+  if (internal_neighbour_not_found)
+  {
+    report_python_error(AT, "Internal neighbour not found");
+    return -1;
+  }
 
   // Compute vertex values of quantities
-  for (k=0; k< D->number_of_elements; k++){
+  #pragma omp parallel for num_threads(D->omp_num_threads) schedule(static) \
+      private(j, k, k3, i, dk)
+  for (j=0; j< number_of_cells; j++){
+      k = (cells == NULL) ? j : cells[j];
       if(D->extrapolate_velocity_second_order==1){
           //Convert velocity back to momenta at centroids
           D->xmom_centroid_values[k] = D->x_centroid_work[k];
@@ -2076,7 +2756,7 @@ PyObject *swde1_compute_fluxes_ext_central(PyObject *self, PyObject *args) {
       return NULL;
   }
 
-  get_python_domain(&D,domain);
+  if (get_python_domain(&D, domain) == NULL) return NULL;
 
   timestep=_compute_fluxes_central(&D,timestep);
 
@@ -2225,7 +2905,7 @@ PyObject *swde1_compute_flux_update_frequency(PyObject *self, PyObject *args) {
       return NULL;
   }
 
-  get_python_domain(&D,domain);
+  if (get_python_domain(&D, domain) == NULL) return NULL;
 
   _compute_flux_update_frequency(&D, timestep);
 
@@ -2255,7 +2935,7 @@ PyObject *swde1_extrapolate_second_order_edge_sw(PyObject *self, PyObject *args)
       return NULL;
   }
 
-  get_python_domain(&D, domain);
+  if (get_python_domain(&D, domain) == NULL) return NULL;
 
   // Call underlying flux computation routine and update
   // the explicit update arrays
@@ -2346,7 +3026,7 @@ PyObject *swde1_protect_new(PyObject *self, PyObject *args) {
 		return NULL;
 	}
 
-	get_python_domain(&D, domain);
+	if (get_python_domain(&D, domain) == NULL) return NULL;
 
 	mass_error = _protect_new(&D);
 
@@ -2356,6 +3036,212 @@ PyObject *swde1_protect_new(PyObject *self, PyObject *args) {
 
 
 
+//========================================================================
+// Multi-rate local timestepping
+//========================================================================
+
+PyObject *swde1_multirate_set_flux_updates(PyObject *self, PyObject *args) {
+  //
+  //    multirate_set_flux_updates(domain, levels, substep)
+
+	struct domain D;
+	PyObject *domain;
+	PyArrayObject *levels;
+
+	long substep;
+
+	// Convert Python arguments to C
+	if (!PyArg_ParseTuple(args, "OOl", &domain, &levels, &substep)) {
+		report_python_error(AT, "could not parse input arguments");
+		return NULL;
+	}
+
+	if (get_python_domain(&D, domain) == NULL) return NULL;
+
+	CHECK_C_CONTIG(levels);
+
+	_multirate_set_flux_updates(&D, (long*) levels->data, substep);
+
+	return Py_BuildValue("");
+}
+
+PyObject *swde1_multirate_accumulate(PyObject *self, PyObject *args) {
+  //
+  //    boundary_flux = multirate_accumulate(domain, levels, flux_sums, substep, dt0)
+
+	struct domain D;
+	PyObject *domain;
+	PyArrayObject *levels, *flux_sums;
+
+	long substep;
+	double dt0, boundary_flux;
+
+	// Convert Python arguments to C
+	if (!PyArg_ParseTuple(args, "OOOld", &domain, &levels, &flux_sums,
+	                      &substep, &dt0)) {
+		report_python_error(AT, "could not parse input arguments");
+		return NULL;
+	}
+
+	if (get_python_domain(&D, domain) == NULL) return NULL;
+
+	CHECK_C_CONTIG(levels);
+	CHECK_C_CONTIG(flux_sums);
+
+	boundary_flux = _multirate_accumulate(&D, (long*) levels->data,
+	                                      (double*) flux_sums->data,
+	                                      substep, dt0);
+
+	return Py_BuildValue("d", boundary_flux);
+}
+
+
+//========================================================================
+// Update the set of active cells
+//========================================================================
+
+PyObject *swde1_update_active_cells(PyObject *self, PyObject *args) {
+  //
+  //    number_of_active_cells = update_active_cells(domain, changed_cells)
+
+	struct domain D;
+	PyObject *domain;
+	PyArrayObject *changed_cells;
+
+	long count;
+
+	// Convert Python arguments to C
+	if (!PyArg_ParseTuple(args, "OO", &domain, &changed_cells)) {
+		report_python_error(AT, "could not parse input arguments");
+		return NULL;
+	}
+
+	if (get_python_domain(&D, domain) == NULL) return NULL;
+
+	CHECK_C_CONTIG(changed_cells);
+
+	count = _update_active_cells(&D, (long*) changed_cells->data,
+	                             changed_cells->dimensions[0]);
+
+	return Py_BuildValue("l", count);
+}
+
+
+//========================================================================
+// Update the conserved quantities of the active cells
+//========================================================================
+
+PyObject *swde1_update_conserved_quantities(PyObject *self, PyObject *args) {
+  //
+  //    update_conserved_quantities(domain, timestep)
+
+	struct domain D;
+	PyObject *domain;
+
+	double timestep;
+	int err;
+
+	// Convert Python arguments to C
+	if (!PyArg_ParseTuple(args, "Od", &domain, &timestep)) {
+		report_python_error(AT, "could not parse input arguments");
+		return NULL;
+	}
+
+	if (get_python_domain(&D, domain) == NULL) return NULL;
+
+	err = _update_conserved_quantities(&D, timestep);
+
+	if (err != 0) {
+		report_python_error(AT, "division by zero in semi implicit update");
+		return NULL;
+	}
+
+	return Py_BuildValue("");
+}
+
+
+//========================================================================
+// Built-in boundaries of all types in one pass
+//========================================================================
+
+PyObject *swde1_update_boundaries(PyObject *self, PyObject *args) {
+  //
+  //    update_boundaries(domain, ids, edges, boundary_index, types, params)
+
+	struct domain D;
+	PyObject *domain, *quantities;
+	PyArrayObject *ids, *edges, *boundary_index, *types, *params;
+
+	double *xvel_edge_values, *yvel_edge_values;
+	double *xvel_boundary_values, *yvel_boundary_values;
+
+	// Convert Python arguments to C
+	if (!PyArg_ParseTuple(args, "OOOOOO", &domain, &ids, &edges,
+	                      &boundary_index, &types, &params)) {
+		report_python_error(AT, "could not parse input arguments");
+		return NULL;
+	}
+
+	CHECK_C_CONTIG(ids);
+	CHECK_C_CONTIG(edges);
+	CHECK_C_CONTIG(boundary_index);
+	CHECK_C_CONTIG(types);
+	CHECK_C_CONTIG(params);
+
+	if (get_python_domain(&D, domain) == NULL) return NULL;
+
+	quantities = get_python_object(domain, "quantities");
+	if (!quantities) return NULL;
+
+	xvel_edge_values = get_python_quantity_data(quantities, "xvelocity", "edge_values", NPY_DOUBLE);
+	yvel_edge_values = get_python_quantity_data(quantities, "yvelocity", "edge_values", NPY_DOUBLE);
+	xvel_boundary_values = get_python_quantity_data(quantities, "xvelocity", "boundary_values", NPY_DOUBLE);
+	yvel_boundary_values = get_python_quantity_data(quantities, "yvelocity", "boundary_values", NPY_DOUBLE);
+	Py_DECREF(quantities);
+
+	if (!xvel_edge_values || !yvel_edge_values ||
+	    !xvel_boundary_values || !yvel_boundary_values) return NULL;
+
+	_apply_boundaries(&D, ids->dimensions[0],
+	                  (long*) ids->data,
+	                  (long*) edges->data,
+	                  (long*) boundary_index->data,
+	                  (long*) types->data,
+	                  (double*) params->data,
+	                  xvel_edge_values, yvel_edge_values,
+	                  xvel_boundary_values, yvel_boundary_values);
+
+	return Py_BuildValue("");
+}
+
+
+//========================================================================
+// Manning friction of the visited triangles
+//========================================================================
+
+PyObject *swde1_manning_friction(PyObject *self, PyObject *args) {
+  //
+  //    manning_friction(domain, implicit)
+
+	struct domain D;
+	PyObject *domain;
+
+	long implicit;
+
+	// Convert Python arguments to C
+	if (!PyArg_ParseTuple(args, "Ol", &domain, &implicit)) {
+		report_python_error(AT, "could not parse input arguments");
+		return NULL;
+	}
+
+	if (get_python_domain(&D, domain) == NULL) return NULL;
+
+	_manning_friction(&D, get_python_integer(domain, "use_sloped_mannings"), implicit);
+
+	return Py_BuildValue("");
+}
+
+
 //========================================================================
 // swde1_evolve_one_euler_step
 //========================================================================
@@ -2386,7 +3272,7 @@ PyObject *swde1_evolve_one_euler_step(PyObject *self, PyObject *args) {
   }
 
 
-  get_python_domain(&D, domain);
+  if (get_python_domain(&D, domain) == NULL) return NULL;
 
   //printf("In C_evolve %f %f \n", yieldstep, finaltime);
 
@@ -2401,6 +3287,10 @@ PyObject *swde1_evolve_one_euler_step(PyObject *self, PyObject *args) {
 
   mass_error = _protect_new(&D);
 
+  if (D.use_active_cells) {
+    _update_active_cells(&D, NULL, 0);
+  }
+
   e = _extrapolate_second_order_edge_sw(&D);
   if (e == -1) {
     // Use error string set inside computational routine
@@ -2480,6 +3370,268 @@ PyObject *swde1_evolve_one_euler_step(PyObject *self, PyObject *args) {
 
 }// swde1_evolve_one_euler_step
 
+
+//========================================================================
+// swde1_evolve_one_rk2_step
+//========================================================================
+
+// Call a method of the domain without arguments, return -1 on exception
+int _call_domain_method(PyObject *domain, char *name) {
+
+  PyObject *result;
+
+  result = PyObject_CallMethod(domain, name, NULL);
+  if (result == NULL) {
+    return -1;
+  }
+  Py_DECREF(result);
+
+  return 0;
+}
+
+// Set a float attribute of the domain, return -1 on exception
+int _set_domain_double(PyObject *domain, char *name, double value) {
+
+  PyObject *result;
+  int e;
+
+  result = PyFloat_FromDouble(value);
+  if (result == NULL) {
+    return -1;
+  }
+  e = PyObject_SetAttrString(domain, name, result);
+  Py_DECREF(result);
+
+  return e;
+}
+
+// Protect, update the active cells and extrapolate
+// (as Domain.distribute_to_vertices_and_edges)
+int _fused_distribute(struct domain *D, PyObject *domain) {
+
+  PyObject *changed_cells;
+  long number_of_changed_cells;
+
+  _protect_new(D);
+
+  if (D->use_active_cells) {
+    changed_cells = get_python_object(domain, "changed_cells");
+    if (changed_cells == NULL) {
+      return -1;
+    }
+    number_of_changed_cells = PyArray_SIZE((PyArrayObject *) changed_cells);
+    Py_DECREF(changed_cells);
+
+    if (number_of_changed_cells > 0 || D->max_flux_update_frequency != 1) {
+      if (_call_domain_method(domain, "update_active_cells") == -1) {
+        return -1;
+      }
+    } else {
+      _update_active_cells(D, NULL, 0);
+    }
+  }
+
+  return _extrapolate_second_order_edge_sw(D);
+}
+
+// Apply the boundaries handled in C, and call back into python for the rest
+// (as Domain.update_boundary)
+int _fused_update_boundary(struct domain *D, PyObject *domain,
+                           PyArrayObject *ids, PyArrayObject *edges,
+                           PyArrayObject *boundary_index,
+                           PyArrayObject *types, PyArrayObject *params,
+                           PyObject *python_tags,
+                           double* xvel_edge_values, double* yvel_edge_values,
+                           double* xvel_boundary_values, double* yvel_boundary_values) {
+
+  PyObject *result;
+
+  if (PyList_Size(python_tags) > 0) {
+    result = PyObject_CallMethod(domain, "_update_boundary_tags", "O", python_tags);
+    if (result == NULL) {
+      return -1;
+    }
+    Py_DECREF(result);
+  }
+
+  if (ids->dimensions[0] == 0) {
+    return 0;
+  }
+
+  // Parameters of time dependent boundaries
+  if (_call_domain_method(domain, "_set_c_boundary_parameters") == -1) {
+    return -1;
+  }
+
+  _apply_boundaries(D, ids->dimensions[0],
+                    (long*) ids->data,
+                    (long*) edges->data,
+                    (long*) boundary_index->data,
+                    (long*) types->data,
+                    (double*) params->data,
+                    xvel_edge_values, yvel_edge_values,
+                    xvel_boundary_values, yvel_boundary_values);
+
+  return 0;
+}
+
+// Compute the fluxes and the forcing terms (friction in C, the rest in python)
+int _fused_compute_fluxes_and_forcing_terms(struct domain *D, PyObject *domain,
+                                            long friction,
+                                            long python_forcing_terms) {
+
+  double flux_timestep;
+
+  flux_timestep = _compute_fluxes_central(D, D->evolve_max_timestep);
+  if (_set_domain_double(domain, "flux_timestep", flux_timestep) == -1) {
+    return -1;
+  }
+
+  if (friction) {
+    _manning_friction(D, get_python_integer(domain, "use_sloped_mannings"), 1);
+  }
+
+  if (python_forcing_terms) {
+    return _call_domain_method(domain, "_compute_python_forcing_terms");
+  }
+
+  return 0;
+}
+
+// Update the conserved quantities (as Domain.update_conserved_quantities)
+int _fused_update_conserved_quantities(struct domain *D, PyObject *domain,
+                                       double timestep,
+                                       long python_forcing_terms) {
+
+  if (python_forcing_terms) {
+    // Changes by python forcing terms are tracked in python
+    return _call_domain_method(domain, "update_conserved_quantities");
+  }
+
+  if (_update_conserved_quantities(D, timestep) != 0) {
+    report_python_error(AT, "division by zero in semi implicit update");
+    return -1;
+  }
+
+  if (_zero_negative_depths(D) > 0) {
+    return PyErr_WarnEx(PyExc_UserWarning,
+        "Negative cells being set to zero depth, possible loss of conservation. \n"
+        "Consider using domain.report_water_volume_statistics() to check the extent of the problem", 1);
+  }
+
+  return 0;
+}
+
+PyObject *swde1_evolve_one_rk2_step(PyObject *self, PyObject *args) {
+  /*
+   * One 2nd order RK timestep in C (see Domain.evolve_one_rk2_step)
+   *
+   * evolve_one_rk2_step(domain, yieldstep, finaltime,
+   *                     ids, edges, boundary_index, types, params,
+   *                     python_tags,
+   *                     friction, python_forcing_terms, update_ghosts)
+   *
+   * The boundary arrays are those of Domain._get_boundary_engine_data
+  */
+
+  PyObject *domain, *yieldstep, *finaltime, *python_tags, *quantities, *result;
+  PyArrayObject *ids, *edges, *boundary_index, *types, *params;
+
+  struct domain D;
+
+  double *xvel_edge_values, *yvel_edge_values;
+  double *xvel_boundary_values, *yvel_boundary_values;
+
+  long friction, python_forcing_terms, update_ghosts;
+  double timestep;
+
+  if (!PyArg_ParseTuple(args, "OOOOOOOOOlll", &domain, &yieldstep, &finaltime,
+                        &ids, &edges, &boundary_index, &types, &params,
+                        &python_tags,
+                        &friction, &python_forcing_terms, &update_ghosts)) {
+      report_python_error(AT, "could not parse input arguments");
+      return NULL;
+  }
+
+  CHECK_C_CONTIG(ids);
+  CHECK_C_CONTIG(edges);
+  CHECK_C_CONTIG(boundary_index);
+  CHECK_C_CONTIG(types);
+  CHECK_C_CONTIG(params);
+
+  if (get_python_domain(&D, domain) == NULL) return NULL;
+
+  quantities = get_python_object(domain, "quantities");
+  if (!quantities) return NULL;
+
+  xvel_edge_values = get_python_quantity_data(quantities, "xvelocity", "edge_values", NPY_DOUBLE);
+  yvel_edge_values = get_python_quantity_data(quantities, "yvelocity", "edge_values", NPY_DOUBLE);
+  xvel_boundary_values = get_python_quantity_data(quantities, "xvelocity", "boundary_values", NPY_DOUBLE);
+  yvel_boundary_values = get_python_quantity_data(quantities, "yvelocity", "boundary_values", NPY_DOUBLE);
+  Py_DECREF(quantities);
+
+  if (!xvel_edge_values || !yvel_edge_values ||
+      !xvel_boundary_values || !yvel_boundary_values) return NULL;
+
+  // Save initial conserved quantities values
+  _backup_conserved_quantities(&D);
+
+  //------------------
+  // First euler step
+  //------------------
+
+  if (_fused_distribute(&D, domain) == -1) return NULL;
+
+  if (_fused_update_boundary(&D, domain, ids, edges, boundary_index,
+                             types, params, python_tags,
+                             xvel_edge_values, yvel_edge_values,
+                             xvel_boundary_values, yvel_boundary_values) == -1) return NULL;
+
+  if (_fused_compute_fluxes_and_forcing_terms(&D, domain, friction,
+                                              python_forcing_terms) == -1) return NULL;
+
+  // Update timestep to fit yieldstep and finaltime
+  result = PyObject_CallMethod(domain, "update_timestep", "OO", yieldstep, finaltime);
+  if (result == NULL) return NULL;
+  Py_DECREF(result);
+
+  timestep = get_python_double(domain, "timestep");
+
+  if (_fused_update_conserved_quantities(&D, domain, timestep,
+                                         python_forcing_terms) == -1) return NULL;
+
+  // Update time
+  if (_set_domain_double(domain, "time",
+                         get_python_double(domain, "time") + timestep) == -1) return NULL;
+
+  if (update_ghosts) {
+    if (_call_domain_method(domain, "update_ghosts") == -1) return NULL;
+  }
+
+  if (_fused_distribute(&D, domain) == -1) return NULL;
+
+  if (_fused_update_boundary(&D, domain, ids, edges, boundary_index,
+                             types, params, python_tags,
+                             xvel_edge_values, yvel_edge_values,
+                             xvel_boundary_values, yvel_boundary_values) == -1) return NULL;
+
+  //------------------------------------------------
+  // Second euler step using the same timestep
+  //------------------------------------------------
+
+  if (_fused_compute_fluxes_and_forcing_terms(&D, domain, friction,
+                                              python_forcing_terms) == -1) return NULL;
+
+  if (_fused_update_conserved_quantities(&D, domain, timestep,
+                                         python_forcing_terms) == -1) return NULL;
+
+  // Combine initial and final values of conserved quantities
+  _saxpy_conserved_quantities(&D, 0.5, 0.5);
+
+  Py_RETURN_NONE;
+
+}// swde1_evolve_one_rk2_step
+
 //========================================================================
 // Method table for python module
 //========================================================================
@@ -2497,13 +3649,25 @@ static struct PyMethodDef MethodTable[] = {
   {"compute_flux_update_frequency", swde1_compute_flux_update_frequency, METH_VARARGS, "Print out"},
   {"protect",          swde1_protect, METH_VARARGS | METH_KEYWORDS, "Print out"},
   {"protect_new",      swde1_protect_new, METH_VARARGS | METH_KEYWORDS, "Print out"},
+  {"update_active_cells", swde1_update_active_cells, METH_VARARGS, "Print out"},
+  {"multirate_set_flux_updates", swde1_multirate_set_flux_updates, METH_VARARGS, "Print out"},
+  {"multirate_accumulate", swde1_multirate_accumulate, METH_VARARGS, "Print out"},
+  {"update_conserved_quantities", swde1_update_conserved_quantities, METH_VARARGS, "Print out"},
+  {"manning_friction", swde1_manning_friction, METH_VARARGS, "Print out"},
+  {"update_boundaries", swde1_update_boundaries, METH_VARARGS, "Print out"},
   {"evolve_one_euler_step", swde1_evolve_one_euler_step, METH_VARARGS | METH_KEYWORDS, "Print out"},
+  {"evolve_one_rk2_step", swde1_evolve_one_rk2_step, METH_VARARGS, "Print out"},
   {NULL, NULL, 0, NULL}
 };
 
 // Module initialisation
+#ifdef ANUGA_SINGLE_PRECISION
+void initswDE1_domain_single_ext(void){
+  Py_InitModule("swDE1_domain_single_ext", MethodTable);
+#else
 void initswDE1_domain_ext(void){
   Py_InitModule("swDE1_domain_ext", MethodTable);
+#endif
 
   import_array(); // Necessary for handling of NumPY structures
 }
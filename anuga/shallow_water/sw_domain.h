@@ -8,6 +8,17 @@
 #include "util_ext.h"
 
 
+// Type of the quantity arrays (float in the single precision build of the
+// DE algorithms, see Domain.set_precision). Arithmetic is done in double.
+#ifdef ANUGA_SINGLE_PRECISION
+typedef float anuga_float;
+#define ANUGA_FLOAT_TYPE NPY_FLOAT
+#else
+typedef double anuga_float;
+#define ANUGA_FLOAT_TYPE NPY_DOUBLE
+#endif
+
+
 // structures
 struct domain {
     // Changing these don't change the data in python object
@@ -35,6 +46,12 @@ struct domain {
     long max_flux_update_frequency;
     long ncol_riverwall_hydraulic_properties;
 
+    long omp_num_threads;
+    long use_edge_flux_loop;
+    long number_of_unique_edges;
+    long use_active_cells;
+    long number_of_always_active_cells;
+
     // Changing values in these arrays will change the values in the python object
     long*   neighbours;
     long*   neighbour_edges;
@@ -55,33 +72,44 @@ struct domain {
     double* centroid_coordinates;
 
     long*   number_of_boundaries;
-    double* stage_edge_values;
-    double* xmom_edge_values;
-    double* ymom_edge_values;
+    anuga_float* stage_edge_values;
+    anuga_float* xmom_edge_values;
+    anuga_float* ymom_edge_values;
     double* bed_edge_values;
     double* height_edge_values;
 
-    double* stage_centroid_values;
-    double* xmom_centroid_values;
-    double* ymom_centroid_values;
+    anuga_float* stage_centroid_values;
+    anuga_float* xmom_centroid_values;
+    anuga_float* ymom_centroid_values;
     double* bed_centroid_values;
     double* height_centroid_values;
 
-    double* stage_vertex_values;
-    double* xmom_vertex_values;
-    double* ymom_vertex_values;
+    anuga_float* stage_vertex_values;
+    anuga_float* xmom_vertex_values;
+    anuga_float* ymom_vertex_values;
     double* bed_vertex_values;
     double* height_vertex_values;
 
 
-    double* stage_boundary_values;
-    double* xmom_boundary_values;
-    double* ymom_boundary_values;
+    anuga_float* stage_boundary_values;
+    anuga_float* xmom_boundary_values;
+    anuga_float* ymom_boundary_values;
     double* bed_boundary_values;
+    double* height_boundary_values;
+
+    anuga_float* stage_centroid_backup_values;
+    anuga_float* xmom_centroid_backup_values;
+    anuga_float* ymom_centroid_backup_values;
+
+    double* friction_centroid_values;
 
-    double* stage_explicit_update;
-    double* xmom_explicit_update;
-    double* ymom_explicit_update;
+    anuga_float* stage_explicit_update;
+    anuga_float* xmom_explicit_update;
+    anuga_float* ymom_explicit_update;
+
+    anuga_float* stage_semi_implicit_update;
+    anuga_float* xmom_semi_implicit_update;
+    anuga_float* ymom_semi_implicit_update;
 
     long* flux_update_frequency;
     long* update_next_flux;
@@ -95,6 +123,27 @@ struct domain {
 
     long* allow_timestep_increase;
 
+    // Per domain replacements for the static variables of the flux kernel
+    long* flux_call_count;
+    double* flux_local_timestep;
+
+    // Table of unique edges
+    long*   edge_left_cells;
+    long*   edge_left_edges;
+    long*   edge_right_cells;
+    long*   edge_right_edges;
+    double* edge_normals;
+    double* edge_lengths;
+    long*   edge_index;
+    long*   edge_river_wall_ids;
+    double* edge_max_speed_work;
+
+    // Active (wet plus neighbouring) cells visited by the kernels
+    long*   active_cells;
+    long*   number_of_active_cells;
+    long*   active_cell_flags;
+    long*   always_active_cells;
+
     double* riverwall_elevation;
     long* riverwall_rowIndex;
     double* riverwall_hydraulic_properties;
@@ -169,6 +218,40 @@ void get_edge_data(struct edge *E, struct domain *D, int k, int i) {
 }
 
 
+// Data of the given array of a quantity, checking its type
+void* get_python_quantity_data(PyObject *quantities, char *name, char *array,
+                               int type_num) {
+    PyObject *Q;
+    PyArrayObject *A;
+    void *data;
+
+    Q = PyDict_GetItemString(quantities, name); // Borrowed Reference
+    if (!Q) {
+        PyErr_Format(PyExc_RuntimeError, "sw_domain.h: could not obtain quantity %s", name);
+        return NULL;
+    }
+
+    A = get_consecutive_array(Q, array); // New Reference
+    if (!A) {
+        return NULL;
+    }
+
+    if (A->descr->type_num != type_num) {
+        PyErr_Format(PyExc_TypeError,
+                     "sw_domain.h: %s of quantity %s do not have the precision of this extension",
+                     array, name);
+        Py_DECREF(A);
+        return NULL;
+    }
+
+    data = (void *) A->data;
+
+    Py_DECREF(A);
+
+    return data;
+}
+
+
 struct domain* get_python_domain(struct domain *D, PyObject *domain) {
     PyArrayObject
             *neighbours,
@@ -190,6 +273,21 @@ struct domain* get_python_domain(struct domain *D, PyObject *domain) {
             *update_next_flux,
             *update_extrapolation,
             *allow_timestep_increase,
+            *flux_call_count,
+            *flux_local_timestep,
+            *edge_left_cells,
+            *edge_left_edges,
+            *edge_right_cells,
+            *edge_right_edges,
+            *edge_normals,
+            *edge_lengths,
+            *edge_index,
+            *edge_river_wall_ids,
+            *edge_max_speed_work,
+            *active_cells,
+            *number_of_active_cells,
+            *active_cell_flags,
+            *always_active_cells,
             *edge_timestep,
             *edge_flux_work,
             *pressuregrad_work,
@@ -226,6 +324,11 @@ struct domain* get_python_domain(struct domain *D, PyObject *domain) {
 
     D->max_flux_update_frequency = get_python_integer(domain,"max_flux_update_frequency");
 
+    D->omp_num_threads = get_python_integer(domain,"omp_num_threads");
+    D->use_edge_flux_loop = get_python_integer(domain,"use_edge_flux_loop");
+    D->number_of_unique_edges = get_python_integer(domain,"number_of_unique_edges");
+    D->use_active_cells = get_python_integer(domain,"use_active_cells");
+
     neighbours = get_consecutive_array(domain, "neighbours");
     D->neighbours = (long *) neighbours->data;
 
@@ -285,6 +388,52 @@ struct domain* get_python_domain(struct domain *D, PyObject *domain) {
     allow_timestep_increase = get_consecutive_array(domain, "allow_timestep_increase");
     D->allow_timestep_increase = (long*) allow_timestep_increase->data;
 
+    flux_call_count = get_consecutive_array(domain, "flux_call_count");
+    D->flux_call_count = (long*) flux_call_count->data;
+
+    flux_local_timestep = get_consecutive_array(domain, "flux_local_timestep");
+    D->flux_local_timestep = (double*) flux_local_timestep->data;
+
+    edge_left_cells = get_consecutive_array(domain, "edge_left_cells");
+    D->edge_left_cells = (long*) edge_left_cells->data;
+
+    edge_left_edges = get_consecutive_array(domain, "edge_left_edges");
+    D->edge_left_edges = (long*) edge_left_edges->data;
+
+    edge_right_cells = get_consecutive_array(domain, "edge_right_cells");
+    D->edge_right_cells = (long*) edge_right_cells->data;
+
+    edge_right_edges = get_consecutive_array(domain, "edge_right_edges");
+    D->edge_right_edges = (long*) edge_right_edges->data;
+
+    edge_normals = get_consecutive_array(domain, "edge_normals");
+    D->edge_normals = (double*) edge_normals->data;
+
+    edge_lengths = get_consecutive_array(domain, "edge_lengths");
+    D->edge_lengths = (double*) edge_lengths->data;
+
+    edge_index = get_consecutive_array(domain, "edge_index");
+    D->edge_index = (long*) edge_index->data;
+
+    edge_river_wall_ids = get_consecutive_array(domain, "edge_river_wall_ids");
+    D->edge_river_wall_ids = (long*) edge_river_wall_ids->data;
+
+    edge_max_speed_work = get_consecutive_array(domain, "edge_max_speed_work");
+    D->edge_max_speed_work = (double*) edge_max_speed_work->data;
+
+    active_cells = get_consecutive_array(domain, "active_cells");
+    D->active_cells = (long*) active_cells->data;
+
+    number_of_active_cells = get_consecutive_array(domain, "number_of_active_cells");
+    D->number_of_active_cells = (long*) number_of_active_cells->data;
+
+    active_cell_flags = get_consecutive_array(domain, "active_cell_flags");
+    D->active_cell_flags = (long*) active_cell_flags->data;
+
+    always_active_cells = get_consecutive_array(domain, "always_active_cells");
+    D->always_active_cells = (long*) always_active_cells->data;
+    D->number_of_always_active_cells = always_active_cells->dimensions[0];
+
     edge_timestep = get_consecutive_array(domain, "edge_timestep");
     D->edge_timestep = (double*) edge_timestep->data;
 
@@ -305,32 +454,43 @@ struct domain* get_python_domain(struct domain *D, PyObject *domain) {
 
     quantities = get_python_object(domain, "quantities");
 
-    D->stage_edge_values     = get_python_array_data_from_dict(quantities, "stage",     "edge_values");
-    D->xmom_edge_values      = get_python_array_data_from_dict(quantities, "xmomentum", "edge_values");
-    D->ymom_edge_values      = get_python_array_data_from_dict(quantities, "ymomentum", "edge_values");
-    D->bed_edge_values       = get_python_array_data_from_dict(quantities, "elevation", "edge_values");
-    D->height_edge_values    = get_python_array_data_from_dict(quantities, "height", "edge_values");
+    D->stage_edge_values     = get_python_quantity_data(quantities, "stage",     "edge_values", ANUGA_FLOAT_TYPE);
+    D->xmom_edge_values      = get_python_quantity_data(quantities, "xmomentum", "edge_values", ANUGA_FLOAT_TYPE);
+    D->ymom_edge_values      = get_python_quantity_data(quantities, "ymomentum", "edge_values", ANUGA_FLOAT_TYPE);
+    D->bed_edge_values       = get_python_quantity_data(quantities, "elevation", "edge_values", NPY_DOUBLE);
+    D->height_edge_values    = get_python_quantity_data(quantities, "height", "edge_values", NPY_DOUBLE);
+
+    D->stage_centroid_values     = get_python_quantity_data(quantities, "stage",     "centroid_values", ANUGA_FLOAT_TYPE);
+    D->xmom_centroid_values      = get_python_quantity_data(quantities, "xmomentum", "centroid_values", ANUGA_FLOAT_TYPE);
+    D->ymom_centroid_values      = get_python_quantity_data(quantities, "ymomentum", "centroid_values", ANUGA_FLOAT_TYPE);
+    D->bed_centroid_values       = get_python_quantity_data(quantities, "elevation", "centroid_values", NPY_DOUBLE);
+    D->height_centroid_values    = get_python_quantity_data(quantities, "height", "centroid_values", NPY_DOUBLE);
+
+    D->stage_vertex_values     = get_python_quantity_data(quantities, "stage",     "vertex_values", ANUGA_FLOAT_TYPE);
+    D->xmom_vertex_values      = get_python_quantity_data(quantities, "xmomentum", "vertex_values", ANUGA_FLOAT_TYPE);
+    D->ymom_vertex_values      = get_python_quantity_data(quantities, "ymomentum", "vertex_values", ANUGA_FLOAT_TYPE);
+    D->bed_vertex_values       = get_python_quantity_data(quantities, "elevation", "vertex_values", NPY_DOUBLE);
+    D->height_vertex_values       = get_python_quantity_data(quantities, "height", "vertex_values", NPY_DOUBLE);
+
+    D->stage_boundary_values = get_python_quantity_data(quantities, "stage",     "boundary_values", ANUGA_FLOAT_TYPE);
+    D->xmom_boundary_values  = get_python_quantity_data(quantities, "xmomentum", "boundary_values", ANUGA_FLOAT_TYPE);
+    D->ymom_boundary_values  = get_python_quantity_data(quantities, "ymomentum", "boundary_values", ANUGA_FLOAT_TYPE);
+    D->bed_boundary_values   = get_python_quantity_data(quantities, "elevation", "boundary_values", NPY_DOUBLE);
+    D->height_boundary_values = get_python_quantity_data(quantities, "height",   "boundary_values", NPY_DOUBLE);
 
-    D->stage_centroid_values     = get_python_array_data_from_dict(quantities, "stage",     "centroid_values");
-    D->xmom_centroid_values      = get_python_array_data_from_dict(quantities, "xmomentum", "centroid_values");
-    D->ymom_centroid_values      = get_python_array_data_from_dict(quantities, "ymomentum", "centroid_values");
-    D->bed_centroid_values       = get_python_array_data_from_dict(quantities, "elevation", "centroid_values");
-    D->height_centroid_values    = get_python_array_data_from_dict(quantities, "height", "centroid_values");
+    D->stage_centroid_backup_values = get_python_quantity_data(quantities, "stage",     "centroid_backup_values", ANUGA_FLOAT_TYPE);
+    D->xmom_centroid_backup_values  = get_python_quantity_data(quantities, "xmomentum", "centroid_backup_values", ANUGA_FLOAT_TYPE);
+    D->ymom_centroid_backup_values  = get_python_quantity_data(quantities, "ymomentum", "centroid_backup_values", ANUGA_FLOAT_TYPE);
 
-    D->stage_vertex_values     = get_python_array_data_from_dict(quantities, "stage",     "vertex_values");
-    D->xmom_vertex_values      = get_python_array_data_from_dict(quantities, "xmomentum", "vertex_values");
-    D->ymom_vertex_values      = get_python_array_data_from_dict(quantities, "ymomentum", "vertex_values");
-    D->bed_vertex_values       = get_python_array_data_from_dict(quantities, "elevation", "vertex_values");
-    D->height_vertex_values       = get_python_array_data_from_dict(quantities, "height", "vertex_values");
+    D->friction_centroid_values = get_python_quantity_data(quantities, "friction", "centroid_values", NPY_DOUBLE);
 
-    D->stage_boundary_values = get_python_array_data_from_dict(quantities, "stage",     "boundary_values");
-    D->xmom_boundary_values  = get_python_array_data_from_dict(quantities, "xmomentum", "boundary_values");
-    D->ymom_boundary_values  = get_python_array_data_from_dict(quantities, "ymomentum", "boundary_values");
-    D->bed_boundary_values   = get_python_array_data_from_dict(quantities, "elevation", "boundary_values");
+    D->stage_explicit_update = get_python_quantity_data(quantities, "stage",     "explicit_update", ANUGA_FLOAT_TYPE);
+    D->xmom_explicit_update  = get_python_quantity_data(quantities, "xmomentum", "explicit_update", ANUGA_FLOAT_TYPE);
+    D->ymom_explicit_update  = get_python_quantity_data(quantities, "ymomentum", "explicit_update", ANUGA_FLOAT_TYPE);
 
-    D->stage_explicit_update = get_python_array_data_from_dict(quantities, "stage",     "explicit_update");
-    D->xmom_explicit_update  = get_python_array_data_from_dict(quantities, "xmomentum", "explicit_update");
-    D->ymom_explicit_update  = get_python_array_data_from_dict(quantities, "ymomentum", "explicit_update");
+    D->stage_semi_implicit_update = get_python_quantity_data(quantities, "stage",     "semi_implicit_update", ANUGA_FLOAT_TYPE);
+    D->xmom_semi_implicit_update  = get_python_quantity_data(quantities, "xmomentum", "semi_implicit_update", ANUGA_FLOAT_TYPE);
+    D->ymom_semi_implicit_update  = get_python_quantity_data(quantities, "ymomentum", "semi_implicit_update", ANUGA_FLOAT_TYPE);
 
 
     riverwallData = get_python_object(domain,"riverwallData");
@@ -374,6 +534,25 @@ struct domain* get_python_domain(struct domain *D, PyObject *domain) {
     Py_DECREF(y_centroid_work);
     Py_DECREF(boundary_flux_sum);
     Py_DECREF(allow_timestep_increase);
+    Py_DECREF(flux_call_count);
+    Py_DECREF(flux_local_timestep);
+    Py_DECREF(edge_left_cells);
+    Py_DECREF(edge_left_edges);
+    Py_DECREF(edge_right_cells);
+    Py_DECREF(edge_right_edges);
+    Py_DECREF(edge_normals);
+    Py_DECREF(edge_lengths);
+    Py_DECREF(edge_index);
+    Py_DECREF(edge_river_wall_ids);
+    Py_DECREF(edge_max_speed_work);
+    Py_DECREF(active_cells);
+    Py_DECREF(number_of_active_cells);
+    Py_DECREF(active_cell_flags);
+    Py_DECREF(always_active_cells);
+
+    if (PyErr_Occurred()) {
+        return NULL;
+    }
 
     return D;
 }
@@ -102,6 +102,495 @@ class Test_DE1_domain(unittest.TestCase):
 
         assert num.all(vv<2.0e-02)
 
+    def create_riverwall_domain(self, precision='double'):
+        """ Create a small DE1 domain with an inflow boundary and a
+        riverwall
+        """
+
+        points, vertices, boundary = anuga.rectangular_cross(20,20, len1=1., len2=1.)
+
+        domain=Domain(points,vertices,boundary)
+        domain.set_flow_algorithm('DE1')
+        domain.set_store(False)
+        domain.set_precision(precision)
+
+        def topography(x,y):
+            return -x/2.0 +0.05*num.sin((x+y)*50.0)
+
+        def stagefun(x,y):
+            return -0.2 + 0.3*(x<0.3)
+
+        domain.set_quantity('elevation',topography)
+        domain.set_quantity('friction',0.03)
+        domain.set_quantity('stage', stagefun)
+
+        riverWall={'wall': [[0.5, 0.0, -0.1], [0.5, 1.0, -0.1]]}
+        domain.riverwallData.create_riverwalls(riverWall, verbose=False)
+
+        Br=anuga.Reflective_boundary(domain)
+        Bd=anuga.Dirichlet_boundary([0.1, 0., 0.])
+        domain.set_boundary({'left': Bd, 'right': Br, 'top': Br, 'bottom':Br})
+
+        return domain
+
+    def check_same_solution(self, domain1, domain2):
+
+        for t in domain1.evolve(yieldstep=0.1,finaltime=0.3):
+            pass
+
+        for t in domain2.evolve(yieldstep=0.1,finaltime=0.3):
+            pass
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            q1 = domain1.quantities[name].centroid_values
+            q2 = domain2.quantities[name].centroid_values
+            assert num.allclose(q1, q2)
+
+        assert num.allclose(domain1.max_speed, domain2.max_speed)
+        assert num.allclose(domain1.get_boundary_flux_integral(),
+                            domain2.get_boundary_flux_integral())
+
+    def test_omp_num_threads(self):
+        """ Check that the multithreaded flux computation gives the
+        same answer as the serial one (including riverwall edges)
+        """
+
+        domain1 = self.create_riverwall_domain()
+        assert domain1.get_omp_num_threads() == 1
+
+        domain4 = self.create_riverwall_domain()
+        domain4.set_omp_num_threads(4)
+        assert domain4.get_omp_num_threads() == 4
+
+        self.check_same_solution(domain1, domain4)
+
+    def test_edge_flux_loop(self):
+        """ Check that computing the fluxes with the loop over unique
+        edges gives the same answer as the loop over triangles
+        """
+
+        domain1 = self.create_riverwall_domain()
+
+        domain2 = self.create_riverwall_domain()
+        domain2.set_use_edge_flux_loop(True)
+        domain2.set_omp_num_threads(3)
+
+        # Riverwall ids are given for the unique edges
+        assert num.sum(domain2.edge_river_wall_ids >= 0) == \
+               len(domain2.riverwallData.riverwall_elevation)/2
+
+        self.check_same_solution(domain1, domain2)
+
+    def test_active_cells(self):
+        """ Check that restricting the kernels to the active (wet and
+        neighbouring) cells gives the same answer as visiting all cells
+        """
+
+        domain1 = self.create_riverwall_domain()
+
+        domain2 = self.create_riverwall_domain()
+        domain2.set_use_active_cells(True)
+
+        self.check_same_solution(domain1, domain2)
+
+        def create_dry_domain(use_active_cells):
+            points, vertices, boundary = anuga.rectangular_cross(30, 30,
+                                                    len1=10., len2=10.)
+
+            domain = Domain(points, vertices, boundary)
+            domain.set_flow_algorithm('DE1')
+            domain.set_store(False)
+
+            def topography(x, y):
+                return -x/20.0 + 0.05*num.sin((x+y)*5.0)
+
+            def stagefun(x, y):
+                return num.where((x-2.0)**2 + (y-5.0)**2 < 1.0, 0.5, -10.0)
+
+            domain.set_quantity('elevation', topography)
+            domain.set_quantity('friction', 0.03)
+            domain.set_quantity('stage', stagefun)
+
+            Br = anuga.Reflective_boundary(domain)
+            domain.set_boundary({'left': Br, 'right': Br,
+                                 'top': Br, 'bottom': Br})
+
+            # Rain on a dry region
+            anuga.Rate_operator(domain, rate=0.01,
+                                polygon=[[6,6], [8,6], [8,8], [6,8]])
+
+            # and as a forcing term
+            domain.forcing_terms.append(anuga.Rainfall(domain, rate=0.01,
+                                        polygon=[[6,2], [8,2], [8,4], [6,4]]))
+
+            domain.set_use_active_cells(use_active_cells)
+
+            return domain
+
+        domain1 = create_dry_domain(False)
+        domain2 = create_dry_domain(True)
+
+        for t in domain2.evolve(yieldstep=0.1, finaltime=0.3):
+            assert domain2.get_number_of_active_cells() < len(domain2)/2
+
+        for t in domain1.evolve(yieldstep=0.1, finaltime=0.3):
+            assert domain1.get_number_of_active_cells() == len(domain1)
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            q1 = domain1.quantities[name].centroid_values
+            q2 = domain2.quantities[name].centroid_values
+            assert num.allclose(q1, q2)
+
+            q1 = domain1.quantities[name].vertex_values
+            q2 = domain2.quantities[name].vertex_values
+            assert num.allclose(q1, q2)
+
+    def test_fused_rk2_step(self):
+        """ Check that the rk2 step in a single C call gives the same
+        answer as the python rk2 step, including boundaries and forcing
+        terms which are called back in python
+        """
+
+        domain1 = self.create_riverwall_domain()
+
+        domain2 = self.create_riverwall_domain()
+        domain2.set_use_fused_rk2_step(True)
+
+        self.check_same_solution(domain1, domain2)
+
+        # The boundaries and friction are done in C
+        ids, edges, boundary_index, types, params, c_boundaries, \
+            python_tags = domain2._get_boundary_engine_data()
+        assert len(ids) == domain2.boundary_length
+        assert python_tags == []
+        friction, python_forcing_terms = domain2._get_fused_step_data()
+        assert friction
+        assert not python_forcing_terms
+
+        from anuga.shallow_water.forcing import Wind_stress
+
+        # The fused step applies the boundaries as update_boundary does,
+        # user defined ones are called back in python
+        class My_boundary(anuga.Transmissive_boundary):
+            pass
+
+        domains = []
+        for fused in [False, True]:
+            domain = self.create_riverwall_domain()
+            Bt = anuga.Time_boundary(domain,
+                                     function=lambda t: [0.1 + 0.1*t, 0.0, 0.0])
+            domain.set_boundary({'left': Bt, 'right': My_boundary(domain)})
+            domain.forcing_terms.append(Wind_stress(s=10.0, phi=45.0))
+            domain.set_use_fused_rk2_step(fused)
+            domains.append(domain)
+
+        self.check_same_solution(*domains)
+
+        assert domains[1]._get_boundary_engine_data()[-1] == ['right']
+        assert domains[1]._get_fused_step_data()[1]
+
+        for name in domains[0].quantities:
+            q1 = domains[0].quantities[name].boundary_values
+            q2 = domains[1].quantities[name].boundary_values
+            assert num.allclose(q1, q2), name
+
+    def test_c_boundaries(self):
+        """ Check that the built-in boundaries applied in C give the same
+        boundary values as their python implementations
+        """
+
+        from anuga.shallow_water.boundaries import Dirichlet_discharge_boundary
+        from anuga.shallow_water.boundaries import Inflow_boundary
+
+        def create_domain(use_c_boundaries):
+            domain = rectangular_cross_domain(6, 6, len1=3., len2=2.)
+            domain.set_flow_algorithm('DE1')
+            domain.set_store(False)
+            domain.set_use_c_boundaries(use_c_boundaries)
+
+            domain.set_quantity('elevation', lambda x, y: -x/10.0 + 0.1*y)
+            domain.set_quantity('stage', lambda x, y: 0.1*num.sin(x + 2*y))
+            domain.set_quantity('xmomentum', lambda x, y: 0.2*x - 0.1*y)
+            domain.set_quantity('ymomentum', lambda x, y: 0.05 + 0.1*x*y)
+            domain.set_time(2.0)
+            domain.distribute_to_vertices_and_edges()
+
+            return domain
+
+        boundaries = [
+            lambda domain: anuga.Reflective_boundary(domain),
+            lambda domain: anuga.Transmissive_boundary(domain),
+            lambda domain: anuga.Dirichlet_boundary([0.2, 0.1, -0.1]),
+            lambda domain: anuga.Time_boundary(domain,
+                                   function=lambda t: [0.1*t, 0.2, -0.3]),
+            lambda domain: anuga.Time_stage_zero_momentum_boundary(domain,
+                                   function=lambda t: 0.05*t),
+            lambda domain: anuga.Transmissive_stage_zero_momentum_boundary(domain),
+            lambda domain: anuga.Transmissive_momentum_set_stage_boundary(domain,
+                                   function=lambda t: 0.3*t),
+            lambda domain: anuga.Transmissive_n_momentum_zero_t_momentum_set_stage_boundary(domain,
+                                   function=lambda t: [0.4*t, 0.0, 0.0]),
+            lambda domain: Dirichlet_discharge_boundary(domain, 0.3, 0.2),
+            lambda domain: Inflow_boundary(domain, rate=0.5)]
+
+        names = ['stage', 'xmomentum', 'ymomentum']
+
+        for create_boundary in boundaries:
+            domains = []
+            for use_c_boundaries in [False, True]:
+                domain = create_domain(use_c_boundaries)
+                B = create_boundary(domain)
+                Br = anuga.Reflective_boundary(domain)
+                domain.set_boundary({'left': B, 'right': Br,
+                                     'top': Br, 'bottom': B})
+                domain.update_boundary()
+                domains.append(domain)
+
+            assert domains[1]._get_boundary_engine_data()[-1] == []
+
+            if B.__class__ is anuga.Reflective_boundary:
+                names = names + ['elevation', 'height',
+                                 'xvelocity', 'yvelocity']
+
+            for name in names:
+                q1 = domains[0].quantities[name].boundary_values
+                q2 = domains[1].quantities[name].boundary_values
+                assert num.allclose(q1, q2), (B, name)
+
+        # User defined boundaries, including subclasses of the built-in
+        # ones, are evaluated in python
+        class My_boundary(anuga.Dirichlet_boundary):
+            def evaluate(self, vol_id=None, edge_id=None):
+                return self.dirichlet_values
+
+        domain = create_domain(True)
+        Bd = My_boundary([0.2, 0.1, -0.1])
+        Br = anuga.Reflective_boundary(domain)
+        domain.set_boundary({'left': Bd, 'right': Br, 'top': Br, 'bottom': Br})
+        domain.update_boundary()
+
+        ids, edges, boundary_index, types, params, c_boundaries, \
+            python_tags = domain._get_boundary_engine_data()
+        assert python_tags == ['left']
+        assert c_boundaries == [Br]
+        assert len(ids) == domain.boundary_length - 6
+
+        ids = domain.tag_boundary_cells['left']
+        assert num.allclose(domain.quantities['stage'].boundary_values[ids], 0.2)
+
+        domain1 = self.create_riverwall_domain()
+        domain1.set_use_c_boundaries(False)
+
+        domain2 = self.create_riverwall_domain()
+        domain2.set_use_c_boundaries(True)
+
+        self.check_same_solution(domain1, domain2)
+
+    def test_single_precision(self):
+        """ Check that the single precision build of the DE algorithms
+        conserves mass and is close to the double precision solution
+        """
+
+        domain1 = self.create_riverwall_domain()
+        assert domain1.get_precision() == 'double'
+
+        domain2 = self.create_riverwall_domain('single')
+        assert domain2.get_precision() == 'single'
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            Q = domain2.quantities[name]
+            assert Q.get_precision() == num.float32
+            assert Q.vertex_values.dtype == num.float32
+            assert Q.edge_values.dtype == num.float32
+            assert Q.explicit_update.dtype == num.float32
+        assert domain2.quantities['elevation'].get_precision() == num.float64
+        assert domain2.quantities['height'].get_precision() == num.float64
+
+        initial_volume = domain1.get_water_volume()
+
+        for t in domain1.evolve(yieldstep=0.1,finaltime=0.3):
+            pass
+
+        for t in domain2.evolve(yieldstep=0.1,finaltime=0.3):
+            pass
+
+        # Same inflow of mass
+        volume_change1 = domain1.get_water_volume() - initial_volume
+        volume_change2 = domain2.get_water_volume() - initial_volume
+        assert num.allclose(volume_change1, volume_change2, rtol=1.0e-4)
+        assert num.allclose(domain1.get_boundary_flux_integral(),
+                            domain2.get_boundary_flux_integral(), rtol=1.0e-4)
+
+        areas = domain1.areas
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            q1 = domain1.quantities[name].centroid_values
+            q2 = domain2.quantities[name].centroid_values
+            assert q2.dtype == num.float32
+            assert num.sum(num.abs(q1-q2)*areas) < 1.0e-3*num.sum(num.abs(q1)*areas)
+
+        # The rk2 step in C gives the same answer in single precision
+        domain3 = self.create_riverwall_domain('single')
+        domain3.set_use_fused_rk2_step(True)
+        for t in domain3.evolve(yieldstep=0.1,finaltime=0.3):
+            pass
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            q2 = domain2.quantities[name].centroid_values
+            q3 = domain3.quantities[name].centroid_values
+            assert num.allclose(q2, q3)
+
+        # Precision must be set before the boundaries
+        try:
+            domain1.set_precision('single')
+        except Exception:
+            pass
+        else:
+            msg = 'Setting the precision after the boundaries should raise an error'
+            raise Exception(msg)
+
+    def test_multirate_timestepping(self):
+        """ Check that multi-rate timestepping on a graded mesh is
+        conservative, stops at the yieldsteps and is close to the
+        global timestepping solution
+        """
+
+        def create_graded_domain(nlevels):
+            bounding_polygon = [[0, 0], [10, 0], [10, 5], [0, 5]]
+            fine_region = [[4, 2], [6, 2], [6, 3], [4, 3]]
+            anuga.create_mesh_from_regions(bounding_polygon,
+                            boundary_tags={'bottom': [0], 'right': [1],
+                                           'top': [2], 'left': [3]},
+                            maximum_triangle_area=0.1,
+                            interior_regions=[[fine_region, 0.005]],
+                            filename='multirate.msh')
+
+            domain = anuga.create_domain_from_file('multirate.msh')
+            domain.set_store(False)
+
+            def topography(x, y):
+                return -x/10.0
+
+            def stagefun(x, y):
+                return num.where(x < 3.0, 0.3, -x/10.0)
+
+            domain.set_quantity('elevation', topography)
+            domain.set_quantity('friction', 0.03)
+            domain.set_quantity('stage', stagefun)
+
+            Br = anuga.Reflective_boundary(domain)
+            Bd = anuga.Dirichlet_boundary([0.35, 0., 0.])
+            domain.set_boundary({'left': Bd, 'right': Br,
+                                 'top': Br, 'bottom': Br})
+
+            if nlevels > 0:
+                domain.set_multirate_timestepping(nlevels)
+
+            return domain
+
+        domain1 = create_graded_domain(0)
+        domain2 = create_graded_domain(3)
+        assert domain2.get_multirate_levels() == 3
+
+        initial_volume = domain2.get_water_volume()
+
+        times = []
+        for t in domain2.evolve(yieldstep=0.25, finaltime=1.0):
+            times.append(domain2.get_time())
+        assert num.allclose(times, [0.0, 0.25, 0.5, 0.75, 1.0])
+
+        # Triangles are updated at several rates
+        assert num.max(domain2.multirate_cell_levels) > 0
+
+        for t in domain1.evolve(yieldstep=0.25, finaltime=1.0):
+            pass
+
+        # Fewer (larger) timesteps
+        assert domain2.number_of_steps < domain1.number_of_steps
+
+        # Mass only enters through the boundary
+        volume_change = domain2.get_water_volume() - initial_volume
+        assert volume_change > 0.0
+        assert num.allclose(volume_change,
+                            domain2.get_boundary_flux_integral())
+
+        # The coarse triangles take larger timesteps, so the solutions
+        # are close in the L1 norm rather than identical
+        areas = domain1.areas
+        for name in ['stage', 'xmomentum']:
+            q1 = domain1.quantities[name].centroid_values
+            q2 = domain2.quantities[name].centroid_values
+            assert num.sum(num.abs(q1-q2)*areas) < 0.05*num.sum(num.abs(q1)*areas)
+
+        # Only for the euler DE algorithms
+        domain3 = create_graded_domain(0)
+        domain3.set_flow_algorithm('DE1')
+        try:
+            domain3.set_multirate_timestepping(2)
+        except Exception:
+            pass
+        else:
+            msg = 'Multi-rate timestepping with rk2 should raise an error'
+            raise Exception(msg)
+
+        os.remove('multirate.msh')
+
+    def test_threaded_protect_and_extrapolate(self):
+        """ Check the multithreaded protection and extrapolation steps
+        give the same answer as the serial ones, and that the protection
+        mass error does not depend on the number of threads
+        """
+
+        from anuga.shallow_water.swDE1_domain_ext import protect_new
+
+        def create_domain(omp_num_threads):
+            points, vertices, boundary = anuga.rectangular_cross(20,20, len1=1., len2=1.)
+
+            domain=Domain(points,vertices,boundary)
+            domain.set_flow_algorithm('DE1')
+            domain.set_store(False)
+            domain.set_omp_num_threads(omp_num_threads)
+
+            def topography(x,y):
+                return -x/2.0 +0.05*num.sin((x+y)*50.0)
+
+            def stagefun(x,y):
+                return -0.25 + 0.1*num.cos(x*30.0)
+
+            domain.set_quantity('elevation',topography, location='centroids')
+            domain.set_quantity('stage', stagefun, location='centroids')
+            domain.set_quantity('xmomentum', 0.01, location='centroids')
+
+            Br=anuga.Reflective_boundary(domain)
+            domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom':Br})
+
+            return domain
+
+        domain1 = create_domain(1)
+        domain4 = create_domain(4)
+
+        # Some cells have stage below the bed
+        w = domain1.quantities['stage'].centroid_values
+        z = domain1.quantities['elevation'].centroid_values
+        expected_mass_error = num.sum(num.maximum(z-w, 0.)*domain1.areas)
+        assert expected_mass_error > 0.
+        assert domain1.number_of_elements > 1024
+
+        mass_error1 = protect_new(domain1)
+        mass_error4 = protect_new(domain4)
+
+        assert mass_error1 == mass_error4
+        assert num.allclose(mass_error1, expected_mass_error)
+
+        domain1.distribute_to_vertices_and_edges()
+        domain4.distribute_to_vertices_and_edges()
+
+        for name in ['stage', 'height', 'xmomentum', 'ymomentum', 'elevation']:
+            q1 = domain1.quantities[name]
+            q4 = domain4.quantities[name]
+            assert num.all(q1.centroid_values == q4.centroid_values)
+            assert num.all(q1.edge_values == q4.edge_values)
+            assert num.all(q1.vertex_values == q4.vertex_values)
+
 
             
 if __name__ == "__main__":
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import numpy as num
+
+import anuga
+from anuga.shallow_water.checkpoint import load_checkpoint_file
+from anuga.shallow_water.checkpoint import get_domain_state, set_domain_state
+
+verbose = False
+
+
+class Test_checkpoint(unittest.TestCase):
+
+    def setUp(self):
+
+        self.checkpoint_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.checkpoint_dir)
+
+
+    def create_domain(self, rate_operator=False):
+
+        domain = anuga.rectangular_cross_domain(20, 10, len1=20.0, len2=10.0)
+        domain.set_name('checkpoint')
+        domain.set_store(False)
+
+        domain.set_quantity('elevation', lambda x, y: -x/20.0)
+        domain.set_quantity('stage', lambda x, y: num.where(x < 5.0, 0.5, -x/20.0))
+        domain.set_quantity('friction', 0.02)
+
+        Br = anuga.Reflective_boundary(domain)
+        domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+        # Rate_operator can only be pickled with dill
+        if rate_operator:
+            anuga.Rate_operator(domain, rate=0.01, center=(15.0, 5.0), radius=2.0)
+
+        return domain
+
+
+    def run_checkpoint(self, checkpoint_format, checkpoint_background=True):
+
+        # Uninterrupted run
+        domain = self.create_domain()
+        for t in domain.evolve(yieldstep=0.5, finaltime=3.0):
+            pass
+
+        # Run to 2.0 with checkpoints, then restart from the last one
+        domain1 = self.create_domain()
+        domain1.set_checkpointing(checkpoint_dir=self.checkpoint_dir,
+                                  checkpoint_step=1,
+                                  checkpoint_format=checkpoint_format,
+                                  checkpoint_background=checkpoint_background)
+        for t in domain1.evolve(yieldstep=0.5, finaltime=2.0):
+            pass
+
+        domain2 = load_checkpoint_file(domain_name='checkpoint',
+                                       checkpoint_dir=self.checkpoint_dir)
+
+        assert domain2.get_time() == 2.0
+        assert domain2.yieldstep_id == domain1.yieldstep_id
+        for name in domain1.quantities:
+            if domain1.quantities[name].get_role() == 'diagnostic':
+                continue
+            assert num.array_equal(domain2.quantities[name].centroid_values,
+                                   domain1.quantities[name].centroid_values)
+
+        for t in domain2.evolve(yieldstep=0.5, finaltime=3.0):
+            pass
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            assert num.array_equal(domain2.quantities[name].centroid_values,
+                                   domain.quantities[name].centroid_values)
+
+        return os.listdir(self.checkpoint_dir)
+
+
+    def test_checkpoint_pickle(self):
+
+        filenames = self.run_checkpoint('pickle')
+
+        assert 'checkpoint_2.0.pickle' in filenames
+
+
+    def test_checkpoint_arrays(self):
+
+        filenames = self.run_checkpoint('arrays')
+
+        if verbose:
+            print sorted(filenames)
+
+        # The domain is stored once, the checkpoints only hold the state
+        assert 'checkpoint.checkpoint' in filenames
+        assert 'checkpoint_2.0.state' in filenames
+        assert len([f for f in filenames if f.endswith('.pickle')]) == 0
+        assert len([f for f in filenames if f.endswith('.tmp')]) == 0
+
+
+    def test_checkpoint_arrays_foreground(self):
+
+        filenames = self.run_checkpoint('arrays', checkpoint_background=False)
+
+        assert 'checkpoint_2.0.state' in filenames
+
+
+    def test_domain_state(self):
+
+        domain = self.create_domain(rate_operator=True)
+        for t in domain.evolve(yieldstep=0.5, finaltime=1.0):
+            pass
+
+        state = get_domain_state(domain)
+        stage = domain.quantities['stage'].centroid_values.copy()
+        operator = domain.fractional_step_operators[0]
+
+        for t in domain.evolve(yieldstep=0.5, finaltime=2.0):
+            pass
+
+        set_domain_state(domain, state)
+
+        assert domain.get_time() == 1.0
+        assert num.allclose(domain.quantities['stage'].centroid_values, stage)
+        # The state is copied, the arrays shared with operators are kept
+        assert domain.fractional_step_operators[0] is operator
+        assert operator.stage_c is domain.quantities['stage'].centroid_values
+
+
+    def test_domain_state_quantities(self):
+
+        domain = self.create_domain()
+        domain.set_datadir(self.checkpoint_dir)
+        domain.set_store(True)
+        for t in domain.evolve(yieldstep=0.5, finaltime=1.0):
+            pass
+
+        # Static quantities are in the pickled domain, diagnostic ones
+        # are rebuilt
+        state = get_domain_state(domain)
+        assert set(state['quantities']) == set(['stage', 'xmomentum', 'ymomentum'])
+
+        filename = domain.writer.filename
+        domain.set_name('renamed')
+        domain.writer.filename = 'renamed.sww'
+        domain.quantities['height'].centroid_values[:] = -1.0
+
+        set_domain_state(domain, state)
+
+        assert domain.get_name() == 'checkpoint'
+        assert domain.writer.filename == filename
+        stage = domain.quantities['stage'].centroid_values
+        elevation = domain.quantities['elevation'].centroid_values
+        assert num.allclose(domain.quantities['height'].centroid_values,
+                            num.maximum(stage - elevation, 0.0))
+
+        # Unless an operator may change them
+        anuga.Set_elevation_operator(domain, elevation=-1.0, indices=[0, 1])
+        state = get_domain_state(domain)
+        assert 'elevation' in state['quantities']
+        assert state['quantities']['elevation'][1] is not None
+        assert 'friction' not in state['quantities']
+
+
+# =========================================================================
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_checkpoint, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
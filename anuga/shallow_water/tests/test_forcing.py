@@ -2027,6 +2027,125 @@ class Test_Forcing(unittest.TestCase):
         os.remove(field_sts_filename+'.sts')
         os.remove(field_sts_filename+'.sww')
 
+    def test_gridded_met_forcing(self):
+        from anuga.config import rho_a, rho_w, eta_w
+
+        cellsize = 25
+        nrows=10; ncols = 12;
+        refzone=50
+        xllcorner=366000;yllcorner=6369500;
+        number_of_timesteps = 10
+        timestep=1.
+
+        points, vertices, boundary =rectangular(6,5,
+                                                len1=cellsize*(ncols-1),
+                                                len2=cellsize*(nrows-1),
+                                                origin=(xllcorner,yllcorner))
+
+        # Fields linear in space and time are reproduced exactly
+        field_sts_filename = 'met_field'
+        self.write_wind_pressure_field_sts(field_sts_filename,
+                                      nrows=nrows,
+                                      ncols=ncols,
+                                      cellsize=cellsize,
+                                      origin=(xllcorner,yllcorner),
+                                      refzone=50,
+                                      timestep=timestep,
+                                      number_of_timesteps=number_of_timesteps,
+                                      speed=spatial_linear_varying_speed,
+                                      angle=lambda t,x,y: 135.0 + 0*x,
+                                      pressure=spatial_linear_varying_pressure)
+
+        domains = []
+        for i in range(2):
+            domain = Domain(points, vertices, boundary)
+
+            # Sloping water surface so that pressure term varies
+            domain.set_quantity('elevation', 0)
+            domain.set_quantity('stage', lambda x,y: 1.0 + 0.001*(x-xllcorner))
+            domain.set_quantity('friction', 0)
+            domains.append(domain)
+
+        F = Gridded_met_forcing(field_sts_filename+'.sts', domains[0],
+                                block_size=3)
+        domains[0].forcing_terms = [F]
+
+        domains[1].forcing_terms = \
+            [Wind_stress(spatial_linear_varying_speed, 135.0),
+             Barometric_pressure(p=spatial_linear_varying_pressure)]
+
+        # Frames are read in order, out of order and between blocks
+        for t in [0.0, 3.5, 4.0, 4.25, 8.9, 2.0, 9.0]:
+            for domain in domains:
+                domain.set_time(t)
+                for name in domain.conserved_quantities:
+                    domain.quantities[name].explicit_update[:] = 0.0
+                domain.compute_forcing_terms()
+
+            for name in domain.conserved_quantities:
+                assert num.allclose(domains[0].quantities[name].explicit_update,
+                                    domains[1].quantities[name].explicit_update)
+
+        assert F.index == 8
+        F.close()
+
+        # Wind or pressure only
+        F = Gridded_met_forcing(field_sts_filename+'.sts', domains[0],
+                                pressure=False)
+        domains[0].forcing_terms = [F]
+        domains[1].forcing_terms = \
+            [Wind_stress(spatial_linear_varying_speed, 135.0)]
+
+        for domain in domains:
+            domain.set_time(6.5)
+            domain.quantities['xmomentum'].explicit_update[:] = 0.0
+            domain.compute_forcing_terms()
+
+        assert num.allclose(domains[0].quantities['xmomentum'].explicit_update,
+                            domains[1].quantities['xmomentum'].explicit_update)
+
+        domains[0].set_time(9.5)
+        try:
+            domains[0].compute_forcing_terms()
+        except Modeltime_too_late:
+            pass
+        else:
+            raise Exception('Should have raised Modeltime_too_late')
+
+        F.close()
+        assert F.fid is None
+        F.close()
+
+        # Single precision explicit updates
+        domain = Domain(points, vertices, boundary)
+        domain.set_precision('single')
+        domain.set_quantity('elevation', 0)
+        domain.set_quantity('stage', lambda x,y: 1.0 + 0.001*(x-xllcorner))
+        domain.set_quantity('friction', 0)
+        domains[0] = domain
+
+        F = Gridded_met_forcing(field_sts_filename+'.sts', domains[0])
+        domains[0].forcing_terms = [F]
+        domains[1].forcing_terms = \
+            [Wind_stress(spatial_linear_varying_speed, 135.0),
+             Barometric_pressure(p=spatial_linear_varying_pressure)]
+
+        for domain in domains:
+            domain.set_time(6.5)
+            for name in domain.conserved_quantities:
+                domain.quantities[name].explicit_update[:] = 0.0
+            domain.compute_forcing_terms()
+
+        for name in ['xmomentum', 'ymomentum']:
+            update = domains[0].quantities[name].explicit_update
+            assert update.dtype == num.float32
+            assert num.allclose(update,
+                                domains[1].quantities[name].explicit_update,
+                                rtol=1.0e-5)
+
+        F.close()
+        os.remove(field_sts_filename+'.sts')
+
     def test_flux_gravity(self):
         #Assuming no friction
 
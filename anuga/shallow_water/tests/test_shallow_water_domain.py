@@ -287,6 +287,53 @@ class Test_Shallow_Water(unittest.TestCase):
         else:
             raise Exception('Should have raised an exception')
 
+    def test_timing_statistics(self):
+        import json
+        from anuga.operators.rate_operators import Rate_operator
+
+        points, vertices, boundary = rectangular_cross(10, 10)
+        domain = Domain(points, vertices, boundary)
+        domain.set_name('timing_statistics')
+        domain.set_datadir(tempfile.gettempdir())
+        domain.set_quantity('elevation', lambda x, y: -x/10.0)
+        domain.set_quantity('stage', 0.05)
+
+        op = Rate_operator(domain, rate=0.001, label='rain')
+
+        Br = Reflective_boundary(domain)
+        domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+        fid, filename = tempfile.mkstemp('.json')
+        os.close(fid)
+        os.remove(filename)
+        domain.set_timing_file(filename)
+
+        for t in domain.evolve(yieldstep=0.05, finaltime=0.1):
+            pass
+
+        stats = domain.get_timing_statistics()
+        assert stats['steps'] > 0
+        assert stats['evolve'] > 0.0
+        assert stats['phases']['fluxes'] > 0.0
+        assert stats['phases']['extrapolation'] > 0.0
+        assert num.allclose(sum(stats['phases'].values()), stats['evolve'])
+        assert op.label in stats['operators']
+        assert 'fluxes' in domain.timing_statistics()
+
+        # One line of JSON per yield
+        lines = open(filename).readlines()
+        assert len(lines) == 3
+        assert num.allclose(json.loads(lines[-1])['time'], 0.1)
+        assert num.allclose(json.loads(lines[-1])['evolve'], stats['evolve'])
+        # Including the storage of the last timestep
+        assert stats['phases']['storage'] > 0.0
+        assert json.loads(lines[-1])['phases']['storage'] == stats['phases']['storage']
+        os.remove(filename)
+        os.remove(os.path.join(tempfile.gettempdir(), 'timing_statistics.sww'))
+
+        domain.reset_timing_statistics()
+        assert domain.get_timing_statistics()['evolve'] == 0.0
+
     # Individual flux tests
     def test_flux_zero_case(self):
         ql = num.zeros(3, num.float)
@@ -6115,6 +6162,72 @@ class Test_Shallow_Water(unittest.TestCase):
         os.remove(domain1.get_name() + '.sww')
         os.remove(domain2.get_name() + '.sww')
 
+    def test_spatio_temporal_boundary_segment(self):
+        """Test that the array based evaluate_segment of Field_boundary
+        agrees with evaluating each boundary edge separately, including
+        the fallback to the default boundary.
+        """
+
+        import time
+        from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular
+
+        # Create sww file of simple propagation from left to right
+        points, vertices, boundary = rectangular(3, 3)
+        domain1 = Domain(points, vertices, boundary)
+        domain1.smooth = False
+        domain1.store = True
+        domain1.set_datadir('.')
+        domain1.set_name('spatio_temporal_boundary_segment' + str(time.time()))
+
+        domain1.set_quantity('elevation', 0)
+        domain1.set_quantity('friction', 0)
+        domain1.set_quantity('stage', 0)
+
+        Br = Reflective_boundary(domain1)
+        Bd = Dirichlet_boundary([0.3,0,0])
+        domain1.set_boundary({'left': Bd, 'top': Bd, 'right': Br, 'bottom': Br})
+
+        finaltime = 2.0
+        for t in domain1.evolve(yieldstep=0.5, finaltime=finaltime):
+            pass
+
+        # Read it back as boundary of a domain with the same mesh
+        domain2 = Domain(points, vertices, boundary)
+        domain2.set_quantity('elevation', 0)
+        domain2.set_quantity('stage', 0)
+
+        Bdefault = Dirichlet_boundary([0.2, 0.1, -0.1])
+        Bf = Field_boundary(domain1.get_name() + '.sww', domain2,
+                            mean_stage=0.5,
+                            default_boundary=Bdefault)
+        Br = Reflective_boundary(domain2)
+        domain2.set_boundary({'left': Bf, 'top': Bf, 'right': Br, 'bottom': Br})
+
+        segment_edges = domain2.tag_boundary_cells['left'] + \
+                        domain2.tag_boundary_cells['top']
+
+        # Times inside the file (incl. on a stored timestep) and beyond
+        for t in [0.0, 0.3, 1.0, 1.75, finaltime + 1.0]:
+            domain2.set_time(t)
+            Bf.evaluate_segment(domain2, segment_edges)
+
+            for i in segment_edges:
+                vol_id = domain2.boundary_cells[i]
+                edge_id = domain2.boundary_edges[i]
+                q = Bf.evaluate(vol_id, edge_id)
+
+                for j, name in enumerate(domain2.conserved_quantities):
+                    Q = domain2.quantities[name]
+                    assert num.allclose(Q.boundary_values[i], q[j])
+
+        # Beyond the data the default boundary values are used
+        assert Bf.file_boundary.default_boundary_invoked
+        Q = domain2.quantities['stage']
+        assert num.allclose(Q.boundary_values[segment_edges], 0.7)
+
+        # Cleanup
+        os.remove(domain1.get_name() + '.sww')
+
     def test_spatio_temporal_boundary_2(self):
         """Test that boundary values can be read from file and interpolated
         in both time and space.
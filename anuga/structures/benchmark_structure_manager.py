@@ -0,0 +1,68 @@
+"""
+Benchmark the per step cost of the fractional step for many Boyd box
+culverts, applied as separate operators and by a Structure_manager.
+
+Culverts are laid out on a regular grid over a 400 x 100 domain with a
+sloping bed and water on the upper half.
+
+Run as
+    python benchmark_structure_manager.py
+"""
+
+import time
+import warnings
+
+import numpy as num
+import anuga
+
+
+number_of_steps = 50
+rows = 5
+columns = 20
+
+
+def time_structures(use_manager):
+    """Return wall time per call of apply_fractional_steps and the
+    final stage
+    """
+
+    anuga.Structure_operator.counter = 0
+    domain = anuga.rectangular_cross_domain(400, 100, len1=400.0, len2=100.0)
+    domain.set_store(False)
+    domain.set_quantity('elevation', lambda x, y: -x/400.0)
+    domain.set_quantity('stage', lambda x, y: num.where(x < 200.0, 1.0, -x/400.0))
+
+    for i in range(columns):
+        for j in range(rows):
+            x = 5.0 + 20.0*i
+            y = 10.0 + 20.0*j
+            anuga.Boyd_box_operator(domain,
+                                    losses=1.5,
+                                    width=1.0,
+                                    height=0.5,
+                                    end_points=[[x, y], [x + 4.0, y]],
+                                    verbose=False)
+
+    if use_manager:
+        anuga.Structure_manager(domain)
+
+    domain.timestep = 0.01
+    domain.yieldstep = 1.0
+
+    t0 = time.time()
+    for i in range(number_of_steps):
+        domain.apply_fractional_steps()
+
+    return (time.time() - t0)/number_of_steps, \
+           domain.quantities['stage'].centroid_values.copy()
+
+
+warnings.simplefilter('ignore')
+
+operator_step, operator_stage = time_structures(False)
+manager_step, manager_stage = time_structures(True)
+
+print '%d Boyd box culverts, %d steps' % (rows*columns, number_of_steps)
+print 'Separate operators  %10.2f ms per step' % (1000*operator_step)
+print 'Structure_manager   %10.2f ms per step' % (1000*manager_step)
+print 'Max stage difference %g' % num.max(num.abs(operator_stage - manager_stage))
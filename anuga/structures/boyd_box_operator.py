@@ -397,3 +397,81 @@ def boyd_box_function(width,
 
     return Q, barrel_velocity, outlet_culvert_depth, flow_area, case
 
+
+
+#=============================================================================
+# Array version of boyd_box_function, used by the Structure_manager to
+# evaluate the discharge of many culverts at once. Cases are returned as
+# indices into boyd_box_cases.
+#=============================================================================
+boyd_box_cases = ['100 blocked culvert',
+                  'Inlet CTRL Outlet unsubmerged PIPE PART FULL',
+                  'INLET CTRL Culvert is open channel flow we will for now assume critical depth',
+                  'Outlet submerged',
+                  'Outlet is Flowing Full',
+                  'Outlet is open channel flow']
+
+def boyd_box_function_vectorised(width,
+                                 depth,
+                                 blockage,
+                                 barrels,
+                                 flow_width,
+                                 length,
+                                 driving_energy,
+                                 delta_total_energy,
+                                 outlet_enquiry_depth,
+                                 sum_loss,
+                                 manning):
+    """Same as boyd_box_function with each argument an array holding
+    the values for a set of culverts
+    """
+
+    g = anuga.g
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        bf = 1 - blockage
+        bfwb = bf*width*barrels
+
+        Q_inlet_unsubmerged = 0.544*g**0.5*bfwb*driving_energy**1.50
+        Q_inlet_submerged = 0.702*g**0.5*bfwb*depth**0.89*driving_energy**0.61
+        Q = numpy.minimum(Q_inlet_unsubmerged, Q_inlet_submerged)
+
+        dcrit = (Q**2/g/bfwb**2)**0.333333
+
+        # Inlet control
+        full = dcrit > depth
+        outlet_culvert_depth = numpy.where(full, depth, dcrit)
+        flow_area = bfwb*outlet_culvert_depth
+        perimeter = numpy.where(full, 2*(bfwb + depth), bfwb + 2*dcrit)
+        case = numpy.where(full, 1, 2)
+
+        # Outlet control
+        outlet = delta_total_energy < driving_energy
+        submerged = outlet & (outlet_enquiry_depth > depth)
+        full = outlet & ~submerged & (dcrit > depth)
+        open_channel = outlet & ~submerged & ~full
+
+        outlet_culvert_depth[submerged | full] = depth[submerged | full]
+        flow_area = bfwb*outlet_culvert_depth
+        perimeter = numpy.where(submerged | full, 2.0*(bfwb + depth), perimeter)
+        perimeter = numpy.where(open_channel, bfwb + 2.0*dcrit, perimeter)
+        case[submerged] = 3
+        case[full] = 4
+        case[open_channel] = 5
+
+        hyd_rad = flow_area/perimeter
+        culvert_velocity = numpy.sqrt(delta_total_energy/((sum_loss/2/g)
+                                      + (manning**2*length)/hyd_rad**1.33333))
+        Q_outlet_tailwater = flow_area*culvert_velocity
+        Q = numpy.where(outlet, numpy.minimum(Q, Q_outlet_tailwater), Q)
+
+        barrel_velocity = Q/(flow_area + anuga.velocity_protection/flow_area)
+
+    blocked = blockage >= 1.0
+    Q[blocked] = 0.0
+    barrel_velocity[blocked] = 0.0
+    outlet_culvert_depth[blocked] = 0.0
+    flow_area[blocked] = 0.00001
+    case[blocked] = 0
+
+    return Q, barrel_velocity, outlet_culvert_depth, flow_area, case
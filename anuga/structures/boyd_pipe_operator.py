@@ -402,3 +402,86 @@ def boyd_pipe_function(depth,
 
     return Q, barrel_velocity, outlet_culvert_depth, flow_area, case
 
+
+
+#=============================================================================
+# Array version of boyd_pipe_function, used by the Structure_manager to
+# evaluate the discharge of many culverts at once. Cases are returned as
+# indices into boyd_pipe_cases.
+#=============================================================================
+boyd_pipe_cases = ['100 blocked culvert',
+                   'Inlet CTRL Outlet submerged Circular PIPE FULL',
+                   'INLET CTRL Culvert is open channel flow we will for now assume critical depth',
+                   'Outlet submerged',
+                   'Outlet unsubmerged PIPE FULL',
+                   'Outlet is open channel flow we will for now assume critical depth']
+
+def boyd_pipe_function_vectorised(depth,
+                                  diameter,
+                                  blockage,
+                                  barrels,
+                                  length,
+                                  driving_energy,
+                                  delta_total_energy,
+                                  outlet_enquiry_depth,
+                                  sum_loss,
+                                  manning):
+    """Same as boyd_pipe_function with each argument an array holding
+    the values for a set of culverts
+    """
+
+    g = anuga.g
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        bf = numpy.where(blockage > 0.9,
+                         3.333-3.333*blockage,
+                         1.0-0.4012316798*blockage-0.3768350138*(blockage**2))
+        bfd = bf*diameter
+
+        Q_inlet_unsubmerged = barrels*(0.421*g**0.5*(bfd**0.87)*driving_energy**1.63)
+        Q_inlet_submerged = barrels*(0.530*g**0.5*(bfd**1.87)*driving_energy**0.63)
+        Q = numpy.minimum(Q_inlet_unsubmerged, Q_inlet_submerged)
+
+        dcrit1 = bfd/1.26*(Q/g**0.5*(bfd**2.5))**(1/3.75)
+        dcrit2 = bfd/0.95*(Q/g**0.5*(bfd**2.5))**(1/1.95)
+        dcrit = numpy.where(dcrit1/bfd > 0.85, dcrit2, dcrit1)
+
+        # Inlet control
+        full = dcrit >= bfd
+        case = numpy.where(full, 1, 2)
+
+        # Outlet control
+        outlet = delta_total_energy < driving_energy
+        submerged = outlet & (outlet_enquiry_depth > bfd)
+        case[submerged] = 3
+        outlet_full = outlet & ~submerged & (dcrit > bfd)
+        case[outlet_full] = 4
+        open_channel = outlet & ~submerged & ~outlet_full
+        case[open_channel] = 5
+        full = numpy.where(outlet, submerged | outlet_full, full)
+
+        outlet_culvert_depth = numpy.where(full, bfd, dcrit)
+        alpha = numpy.arccos(numpy.clip(1-2*outlet_culvert_depth/bfd, -1.0, 1.0))*2
+        flow_area = numpy.where(full,
+                                barrels*(bfd/2)**2*math.pi,
+                                barrels*bfd**2/8*(alpha - numpy.sin(alpha)))
+        perimeter = numpy.where(full,
+                                barrels*bfd*math.pi,
+                                barrels*(alpha*bfd/2.0))
+
+        hyd_rad = flow_area/perimeter
+        culvert_velocity = numpy.sqrt(delta_total_energy/((sum_loss/2/g)
+                                      + (manning**2*length)/hyd_rad**1.33333))
+        Q_outlet_tailwater = flow_area*culvert_velocity
+        Q = numpy.minimum(Q, Q_outlet_tailwater)
+
+        barrel_velocity = Q/(flow_area + anuga.velocity_protection/flow_area)
+
+    blocked = blockage >= 1.0
+    Q[blocked] = 0.0
+    barrel_velocity[blocked] = 0.0
+    outlet_culvert_depth[blocked] = 0.0
+    flow_area[blocked] = 0.00001
+    case[blocked] = 0
+
+    return Q, barrel_velocity, outlet_culvert_depth, flow_area, case
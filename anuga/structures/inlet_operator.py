@@ -116,6 +116,11 @@ class Inlet_operator(anuga.Operator):
 
         return Q
 
+    def get_changed_indices(self):
+        """Only the triangles of the inlet are changed
+        """
+        return self.inlet.triangle_indices
+
     def statistics(self):
 
 
@@ -387,6 +387,12 @@ class RiverWall:
         # etc
         #
         riverwallInds=(domain.edge_flux_type==1).nonzero()[0]
+        # Riverwall index of each unique edge (-1 if not a riverwall), so the
+        # flux computation can find it without visiting the edges in order
+        riverwall_ids=numpy.cumsum(domain.edge_flux_type==1).astype(int)-1
+        edge_ki=3*domain.edge_left_cells+domain.edge_left_edges
+        domain.edge_river_wall_ids[:]=numpy.where(domain.edge_flux_type[edge_ki]==1,
+                                                  riverwall_ids[edge_ki], -1)
         # elevation
         self.riverwall_elevation=\
             riverwall_elevation[riverwallInds]
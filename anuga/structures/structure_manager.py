@@ -0,0 +1,672 @@
+"""
+Structure manager - apply many structure operators as one fractional step.
+
+Each Structure_operator is a separate fractional step operator which,
+every timestep, calls its discharge_routine and then gathers and sets
+the average depth and momentum of its inlets with a dozen small numpy
+reductions. With hundreds of culverts this dominates the cost of a step.
+
+The Structure_manager takes over the structures of a domain and stores
+them in arrays:
+
+* the triangles of all the inlets are held as one CSR index set
+  (inlet_triangles with offsets inlet_ptr), so the inlet averages of
+  all structures are computed with one segmented reduction;
+
+* Boyd box, Boyd pipe and weir orifice trapezoid culverts have their
+  discharge evaluated for all culverts at once (culvert_discharge_routine,
+  using boyd_box_function_vectorised and boyd_pipe_function_vectorised),
+  other structures use their own discharge_routine;
+
+* the semi-implicit depth and momentum update of
+  Structure_operator.__call__ is applied to all the structures in one
+  pass.
+
+Structures are updated from the state at the start of the fractional
+step. This is the same as applying them one after the other provided
+no structure changes the inlet or enquiry triangles of another, so
+structures whose inlets overlap, or whose enquiry points lie in the
+inlet of another structure, are left as separate operators.
+
+Usage:
+
+    culverts = [anuga.Boyd_box_operator(domain, ...) for ...]
+    manager = anuga.Structure_manager(domain)
+
+The manager reads the parameters of the structures (size, blockage,
+losses, smoothing etc) when it is created. Call update_parameters if
+these are changed during the evolve.
+"""
+
+import numpy as num
+
+import anuga
+import anuga.utilities.log as log
+
+from anuga.structures.structure_operator import Structure_operator
+from anuga.structures.boyd_box_operator import Boyd_box_operator
+from anuga.structures.boyd_box_operator import boyd_box_function_vectorised
+from anuga.structures.boyd_box_operator import boyd_box_cases
+from anuga.structures.boyd_pipe_operator import Boyd_pipe_operator
+from anuga.structures.boyd_pipe_operator import boyd_pipe_function_vectorised
+from anuga.structures.boyd_pipe_operator import boyd_pipe_cases
+from anuga.structures.weir_orifice_trapezoid_operator import Weir_orifice_trapezoid_operator
+from anuga.structures.weir_orifice_trapezoid_operator import weir_orifice_trapezoid_function
+
+
+# Culverts with the discharge routine of the Boyd box operator
+BOYD_BOX = 0
+BOYD_PIPE = 1
+WEIR_ORIFICE_TRAPEZOID = 2
+
+culvert_classes = {Boyd_box_operator : BOYD_BOX,
+                   Boyd_pipe_operator : BOYD_PIPE,
+                   Weir_orifice_trapezoid_operator : WEIR_ORIFICE_TRAPEZOID}
+
+culvert_parameter_names = ['culvert_width', 'culvert_height', 'culvert_diameter',
+                           'culvert_z1', 'culvert_z2', 'culvert_blockage',
+                           'culvert_barrels', 'culvert_length', 'sum_loss',
+                           'manning', 'smoothing_timescale', 'max_velocity',
+                           'use_velocity_head']
+
+
+class Structure_manager(anuga.Operator):
+    """Apply a set of structure operators as one fractional step operator
+
+    domain: the domain
+    structures: list of structure operators to manage. If None all the
+                structure operators of the domain are used.
+
+    The managed structures are removed from the fractional step
+    operators of the domain and the manager takes the place of the
+    first of them.
+    """
+
+    def __init__(self,
+                 domain,
+                 structures=None,
+                 description=None,
+                 label=None,
+                 logging=False,
+                 verbose=False):
+
+        anuga.Operator.__init__(self, domain, description, label, logging, verbose)
+
+        if structures is None:
+            structures = [op for op in domain.fractional_step_operators
+                          if isinstance(op, Structure_operator)]
+
+        candidates = []
+        self.unmanaged_structures = []
+        for structure in structures:
+            if structure.__class__.__call__.im_func is Structure_operator.__call__.im_func:
+                candidates.append(structure)
+            else:
+                self.unmanaged_structures.append(structure)
+
+        self.structures = self._get_independent_structures(candidates)
+
+        if self.verbose:
+            log.critical('Structure_manager: managing %d structures, %d left as operators'
+                         % (len(self.structures), len(self.unmanaged_structures)))
+
+        # Take the place of the first managed structure
+        operators = domain.fractional_step_operators
+        operators.remove(self)
+        if self.structures:
+            position = min([operators.index(s) for s in self.structures])
+            for structure in self.structures:
+                operators.remove(structure)
+            operators.insert(position, self)
+        else:
+            operators.append(self)
+
+        self.set_inlets()
+        self.update_parameters()
+
+
+    def _get_independent_structures(self, structures):
+        """Return the structures which can be updated independently of
+        each other. The rest are added to self.unmanaged_structures
+        """
+
+        N = self.domain.number_of_elements
+        owner = -num.ones(N, num.int)
+        count = num.zeros(N, num.int)
+        for structure in structures:
+            for inlet in structure.inlets:
+                count[inlet.triangle_indices] += 1
+
+        independent = num.ones(len(structures), num.bool)
+        for i, structure in enumerate(structures):
+            for inlet in structure.inlets:
+                if num.any(count[inlet.triangle_indices] > 1):
+                    independent[i] = False
+            if independent[i]:
+                for inlet in structure.inlets:
+                    owner[inlet.triangle_indices] = i
+
+        # Enquiry points in the inlets of another structure
+        for i, structure in enumerate(structures):
+            for inlet in structure.inlets:
+                j = owner[inlet.enquiry_index]
+                if j >= 0 and j != i:
+                    independent[i] = False
+                    independent[j] = False
+
+        for i, structure in enumerate(structures):
+            if not independent[i]:
+                self.unmanaged_structures.append(structure)
+
+        return [s for i, s in enumerate(structures) if independent[i]]
+
+
+    def set_inlets(self):
+        """Store the inlets of the structures as a CSR index set. Inlet
+        2*i + j is inlets[j] of structure i.
+        """
+
+        inlets = [inlet for s in self.structures for inlet in s.inlets]
+
+        counts = num.array([len(inlet.triangle_indices) for inlet in inlets], num.int)
+        self.inlet_ptr = num.zeros(len(inlets) + 1, num.int)
+        self.inlet_ptr[1:] = num.cumsum(counts)
+        self.inlet_counts = counts
+
+        if inlets:
+            self.inlet_triangles = num.concatenate(
+                [num.asarray(inlet.triangle_indices, num.int) for inlet in inlets])
+        else:
+            self.inlet_triangles = num.zeros(0, num.int)
+
+        self.triangle_areas = self.areas[self.inlet_triangles]
+        self.inlet_areas = num.array([inlet.get_area() for inlet in inlets], num.float)
+
+        self.outward_vectors = num.zeros((len(inlets), 2), num.float)
+        for k, inlet in enumerate(inlets):
+            if inlet.outward_culvert_vector is not None:
+                self.outward_vectors[k] = inlet.outward_culvert_vector
+
+        self.enquiry_indices = num.array([inlet.enquiry_index for inlet in inlets], num.int)
+        self.invert_elevations = num.array(
+            [num.nan if inlet.invert_elevation is None else inlet.invert_elevation
+             for inlet in inlets], num.float)
+
+
+    def update_parameters(self):
+        """Read the parameters and smoothing state of the structures
+        into the arrays of the manager
+        """
+
+        structures = self.structures
+
+        self.always_use_Q_wetdry_adjustment = num.array(
+            [s.always_use_Q_wetdry_adjustment for s in structures], num.bool)
+        self.use_old_momentum_method = num.array(
+            [s.use_old_momentum_method for s in structures], num.bool)
+        self.use_momentum_jet = num.array(
+            [s.use_momentum_jet for s in structures], num.bool)
+        self.zero_outflow_momentum = num.array(
+            [s.zero_outflow_momentum for s in structures], num.bool)
+
+        # Culverts handled by culvert_discharge_routine
+        ids = [i for i, s in enumerate(structures) if s.__class__ in culvert_classes]
+        self.culvert_ids = num.array(ids, num.int)
+        self.culverts = [structures[i] for i in ids]
+        self.culvert_types = num.array(
+            [culvert_classes[s.__class__] for s in self.culverts], num.int)
+        self.culvert_parameters = get_culvert_parameters(self.culverts)
+        self.smooth_delta_total_energy = num.array(
+            [s.smooth_delta_total_energy for s in self.culverts], num.float)
+        self.smooth_Q = num.array([s.smooth_Q for s in self.culverts], num.float)
+
+        is_culvert = num.zeros(len(structures), num.bool)
+        is_culvert[self.culvert_ids] = True
+        self.other_ids = num.flatnonzero(~is_culvert)
+
+
+    def __call__(self):
+
+        if not self.structures:
+            return
+
+        timestep = self.domain.get_timestep()
+        ns = len(self.structures)
+
+        Q = num.zeros(ns, num.float)
+        barrel_speed = num.zeros(ns, num.float)
+        outlet_depth = num.zeros(ns, num.float)
+        forward = num.ones(ns, num.bool)
+
+        if self.culverts:
+            ids = self.culvert_ids
+            enquiry = self.get_enquiry_values()
+            for name in enquiry:
+                enquiry[name] = enquiry[name][ids]
+
+            Q[ids], barrel_speed[ids], outlet_depth[ids], direction, case, \
+                delta_total_energy, driving_energy, is_open, wet = \
+                culvert_discharge_routine(self.culvert_types,
+                                          self.culvert_parameters,
+                                          self.smooth_delta_total_energy,
+                                          self.smooth_Q,
+                                          enquiry,
+                                          timestep)
+            forward[ids] = direction == 0
+
+            # Record the state on the culverts for their statistics
+            for k, culvert in enumerate(self.culverts):
+                culvert.inflow = culvert.inlets[direction[k]]
+                culvert.outflow = culvert.inlets[1 - direction[k]]
+                culvert.case = case[k]
+                if is_open[k]:
+                    culvert.delta_total_energy = delta_total_energy[k]
+                    culvert.smooth_delta_total_energy = self.smooth_delta_total_energy[k]
+                if wet[k]:
+                    culvert.driving_energy = driving_energy[k]
+                    culvert.smooth_Q = self.smooth_Q[k]
+
+        for i in self.other_ids:
+            structure = self.structures[i]
+            Q[i], barrel_speed[i], outlet_depth[i] = structure.discharge_routine()
+            forward[i] = structure.inflow is structure.inlets[0]
+
+        self.update_inlets(timestep, Q, barrel_speed, outlet_depth, forward)
+
+
+    def get_enquiry_values(self):
+        """Return a dictionary of the enquiry stage, depth, total energy and
+        specific energy of the inlets, as (number of structures, 2) arrays
+        """
+
+        ids = self.enquiry_indices
+        elevation = self.elev_c[ids].astype(num.float)
+        invert = num.where(num.isnan(self.invert_elevations),
+                           elevation, self.invert_elevations)
+
+        enquiry = get_enquiry_energies(self.stage_c[ids].astype(num.float),
+                                       elevation,
+                                       self.xmom_c[ids].astype(num.float),
+                                       self.ymom_c[ids].astype(num.float),
+                                       invert)
+        for name in enquiry:
+            enquiry[name] = enquiry[name].reshape(-1, 2)
+
+        return enquiry
+
+
+    def get_inlet_averages(self):
+        """Return the area weighted average depth, xmomentum and
+        ymomentum of each inlet, using one segmented reduction
+        """
+
+        tris = self.inlet_triangles
+        values = num.empty((len(tris), 3), num.float)
+        values[:, 0] = self.stage_c[tris] - self.elev_c[tris]
+        values[:, 1] = self.xmom_c[tris]
+        values[:, 2] = self.ymom_c[tris]
+        values *= self.triangle_areas[:, num.newaxis]
+
+        totals = num.add.reduceat(values, self.inlet_ptr[:-1], axis=0)
+
+        return totals/self.inlet_areas[:, num.newaxis]
+
+
+    def update_inlets(self, timestep, Q, barrel_speed, outlet_depth, forward):
+        """The semi-implicit update of Structure_operator.__call__ applied
+        to all the structures at once
+        """
+
+        ns = len(self.structures)
+        averages = self.get_inlet_averages()
+
+        inflow = 2*num.arange(ns) + num.where(forward, 0, 1)
+        outflow = 2*num.arange(ns) + num.where(forward, 1, 0)
+
+        new_inflow, new_outflow, gain, loss, timestep_star = \
+            structure_inlet_update(timestep, Q, barrel_speed,
+                                   averages[inflow], averages[outflow],
+                                   self.inlet_areas[inflow],
+                                   self.inlet_areas[outflow],
+                                   -self.outward_vectors[outflow],
+                                   self.always_use_Q_wetdry_adjustment,
+                                   self.use_old_momentum_method,
+                                   self.use_momentum_jet,
+                                   self.zero_outflow_momentum)
+
+        assert num.allclose(gain-loss, 0.0)
+
+        # Set the inlets in one pass
+        values = num.empty((2*ns, 3), num.float)
+        values[inflow] = new_inflow
+        values[outflow] = new_outflow
+
+        tris = self.inlet_triangles
+        self.stage_c[tris] = self.elev_c[tris] + num.repeat(values[:, 0], self.inlet_counts)
+        self.xmom_c[tris] = num.repeat(values[:, 1], self.inlet_counts)
+        self.ymom_c[tris] = num.repeat(values[:, 2], self.inlet_counts)
+
+        # Stats
+        with num.errstate(divide='ignore', invalid='ignore'):
+            discharge = Q*timestep_star/timestep
+        yieldstep = self.domain.yieldstep
+
+        for structure, g, d, v, o in zip(self.structures, gain.tolist(),
+                                         discharge.tolist(),
+                                         barrel_speed.tolist(),
+                                         outlet_depth.tolist()):
+            structure.accumulated_flow += g
+            structure.discharge = d
+            structure.discharge_abs_timemean += g/yieldstep
+            structure.velocity = v
+            structure.outlet_depth = o
+
+
+    def parallel_safe(self):
+
+        return False
+
+
+    def get_changed_indices(self):
+        """Only the triangles of the inlets of the structures are changed
+        """
+
+        if not self.structures:
+            return []
+        return num.unique(num.concatenate([s.get_changed_indices()
+                                           for s in self.structures]))
+
+
+    def statistics(self):
+
+        message = 'Structure_manager: %d structures\n' % len(self.structures)
+        for structure in self.structures:
+            message += structure.statistics()
+
+        return message
+
+
+    def timestepping_statistics(self):
+
+        message = ''
+        for structure in self.structures:
+            message += structure.timestepping_statistics() + '\n'
+
+        return message
+
+
+    def print_statistics(self):
+
+        for structure in self.structures:
+            structure.print_statistics()
+
+
+    def print_timestepping_statistics(self):
+
+        for structure in self.structures:
+            structure.print_timestepping_statistics()
+
+
+    def log_timestepping_statistics(self):
+
+        for structure in self.structures:
+            structure.log_timestepping_statistics()
+
+
+    def get_structures(self):
+
+        return self.structures
+
+
+#=============================================================================
+# Array forms of the structure computations, shared with the parallel
+# structure scheduler
+#=============================================================================
+
+def get_culvert_parameters(culverts):
+    """Return an array of the parameters of the culverts, one row per
+    culvert with columns in the order of culvert_parameter_names.
+    Parameters a culvert does not have are zero.
+    """
+
+    parameters = num.zeros((len(culverts), len(culvert_parameter_names)), num.float)
+    for i, culvert in enumerate(culverts):
+        for j, name in enumerate(culvert_parameter_names):
+            value = getattr(culvert, name, None)
+            if value is not None:
+                parameters[i, j] = value
+
+    return parameters
+
+
+def get_enquiry_energies(stage, elevation, xmom, ymom, invert_elevation):
+    """Return a dictionary of the enquiry stage, depth, total energy and
+    specific energy from the values at a set of enquiry points, as
+    computed by Inlet_enquiry
+    """
+
+    depth = num.maximum(stage - invert_elevation, 0.0)
+
+    water_depth = stage - elevation
+    u = water_depth*xmom/(water_depth**2 + anuga.velocity_protection)
+    v = water_depth*ymom/(water_depth**2 + anuga.velocity_protection)
+    velocity_head = 0.5*(u**2 + v**2)/anuga.g
+
+    enquiry = {}
+    enquiry['stage'] = stage
+    enquiry['depth'] = depth
+    enquiry['total_energy'] = velocity_head + stage
+    enquiry['specific_energy'] = velocity_head + depth
+
+    return enquiry
+
+
+def culvert_discharge_routine(culvert_type,
+                              parameters,
+                              smooth_delta_total_energy,
+                              smooth_Q,
+                              enquiry,
+                              timestep):
+    """Vectorised form of the discharge_routine of the Boyd box, Boyd
+    pipe and weir orifice trapezoid operators.
+
+    culvert_type: array of BOYD_BOX, BOYD_PIPE or WEIR_ORIFICE_TRAPEZOID
+    parameters: array of culvert parameters (see get_culvert_parameters)
+    smooth_delta_total_energy, smooth_Q: smoothing state of the culverts,
+                                         updated in place
+    enquiry: dictionary of (n, 2) arrays of the enquiry 'stage', 'depth',
+             'total_energy' and 'specific_energy' at both inlets
+
+    Returns arrays of Q, barrel_velocity, outlet_culvert_depth, direction
+    (1 if inlets[1] is the inflow), a list of the cases, and arrays of
+    delta_total_energy, driving_energy and the open and wet culverts
+    """
+
+    n = len(culvert_type)
+    p = dict(zip(culvert_parameter_names, parameters.T))
+
+    size = num.where(culvert_type == BOYD_PIPE, p['culvert_diameter'], p['culvert_height'])
+    is_open = size > 0.0
+
+    use_velocity_head = p['use_velocity_head'] > 0.0
+    energy = num.where(use_velocity_head[:, num.newaxis],
+                       enquiry['total_energy'], enquiry['stage'])
+    delta_total_energy = energy[:, 0] - energy[:, 1]
+
+    if timestep > 0.0:
+        ts = timestep/num.maximum(p['smoothing_timescale'], max(timestep, 1.0e-06))
+    else:
+        ts = num.ones(n, num.float)
+
+    smooth_delta_total_energy[is_open] += \
+        ts[is_open]*(delta_total_energy[is_open] - smooth_delta_total_energy[is_open])
+
+    direction = num.where(is_open & (smooth_delta_total_energy < 0.0), 1, 0)
+    delta_total_energy = num.where(is_open, num.abs(smooth_delta_total_energy),
+                                   delta_total_energy)
+
+    rows = num.arange(n)
+    inflow_depth = enquiry['depth'][rows, direction]
+    outflow_depth = enquiry['depth'][rows, 1 - direction]
+    inflow_specific_energy = enquiry['specific_energy'][rows, direction]
+
+    wet = is_open & (inflow_depth > 0.01)
+
+    driving_energy = num.where(use_velocity_head, inflow_specific_energy, inflow_depth)
+
+    Q = num.zeros(n, num.float)
+    barrel_velocity = num.zeros(n, num.float)
+    outlet_culvert_depth = num.zeros(n, num.float)
+    flow_area = num.ones(n, num.float)
+
+    case = ['Culvert blocked']*n
+    for k in num.flatnonzero(is_open & ~wet):
+        case[k] = 'Inlet dry'
+
+    w = num.flatnonzero(wet & (culvert_type == BOYD_BOX))
+    if len(w) > 0:
+        Q[w], barrel_velocity[w], outlet_culvert_depth[w], flow_area[w], cases = \
+            boyd_box_function_vectorised(width=p['culvert_width'][w],
+                                         depth=p['culvert_height'][w],
+                                         blockage=p['culvert_blockage'][w],
+                                         barrels=p['culvert_barrels'][w],
+                                         flow_width=p['culvert_width'][w],
+                                         length=p['culvert_length'][w],
+                                         driving_energy=driving_energy[w],
+                                         delta_total_energy=delta_total_energy[w],
+                                         outlet_enquiry_depth=outflow_depth[w],
+                                         sum_loss=p['sum_loss'][w],
+                                         manning=p['manning'][w])
+        for k, c in zip(w, cases):
+            case[k] = boyd_box_cases[c]
+
+    w = num.flatnonzero(wet & (culvert_type == BOYD_PIPE))
+    if len(w) > 0:
+        Q[w], barrel_velocity[w], outlet_culvert_depth[w], flow_area[w], cases = \
+            boyd_pipe_function_vectorised(depth=inflow_depth[w],
+                                          diameter=p['culvert_diameter'][w],
+                                          blockage=p['culvert_blockage'][w],
+                                          barrels=p['culvert_barrels'][w],
+                                          length=p['culvert_length'][w],
+                                          driving_energy=driving_energy[w],
+                                          delta_total_energy=delta_total_energy[w],
+                                          outlet_enquiry_depth=outflow_depth[w],
+                                          sum_loss=p['sum_loss'][w],
+                                          manning=p['manning'][w])
+        for k, c in zip(w, cases):
+            case[k] = boyd_pipe_cases[c]
+
+    # No array form of the weir orifice trapezoid function
+    for k in num.flatnonzero(wet & (culvert_type == WEIR_ORIFICE_TRAPEZOID)):
+        Q[k], barrel_velocity[k], outlet_culvert_depth[k], flow_area[k], case[k] = \
+            weir_orifice_trapezoid_function(width=p['culvert_width'][k],
+                                            depth=p['culvert_height'][k],
+                                            blockage=p['culvert_blockage'][k],
+                                            barrels=p['culvert_barrels'][k],
+                                            z1=p['culvert_z1'][k],
+                                            z2=p['culvert_z2'][k],
+                                            flow_width=p['culvert_width'][k],
+                                            length=p['culvert_length'][k],
+                                            driving_energy=driving_energy[k],
+                                            delta_total_energy=delta_total_energy[k],
+                                            outlet_enquiry_depth=outflow_depth[k],
+                                            sum_loss=p['sum_loss'][k],
+                                            manning=p['manning'][k])
+
+    if num.any(wet):
+        # Time-smoothed discharge
+        Qsign = num.sign(smooth_delta_total_energy[wet])
+        smooth_Q[wet] += ts[wet]*(Q[wet]*Qsign - smooth_Q[wet])
+
+        Q[wet] = num.where(num.sign(smooth_Q[wet]) != Qsign, 0.0,
+                           num.minimum(num.abs(smooth_Q[wet]), Q[wet]))
+        barrel_velocity[wet] = Q[wet]/flow_area[wet]
+
+        # Temporary flow limit
+        fast = wet & (barrel_velocity > p['max_velocity'])
+        barrel_velocity[fast] = p['max_velocity'][fast]
+        Q[fast] = flow_area[fast]*barrel_velocity[fast]
+
+    return Q, barrel_velocity, outlet_culvert_depth, direction, case, \
+           delta_total_energy, driving_energy, is_open, wet
+
+
+def structure_inlet_update(timestep,
+                           Q,
+                           barrel_speed,
+                           inflow,
+                           outflow,
+                           inflow_area,
+                           outflow_area,
+                           outflow_direction,
+                           always_use_Q_wetdry_adjustment,
+                           use_old_momentum_method,
+                           use_momentum_jet,
+                           zero_outflow_momentum):
+    """The semi-implicit update of Structure_operator.__call__ for arrays
+    of structures.
+
+    inflow, outflow: (n, 3) arrays of the average depth, xmomentum and
+                     ymomentum of the inflow and outflow inlets
+    outflow_direction: (n, 2) array, minus the outward culvert vector of
+                       the outflow inlet
+
+    Returns the new inflow and outflow values as (n, 3) arrays, the
+    volume gained at the outflow and lost at the inflow, and timestep_star
+    """
+
+    old_inflow_depth = inflow[:, 0]
+    old_inflow_xmom = inflow[:, 1]
+    old_inflow_ymom = inflow[:, 2]
+
+    wet = old_inflow_depth > 0.0
+    safe_depth = num.where(wet, old_inflow_depth, 1.0)
+
+    dt_Q_on_d = num.where(wet, timestep*Q/safe_depth, 0.0)
+
+    use_Q_wetdry_adjustment = always_use_Q_wetdry_adjustment | \
+                              (old_inflow_depth*inflow_area <= Q*timestep)
+
+    factor = 1.0/(1.0 + dt_Q_on_d/inflow_area)
+
+    new_inflow_depth = num.where(use_Q_wetdry_adjustment,
+                                 old_inflow_depth*factor,
+                                 old_inflow_depth - timestep*Q/inflow_area)
+    timestep_star = num.where(use_Q_wetdry_adjustment,
+                              num.where(wet, timestep*new_inflow_depth/safe_depth, 0.0),
+                              timestep)
+
+    # Momentum
+    factor2 = num.where(use_Q_wetdry_adjustment,
+                        1.0/(1.0 + dt_Q_on_d*new_inflow_depth/(safe_depth*inflow_area)),
+                        1.0/(1.0 + timestep*Q/(safe_depth*inflow_area)))
+    factor2 = num.where(wet, factor2, 0.0)
+    factor2 = num.where(use_old_momentum_method, factor, factor2)
+
+    new_inflow = num.empty_like(inflow)
+    new_inflow[:, 0] = new_inflow_depth
+    new_inflow[:, 1] = old_inflow_xmom*factor2
+    new_inflow[:, 2] = old_inflow_ymom*factor2
+
+    loss = (old_inflow_depth - new_inflow_depth)*inflow_area
+    xmom_loss = (old_inflow_xmom - new_inflow[:, 1])*inflow_area
+    ymom_loss = (old_inflow_ymom - new_inflow[:, 2])*inflow_area
+
+    # Outflow
+    outflow_extra_depth = Q*timestep_star/outflow_area
+    gain = outflow_extra_depth*outflow_area
+
+    new_outflow = num.empty_like(outflow)
+    new_outflow[:, 0] = outflow[:, 0] + outflow_extra_depth
+    new_outflow[:, 1] = outflow[:, 1] + xmom_loss/outflow_area
+    new_outflow[:, 2] = outflow[:, 2] + ymom_loss/outflow_area
+
+    new_outflow[zero_outflow_momentum, 1:] = 0.0
+
+    with num.errstate(invalid='ignore'):
+        jet_xmom = barrel_speed*new_outflow[:, 0]*outflow_direction[:, 0]
+        jet_ymom = barrel_speed*new_outflow[:, 0]*outflow_direction[:, 1]
+    new_outflow[use_momentum_jet, 1] = jet_xmom[use_momentum_jet]
+    new_outflow[use_momentum_jet, 2] = jet_ymom[use_momentum_jet]
+
+    return new_inflow, new_outflow, gain, loss, timestep_star
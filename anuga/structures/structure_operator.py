@@ -488,6 +488,14 @@ class Structure_operator(anuga.Operator):
         raise
             
 
+    def get_changed_indices(self):
+        """Only the triangles of the inlets are changed
+        """
+
+        return num.unique(num.concatenate([inlet.triangle_indices
+                                           for inlet in self.inlets]))
+
+
     def statistics(self):
 
 
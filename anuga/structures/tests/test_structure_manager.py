@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+
+import unittest
+import numpy
+
+import anuga
+
+from anuga.structures.structure_manager import Structure_manager
+from anuga.structures.boyd_box_operator import Boyd_box_operator
+from anuga.structures.boyd_box_operator import boyd_box_function
+from anuga.structures.boyd_box_operator import boyd_box_function_vectorised
+from anuga.structures.boyd_box_operator import boyd_box_cases
+from anuga.structures.boyd_pipe_operator import Boyd_pipe_operator
+from anuga.structures.boyd_pipe_operator import boyd_pipe_function
+from anuga.structures.boyd_pipe_operator import boyd_pipe_function_vectorised
+from anuga.structures.boyd_pipe_operator import boyd_pipe_cases
+from anuga.structures.weir_orifice_trapezoid_operator import Weir_orifice_trapezoid_operator
+from anuga.structures.internal_boundary_operator import Internal_boundary_operator
+
+verbose = False
+
+
+class Test_structure_manager(unittest.TestCase):
+    """
+    Test the Structure_manager against the structure operators applied
+    one at a time
+    """
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+
+    def _create_domain(self):
+
+        domain = anuga.rectangular_cross_domain(60, 20, len1=60.0, len2=20.0)
+        domain.set_name('test_structure_manager')
+        domain.set_store(False)
+
+        domain.set_quantity('elevation', lambda x, y: -x/60.0)
+        domain.set_quantity('stage', lambda x, y: numpy.where(x < 10, 1.0, -x/60.0))
+        domain.set_quantity('friction', 0.01)
+
+        Br = anuga.Reflective_boundary(domain)
+        domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+        return domain
+
+
+    def _create_structures(self, domain):
+
+        structures = []
+        for j, y in enumerate([2.5, 7.5, 12.5, 17.5]):
+            structures.append(Boyd_box_operator(domain,
+                                                losses=1.5,
+                                                width=1.0+0.2*j,
+                                                height=0.5,
+                                                end_points=[[8.0, y], [20.0+2*j, y]],
+                                                blockage=0.1*j,
+                                                smoothing_timescale=0.1*j,
+                                                use_velocity_head=(j%2 == 0),
+                                                verbose=False))
+
+            structures.append(Boyd_pipe_operator(domain,
+                                                 losses=1.5,
+                                                 diameter=0.6,
+                                                 end_points=[[30.0, y+1], [45.0, y+1]],
+                                                 blockage=0.2*j,
+                                                 use_velocity_head=(j%2 == 1),
+                                                 verbose=False))
+
+        structures.append(Weir_orifice_trapezoid_operator(domain,
+                                                          losses=1.5,
+                                                          width=1.0,
+                                                          height=0.5,
+                                                          z1=1.0,
+                                                          z2=1.0,
+                                                          end_points=[[50.0, 5.0], [56.0, 5.0]],
+                                                          verbose=False))
+
+        # Overlaps the inlet of the third box culvert
+        structures.append(Internal_boundary_operator(domain,
+                                                     lambda hw, tw: 0.5*(hw-tw),
+                                                     exchange_lines=[[[24.0, 14.0], [24.0, 16.0]],
+                                                                     [[28.0, 14.0], [28.0, 16.0]]],
+                                                     enquiry_points=[[23.0, 15.0], [29.0, 15.0]],
+                                                     verbose=False))
+
+        return structures
+
+
+    def test_structure_manager_operators(self):
+
+        import warnings
+        warnings.simplefilter('ignore')
+
+        domain = self._create_domain()
+        structures = self._create_structures(domain)
+        position = domain.fractional_step_operators.index(structures[0])
+
+        manager = Structure_manager(domain)
+
+        # The third box culvert and the internal boundary overlap
+        assert len(manager.get_structures()) == 8
+        assert structures[4] in manager.unmanaged_structures
+        assert structures[9] in manager.unmanaged_structures
+
+        operators = domain.fractional_step_operators
+        assert operators.index(manager) == position
+        for structure in manager.get_structures():
+            assert structure not in operators
+        for structure in manager.unmanaged_structures:
+            assert structure in operators
+
+
+    def test_structure_manager_evolve(self):
+
+        import warnings
+        warnings.simplefilter('ignore')
+
+        results = []
+        for manage in [False, True]:
+            domain = self._create_domain()
+            structures = self._create_structures(domain)
+
+            if manage:
+                Structure_manager(domain)
+
+            for t in domain.evolve(yieldstep=1.0, finaltime=5.0):
+                pass
+
+            results.append((domain, structures))
+
+        (domain0, structures0), (domain1, structures1) = results
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            assert numpy.allclose(domain0.quantities[name].centroid_values,
+                                  domain1.quantities[name].centroid_values,
+                                  rtol=1.0e-10, atol=1.0e-10)
+
+        for s0, s1 in zip(structures0, structures1):
+            if verbose:
+                print s0.label, s0.discharge, s1.discharge, s0.case
+            assert numpy.allclose(s0.discharge, s1.discharge)
+            assert numpy.allclose(s0.accumulated_flow, s1.accumulated_flow)
+            assert s0.case == s1.case
+            assert s0.inflow is s0.inlets[0] and s1.inflow is s1.inlets[0] or \
+                   s0.inflow is s0.inlets[1] and s1.inflow is s1.inlets[1]
+
+
+    def test_boyd_functions_vectorised(self):
+
+        numpy.random.seed(1)
+        n = 500
+
+        width = numpy.random.uniform(0.5, 3.0, n)
+        depth = numpy.random.uniform(0.3, 2.0, n)
+        blockage = numpy.random.choice([0.0, 0.3, 0.95, 1.0], n)
+        barrels = numpy.random.choice([1.0, 2.0], n)
+        length = numpy.random.uniform(5.0, 50.0, n)
+        driving_energy = numpy.random.uniform(0.02, 3.0, n)
+        delta_total_energy = driving_energy*numpy.random.uniform(0.01, 2.0, n)
+        outlet_enquiry_depth = numpy.random.uniform(0.0, 3.0, n)
+        sum_loss = numpy.random.uniform(0.0, 3.0, n)
+        manning = numpy.random.uniform(0.01, 0.03, n)
+
+        box = boyd_box_function_vectorised(width, depth, blockage, barrels,
+                                           width, length, driving_energy,
+                                           delta_total_energy, outlet_enquiry_depth,
+                                           sum_loss, manning)
+
+        pipe = boyd_pipe_function_vectorised(driving_energy, depth, blockage, barrels,
+                                             length, driving_energy,
+                                             delta_total_energy, outlet_enquiry_depth,
+                                             sum_loss, manning)
+
+        for i in range(n):
+            result = boyd_box_function(width[i], depth[i], blockage[i], barrels[i],
+                                       width[i], length[i], driving_energy[i],
+                                       delta_total_energy[i], outlet_enquiry_depth[i],
+                                       sum_loss[i], manning[i])
+            assert numpy.allclose(result[:4], [box[k][i] for k in range(4)])
+            assert result[4] == boyd_box_cases[box[4][i]]
+
+            result = boyd_pipe_function(driving_energy[i], depth[i], blockage[i], barrels[i],
+                                        length[i], driving_energy[i],
+                                        delta_total_energy[i], outlet_enquiry_depth[i],
+                                        sum_loss[i], manning[i])
+            assert numpy.allclose(result[:4], [pipe[k][i] for k in range(4)])
+            assert result[4] == boyd_pipe_cases[pipe[4][i]]
+
+
+# =========================================================================
+if __name__ == "__main__":
+    suite = unittest.makeSuite(Test_structure_manager, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
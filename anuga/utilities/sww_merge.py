@@ -3,13 +3,19 @@
     Merge a list of .sww files together into a single file.
 """
 
+from collections import deque
+
 import numpy as num
 from anuga.utilities.numerical_tools import ensure_numeric
 
 from anuga.file.netcdf import NetCDFFile
 from anuga.config import netcdf_mode_r, netcdf_mode_w, netcdf_mode_a
 from anuga.config import netcdf_float, netcdf_float32, netcdf_int
-from anuga.file.sww import SWW_file, Write_sww
+from anuga.file.sww import SWW_file, Write_sww, get_sww_format
+
+# Default bound on the memory used for the time dependent quantities
+# by sww_merge_parallel
+default_memory_budget = 2**28
 
 def sww_merge(domain_global_name, np, verbose=False):
 
@@ -19,7 +25,17 @@ def sww_merge(domain_global_name, np, verbose=False):
     _sww_merge(swwfiles, output, verbose)
 
 
-def sww_merge_parallel(domain_global_name, np, verbose=False, delete_old=False):
+def sww_merge_parallel(domain_global_name, np, verbose=False, delete_old=False,
+                       memory_budget=None, processes=None):
+    """Merge the sww files domain_global_name_P<np>_<p>.sww of a parallel
+    run into domain_global_name.sww
+
+    The time dependent quantities are merged a block of timesteps at a
+    time, so that the memory used is about memory_budget bytes (default
+    default_memory_budget) however many timesteps are stored. If
+    processes > 1 the blocks of the different quantities are read and
+    assembled by a pool of processes.
+    """
 
     output = domain_global_name+".sww"
     swwfiles = [ domain_global_name+"_P"+str(np)+"_"+str(v)+".sww" for v in range(np)]
@@ -36,9 +52,11 @@ def sww_merge_parallel(domain_global_name, np, verbose=False, delete_old=False):
     fid.close()
 
     if 3*number_of_volumes == number_of_points:
-        _sww_merge_parallel_non_smooth(swwfiles, output, verbose, delete_old)
+        _sww_merge_parallel_non_smooth(swwfiles, output, verbose, delete_old,
+                                       memory_budget, processes)
     else:
-        _sww_merge_parallel_smooth(swwfiles, output, verbose, delete_old)
+        _sww_merge_parallel_smooth(swwfiles, output, verbose, delete_old,
+                                   memory_budget, processes)
         
 
 def _sww_merge(swwfiles, output, verbose=False):
@@ -79,6 +97,9 @@ def _sww_merge(swwfiles, output, verbose=False):
         tris = fid.variables['volumes'][:]       
          
         if first_file:
+            # Write the merged file in the format of the first
+            sww_format, sww_compression = get_sww_format(fid)
+
             times = fid.variables['time'][:]
             x = []
             y = []
@@ -153,8 +174,9 @@ def _sww_merge(swwfiles, output, verbose=False):
 
     if verbose:
         print 'Writing file ', output, ':'
-    fido = NetCDFFile(output, netcdf_mode_w)
-    sww = Write_sww(static_quantities, dynamic_quantities)
+    fido = NetCDFFile(output, netcdf_mode_w, netcdf_format=sww_format)
+    sww = Write_sww(static_quantities, dynamic_quantities,
+                    compression=sww_compression)
     sww.store_header(fido, times,
                              len(out_tris),
                              len(points),
@@ -198,7 +220,8 @@ def _sww_merge(swwfiles, output, verbose=False):
     fido.close()
 
 
-def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=False):
+def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=False,
+                               memory_budget=None, processes=None):
     """
         Merge a list of sww files into a single file.
         
@@ -215,12 +238,14 @@ def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=Fals
         swwfiles is a list of .sww files to merge.
         output is the output filename, including .sww extension.
         verbose True to log output information
+        memory_budget, processes see sww_merge_parallel
     """
 
     if verbose:
         print "MERGING SWW Files"
         
     
+    index_maps = []
     first_file = True
     tri_offset = 0
     for filename in swwfiles:
@@ -230,6 +255,9 @@ def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=Fals
         fid = NetCDFFile(filename, netcdf_mode_r)
          
         if first_file:
+            # Write the merged file in the format of the first
+            sww_format, sww_compression = get_sww_format(fid)
+
 
             times    = fid.variables['time'][:]
             n_steps = len(times)
@@ -238,10 +266,8 @@ def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=Fals
             starttime = int(fid.starttime)
             
             out_s_quantities = {}
-            out_d_quantities = {}
 
             out_s_c_quantities = {}
-            out_d_c_quantities = {}
 
 
             xllcorner = fid.xllcorner
@@ -287,11 +313,6 @@ def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=Fals
             for quantity in static_quantities:
                 out_s_quantities[quantity] = num.zeros((number_of_global_nodes,),num.float32)
 
-            # Quantities are stored as a 2D array of timesteps x data.
-            for quantity in dynamic_quantities:
-                out_d_quantities[quantity] = \
-                      num.zeros((n_steps,number_of_global_nodes),num.float32)
-
             #=======================================
             # Deal with the centroid based variables
             #=======================================
@@ -313,11 +334,6 @@ def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=Fals
                 
             for quantity in static_c_quantities:
                 out_s_c_quantities[quantity] = num.zeros((number_of_global_triangles,),num.float32)
-
-            # Quantities are stored as a 2D array of timesteps x data.
-            for quantity in dynamic_c_quantities:
-                out_d_c_quantities[quantity] = \
-                      num.zeros((n_steps,number_of_global_triangles),num.float32)
                  
             description = 'merged:' + getattr(fid, 'description')          
             first_file = False
@@ -412,16 +428,6 @@ def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=Fals
             out_s_quantities[quantity][f_node_l2g] = \
                          num.array(q[:],dtype=num.float32)[fl_nodes]
 
-        
-        #Collate all dynamic quantities according to their timestep
-        for quantity in dynamic_quantities:
-            q = fid.variables[quantity]
-            #print q.shape
-            for i in range(n_steps):
-                #out_d_quantities[quantity][i][node_l2g] = \
-                #           num.array(q[i],dtype=num.float32)
-                out_d_quantities[quantity][i][f_node_l2g] = \
-                           num.array(q[i],dtype=num.float32)[fl_nodes]
 
 
         # Read in static c quantities
@@ -432,15 +438,9 @@ def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=Fals
             out_s_c_quantities[quantity][ftri_l2g] = \
                          num.array(q).astype(num.float32)[ftri_ids]
 
-        
-        #Collate all dynamic c quantities according to their timestep
-        for quantity in dynamic_c_quantities:
-            q = fid.variables[quantity]
-            #print q.shape
-            for i in range(n_steps):
-                out_d_c_quantities[quantity][i][ftri_l2g] = \
-                           num.array(q[i]).astype(num.float32)[ftri_ids]
 
+        # The dynamic quantities are merged after the static ones
+        index_maps.append((fl_nodes, f_node_l2g, ftri_ids[0], ftri_l2g))
 
         fid.close()
 
@@ -456,9 +456,10 @@ def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=Fals
 
     if verbose:
             print 'Writing file ', output, ':'
-    fido = NetCDFFile(output, netcdf_mode_w)
+    fido = NetCDFFile(output, netcdf_mode_w, netcdf_format=sww_format)
 
-    sww = Write_sww(static_quantities, dynamic_quantities, static_c_quantities, dynamic_c_quantities)
+    sww = Write_sww(static_quantities, dynamic_quantities, static_c_quantities, dynamic_c_quantities,
+                    compression=sww_compression)
     sww.store_header(fido, starttime,
                              number_of_global_triangles,
                              number_of_global_nodes,
@@ -489,40 +490,10 @@ def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=Fals
     for i in range(n_steps):
         fido.variables['time'][i] = times[i]
 
-        
-    for q in dynamic_quantities:
-        q_values = out_d_quantities[q]
-        if verbose:
-            print '  Writing quantity: ',q
-            
-        for i in range(n_steps):
-            fido.variables[q][i] = q_values[i]
-        
-        # This updates the _range values
-        q_range = fido.variables[q + Write_sww.RANGE][:]
-        q_values_min = num.min(q_values)
-        if q_values_min < q_range[0]:
-            fido.variables[q + Write_sww.RANGE][0] = q_values_min
-        q_values_max = num.max(q_values)
-        if q_values_max > q_range[1]:
-            fido.variables[q + Write_sww.RANGE][1] = q_values_max        
-
-    for q in dynamic_c_quantities:
-        if verbose:
-            print '  Writing quantity: ',q
-            
-        q_values = out_d_c_quantities[q]
-        for i in range(n_steps):
-            fido.variables[q][i] = q_values[i]
-
-                                        
-    #print out_s_quantities
-    #print out_d_quantities
-    
-    #print g_x
-    #print g_y
-
-    #print g_volumes
+    _merge_dynamic_quantities(swwfiles, fido, index_maps,
+                              dynamic_quantities, dynamic_c_quantities,
+                              number_of_global_nodes, number_of_global_triangles,
+                              n_steps, memory_budget, processes, verbose)
 
     fido.close()
     
@@ -535,7 +506,8 @@ def _sww_merge_parallel_smooth(swwfiles, output,  verbose=False, delete_old=Fals
             os.remove(filename)
 
 
-def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=False):
+def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=False,
+                                   memory_budget=None, processes=None):
     """
         Merge a list of sww files into a single file.
 
@@ -552,12 +524,14 @@ def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=
         swwfiles is a list of .sww files to merge.
         output is the output filename, including .sww extension.
         verbose True to log output information
+        memory_budget, processes see sww_merge_parallel
     """
 
     if verbose:
         print "MERGING SWW Files"
 
 
+    index_maps = []
     first_file = True
     tri_offset = 0
     for filename in swwfiles:
@@ -567,6 +541,9 @@ def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=
         fid = NetCDFFile(filename, netcdf_mode_r)
 
         if first_file:
+            # Write the merged file in the format of the first
+            sww_format, sww_compression = get_sww_format(fid)
+
 
             times    = fid.variables['time'][:]
             n_steps = len(times)
@@ -575,10 +552,8 @@ def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=
             starttime = int(fid.starttime)
 
             out_s_quantities = {}
-            out_d_quantities = {}
 
             out_s_c_quantities = {}
-            out_d_c_quantities = {}
 
 
             xllcorner = fid.xllcorner
@@ -695,6 +670,8 @@ def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=
                          num.array(q).astype(num.float32)[f_ids]
                          #num.array(q,dtype=num.float32)[f_ids]
 
+        # The dynamic quantities are merged after the static ones
+        index_maps.append((l_vids, g_vids, f_ids, f_gids))
         
         fid.close()
 
@@ -705,8 +682,9 @@ def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=
     if verbose:
             print 'Writing file ', output, ':'
 
-    fido = NetCDFFile(output, netcdf_mode_w)
-    sww = Write_sww(static_quantities, dynamic_quantities, static_c_quantities, dynamic_c_quantities)
+    fido = NetCDFFile(output, netcdf_mode_w, netcdf_format=sww_format)
+    sww = Write_sww(static_quantities, dynamic_quantities, static_c_quantities, dynamic_c_quantities,
+                    compression=sww_compression)
     sww.store_header(fido, starttime,
                              number_of_global_triangles,
                              number_of_global_triangles*3,
@@ -736,54 +714,10 @@ def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=
     for i in range(n_steps):
         fido.variables['time'][i] = times[i]
 
-    for q in (dynamic_quantities + dynamic_c_quantities):
-
-        if verbose:
-            print '  Writing quantity: ',q
-                    
-        # Initialise q_values with zeros
-        if q in dynamic_quantities:
-            q_values = num.zeros((n_steps, 3*number_of_global_triangles), num.float32)
-        elif q in dynamic_c_quantities:
-            q_values = num.zeros((n_steps, number_of_global_triangles), num.float32)
-
-
-        # Read the quantities one at a time, to reduce memory usage
-        for filename in swwfiles:
-            fid = NetCDFFile(filename, netcdf_mode_r)
-
-            # Index information
-            tri_l2g  = fid.variables['tri_l2g'][:]
-            node_l2g = fid.variables['node_l2g'][:]
-            tri_full_flag = fid.variables['tri_full_flag'][:]
-            f_ids = num.argwhere(tri_full_flag==1).reshape(-1,)
-            f_gids = tri_l2g[f_ids]
-            g_vids = (3*f_gids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
-            l_vids = (3*f_ids.reshape(-1,1) + num.array([0,1,2])).reshape(-1,)
-            for i in range(n_steps):
-                # Different indices for vertex and centroid quantities
-                if q in dynamic_quantities:
-                    q_values[i][g_vids] = \
-                    num.array(fid.variables[q][i], dtype=num.float32)[l_vids]
-                elif q in dynamic_c_quantities:
-                    q_values[i][f_gids] = \
-                    num.array(fid.variables[q][i], dtype=num.float32)[f_ids]
-
-            fid.close()
-
-        # Write to the file
-        for i in range(n_steps):
-            fido.variables[q][i] = q_values[i]
-
-        if q in dynamic_quantities:
-            # This updates the _range values
-            q_range = fido.variables[q + Write_sww.RANGE][:]
-            q_values_min = num.min(q_values)
-            if q_values_min < q_range[0]:
-                fido.variables[q + Write_sww.RANGE][0] = q_values_min
-            q_values_max = num.max(q_values)
-            if q_values_max > q_range[1]:
-                fido.variables[q + Write_sww.RANGE][1] = q_values_max
+    _merge_dynamic_quantities(swwfiles, fido, index_maps,
+                              dynamic_quantities, dynamic_c_quantities,
+                              3*number_of_global_triangles, number_of_global_triangles,
+                              n_steps, memory_budget, processes, verbose)
 
     fido.close()
 
@@ -800,6 +734,147 @@ def _sww_merge_parallel_non_smooth(swwfiles, output,  verbose=False, delete_old=
 
 
 
+def _merge_dynamic_quantities(swwfiles, fido, index_maps,
+                              dynamic_quantities, dynamic_c_quantities,
+                              number_of_points, number_of_volumes, n_steps,
+                              memory_budget=None, processes=None, verbose=False):
+    """Merge the time dependent quantities of swwfiles into the open file
+    fido a block of timesteps at a time.
+
+    index_maps holds for each file the local and global ids of its full
+    points and of its full triangles. Blocks of a quantity are assembled
+    from all the files (by processes worker processes) and written as they
+    arrive, with at most processes blocks held at once, so about
+    memory_budget bytes are used whatever the number of timesteps.
+    """
+
+    if memory_budget is None:
+        memory_budget = default_memory_budget
+
+    if processes is None or processes < 1:
+        processes = 1
+
+    # Copies of each block held at once: the assembled block and the
+    # values read from a file, and with worker processes also the pickled
+    # copy sent to this process and the block received here
+    if processes > 1:
+        copies = 3
+    else:
+        copies = 2
+
+    itemsize = num.dtype(num.float32).itemsize
+    step_size = copies*itemsize*max(number_of_points, number_of_volumes)
+    steps_per_block = max(1, int(memory_budget/(processes*step_size)))
+    steps_per_block = min(steps_per_block, max(n_steps, 1))
+
+    blocks = []
+    for q in dynamic_quantities + dynamic_c_quantities:
+        if q in dynamic_quantities:
+            n = number_of_points
+        else:
+            n = number_of_volumes
+
+        for start in range(0, n_steps, steps_per_block):
+            blocks.append((q, n, start, min(start+steps_per_block, n_steps)))
+
+    if verbose:
+        print '  Merging %d blocks of %d timesteps' % (len(blocks), steps_per_block)
+
+    pool = None
+    if processes > 1 and len(blocks) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes, _init_merge_worker,
+                                    (swwfiles, index_maps, dynamic_c_quantities))
+    else:
+        _init_merge_worker(swwfiles, index_maps, dynamic_c_quantities)
+
+    try:
+        # At most processes blocks are being assembled or waiting to be
+        # written, each is written (only by this process) as soon as it
+        # arrives and the next one is then started
+        pending = deque()
+        for block in blocks:
+            if pool is None:
+                _write_block(fido, block, _merge_block(block),
+                             dynamic_quantities, verbose)
+                continue
+
+            if len(pending) == processes:
+                done, result = pending.popleft()
+                _write_block(fido, done, result.get(),
+                             dynamic_quantities, verbose)
+                del result
+
+            pending.append((block, pool.apply_async(_merge_block, (block,))))
+
+        while pending:
+            done, result = pending.popleft()
+            _write_block(fido, done, result.get(), dynamic_quantities, verbose)
+            del result
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def _write_block(fido, block, q_values, dynamic_quantities, verbose=False):
+    """Write the assembled block of timesteps of a quantity to fido and
+    update its range
+    """
+
+    q, n, start, end = block
+
+    if verbose:
+        print '  Writing quantity: %s timesteps %d to %d' % (q, start, end-1)
+
+    fido.variables[q][start:end] = q_values
+
+    if q in dynamic_quantities:
+        # This updates the _range values
+        q_range = fido.variables[q + Write_sww.RANGE][:]
+        q_values_min = num.min(q_values)
+        if q_values_min < q_range[0]:
+            fido.variables[q + Write_sww.RANGE][0] = q_values_min
+        q_values_max = num.max(q_values)
+        if q_values_max > q_range[1]:
+            fido.variables[q + Write_sww.RANGE][1] = q_values_max
+
+
+# Arguments shared by the blocks merged in a worker process
+_merge_worker_args = None
+
+def _init_merge_worker(swwfiles, index_maps, dynamic_c_quantities):
+
+    global _merge_worker_args
+    _merge_worker_args = (swwfiles, index_maps, dynamic_c_quantities)
+
+
+def _merge_block(block):
+    """Return the timesteps start to end-1 of quantity q assembled from
+    the full points (or triangles) of all the files
+    """
+
+    q, n, start, end = block
+    swwfiles, index_maps, dynamic_c_quantities = _merge_worker_args
+
+    q_values = num.zeros((end-start, n), num.float32)
+
+    for filename, (l_points, g_points, l_tris, g_tris) in zip(swwfiles, index_maps):
+        fid = NetCDFFile(filename, netcdf_mode_r)
+
+        if q in dynamic_c_quantities:
+            l_ids, g_ids = l_tris, g_tris
+        else:
+            l_ids, g_ids = l_points, g_points
+
+        values = num.array(fid.variables[q][start:end], dtype=num.float32)
+        q_values[:, g_ids] = values[:, l_ids]
+
+        fid.close()
+
+    return q_values
+
+
 if __name__ == "__main__":
 
     import argparse
@@ -815,16 +890,23 @@ if __name__ == "__main__":
                    help='verbosity')
     parser.add_argument('-delete_old', nargs='?', type=bool, const=True, default=False,
                    help='Flag to delete the input files')
+    parser.add_argument('-memory_budget', type=int, default=default_memory_budget,
+                   help='approximate memory in bytes used to merge the time dependent quantities')
+    parser.add_argument('-processes', type=int, default=1,
+                   help='number of processes merging the quantities')
     args = parser.parse_args()
 
     np = args.np
     domain_global_name = args.f
     verbose = args.v
     delete_old = args.delete_old
+    memory_budget = args.memory_budget
+    processes = args.processes
 
 
     try:
-        sww_merge_parallel(domain_global_name, np, verbose, delete_old)
+        sww_merge_parallel(domain_global_name, np, verbose, delete_old,
+                           memory_budget, processes)
     except:
         msg = 'ERROR: When merging sww files %s '% domain_global_name
         print msg
@@ -0,0 +1,148 @@
+"""Compare single and double precision evolution with ANUGA
+
+Runs dry and wet dam breaks and a lake at rest over an immersed bump
+with the conserved quantities stored in double and in single precision
+(see Domain.set_precision) and reports the L^1 errors against the
+analytical solutions together with the evolve times.
+"""
+
+#------------------------------------------------------------------------------
+# Import necessary modules
+#------------------------------------------------------------------------------
+import os
+import sys
+import time
+
+import numpy
+import anuga
+
+args = anuga.get_args()
+alg = args.alg
+verbose = args.verbose
+
+if not alg.startswith('DE'):
+    alg = 'DE0'
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(here, 'dam_break_dry'))
+sys.path.append(os.path.join(here, 'dam_break_wet'))
+
+import analytical_dam_break_dry
+import analytical_dam_break_wet
+
+
+#================================================================================
+# Setup the test cases
+#================================================================================
+def dam_break(precision, h0, analytic):
+    """Dam break of depth h1 = 10 into water of depth h0 after 20 s
+    """
+
+    dx = 1.0
+    L = 400.0
+    W = 5*dx
+    h1 = 10.0
+    finaltime = 20.0
+
+    points, vertices, boundary = anuga.rectangular_cross(int(L/dx), int(W/dx),
+                                                         L, W, (-L/2.0, -W/2.0))
+
+    domain = anuga.Domain(points, vertices, boundary)
+    domain.set_flow_algorithm(alg)
+    domain.set_store(False)
+    domain.set_precision(precision)
+
+    domain.set_quantity('elevation', 0.0)
+    domain.set_quantity('friction', 0.0)
+    domain.set_quantity('stage', lambda x, y: numpy.where(x <= 0.0, h1, h0))
+
+    Br = anuga.Reflective_boundary(domain)
+    Bt = anuga.Transmissive_boundary(domain)
+    domain.set_boundary({'left': Bt, 'right': Bt, 'top': Br, 'bottom': Br})
+
+    t0 = time.time()
+    for t in domain.evolve(yieldstep=finaltime, finaltime=finaltime):
+        if verbose:
+            print domain.timestepping_statistics()
+    runtime = time.time() - t0
+
+    x = domain.centroid_coordinates[:, 0]
+    h, u = analytic.vec_dam_break(x, finaltime, h0=h0, h1=h1)
+
+    stage = domain.quantities['stage'].centroid_values
+    xmom = domain.quantities['xmomentum'].centroid_values
+
+    error_stage = numpy.sum(numpy.abs(stage - h))/numpy.sum(numpy.abs(h))
+    error_xmom = numpy.sum(numpy.abs(xmom - u*h))/numpy.sum(numpy.abs(u*h))
+
+    return error_stage, error_xmom, runtime
+
+
+def dam_break_dry(precision):
+    return dam_break(precision, 0.0, analytical_dam_break_dry)
+
+
+def dam_break_wet(precision):
+    return dam_break(precision, 1.0, analytical_dam_break_wet)
+
+
+def lake_at_rest_immersed_bump(precision):
+    """Lake at rest of stage 0.5 over a bump, which should stay at rest
+    """
+
+    dx = 0.25
+    L = 25.0
+    W = 5*dx
+    finaltime = 5.0
+
+    def bed_elevation(x, y):
+        return numpy.where(numpy.abs(x - 10.0) < 2.0,
+                           0.2 - 0.05*(x - 10.0)**2, 0.0)
+
+    points, vertices, boundary = anuga.rectangular_cross(int(L/dx), int(W/dx),
+                                                         L, W, (0.0, 0.0))
+
+    domain = anuga.Domain(points, vertices, boundary)
+    domain.set_flow_algorithm(alg)
+    domain.set_store(False)
+    domain.set_precision(precision)
+
+    domain.set_quantity('friction', 0.0)
+    domain.set_quantity('stage', 0.5)
+    domain.set_quantity('elevation', bed_elevation)
+
+    Br = anuga.Reflective_boundary(domain)
+    domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+    t0 = time.time()
+    for t in domain.evolve(yieldstep=finaltime, finaltime=finaltime):
+        if verbose:
+            print domain.timestepping_statistics()
+    runtime = time.time() - t0
+
+    stage = domain.quantities['stage'].centroid_values
+    xmom = domain.quantities['xmomentum'].centroid_values
+
+    # Relative stage error and absolute momentum error as the exact
+    # momentum is zero
+    error_stage = numpy.mean(numpy.abs(stage - 0.5))/0.5
+    error_xmom = numpy.mean(numpy.abs(xmom))
+
+    return error_stage, error_xmom, runtime
+
+
+#================================================================================
+# Run the cases in both precisions
+#================================================================================
+cases = [dam_break_dry, dam_break_wet, lake_at_rest_immersed_bump]
+
+print 'Flow algorithm', alg
+print '%-28s %-8s %14s %14s %10s' % ('case', 'precision', 'L1 stage',
+                                     'L1 xmomentum', 'time (s)')
+
+for case in cases:
+    for precision in ['double', 'single']:
+        error_stage, error_xmom, runtime = case(precision)
+        print '%-28s %-8s %14.6e %14.6e %10.3f' % (case.__name__, precision,
+                                                  error_stage, error_xmom,
+                                                  runtime)